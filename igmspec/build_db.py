@@ -27,6 +27,13 @@ from igmspec.ingest import uves_dall
 from igmspec.ingest import boss_dr14
 from igmspec.ingest import esi_z6
 from igmspec.ingest import kodiaq_two
+from igmspec.journal import BuildJournal
+from igmspec import fingerprint as ifp
+from igmspec import links
+from igmspec import migrate
+from igmspec import shards
+from igmspec import buildstats as ibs
+from igmspec import defs as idefs
 
 from astropy.table import Table, vstack, Column
 from astropy import units as u
@@ -111,7 +118,8 @@ def ver01(test=False, clobber=False, publisher='J.X. Prochaska', **kwargs):
 
 
 def ver02(test=False, skip_copy=False, publisher='J.X. Prochaska', clobber=False,
-          version='v02', out_path=None):
+          version='v02', out_path=None, nproc=1, resume=False, spec_link='copy',
+          shard_path=None):
     """ Build version 2.X
 
     Reads previous datasets from v1.X
@@ -122,6 +130,18 @@ def ver02(test=False, skip_copy=False, publisher='J.X. Prochaska', clobber=False
       Run test only
     skip_copy : bool, optional
       Skip copying the data from v01
+    nproc : int, optional
+      Number of processes for reading the raw spectra
+    resume : bool, optional
+      Continue a crashed build from its journal.  Completed groups are
+      kept;  a group that was cut short is rebuilt from scratch, as the
+      journal records row checkpoints only for BOSS_DR14 (not in v02)
+    spec_link : str, optional
+      How to add the spectra of the v01 groups:  copy, external or virtual
+      See links.add_spec;  use links.materialize() for distribution
+    shard_path : str, optional
+      Merge the new groups from their shard files in this path
+      (see shards.build_shards) instead of ingesting them
 
     Returns
     -------
@@ -141,10 +161,10 @@ def ver02(test=False, skip_copy=False, publisher='J.X. Prochaska', clobber=False
         out_path = igmspec.__path__[0]+'/../DB/'
     outfil = out_path + 'IGMspec_DB_{:s}.hdf5'.format(version)
     # Clobber?
-    if not chk_clobber(outfil, clobber=clobber):
+    if (not resume) and (not chk_clobber(outfil, clobber=clobber)):
         return
     # Begin
-    hdf = h5py.File(outfil,'w')
+    hdf, journal = open_build(outfil, version, resume=resume)
 
 
     # Copy over the old stuff
@@ -156,27 +176,27 @@ def ver02(test=False, skip_copy=False, publisher='J.X. Prochaska', clobber=False
         for key in v01hdf.keys():
             if key in ['catalog','quasars']+redo_groups+skip_groups:
                 continue
+            elif chk_resume(hdf, key, journal):
+                continue
             else:
                 #v01hdf.copy(key, hdf)  # ONE STOP SHOPPING
                 grp = hdf.create_group(key)
                 # Copy spectra
-                v01hdf.copy(key+'/spec', hdf[key])
-                # Modify v01 meta and add
-                if key == 'BOSS_DR12':
-                    meta = boss.add_coflag(v01hdf)
-                else:
-                    meta = Table(v01hdf[key+'/meta'].value)
-                meta.rename_column('GRATING', 'DISPERSER')
-                hdf[key+'/meta'] = meta
-                for akey in v01hdf[key+'/meta'].attrs.keys():
-                    hdf[key+'/meta'].attrs[akey] = v01hdf[key+'/meta'].attrs[akey]
+                links.add_spec(v01hdf, hdf, key, mode=spec_link)
+                # Migrate v01 meta and add
+                meta = migrate.carry_meta(v01hdf, key, version)
+                migrate.write_meta(hdf, key, meta, src_hdf=v01hdf)
                 # SSA info
-                old_groups[key].add_ssa(hdf, key)
+                with ibs.stage(key, 'add_ssa', nrows=len(meta)):
+                    old_groups[key].add_ssa(hdf, key)
+                finish_group(hdf, key, journal)
     skip_myers = False
     if skip_myers:
         warnings.warn("NEED TO INCLUDE MYERS!")
-    else:
-        myers.add_to_hdf(hdf)
+    elif not chk_resume(hdf, 'quasars', journal):
+        if not add_catalog_shard(hdf, version, shard_path):
+            myers.add_to_hdf(hdf)
+        finish_group(hdf, 'quasars', journal)
 
     # Setup groups
     old_groups = get_build_groups('v01')
@@ -194,7 +214,9 @@ def ver02(test=False, skip_copy=False, publisher='J.X. Prochaska', clobber=False
     for gname in redo_groups:
         print("Working to replace meta/spec for group: {:s}".format(gname))
         # Meta
-        meta = old_groups[gname].grab_meta()
+        with ibs.stage(gname, 'grab_meta') as rec:
+            meta = old_groups[gname].grab_meta()
+            rec.nrows = len(meta)
         # Group flag
         flag_g = group_dict[gname]
         # IDs
@@ -205,29 +227,52 @@ def ver02(test=False, skip_copy=False, publisher='J.X. Prochaska', clobber=False
         else:
             _, _, ids = sdbbu.set_new_ids(maindb, meta, idkey)
         # Spectra
-        old_groups[gname].hdf5_adddata(hdf, gname, meta)
-        old_groups[gname].add_ssa(hdf, gname)
+        if chk_resume(hdf, gname, journal):
+            continue
+        with ibs.stage(gname, 'hdf5_adddata', nrows=len(meta)):
+            old_groups[gname].hdf5_adddata(hdf, gname, meta, nproc=nproc)
+        with ibs.stage(gname, 'add_ssa', nrows=len(meta)):
+            old_groups[gname].add_ssa(hdf, gname)
+        finish_group(hdf, gname, journal)
 
     meta_only = False
     new_groups = get_build_groups(version)
     # Loop over the new groups
     for gname in new_groups:
         print("Working on group: {:s}".format(gname))
+        if shard_path is not None:
+            flag_g = sdbbu.add_to_group_dict(gname, group_dict, skip_for_debug=True)
+            if chk_resume(hdf, gname, journal):
+                maindb = replay_group(hdf, gname, maindb, flag_g, tkeys, idkey, pair_groups)
+            else:
+                maindb = merge_shard(hdf, gname, version, shard_path, maindb, flag_g, tkeys,
+                                     idkey, pair_groups, spec_link=spec_link)
+                finish_group(hdf, gname, journal)
+            continue
         # Meta
-        meta = new_groups[gname].grab_meta()
+        with ibs.stage(gname, 'grab_meta') as rec:
+            meta = new_groups[gname].grab_meta()
+            rec.nrows = len(meta)
         # Survey flag
         flag_g = sdbbu.add_to_group_dict(gname, group_dict, skip_for_debug=True)
         # IDs
         debug= False
         #if gname == 'XQ-100':
         #    debug = True
-        maindb = sdbbu.add_ids(maindb, meta, flag_g, tkeys, idkey,
-                               first=(flag_g==1), close_pairs=(gname in pair_groups),
-                               debug=debug)
+        with ibs.stage(gname, 'add_ids', nrows=len(meta)):
+            maindb = sdbbu.add_ids(maindb, meta, flag_g, tkeys, idkey,
+                                   first=(flag_g==1), close_pairs=(gname in pair_groups),
+                                   debug=debug)
         # Spectra
-        if not meta_only:
-            new_groups[gname].hdf5_adddata(hdf, gname, meta)
+        if meta_only:
+            continue
+        if chk_resume(hdf, gname, journal):
+            continue
+        with ibs.stage(gname, 'hdf5_adddata', nrows=len(meta)):
+            new_groups[gname].hdf5_adddata(hdf, gname, meta, nproc=nproc)
+        with ibs.stage(gname, 'add_ssa', nrows=len(meta)):
             new_groups[gname].add_ssa(hdf, gname)
+        finish_group(hdf, gname, journal)
 
     # Check for duplicates -- There is 1 pair in SDSS (i.e. 2 duplicates)
     if not sdbbu.chk_for_duplicates(maindb, dup_lim=2):
@@ -241,15 +286,21 @@ def ver02(test=False, skip_copy=False, publisher='J.X. Prochaska', clobber=False
 
     # Finish
     zpri = v01hdf['catalog'].attrs['Z_PRIORITY']
-    sdbbuwrite_hdf(hdf, str('igmspec'), maindb, zpri,
-                    group_dict, version, Publisher=str(publisher))
+    if 'catalog' in hdf.keys():  # Partial from a crashed build
+        del hdf['catalog']
+    with ibs.stage('catalog', 'write_hdf', nrows=len(maindb)) as rec:
+        sdbbu.write_hdf(hdf, str('igmspec'), maindb, zpri,
+                        group_dict, version, Publisher=str(publisher))
+        rec.bytes_written = maindb.as_array().nbytes
+    journal.remove()
 
     print("Wrote {:s} DB file".format(outfil))
     print("Update DB info in specdb.defs.dbase_info !!")
 
 
 def ver03(test=False, skip_copy=False, publisher='J.X. Prochaska', clobber=False,
-          version='v03.1', out_path=None, redo_dr14=False):
+          version='v03.1', out_path=None, redo_dr14=False, nproc=1, resume=False,
+          prev_db=None, spec_link='copy', shard_path=None, dr14_blocks=None, nworker=1):
     """ Build version 3.X
     Reads several previous datasets from v1.X
     Remakes the maindb using BOSS DR14 as the main driver
@@ -262,6 +313,30 @@ def ver03(test=False, skip_copy=False, publisher='J.X. Prochaska', clobber=False
       Run test only
     skip_copy : bool, optional
       Skip copying the data from v01
+    nproc : int, optional
+      Number of processes for reading the raw spectra
+    resume : bool, optional
+      Continue a crashed build from its journal.  Completed groups are
+      kept;  BOSS_DR14 (when ingested, i.e. redo_dr14) resumes after
+      its last checkpointed row, the only group whose rows the journal
+      records, while any other group cut short is rebuilt from scratch
+    prev_db : str, optional
+      Previous DB file built from the raw data (e.g. an earlier v03.X).
+      Groups whose fingerprint (raw files + ingest code) is unchanged
+      are reused from it instead of being ingested again
+    spec_link : str, optional
+      How to add the spectra of groups taken from previous DB files:
+      copy, external or virtual.  See links.add_spec;
+      use links.materialize() for distribution
+    shard_path : str, optional
+      Merge the new groups (not reused from prev_db) from their shard files
+      in this path (see shards.build_shards) instead of ingesting them
+    dr14_blocks : str, optional
+      Ingest BOSS_DR14 in blocks of ORIG_ID in this path, which other
+      machines may work on with scripts/ingest_boss_dr14.py
+      (see boss_dr14.run_blocks)
+    nworker : int, optional
+      Local workers on the BOSS_DR14 blocks
 
     Returns
     -------
@@ -281,14 +356,18 @@ def ver03(test=False, skip_copy=False, publisher='J.X. Prochaska', clobber=False
         out_path = '/scratch/IGMSpec/'
     outfil = out_path + 'IGMspec_DB_{:s}.hdf5'.format(version)
     # Clobber?
-    if not chk_clobber(outfil, clobber=clobber):
+    if (not resume) and (not chk_clobber(outfil, clobber=clobber)):
         return
 
     # Other bits
     pair_groups = ['SDSS_DR7']
 
     # Begin
-    hdf = h5py.File(outfil,'w')
+    hdf, journal = open_build(outfil, version, resume=resume)
+    if prev_db is not None:
+        prev_hdf = h5py.File(prev_db,'r')
+    else:
+        prev_hdf = None
 
     # Set/Check keys (and set idkey internally for other checks)
     idkey = 'IGM_ID'
@@ -301,39 +380,57 @@ def ver03(test=False, skip_copy=False, publisher='J.X. Prochaska', clobber=False
     # Survey flag
     flag_g = sdbbu.add_to_group_dict(gname, group_dict, skip_for_debug=True)
 
-    if not redo_dr14:
+    if chk_resume(hdf, gname, journal, rows_ok=redo_dr14):
+        maindb = replay_group(hdf, gname, maindb, flag_g, tkeys, idkey, pair_groups)
+    elif not redo_dr14:
         v030file = os.getenv('SPECDB')+'/IGMspec_DB_v03.0.hdf5'
         igmsp_v030 = IgmSpec(db_file=v030file)
 
         grp = hdf.create_group(gname)
         # Copy spectra
         #warnings.warn("GET THE DR14 spectra!")
-        igmsp_v030.hdf.copy(gname+'/spec', hdf[gname])
-        # Copy meta
-        igmsp_v030.hdf.copy(gname+'/meta', hdf[gname])
-        # Meta for maindb (a little risky as Meta needs to be aligned to the spectra but they should be)
-        meta = igmsp_v030['BOSS_DR14'].meta
-        meta.remove_column('IGM_ID')
-        maindb = sdbbu.add_ids(maindb, meta, flag_g, tkeys, idkey,
-                               first=(flag_g==1), close_pairs=(gname in pair_groups),
-                               debug=False)
+        links.add_spec(igmsp_v030.hdf, hdf, gname, mode=spec_link)
+        # Meta (aligned to the spectra)
+        meta = migrate.carry_meta(igmsp_v030.hdf, gname, version)
+        with ibs.stage(gname, 'add_ids', nrows=len(meta)):
+            maindb = sdbbu.add_ids(maindb, meta, flag_g, tkeys, idkey,
+                                   first=(flag_g==1), close_pairs=(gname in pair_groups),
+                                   debug=False)
+        migrate.write_meta(hdf, gname, meta, src_hdf=igmsp_v030.hdf)
         #hdf[key+'/meta'] = meta
         #for akey in v01hdf[key+'/meta'].attrs.keys():
         #    hdf[key+'/meta'].attrs[akey] = v01hdf[key+'/meta'].attrs[akey]
         # SSA info
         #new_groups[gname].add_ssa(hdf, gname)
+        finish_group(hdf, gname, journal)
     else:
         # BOSS DR14
         print("Working on group: {:s}".format(gname))
-        # Meta
-        meta = new_groups[gname].grab_meta()
-        # IDs
-        maindb = sdbbu.add_ids(maindb, meta, flag_g, tkeys, idkey,
-                               first=(flag_g==1), close_pairs=(gname in pair_groups),
-                               debug=False)
-        # Spectra
-        new_groups[gname].hdf5_adddata(hdf, gname, meta)
-        new_groups[gname].add_ssa(hdf, gname)
+        fprint = ifp.group_fingerprint(gname, new_groups[gname])
+        if ifp.chk_fingerprint(prev_hdf, gname, fprint):
+            maindb = reuse_group(prev_hdf, hdf, gname, maindb, flag_g, tkeys, idkey, pair_groups,
+                                 spec_link=spec_link)
+        elif shard_path is not None:
+            maindb = merge_shard(hdf, gname, version, shard_path, maindb, flag_g, tkeys,
+                                 idkey, pair_groups, spec_link=spec_link, fprint=fprint)
+        else:
+            # Meta
+            with ibs.stage(gname, 'grab_meta') as rec:
+                meta = new_groups[gname].grab_meta()
+                rec.nrows = len(meta)
+            # IDs
+            with ibs.stage(gname, 'add_ids', nrows=len(meta)):
+                maindb = sdbbu.add_ids(maindb, meta, flag_g, tkeys, idkey,
+                                       first=(flag_g==1), close_pairs=(gname in pair_groups),
+                                       debug=False)
+            # Spectra
+            with ibs.stage(gname, 'hdf5_adddata', nrows=len(meta)):
+                new_groups[gname].hdf5_adddata(hdf, gname, meta, nproc=nproc, journal=journal,
+                                               block_path=dr14_blocks, nworker=nworker)
+            with ibs.stage(gname, 'add_ssa', nrows=len(meta)):
+                new_groups[gname].add_ssa(hdf, gname)
+        ifp.write_fingerprint(hdf, gname, fprint)
+        finish_group(hdf, gname, journal)
 
     # Pop me
     new_groups.pop('BOSS_DR14')
@@ -341,17 +438,35 @@ def ver03(test=False, skip_copy=False, publisher='J.X. Prochaska', clobber=False
     # Loop on new v3 groups before copying in the others
     for gname in new_groups.keys():
         print("Working on group: {:s}".format(gname))
-        # Meta
-        meta = new_groups[gname].grab_meta()
         # Survey flag
         flag_g = sdbbu.add_to_group_dict(gname, group_dict, skip_for_debug=True)
-        # IDs
-        maindb = sdbbu.add_ids(maindb, meta, flag_g, tkeys, idkey,
-                               first=(flag_g==1), close_pairs=(gname in pair_groups),
-                               debug=False)
-        # Spectra
-        new_groups[gname].hdf5_adddata(hdf, gname, meta)
-        new_groups[gname].add_ssa(hdf, gname)
+        if chk_resume(hdf, gname, journal):
+            maindb = replay_group(hdf, gname, maindb, flag_g, tkeys, idkey, pair_groups)
+            continue
+        fprint = ifp.group_fingerprint(gname, new_groups[gname])
+        if ifp.chk_fingerprint(prev_hdf, gname, fprint):
+            maindb = reuse_group(prev_hdf, hdf, gname, maindb, flag_g, tkeys, idkey, pair_groups,
+                                 spec_link=spec_link)
+        elif shard_path is not None:
+            maindb = merge_shard(hdf, gname, version, shard_path, maindb, flag_g, tkeys,
+                                 idkey, pair_groups, spec_link=spec_link, fprint=fprint)
+        else:
+            # Meta
+            with ibs.stage(gname, 'grab_meta') as rec:
+                meta = new_groups[gname].grab_meta()
+                rec.nrows = len(meta)
+            # IDs
+            with ibs.stage(gname, 'add_ids', nrows=len(meta)):
+                maindb = sdbbu.add_ids(maindb, meta, flag_g, tkeys, idkey,
+                                       first=(flag_g==1), close_pairs=(gname in pair_groups),
+                                       debug=False)
+            # Spectra
+            with ibs.stage(gname, 'hdf5_adddata', nrows=len(meta)):
+                new_groups[gname].hdf5_adddata(hdf, gname, meta, nproc=nproc)
+            with ibs.stage(gname, 'add_ssa', nrows=len(meta)):
+                new_groups[gname].add_ssa(hdf, gname)
+        ifp.write_fingerprint(hdf, gname, fprint)
+        finish_group(hdf, gname, journal)
 
     # Copy over all the old stuff
     redo_groups = []#'HD-LLS_DR1']
@@ -368,34 +483,38 @@ def ver03(test=False, skip_copy=False, publisher='J.X. Prochaska', clobber=False
             if key in ['catalog']+redo_groups+skip_groups:
                 continue
             print("Working on: {:s}".format(key))
-            grp = hdf.create_group(key)
-            # Meta
-            meta = Table(v02hdf[key+'/meta'].value)
-            meta.remove_column('IGM_ID')
             # Survey flag
             flag_g = sdbbu.add_to_group_dict(key, group_dict, skip_for_debug=True)
+            if chk_resume(hdf, key, journal):
+                maindb = replay_group(hdf, key, maindb, flag_g, tkeys, idkey, pair_groups)
+                continue
+            grp = hdf.create_group(key)
+            # Meta
+            meta = migrate.carry_meta(v02hdf, key, version)
             # IDs
-            maindb = sdbbu.add_ids(maindb, meta, flag_g, tkeys, idkey,
-                                   first=(flag_g==1), close_pairs=(key in pair_groups),
-                                   debug=False)
+            with ibs.stage(key, 'add_ids', nrows=len(meta)):
+                maindb = sdbbu.add_ids(maindb, meta, flag_g, tkeys, idkey,
+                                       first=(flag_g==1), close_pairs=(key in pair_groups),
+                                       debug=False)
             # Add meta to HDF5
-            #meta.rename_column('GRATING', 'DISPERSER')
-            hdf[key+'/meta'] = meta
-            for akey in v02hdf[key+'/meta'].attrs.keys():
-                hdf[key+'/meta'].attrs[akey] = v02hdf[key+'/meta'].attrs[akey]
+            migrate.write_meta(hdf, key, meta, src_hdf=v02hdf)
             # SSA info
-            old1[key].add_ssa(hdf, key)
+            with ibs.stage(key, 'add_ssa', nrows=len(meta)):
+                old1[key].add_ssa(hdf, key)
             # Copy spectra
-            v02hdf.copy(key+'/spec', hdf[key])
+            links.add_spec(v02hdf, hdf, key, mode=spec_link)
+            finish_group(hdf, key, journal)
 
 
     skip_myers = False
     if skip_myers:
         warnings.warn("NEED TO INCLUDE MYERS!")
-    else:
-        # Copy from v02
-        _ = hdf.create_group('quasars')
-        v02hdf.copy('quasars', hdf['quasars'])
+    elif not chk_resume(hdf, 'quasars', journal):
+        if not add_catalog_shard(hdf, version, shard_path):
+            # Copy from v02
+            _ = hdf.create_group('quasars')
+            v02hdf.copy('quasars', hdf['quasars'])
+        finish_group(hdf, 'quasars', journal)
         #myers.add_to_hdf(hdf)
 
     # Setup groups
@@ -457,13 +576,285 @@ def ver03(test=False, skip_copy=False, publisher='J.X. Prochaska', clobber=False
 
     # Finish
     zpri = v02hdf['catalog'].attrs['Z_PRIORITY']
-    sdbbu.write_hdf(hdf, str('igmspec'), maindb, zpri,
-                    group_dict, version, Publisher=str(publisher))
+    if 'catalog' in hdf.keys():  # Partial from a crashed build
+        del hdf['catalog']
+    with ibs.stage('catalog', 'write_hdf', nrows=len(maindb)) as rec:
+        sdbbu.write_hdf(hdf, str('igmspec'), maindb, zpri,
+                        group_dict, version, Publisher=str(publisher))
+        rec.bytes_written = maindb.as_array().nbytes
+    journal.remove()
 
     print("Wrote {:s} DB file".format(outfil))
     print("Update DB info in specdb.defs.dbase_info !!")
 
 
+def open_build(outfil, version, resume=False):
+    """ Open the DB file and its build journal
+
+    Parameters
+    ----------
+    outfil : str
+    version : str
+    resume : bool, optional
+      Reopen a partial DB file and continue from its journal
+
+    Returns
+    -------
+    hdf : h5py File
+    journal : BuildJournal
+    """
+    if resume:
+        if not os.path.isfile(outfil):
+            raise IOError("No partial DB file {:s} to resume".format(outfil))
+        print("Resuming the build of {:s}".format(outfil))
+        hdf = h5py.File(outfil,'a')
+    else:
+        hdf = h5py.File(outfil,'w')
+    journal = BuildJournal(outfil, version, resume=resume)
+    return hdf, journal
+
+
+def chk_resume(hdf, gname, journal, rows_ok=False):
+    """ Check the journal for a group before (re)building it
+    Partial output of the group from a crashed build is removed,
+    unless rows_ok is set and its committed rows are in the journal
+
+    Parameters
+    ----------
+    hdf : h5py File
+    gname : str
+    journal : BuildJournal
+    rows_ok : bool, optional
+      The group can resume from its committed rows
+
+    Returns
+    -------
+    done : bool
+      True if the group was completed by a previous build
+    """
+    if journal.is_done(gname):
+        print("Group {:s} was completed previously".format(gname))
+        return True
+    if gname in hdf.keys():
+        if rows_ok and (journal.rows_done(gname) > 0):
+            pass
+        else:
+            print("Removing partial output for {:s}".format(gname))
+            del hdf[gname]
+    return False
+
+
+def finish_group(hdf, gname, journal):
+    """ Flush the DB file and record the group as complete
+
+    Parameters
+    ----------
+    hdf : h5py File
+    gname : str
+    journal : BuildJournal
+    """
+    hdf.flush()
+    journal.complete_group(gname)
+    ibs.add_storage(hdf, gname)
+
+
+def replay_group(hdf, gname, maindb, flag_g, tkeys, idkey, pair_groups):
+    """ Regenerate the maindb entries of a group completed previously
+    Uses its meta in the partial DB file, without re-ingesting
+
+    Parameters
+    ----------
+    hdf : h5py File
+    gname : str
+    maindb : Table
+    flag_g : int
+    tkeys : list
+    idkey : str
+    pair_groups : list
+
+    Returns
+    -------
+    maindb : Table
+    """
+    meta = Table(hdf[gname+'/meta'][()])
+    meta.remove_column(idkey)
+    with ibs.stage(gname, 'add_ids', nrows=len(meta)):
+        maindb = sdbbu.add_ids(maindb, meta, flag_g, tkeys, idkey,
+                               first=(flag_g==1), close_pairs=(gname in pair_groups),
+                               debug=False)
+    return maindb
+
+
+def reuse_group(prev_hdf, hdf, gname, maindb, flag_g, tkeys, idkey, pair_groups,
+                spec_link='copy'):
+    """ Reuse the spectra and meta of an unchanged group from a previous DB file
+    The IDs are regenerated, as they depend on the groups added before
+
+    Parameters
+    ----------
+    prev_hdf : h5py File
+    hdf : h5py File
+    gname : str
+    maindb : Table
+    flag_g : int
+    tkeys : list
+    idkey : str
+    pair_groups : list
+    spec_link : str, optional
+      copy, external or virtual
+
+    Returns
+    -------
+    maindb : Table
+    """
+    print("Reusing {:s} from {:s}".format(gname, prev_hdf.filename))
+    if gname in hdf.keys():
+        del hdf[gname]
+    grp = hdf.create_group(gname)
+    # Copy spectra
+    links.add_spec(prev_hdf, hdf, gname, mode=spec_link)
+    # Meta and IDs
+    meta = Table(prev_hdf[gname+'/meta'][()])
+    colnames = meta.colnames
+    meta.remove_column(idkey)
+    with ibs.stage(gname, 'add_ids', nrows=len(meta)):
+        maindb = sdbbu.add_ids(maindb, meta, flag_g, tkeys, idkey,
+                               first=(flag_g==1), close_pairs=(gname in pair_groups),
+                               debug=False)
+    # add_ids appends the IDs;  restore the column order of the previous
+    # (or shard) meta table, i.e. that of a serial build
+    meta = meta[colnames]
+    hdf[gname+'/meta'] = meta
+    for akey in prev_hdf[gname+'/meta'].attrs.keys():
+        hdf[gname+'/meta'].attrs[akey] = prev_hdf[gname+'/meta'].attrs[akey]
+    return maindb
+
+
+def merge_shard(hdf, gname, version, shard_path, maindb, flag_g, tkeys, idkey, pair_groups,
+                spec_link='copy', fprint=None):
+    """ Add a group from its shard file (see shards.build_shard)
+    The placeholder IDs of the shard are regenerated
+
+    Parameters
+    ----------
+    hdf : h5py File
+    gname : str
+    version : str
+    shard_path : str
+    maindb : Table
+    flag_g : int
+    tkeys : list
+    idkey : str
+    pair_groups : list
+    spec_link : str, optional
+      copy, external or virtual
+    fprint : dict, optional
+      Fingerprint of the group inputs;  if provided, the shard must match it
+
+    Returns
+    -------
+    maindb : Table
+    """
+    shard_hdf = shards.open_shard(shard_path, version, gname)
+    if (fprint is not None) and (not ifp.chk_fingerprint(shard_hdf, gname, fprint)):
+        raise IOError("Shard for {:s} is out of date;  rebuild it".format(gname))
+    maindb = reuse_group(shard_hdf, hdf, gname, maindb, flag_g, tkeys, idkey, pair_groups,
+                         spec_link=spec_link)
+    # Timings of the ingestion into the shard
+    if (ibs.get_stats() is not None) and ('BUILD_STATS' in shard_hdf.attrs):
+        ibs.get_stats().add_group(gname, json.loads(shard_hdf.attrs['BUILD_STATS']))
+    shard_hdf.close()
+    return maindb
+
+
+def add_catalog_shard(hdf, version, shard_path):
+    """ Add the quasars catalog from its shard file (see shards.build_catalog)
+
+    Parameters
+    ----------
+    hdf : h5py File
+    version : str
+    shard_path : str or None
+
+    Returns
+    -------
+    bool
+      False if there is no catalog shard
+    """
+    if shard_path is None:
+        return False
+    if not os.path.isfile(shards.shard_file(shard_path, version, 'quasars')):
+        return False
+    shard_hdf = shards.open_shard(shard_path, version, 'quasars')
+    shard_hdf.copy('quasars', hdf)
+    shard_hdf.close()
+    return True
+
+
+def get_build_dag(version, shard_path, nproc=1, skip_groups=None, **kwargs):
+    """ DAG of the stages of a sharded build (see schedule.BuildDAG)
+
+    Stages:
+      catalog -- quasars catalog (shards.build_catalog)
+      meta:GROUP -- meta table of each new group (shards.build_meta);
+        groups whose meta uses a quasars catalog depend on catalog
+      spec:GROUP -- spectra of each new group (shards.build_shard)
+      merge -- ID assignment (add_ids in the canonical group order),
+        carried groups and write_hdf, i.e. ver02/ver03 with shard_path;
+        these share the DB file and run in sequence
+
+    Costs are the static ones of defs.get_build_costs() (roughly the
+    number of spectra), with 1 for each meta stage;  no raw file is read
+
+    Parameters
+    ----------
+    version : str
+    shard_path : str
+    nproc : int, optional
+      Processes for reading the raw spectra of each group
+    skip_groups : list, optional
+      New groups that are not ingested, e.g. BOSS_DR14 for v03.1
+    **kwargs
+      Passed to ver02/ver03
+
+    Returns
+    -------
+    dag : BuildDAG
+    """
+    from igmspec import schedule
+    if version[0:3] == 'v02':
+        merge = ver02
+    elif version[0:3] == 'v03':
+        merge = ver03
+    else:
+        raise IOError("Not ready for this version")
+    if skip_groups is None:
+        skip_groups = []
+    # Groups whose grab_meta reads a quasars catalog
+    catalog_groups = list(idefs.get_catalog_dbs().keys())
+    if not os.path.isdir(shard_path):
+        os.makedirs(shard_path)
+
+    costs = idefs.get_build_costs()
+    dag = schedule.BuildDAG()
+    dag.add('catalog', shards.build_catalog, args=(version, shard_path), cost=costs['quasars'])
+    groups = get_build_groups(version)
+    spec_stages = []
+    for gname, module in groups.items():
+        if gname in skip_groups:
+            continue
+        deps = ['catalog'] if gname in catalog_groups else []
+        dag.add('meta:'+gname, shards.build_meta, args=(version, gname, shard_path),
+                deps=deps, cost=1.)
+        dag.add('spec:'+gname, shards.build_shard, args=(version, gname, shard_path),
+                kwargs=dict(nproc=nproc), deps=['meta:'+gname], cost=costs.get(gname, 1.),
+                ncore=nproc)
+        spec_stages.append('spec:'+gname)
+    kwargs.update(dict(version=version, shard_path=shard_path, nproc=nproc))
+    dag.add('merge', merge, kwargs=kwargs, deps=['catalog']+spec_stages, cost=1., inline=True)
+    return dag
+
+
 def chk_clobber(outfil, clobber=False):
     """ Simple clobber check
     outfil : str
@@ -512,7 +903,7 @@ def get_build_groups(version):
         groups['MUSoDLA'] = musodla       # Jorgensen et al. 2013
         groups['UVES_Dall'] = uves_dall   # Dall'Aglio et al. 2008
         groups['UVpSM4'] = hst_c          # Cooksey et al. 2010, 2011
-    elif version == 'v03':
+    elif version[0:3] == 'v03':
         groups['BOSS_DR14'] = boss_dr14   # Paris et al. 2018
         groups['ESI_z6'] = esi_z6         # Eiler et al. 2018
         groups['KODIAQ_DR2'] = kodiaq_two
@@ -0,0 +1,492 @@
+""" Module for the performance report of a DB build
+
+The stages of each group are timed (wall and CPU) with their number
+of rows and bytes:
+  grab_meta, add_ids, add_ssa -- as called by the build
+  hdf5_adddata -- the whole ingestion of the spectra, split into:
+    locate -- from the start to the first read, i.e. the parsing of
+      the meta, globbing for files, opening tarballs
+    read -- time the writer waited on iiu.map_spectra;  its CPU and
+      bytes are those of the reader function (in any worker)
+    pack -- filling the rows of the writer with the spectra
+    write -- flushing the rows to the HDF5 datasets (gzip)
+  write_hdf -- the catalog of the DB (under 'catalog')
+The compression ratio of the spectra of each group is measured from
+its datasets once the group is complete.
+
+Statistics are only collected between start() and stop();  the ingest
+code checks get_stats() and does nothing more otherwise.
+"""
+from __future__ import print_function, absolute_import, division, unicode_literals
+
+import os
+import time
+import json
+import datetime
+from contextlib import contextmanager
+from collections import OrderedDict
+import pdb
+
+import h5py
+
+from astropy.table import Table
+
+try:  # Python 3.3+
+    process_time = time.process_time
+except AttributeError:
+    process_time = time.clock
+# CPU time of the calling thread (Python 3.7+);  of the process before
+thread_time = getattr(time, 'thread_time', process_time)
+
+# Order of the stages in the report
+STAGES = ['grab_meta', 'add_ids', 'hdf5_adddata', 'locate', 'read', 'pack', 'write',
+          'add_ssa', 'write_hdf']
+
+# Collecting statistics
+_stats = None
+
+
+class StageRecord(object):
+    """ Totals for one stage of a group
+
+    Attributes
+    ----------
+    wall : float
+      Seconds
+    cpu : float
+      CPU seconds
+    ncall : int
+    nrows : int
+    bytes_read : int
+    bytes_written : int
+      Uncompressed bytes handed to HDF5
+    """
+    keys = ['wall', 'cpu', 'ncall', 'nrows', 'bytes_read', 'bytes_written']
+
+    def __init__(self):
+        self.wall = 0.
+        self.cpu = 0.
+        self.ncall = 0
+        self.nrows = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+
+    @property
+    def rows_per_s(self):
+        if self.wall <= 0.:
+            return None
+        return self.nrows / self.wall
+
+    def add(self, sdict):
+        """ Add the totals of another record (e.g. from to_dict)
+
+        Parameters
+        ----------
+        sdict : dict
+        """
+        for key in self.keys:
+            setattr(self, key, getattr(self, key) + sdict[key])
+
+    def to_dict(self):
+        sdict = OrderedDict([(key, getattr(self, key)) for key in self.keys])
+        sdict['rows_per_s'] = self.rows_per_s
+        return sdict
+
+    def __repr__(self):
+        return ('<StageRecord: wall={:.2f}s cpu={:.2f}s nrows={:d} read={:d}B '
+                'written={:d}B>'.format(self.wall, self.cpu, self.nrows,
+                                         self.bytes_read, self.bytes_written))
+
+
+class TimedReader(object):
+    """ Wrap a reader of iiu.map_spectra to return its CPU time and the
+    size of the files it was given, i.e. (output, cpu, nbytes)
+
+    Picklable as long as the reader is (i.e. module-level)
+
+    Parameters
+    ----------
+    reader : function
+    """
+    def __init__(self, reader):
+        self.reader = reader
+
+    def __call__(self, *args):
+        cpu0 = thread_time()
+        out = self.reader(*args)
+        cpu = thread_time() - cpu0
+        nbytes = 0
+        for arg in args:
+            if isinstance(arg, (str, bytes, type(''))) and os.path.isfile(arg):
+                nbytes += os.path.getsize(arg)
+        return out, cpu, nbytes
+
+
+class BuildStats(object):
+    """ Statistics of the stages of a build, by group
+    """
+    def __init__(self):
+        self.groups = OrderedDict()
+        self.start_time = datetime.datetime.now().isoformat()
+        self.wall0 = time.time()
+        # Group in hdf5_adddata
+        self.group = None
+        self._located = False
+        self._wall0 = 0.
+        self._cpu0 = 0.
+        # Running totals of the write phase (excluded from pack)
+        self.write_wall = 0.
+        self.write_cpu = 0.
+
+    def record(self, gname, name):
+        """ Record of a stage, created as needed
+
+        Parameters
+        ----------
+        gname : str
+        name : str
+
+        Returns
+        -------
+        rec : StageRecord
+        """
+        gdict = self.groups.setdefault(gname, OrderedDict(stages=OrderedDict()))
+        return gdict['stages'].setdefault(name, StageRecord())
+
+    @contextmanager
+    def stage(self, gname, name, nrows=0):
+        """ Time a stage of a group
+
+        Parameters
+        ----------
+        gname : str
+        name : str
+        nrows : int, optional
+          May also be set on the record yielded
+
+        Yields
+        ------
+        rec : StageRecord
+          A record for this call only, added to the totals at the end
+        """
+        rec = StageRecord()
+        rec.nrows = nrows
+        if name == 'hdf5_adddata':
+            prev = (self.group, self._located, self._wall0, self._cpu0)
+            self.group = gname
+            self._located = False
+            self._wall0 = time.time()
+            self._cpu0 = thread_time()
+        wall0 = time.time()
+        cpu0 = process_time()
+        try:
+            yield rec
+        finally:
+            rec.wall = time.time() - wall0
+            rec.cpu = process_time() - cpu0
+            rec.ncall = 1
+            self.record(gname, name).add(rec.to_dict())
+            if name == 'hdf5_adddata':
+                self.group, self._located, self._wall0, self._cpu0 = prev
+
+    def locate(self):
+        """ End of the locate phase of the group in hdf5_adddata, i.e.
+        its first read;  later calls do nothing
+        """
+        if (self.group is None) or self._located:
+            return
+        self._located = True
+        rec = self.record(self.group, 'locate')
+        rec.wall += time.time() - self._wall0
+        rec.cpu += thread_time() - self._cpu0
+        rec.ncall += 1
+
+    def timed_reads(self, results):
+        """ Tally the read and pack phases of the outputs of a TimedReader
+
+        Parameters
+        ----------
+        results : generator
+          Of (output, cpu, nbytes)
+
+        Returns
+        -------
+        generator of reader outputs
+        """
+        self.locate()
+        read = self.record(self.group, 'read')
+        pack = self.record(self.group, 'pack')
+        read.ncall += 1
+        pack.ncall += 1
+        try:
+            while True:
+                wall0 = time.time()
+                try:
+                    out, cpu, nbytes = next(results)
+                except StopIteration:
+                    return
+                wall1 = time.time()
+                read.wall += wall1 - wall0
+                read.cpu += cpu
+                read.bytes_read += nbytes
+                read.nrows += 1
+                # The caller packs (and may flush) until it asks for the next one
+                write_wall, write_cpu = self.write_wall, self.write_cpu
+                cpu1 = thread_time()
+                yield out
+                pack.wall += time.time() - wall1 - (self.write_wall - write_wall)
+                pack.cpu += thread_time() - cpu1 - (self.write_cpu - write_cpu)
+                pack.nrows += 1
+        finally:
+            results.close()
+
+    def add_write(self, wall, cpu, nrows, nbytes):
+        """ Tally a flush of the spectra of the group in hdf5_adddata
+
+        Parameters
+        ----------
+        wall : float
+        cpu : float
+        nrows : int
+        nbytes : int
+          Uncompressed
+        """
+        self.write_wall += wall
+        self.write_cpu += cpu
+        if self.group is None:
+            return
+        rec = self.record(self.group, 'write')
+        rec.wall += wall
+        rec.cpu += cpu
+        rec.ncall += 1
+        rec.nrows += int(nrows)
+        rec.bytes_written += int(nbytes)
+
+    def add_storage(self, grp):
+        """ Record the size and compression of the spectra of a group
+
+        Parameters
+        ----------
+        grp : h5py Group
+        """
+        nbytes, stored = spec_storage(grp)
+        if stored == 0:  # No spectra, or only links to them
+            return
+        gname = grp.name.split('/')[-1]
+        gdict = self.groups.setdefault(gname, OrderedDict(stages=OrderedDict()))
+        gdict['spec_bytes'] = nbytes
+        gdict['stored_bytes'] = stored
+        gdict['compression'] = nbytes / stored
+
+    def add_group(self, gname, gdict):
+        """ Add the statistics of a group from another build
+        (e.g. a shard;  see group_dict)
+
+        Parameters
+        ----------
+        gname : str
+        gdict : dict
+        """
+        for name, sdict in gdict['stages'].items():
+            self.record(gname, name).add(sdict)
+        for key in ['spec_bytes', 'stored_bytes', 'compression']:
+            if key in gdict:
+                self.groups.setdefault(gname, OrderedDict(stages=OrderedDict()))[key] = gdict[key]
+
+    def group_dict(self, gname):
+        """ Statistics of one group
+
+        Parameters
+        ----------
+        gname : str
+
+        Returns
+        -------
+        gdict : dict
+          JSON-able
+        """
+        gdict = OrderedDict()
+        stages = self.groups[gname]['stages']
+        gdict['stages'] = OrderedDict([(name, stages[name].to_dict())
+                                       for name in sorted(stages, key=_stage_order)])
+        for key in ['spec_bytes', 'stored_bytes', 'compression']:
+            if key in self.groups[gname]:
+                gdict[key] = self.groups[gname][key]
+        return gdict
+
+    def to_dict(self):
+        """ The report
+
+        Returns
+        -------
+        rdict : dict
+          JSON-able
+        """
+        rdict = OrderedDict()
+        rdict['start'] = self.start_time
+        rdict['wall'] = time.time() - self.wall0
+        rdict['groups'] = OrderedDict([(gname, self.group_dict(gname))
+                                       for gname in self.groups])
+        return rdict
+
+    def write(self, outfile):
+        """ Write the report as JSON
+
+        Parameters
+        ----------
+        outfile : str
+        """
+        with open(outfile, 'w') as f:
+            json.dump(self.to_dict(), f, indent=1)
+        print("Wrote build report {:s}".format(outfile))
+
+    def summary_table(self):
+        """ One row per stage of each group
+
+        Returns
+        -------
+        tbl : Table
+        """
+        rows = []
+        for gname in self.groups:
+            gdict = self.group_dict(gname)
+            for name, sdict in gdict['stages'].items():
+                rows.append((gname, name, sdict['wall'], sdict['cpu'], sdict['nrows'],
+                             sdict['rows_per_s'] or 0., sdict['bytes_read']/2.**20,
+                             sdict['bytes_written']/2.**20, gdict.get('compression') or 0.))
+        names = ('GROUP', 'STAGE', 'WALL', 'CPU', 'NROWS', 'ROWS_PER_S', 'MB_READ',
+                 'MB_WRITTEN', 'COMPRESSION')
+        if len(rows) == 0:
+            return Table(names=names, dtype=('U1', 'U1', float, float, int, float, float,
+                                             float, float))
+        tbl = Table(rows=rows, names=names)
+        for key in ['WALL', 'CPU', 'ROWS_PER_S', 'MB_READ', 'MB_WRITTEN']:
+            tbl[key].format = '.1f'
+        tbl['COMPRESSION'].format = '.2f'
+        return tbl
+
+    def print_summary(self):
+        """ Print the summary table and the total time
+        """
+        print("Build report:")
+        self.summary_table().pprint(max_lines=-1, max_width=-1)
+        print("Total wall time = {:.1f}s".format(time.time() - self.wall0))
+
+
+def _stage_order(name):
+    if name in STAGES:
+        return (STAGES.index(name), name)
+    return (len(STAGES), name)
+
+
+def spec_storage(grp):
+    """ Uncompressed and stored bytes of the spectra of a group,
+    i.e. its spec dataset or ragged datasets (see igmspec.ragged).
+    Datasets in other files (external links) are not counted
+
+    Parameters
+    ----------
+    grp : h5py Group
+
+    Returns
+    -------
+    nbytes : int
+    stored : int
+    """
+    sizes = [0, 0]
+
+    def visit(name, obj):
+        if isinstance(obj, h5py.Dataset) and ((name == 'spec') or name.startswith('ragged/')):
+            stored = obj.id.get_storage_size()
+            if stored > 0:  # Not virtual
+                sizes[0] += int(obj.size) * obj.dtype.itemsize
+                sizes[1] += int(stored)
+    grp.visititems(visit)
+    return sizes[0], sizes[1]
+
+
+def start():
+    """ Collect the statistics of the stages run from now on
+
+    Returns
+    -------
+    stats : BuildStats
+    """
+    global _stats
+    _stats = BuildStats()
+    return _stats
+
+
+def stop():
+    """ Stop collecting
+
+    Returns
+    -------
+    stats : BuildStats or None
+    """
+    global _stats
+    stats, _stats = _stats, None
+    return stats
+
+
+def get_stats():
+    """ Statistics being collected, if any
+
+    Returns
+    -------
+    stats : BuildStats or None
+    """
+    return _stats
+
+
+@contextmanager
+def collect():
+    """ Collect the statistics of a block apart from any others, e.g.
+    for the shard of a group
+
+    Yields
+    ------
+    stats : BuildStats
+    """
+    global _stats
+    prev = _stats
+    _stats = BuildStats()
+    try:
+        yield _stats
+    finally:
+        _stats = prev
+
+
+@contextmanager
+def stage(gname, name, nrows=0):
+    """ Time a stage of a group, if statistics are being collected
+    (see BuildStats.stage)
+
+    Parameters
+    ----------
+    gname : str
+    name : str
+    nrows : int, optional
+
+    Yields
+    ------
+    rec : StageRecord
+    """
+    if _stats is None:
+        yield StageRecord()
+    else:
+        with _stats.stage(gname, name, nrows=nrows) as rec:
+            yield rec
+
+
+def add_storage(hdf, gname):
+    """ Record the compression of the spectra of a group, if statistics
+    are being collected
+
+    Parameters
+    ----------
+    hdf : h5py File
+    gname : str
+    """
+    if (_stats is not None) and (gname in hdf.keys()):
+        _stats.add_storage(hdf[gname])
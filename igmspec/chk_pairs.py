@@ -1,16 +1,22 @@
 """ Module to check for pairs in igmspec
+
+All pairs closer than pair_sep are found in one pass and joined into
+friends-of-friends groups;  the rules for known good pairs are applied
+to the groups as array filters and the result is a report table.
 """
 from __future__ import print_function, absolute_import, division, unicode_literals
 
 import numpy as np
 import pdb
 
-from specdb.specdb import IgmSpec
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
 
 from astropy import units as u
-from astropy.coordinates import match_coordinates_sky, SkyCoord
 from astropy.table import Table
 
+from igmspec import xmatch
+
 def skip_gd_pair():
     """ Currently up-to-date with v02
     Returns
@@ -66,75 +72,165 @@ def skip_gd_pair():
 
 
 def chk_for_pairs(maindb, pair_sep=10*u.arcsec):
-    """ Generate new IGM_IDs for an input DB
+    """ Find the sources with a neighbor within pair_sep
 
     Parameters
     ----------
     maindb : Table
+    pair_sep : Quantity, optional
 
     Return
     ------
-    result : bool
-      * True = pass
-      * False = fail
+    cand_pairs : ndarray
+      Indices of the sources
     """
-    c_main = SkyCoord(ra=maindb['RA'], dec=maindb['DEC'], unit='deg')
+    tree = xmatch.SkyTree(maindb['RA'], maindb['DEC'])
     # Find candidate dups
-    idx, d2d, d3d = match_coordinates_sky(c_main, c_main, nthneighbor=2)
-    cand_pairs = np.where(d2d < pair_sep)[0]
+    idx, d2d = tree.nearest(tree.ra, tree.dec, nth=2)
+    cand_pairs = np.where(d2d < pair_sep.to('deg').value)[0]
     # Finish
     print("There are {:d} potential pairs with separation theta<{:g}".format(len(cand_pairs)//2,pair_sep))
     return cand_pairs
 
 
-def chk_v02(pair_sep=10*u.arcsec):
+def find_groups(ra, dec, pair_sep=10*u.arcsec):
+    """ Friends-of-friends groups of sources linked by pairs closer than pair_sep
+
+    Parameters
+    ----------
+    ra : ndarray
+    dec : ndarray
+    pair_sep : Quantity, optional
+
+    Returns
+    -------
+    group : ndarray (int)
+      Group of each source, numbered in order of their first member;
+      -1 for isolated sources
+    """
+    nsrc = len(ra)
+    idx1, idx2, _ = xmatch.self_match(ra, dec, pair_sep)
+    graph = coo_matrix((np.ones(len(idx1)), (idx1, idx2)), shape=(nsrc, nsrc))
+    _, labels = connected_components(graph, directed=False)
+    in_group = np.bincount(labels)[labels] > 1
+    group = np.full(nsrc, -1, dtype=int)
+    # Components are labeled in order of their first member
+    _, group[in_group] = np.unique(labels[in_group], return_inverse=True)
+    return group
+
+
+def pair_report(cat, pair_sep=10*u.arcsec, zem_tol=0.1, stbl=None):
+    """ Report on the groups of close sources in a catalog
+
+    Each group gets a STATUS, by the first rule that applies:
+      * zem -- pair with zem differing by more than zem_tol
+      * BOSS -- pair of two BOSS sources
+      * skip -- in the table of good pairs
+      * XQ-100 -- second member from XQ-100 (bad coords, matched);
+        to be inspected too
+      * check -- none of the above;  to be inspected
+
+    Parameters
+    ----------
+    cat : Table
+      Requires RA, DEC, zem and flag_survey
+    pair_sep : Quantity, optional
+    zem_tol : float, optional
+    stbl : Table, optional
+      Good pairs;  defaults to skip_gd_pair()
+
+    Returns
+    -------
+    report : Table
+      One row per member of a group, sorted by GROUP
+    """
+    if stbl is None:
+        stbl = skip_gd_pair()
+    ra = np.asarray(cat['RA'], dtype=float)
+    dec = np.asarray(cat['DEC'], dtype=float)
+    zem = np.asarray(cat['zem'], dtype=float)
+    flag_survey = np.asarray(cat['flag_survey'])
+    group = find_groups(ra, dec, pair_sep=pair_sep)
+    # Members, by group
+    members = np.where(group >= 0)[0]
+    members = members[np.argsort(group[members], kind='mergesort')]
+    gid = group[members]
+    starts = np.where(np.diff(np.concatenate([[-1], gid])) != 0)[0]
+    nmember = np.diff(np.concatenate([starts, [len(members)]]))
+    first = members[starts]
+    second = members[np.minimum(starts+1, len(members)-1)]
+    # Rules
+    is_pair = nmember == 2
+    bad_zem = is_pair & (np.abs(zem[first]-zem[second]) > zem_tol)
+    both_boss = is_pair & (flag_survey[first] == 1.) & (flag_survey[second] == 1.)
+    sra = np.sort(np.asarray(stbl['RA'], dtype=float))
+    iss = np.clip(np.searchsorted(sra, ra[first]), 1, len(sra)-1)
+    in_skip = np.minimum(np.abs(ra[first]-sra[iss-1]), np.abs(ra[first]-sra[iss])) < 1e-4
+    xq100 = flag_survey[second] == 64.
+    status = np.select([bad_zem, both_boss, in_skip, xq100],
+                       ['zem', 'BOSS', 'skip', 'XQ-100'], default='check')
+    # Report
+    report = Table()
+    report['GROUP'] = gid
+    report['NMEMBER'] = np.repeat(nmember, nmember)
+    report['INDEX'] = members
+    for key in ['RA', 'DEC', 'IGM_ID', 'zem', 'flag_survey']:
+        if key in cat.keys():
+            report[key] = cat[key][members]
+    ifirst = np.repeat(first, nmember)
+    report['SEP'] = xmatch.separation(ra[ifirst], dec[ifirst], ra[members], dec[members]) * 3600.
+    report['SEP'].unit = u.arcsec
+    report['STATUS'] = np.repeat(status, nmember)
+    return report
+
+
+def chk_catalog(cat, pair_sep=10*u.arcsec, outfile=None):
+    """ Check a catalog for pairs
+
+    Parameters
+    ----------
+    cat : Table
+    pair_sep : Quantity, optional
+    outfile : str, optional
+      Write the report to this file
+
+    Returns
+    -------
+    report : Table
+    """
+    report = pair_report(cat, pair_sep=pair_sep)
+    ngroup = len(np.unique(report['GROUP']))
+    print("There are {:d} groups of sources with separation theta<{:g}".format(ngroup, pair_sep))
+    for status in ['zem', 'BOSS', 'skip', 'XQ-100', 'check']:
+        ns = len(np.unique(report['GROUP'][report['STATUS'] == status]))
+        print("  {:s}: {:d}".format(status, ns))
+    # XQ-100 coordinates were matched by hand;  show them as well
+    xq100 = report['STATUS'] == 'XQ-100'
+    if np.any(xq100):
+        print("XQ-100 groups:")
+        print(report[xq100])
+    chk = report['STATUS'] == 'check'
+    if np.any(chk):
+        print(report[chk])
+    else:
+        print("All clear..")
+    if outfile is not None:
+        report.write(outfile, overwrite=True)
+        print("Wrote {:s}".format(outfile))
+    return report
+
+
+def chk_v02(pair_sep=10*u.arcsec, outfile=None):
     """ Check v02 for pairs
     
     Returns
     -------
-
+    report : Table
     """
+    from specdb.specdb import IgmSpec
     print("checking..")
     igmsp = IgmSpec()
-    # Grab candidate pairs
-    cpairs = chk_for_pairs(igmsp.qcat.cat, pair_sep=pair_sep)
-    # Coords
-    c_main = SkyCoord(ra=igmsp.qcat.cat['RA'], dec=igmsp.qcat.cat['DEC'], unit='deg')
-    # Skip
-    stbl = skip_gd_pair()
-
-    # Loop
-    flg_cp = np.array([False]*len(igmsp.qcat.cat))
-    for qq, cpair in enumerate(cpairs):
-        # Skip those already done
-        if flg_cp[cpair]:
-            continue
-        # Find the matches
-        sep = c_main[cpair].separation(c_main)
-        pairs = sep < pair_sep
-        flg_cp[pairs] = True
-        # Skip pairs with very different zem
-        if np.sum(pairs) == 2:
-            zem = igmsp.qcat.cat['zem'][pairs]
-            if np.abs(zem[0]-zem[1]) > 0.1:
-                continue
-            # Both BOSS?
-            if (igmsp.qcat.cat['flag_survey'][pairs][0] == 1.) & (
-                igmsp.qcat.cat['flag_survey'][pairs][1] == 1.):
-                continue
-        # Skip table?
-        if np.min(np.abs(igmsp.qcat.cat['RA'][pairs][0]-stbl['RA'])) < 1e-4:
-            continue
-        # XQ-100? -- These have bad coords but have been matched
-        if igmsp.qcat.cat['flag_survey'][pairs][1] == 64.:
-            pdb.set_trace()
-        # Print
-        print('qq = {:d}'.format(qq))
-        print(igmsp.qcat.cat[['RA','DEC','IGM_ID','zem','flag_survey']][pairs])
-        print(sep.to('arcsec')[pairs])
-        pdb.set_trace()
-    # All clear?
-    print("All clear..")
+    return chk_catalog(igmsp.qcat.cat, pair_sep=pair_sep, outfile=outfile)
 
 
 # Command line execution
@@ -0,0 +1,20 @@
+# Fixtures shared by the tests of igmspec and igmspec.ingest
+
+import numpy as np
+import pytest
+
+
+@pytest.fixture
+def template():
+    """ Function returning a one-row spectrum template, laid out as
+    by specdb.build.utils.init_data
+    """
+    def mk_template(max_npix, include_co=True):
+        dtypes = [(str('wave'), 'float64', (max_npix)),
+                  (str('flux'), 'float32', (max_npix)),
+                  (str('sig'),  'float32', (max_npix)),
+                  ]
+        if include_co:
+            dtypes.append((str('co'), 'float32', (max_npix)))
+        return np.zeros((1, ), dtype=dtypes)
+    return mk_template
@@ -86,3 +86,128 @@ def get_ssa_dict():
     survey_dict['UVpSM4'] = 2**15    # Cooksey et al. 2010, 2011
     #
     return survey_dict
+
+
+def get_raw_dirs():
+    """ Raw data of each group, relative to $RAW_IGMSPEC
+    Used to fingerprint the inputs of a group
+
+    Returns
+    -------
+    raw_dict : OrderedDict
+      Keyed by group name;  each a list of directories (or files)
+
+    """
+    raw_dict = OrderedDict()
+    raw_dict['BOSS_DR12'] = ['BOSS']
+    raw_dict['SDSS_DR7'] = ['SDSS']
+    raw_dict['KODIAQ_DR1'] = ['KODIAQ_data_20160618']
+    raw_dict['HD-LLS_DR1'] = ['HD-LLS_DR1']
+    raw_dict['GGG'] = ['GGG']
+    raw_dict['HST_z2'] = ['HST_z2']
+    raw_dict['XQ-100'] = ['XQ-100']
+    raw_dict['HDLA100'] = ['HDLA100']
+    raw_dict['2QZ'] = ['2QZ']
+    raw_dict['ESI_DLA'] = ['HighzESIDLA']
+    raw_dict['COS-Halos'] = ['COS-Halos']
+    raw_dict['COS-Dwarfs'] = ['COS-Dwarfs']
+    raw_dict['HSTQSO'] = ['HSTQSO']
+    raw_dict['MUSoDLA'] = ['MUSoDLA']
+    raw_dict['UVES_Dall'] = ['UVES_Dall']
+    raw_dict['UVpSM4'] = ['HST_Cooksey']
+    raw_dict['BOSS_DR14'] = ['BOSS_DR14']
+    raw_dict['ESI_z6'] = ['ESI_z6']
+    raw_dict['KODIAQ_DR2'] = ['KODIAQ2']
+    raw_dict['quasars'] = ['Myers', 'SDSS_BOSS']
+    #
+    return raw_dict
+
+
+def get_build_costs():
+    """ Static cost of building each group, for ordering the work
+    Roughly its number of spectra;  rows/100 for the quasars catalog
+
+    Returns
+    -------
+    cost_dict : dict
+      Keyed by group name
+
+    """
+    cost_dict = {}
+    cost_dict['BOSS_DR12'] = 300000
+    cost_dict['SDSS_DR7'] = 100000
+    cost_dict['KODIAQ_DR1'] = 250
+    cost_dict['HD-LLS_DR1'] = 200
+    cost_dict['GGG'] = 330
+    cost_dict['HST_z2'] = 60
+    cost_dict['XQ-100'] = 300
+    cost_dict['HDLA100'] = 100
+    cost_dict['2QZ'] = 30000
+    cost_dict['ESI_DLA'] = 70
+    cost_dict['COS-Halos'] = 70
+    cost_dict['COS-Dwarfs'] = 45
+    cost_dict['HSTQSO'] = 600
+    cost_dict['MUSoDLA'] = 150
+    cost_dict['UVES_Dall'] = 40
+    cost_dict['UVpSM4'] = 400
+    cost_dict['BOSS_DR14'] = 500000
+    cost_dict['ESI_z6'] = 40
+    cost_dict['KODIAQ_DR2'] = 300
+    cost_dict['quasars'] = 5000
+    #
+    return cost_dict
+
+
+def get_pkg_meta_files():
+    """ Meta files of each group shipped in igmspec/data/meta
+
+    Returns
+    -------
+    pkg_dict : dict
+      Keyed by group name;  each a list of files
+
+    """
+    pkg_dict = {}
+    pkg_dict['KODIAQ_DR1'] = ['KODIAQ_DR1_summary.ascii']
+    pkg_dict['HD-LLS_DR1'] = ['HD-LLS_DR1_MIKE.ascii']
+    #
+    return pkg_dict
+
+
+def get_pkg_files():
+    """ Package files read by the ingest of each group, relative to igmspec/
+    Used to fingerprint the inputs of a group;  glob patterns are allowed
+
+    Returns
+    -------
+    pkg_dict : dict
+      Keyed by group name;  each a list of files
+
+    """
+    pkg_dict = {}
+    for gname, mfiles in get_pkg_meta_files().items():
+        pkg_dict[gname] = ['data/meta/'+mfile for mfile in mfiles]
+    pkg_dict['BOSS_DR14'] = ['ingest/files/bad_dr14.fits',
+                             'ingest/files/bossdr14_plate*_matched.ascii']
+    #
+    return pkg_dict
+
+
+def get_catalog_dbs():
+    """ Quasars catalog read by the grab_meta of each group, if any
+
+    Returns
+    -------
+    cat_dict : dict
+      Keyed by group name;  the IGMspec DB file read (relative to $SPECDB),
+      'latest' for the latest one in $SPECDB or 'build' for the catalog
+      of the DB being built
+
+    """
+    cat_dict = {}
+    cat_dict['SDSS_DR7'] = 'build'
+    cat_dict['XQ-100'] = 'latest'
+    cat_dict['COS-Halos'] = 'IGMspec_DB_v01.hdf5'
+    cat_dict['UVES_Dall'] = 'latest'
+    #
+    return cat_dict
@@ -0,0 +1,308 @@
+""" Module to fingerprint the inputs of each group in a DB build
+Used to decide which groups may be reused from a previous DB file
+"""
+from __future__ import print_function, absolute_import, division, unicode_literals
+
+import os
+import ast
+import glob
+import json
+import hashlib
+import inspect
+import pdb
+
+import igmspec
+from igmspec import defs
+from igmspec.ingest import utils as iiu
+
+
+def scan_files(path):
+    """ Recursively list the files under path with their size and mtime
+
+    Parameters
+    ----------
+    path : str
+      Directory or file
+
+    Returns
+    -------
+    stats : list of tuple
+      (relative path, size, mtime in ns), sorted by path
+    """
+    if os.path.isfile(path):
+        stat = os.stat(path)
+        return [(os.path.basename(path), stat.st_size, iiu.mtime_ns(stat))]
+    stats = []
+    todo = [path]
+    while len(todo) > 0:
+        for entry in iiu.scandir(todo.pop()):
+            if entry.is_dir():
+                todo.append(entry.path)
+            elif entry.is_file():
+                stat = entry.stat()
+                stats.append((os.path.relpath(entry.path, path), stat.st_size,
+                              iiu.mtime_ns(stat)))
+    stats.sort()
+    return stats
+
+
+def hash_file(filename):
+    """ md5 of the contents of a file
+
+    Parameters
+    ----------
+    filename : str
+
+    Returns
+    -------
+    str
+    """
+    md5 = hashlib.md5()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(2**20), b''):
+            md5.update(block)
+    return md5.hexdigest()
+
+
+def _module_file(name):
+    """ Source file of an igmspec module (or package)
+
+    Parameters
+    ----------
+    name : str
+      e.g. igmspec.ingest.utils
+
+    Returns
+    -------
+    sfile : str or None
+      None if name is not a module, e.g. a class or function
+    """
+    base = os.path.join(igmspec.__path__[0], *name.split('.')[1:])
+    for sfile in [base+'.py', os.path.join(base, '__init__.py')]:
+        if os.path.isfile(sfile):
+            return sfile
+    return None
+
+
+def module_files(module):
+    """ Source files of a module and of all the igmspec modules it
+    imports, recursively (including the imports within functions)
+
+    Parameters
+    ----------
+    module : module
+
+    Returns
+    -------
+    sfiles : list
+      Sorted
+    """
+    sfiles = set()
+    todo = [os.path.abspath(inspect.getsourcefile(module))]
+    while len(todo) > 0:
+        sfile = todo.pop()
+        if sfile in sfiles:
+            continue
+        sfiles.add(sfile)
+        with open(sfile, 'rb') as f:
+            tree = ast.parse(f.read(), filename=sfile)
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                names = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and (node.level == 0) and (node.module is not None):
+                # Submodules, e.g. from igmspec.ingest import utils, or the module itself
+                names = [node.module+'.'+alias.name for alias in node.names] + [node.module]
+            else:
+                continue
+            for name in names:
+                if name.split('.')[0] != 'igmspec':
+                    continue
+                dfile = _module_file(name)
+                if dfile is not None:
+                    todo.append(dfile)
+    return sorted(sfiles)
+
+
+def code_hash(module):
+    """ md5 of the source of a module and of the igmspec modules it uses
+    (see module_files)
+
+    Parameters
+    ----------
+    module : module
+
+    Returns
+    -------
+    str
+    """
+    md5 = hashlib.md5()
+    for sfile in module_files(module):
+        md5.update('{:s} {:s}\n'.format(os.path.relpath(sfile, igmspec.__path__[0]),
+                                         hash_file(sfile)).encode('utf-8'))
+    return md5.hexdigest()
+
+
+def pkg_files(gname):
+    """ Package files read by the ingest of a group (see defs.get_pkg_files)
+
+    Parameters
+    ----------
+    gname : str
+
+    Returns
+    -------
+    pfiles : list
+      Full paths, sorted
+    """
+    pfiles = []
+    for pattern in defs.get_pkg_files().get(gname, []):
+        pfiles += glob.glob(os.path.join(igmspec.__path__[0], pattern))
+    return sorted(pfiles)
+
+
+def catalog_files(gname, raw_path=None):
+    """ Files behind the quasars catalog read by the grab_meta of a group
+    (see defs.get_catalog_dbs)
+
+    Parameters
+    ----------
+    gname : str
+    raw_path : str, optional
+      Defaults to $RAW_IGMSPEC
+
+    Returns
+    -------
+    cfiles : list
+      Full paths;  empty if the group reads no catalog
+    """
+    from igmspec.ingest import quasars
+    db_file = defs.get_catalog_dbs().get(gname)
+    if db_file is None:
+        return []
+    elif db_file == 'latest':
+        return [quasars.default_db_file()]
+    elif db_file == 'build':
+        # Catalog of the DB being built, from the raw data of the quasars
+        if raw_path is None:
+            raw_path = os.getenv('RAW_IGMSPEC')
+        return [os.path.join(raw_path, raw_dir) for raw_dir in defs.get_raw_dirs()['quasars']]
+    else:
+        return [os.path.join(os.getenv('SPECDB'), db_file)]
+
+
+def group_fingerprint(gname, module, raw_path=None):
+    """ Fingerprint the inputs of a group:  its raw files
+    (by name, size and mtime), its package files (by content), the
+    quasars catalog it reads, if any (by name, size and mtime) and the
+    source of its ingest module and the igmspec modules that uses
+    (by content)
+
+    Parameters
+    ----------
+    gname : str
+    module : module
+      Ingest module, e.g. igmspec.ingest.xq100
+    raw_path : str, optional
+      Defaults to $RAW_IGMSPEC
+
+    Returns
+    -------
+    fprint : dict
+      module, package, raw and total hashes plus the number of raw
+      files and bytes
+    """
+    if raw_path is None:
+        raw_path = os.getenv('RAW_IGMSPEC')
+    # Source code
+    mhash = code_hash(module)
+    # Package files and quasars catalog
+    md5 = hashlib.md5()
+    for pfile in pkg_files(gname):
+        md5.update('{:s} {:s}\n'.format(os.path.relpath(pfile, igmspec.__path__[0]),
+                                         hash_file(pfile)).encode('utf-8'))
+    for cfile in catalog_files(gname, raw_path=raw_path):
+        if not os.path.exists(cfile):
+            raise IOError("Missing quasars catalog for {:s}: {:s}".format(gname, cfile))
+        for relpath, size, mtime in scan_files(cfile):
+            md5.update('{:s}/{:s} {:d} {:d}\n'.format(os.path.basename(cfile), relpath, size, mtime).encode('utf-8'))
+    phash = md5.hexdigest()
+    # Raw files
+    raw_dirs = defs.get_raw_dirs()[gname]
+    md5 = hashlib.md5()
+    nfiles, nbytes = 0, 0
+    for raw_dir in raw_dirs:
+        full_path = os.path.join(raw_path, raw_dir)
+        if not os.path.exists(full_path):
+            raise IOError("Missing raw data for {:s}: {:s}".format(gname, full_path))
+        for relpath, size, mtime in scan_files(full_path):
+            md5.update('{:s}/{:s} {:d} {:d}\n'.format(raw_dir, relpath, size, mtime).encode('utf-8'))
+            nfiles += 1
+            nbytes += size
+    rhash = md5.hexdigest()
+    # Finish
+    fprint = dict(group=gname, module=mhash, pkg=phash, raw=rhash, nfiles=nfiles, nbytes=nbytes,
+                  hash=hashlib.md5((mhash+phash+rhash).encode('utf-8')).hexdigest())
+    return fprint
+
+
+def write_fingerprint(hdf, gname, fprint):
+    """ Record the fingerprint of a group in the DB file
+
+    Parameters
+    ----------
+    hdf : h5py File
+    gname : str
+    fprint : dict
+    """
+    hdf[gname].attrs['FINGERPRINT'] = json.dumps(fprint)
+
+
+def read_fingerprint(hdf, gname):
+    """ Fingerprint of a group in a DB file
+
+    Parameters
+    ----------
+    hdf : h5py File
+    gname : str
+
+    Returns
+    -------
+    fprint : dict or None
+      None if the group or its fingerprint is missing
+    """
+    if gname not in hdf.keys():
+        return None
+    if 'FINGERPRINT' not in hdf[gname].attrs.keys():
+        return None
+    return json.loads(hdf[gname].attrs['FINGERPRINT'])
+
+
+def chk_fingerprint(prev_hdf, gname, fprint):
+    """ Can the group be reused from a previous DB file?
+
+    Parameters
+    ----------
+    prev_hdf : h5py File or None
+    gname : str
+    fprint : dict
+
+    Returns
+    -------
+    bool
+    """
+    if prev_hdf is None:
+        return False
+    prev = read_fingerprint(prev_hdf, gname)
+    if prev is None:
+        print("No previous fingerprint for {:s}".format(gname))
+        return False
+    if prev['hash'] != fprint['hash']:
+        if prev['module'] != fprint['module']:
+            print("Ingest code for {:s} has changed".format(gname))
+        if prev.get('pkg') != fprint['pkg']:
+            print("Package files or quasars catalog for {:s} have changed".format(gname))
+        if prev['raw'] != fprint['raw']:
+            print("Raw data for {:s} have changed".format(gname))
+        return False
+    print("Group {:s} is unchanged".format(gname))
+    return True
@@ -15,13 +15,22 @@ from astropy.coordinates import SkyCoord, match_coordinates_sky
 from astropy import units as u
 
 from linetools import utils as ltu
-from linetools.spectra import io as lsio
 
 from specdb.build.utils import chk_for_duplicates
 from specdb.build.utils import chk_meta
 from specdb.build.utils import init_data
 
+from igmspec import inventory
+from igmspec.ingest import utils as iiu
+from igmspec.ingest.metabuilder import MetaBuilder
+from igmspec.ingest import speccache
+from igmspec.ingest import metacache
+from igmspec.ingest import catcache
+from igmspec.ingest import fastspec
+from igmspec.ingest.writer import SpecWriter
 
+
+@metacache.cached('BOSS_DR12', files=['BOSS/DR12Q.fits.gz', 'BOSS/DR12Q_sup.fits.gz', 'BOSS/DR12Q_supbad.fits.gz'])
 def grab_meta():
     """ Grab BOSS meta Table
 
@@ -32,14 +41,14 @@ def grab_meta():
     """
 
     #http://www.sdss.org/dr12/algorithms/boss-dr12-quasar-catalog/
-    boss_dr12 = Table.read(os.getenv('RAW_IGMSPEC')+'/BOSS/DR12Q.fits.gz')
+    boss_dr12 = catcache.read_table(os.getenv('RAW_IGMSPEC')+'/BOSS/DR12Q.fits.gz')
     boss_dr12['CAT'] = ['DR12Q']*len(boss_dr12)
     gd = np.any([boss_dr12['Z_PIPE'] > 0., boss_dr12['Z_PCA'] > 0.],axis=0) # CUTS Z_VI
     boss_dr12 = boss_dr12[gd]
     #
-    boss_sup = Table.read(os.getenv('RAW_IGMSPEC')+'/BOSS/DR12Q_sup.fits.gz')
+    boss_sup = catcache.read_table(os.getenv('RAW_IGMSPEC')+'/BOSS/DR12Q_sup.fits.gz')
     boss_sup['CAT'] = ['SUPGD']*len(boss_sup)
-    boss_supbad = Table.read(os.getenv('RAW_IGMSPEC')+'/BOSS/DR12Q_supbad.fits.gz')
+    boss_supbad = catcache.read_table(os.getenv('RAW_IGMSPEC')+'/BOSS/DR12Q_supbad.fits.gz')
     boss_supbad['CAT'] = ['SUPBD']*len(boss_supbad)
     # Collate
     boss_meta = vstack([boss_dr12, boss_sup, boss_supbad], join_type='outer')
@@ -138,7 +147,83 @@ def get_specfil(row, KG=False, hiz=False):
     return specfil
 
 
-def hdf5_adddata(hdf, sname, meta, debug=False, chk_meta_only=False, boss_hdf=None, **kwargs):
+@speccache.cached
+def read_spec(full_file, hiz_file, KG_file, zem):
+    """ Read one BOSS DR12 spectrum and merge in its continua
+
+    Parameters
+    ----------
+    full_file : str
+    hiz_file : str
+      Used instead for the highest redshift systems
+    KG_file : str
+      MFR continuum generated by KG
+    zem : float
+
+    Returns
+    -------
+    sdict : dict
+      Includes the file actually read and whether it was the hiz one
+    """
+    sdict = fastspec.readspec(full_file)
+    hiz = False
+    # Kludge for higest redshift systems
+    if sdict['npix'] < 10:
+        hiz = True
+        full_file = hiz_file
+        try:
+            sdict = fastspec.readspec(full_file)
+        except:
+            print("Missing: {:s}".format(full_file))
+    npix = sdict['npix']
+    # GZ Continuum -- packed in with spectrum, generated by my IDL script
+    if sdict['co'] is not None:
+        co = sdict['co']
+    else:
+        co = np.zeros_like(sdict['flux'])
+    # KG Continuum
+    KG = inventory.isfile(KG_file)
+    if KG and (npix>1):  # Latter is for junk in GZ file.  Needs fixing
+        hduKG = fits.open(KG_file)
+        KGtbl = hduKG[1].data
+        wvKG = 10.**KGtbl['LOGLAM']
+        if not ((wvKG[0]-sdict['wave'][0]) < 1e-5):
+            raise ValueError("KG continuum does not align with {:s}".format(full_file))
+        gdpix = np.where(wvKG < (1+zem)*1200.)[0]
+        co[gdpix] = KGtbl['CONT'][gdpix]
+    sdict['co'] = co
+    sdict['file'] = full_file
+    sdict['hiz'] = hiz
+    sdict['flag_co'] = coflag(sdict['wave'][:npix], co[:npix], zem, KG=KG)
+    return sdict
+
+
+def coflag(wave, co, zem, KG=False):
+    """ Continuum flag of one spectrum (see derive_coflag)
+
+    Parameters
+    ----------
+    wave : ndarray
+    co : ndarray
+    zem : float
+    KG : bool, optional
+      Has a KG continuum
+
+    Returns
+    -------
+    flg_co : int
+    """
+    flg_co = 0
+    # GZ continuum;  avoid the KG region
+    if np.any((wave < 1215.67*(1+zem)) & (co > 0.)):
+        flg_co += 1
+    if KG:
+        flg_co += 2
+    return flg_co
+
+
+def hdf5_adddata(hdf, sname, meta, debug=False, chk_meta_only=False, boss_hdf=None,
+                 nproc=1, nvalid=0, **kwargs):
     """ Add BOSS data to the DB
 
     Parameters
@@ -151,6 +236,11 @@ def hdf5_adddata(hdf, sname, meta, debug=False, chk_meta_only=False, boss_hdf=No
     chk_meta_only : bool, optional
       Only check meta file;  will not write
     boss_hdf : str, optional
+    nproc : int, optional
+      Number of processes for reading the raw spectra
+    nvalid : int, optional
+      Check the fast reader (fastspec) against linetools on a sample
+      of this many files before ingesting
 
 
     Returns
@@ -173,78 +263,51 @@ def hdf5_adddata(hdf, sname, meta, debug=False, chk_meta_only=False, boss_hdf=No
     spec_set = hdf[sname].create_dataset('spec', data=data, chunks=True,
                                          maxshape=(None,), compression='gzip')
     spec_set.resize((nspec,))
-    wvminlist = []
-    wvmaxlist = []
-    speclist = []
-    npixlist = []
+    writer = SpecWriter(spec_set, data)
+    mbuild = MetaBuilder(nspec)
+    mbuild.add_column('flag_co', int)
+    # Files
+    items = [(get_specfil(row), get_specfil(row, hiz=True), get_specfil(row, KG=True),
+              row['zem_GROUP']) for row in meta]
+    if nvalid > 0:
+        if len(fastspec.validate([item[0] for item in items], nsample=nvalid)) > 0:
+            raise ValueError("Fast reader disagrees with linetools")
     # Loop
     maxpix = 0
-    for jj,row in enumerate(meta):
+    stats = iiu.PrefetchStats()
+    for jj, sdict in enumerate(iiu.map_spectra(read_spec, items, nproc=nproc, stats=stats)):
         # Generate full file
-        full_file = get_specfil(row)
-        if full_file == 'None':
-            continue
-        # Read
-        spec = lsio.readspec(full_file)
+        full_file = sdict['file']
         # npix
-        npix = spec.npix
-        # Kludge for higest redshift systems
-        if npix < 10:
-            full_file = get_specfil(row, hiz=True)
-            try:
-                spec = lsio.readspec(full_file)
-            except:
-                print("Missing: {:s}".format(full_file))
-            npix = spec.npix
-        elif npix > max_npix:
+        npix = sdict['npix']
+        if (not sdict['hiz']) and npix > max_npix:
             raise ValueError("Not enough pixels in the data... ({:d})".format(npix))
         else:
             maxpix = max(npix,maxpix)
         # Parse name
         fname = full_file.split('/')[-1]
         # Fill
-        for key in ['wave','flux','sig']:
-            data[key] = 0.  # Important to init (for compression too)
-        data['flux'][0][:npix] = spec.flux.value
-        data['sig'][0][:npix] = spec.sig.value
-        data['wave'][0][:npix] = spec.wavelength.value
-        # GZ Continuum -- packed in with spectrum, generated by my IDL script
-        try:
-            co = spec.co.value
-        except AttributeError:
-            co = np.zeros_like(spec.flux.value)
-        # KG Continuum
-        KG_file = get_specfil(row, KG=True)
-        if os.path.isfile(KG_file) and (npix>1):  # Latter is for junk in GZ file.  Needs fixing
-            hduKG = fits.open(KG_file)
-            KGtbl = hduKG[1].data
-            wvKG = 10.**KGtbl['LOGLAM']
-            try:
-                assert (wvKG[0]-spec.wavelength[0].value) < 1e-5
-            except:
-                pdb.set_trace()
-            gdpix = np.where(wvKG < (1+row['zem_GROUP'])*1200.)[0]
-            co[gdpix] = KGtbl['CONT'][gdpix]
-        data['co'][0][:npix] = co
+        data = writer.row(jj, npix)
+        data['flux'][0][:npix] = sdict['flux']
+        data['sig'][0][:npix] = sdict['sig']
+        data['wave'][0][:npix] = sdict['wave']
+        data['co'][0][:npix] = sdict['co']
         # Meta
-        speclist.append(str(fname))
-        wvminlist.append(np.min(data['wave'][0][:npix]))
-        wvmaxlist.append(np.max(data['wave'][0][:npix]))
-        npixlist.append(npix)
+        mbuild.set_spec(jj, fname, data['wave'][0], npix)
+        mbuild.set_row(jj, flag_co=sdict['flag_co'])
         if chk_meta_only:
             continue
         # Only way to set the dataset correctly
-        spec_set[jj] = data
+        writer.write(jj)
+    writer.close()
 
     #
     print("Max pix = {:d}".format(maxpix))
+    print("Read-ahead: {}".format(stats))
     # Add columns
-    meta.add_column(Column(speclist, name='SPEC_FILE'))
-    meta.add_column(Column(npixlist, name='NPIX'))
-    meta.add_column(Column(wvminlist, name='WV_MIN'))
-    meta.add_column(Column(wvmaxlist, name='WV_MAX'))
-    meta.add_column(Column(np.arange(nspec,dtype=int),name='GROUP_ID'))
-    meta.add_column(Column([2000.]*len(meta), name='EPOCH'))
+    mbuild.group_id()
+    mbuild.constant('EPOCH', 2000.)
+    mbuild.add_to(meta)
 
     # Add HDLLS meta to hdf5
     if chk_meta(meta):
@@ -263,23 +326,31 @@ def hdf5_adddata(hdf, sname, meta, debug=False, chk_meta_only=False, boss_hdf=No
     #
     return
 
-def add_coflag(hdf):
-    """ Generate a continuum flag to add to the meta table
+def derive_coflag(meta, grp):
+    """ Continuum flag for the meta table
+    Used as a migration step (see igmspec.migrate)
+
+    The flag is stored by hdf5_adddata and then carried as is;  it is
+    only derived from the continua of the previous DB file for files
+    written without it
+
     Parameters
     ----------
-    hdf
+    meta : Table
+    grp : h5py Group
+      BOSS_DR12 group of the previous DB file
 
     Returns
     -------
-    new_meta : Table
-      New column 'flag_co' which is a bitwise flag
+    flg_co : ndarray
+      Values for the new column 'flag_co' which is a bitwise flag
         1 : GZ
         2 : KG
 
     """
+    if 'flag_co' in meta.keys():
+        return meta['flag_co'].data
     dir = os.getenv('RAW_IGMSPEC')
-    # Load meta
-    meta = Table(hdf['BOSS_DR12']['meta'].value)
     nspec = len(meta)
     flg_co = np.zeros(nspec).astype(int)
 
@@ -288,10 +359,8 @@ def add_coflag(hdf):
     nsub = 0
     while(nsub < nspec):
         idx = np.arange(nsub,min(nsub+chunk, nspec)).astype(int)
-        # Grab spectra
-        msk = np.array([False]*nspec)
-        msk[idx] = True
-        data = hdf['BOSS_DR12']['spec'][msk]
+        # Grab the wavelengths and continua only
+        data = grp['spec'][idx[0]:idx[-1]+1, 'wave', 'co']
 
         # Add GZ flag
         zem = meta['zem_GROUP'][idx]
@@ -314,12 +383,11 @@ def add_coflag(hdf):
             pnm = '{0:04d}'.format(plates[ii])
             path = dir+'/BOSS/BOSSLyaDR12_spectra_v1.0/{:s}/'.format(pnm)
             specfil = path+'speclya-{:04d}-{:d}-{:04d}.fits.gz'.format(plates[ii], mjds[ii], fibers[ii])
-            if os.path.isfile(specfil):
+            if inventory.isfile(specfil):
                 flg_co[idx[ii]] += 2
         nsub = min(nsub+chunk, nspec)
     # Finish
-    meta['flag_co'] = flg_co
-    return meta
+    return flg_co
 
 
 def add_ssa(hdf, dset):
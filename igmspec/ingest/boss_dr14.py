@@ -7,6 +7,8 @@ import numpy as np
 import os, json
 import pdb
 import datetime
+import itertools
+from collections import OrderedDict
 
 from pkg_resources import resource_filename
 
@@ -17,13 +19,22 @@ from astropy.coordinates import SkyCoord, match_coordinates_sky
 from astropy import units as u
 
 from linetools import utils as ltu
-from linetools.spectra import io as lsio
 
 from specdb.build.utils import chk_for_duplicates
 from specdb.build.utils import chk_meta
 from specdb.build.utils import init_data
 
+from igmspec import inventory
+from igmspec.ingest import utils as iiu
+from igmspec.ingest import speccache
+from igmspec.ingest import metacache
+from igmspec.ingest import catcache
+from igmspec.ingest import fastspec
+from igmspec.ingest.writer import SpecWriter
+from igmspec.ingest.metabuilder import MetaBuilder
 
+
+@metacache.cached('BOSS_DR14', files=['BOSS_DR14/DR14Q_v4_4.fits.gz'])
 def grab_meta(test=False):
     """ Grab BOSS meta Table
 
@@ -34,7 +45,7 @@ def grab_meta(test=False):
     """
 
     # Paris et al.
-    qsos_dr14 = Table.read(os.getenv('RAW_IGMSPEC')+'/BOSS_DR14/DR14Q_v4_4.fits.gz')
+    qsos_dr14 = catcache.read_table(os.getenv('RAW_IGMSPEC')+'/BOSS_DR14/DR14Q_v4_4.fits.gz')
     # Add original ID to coordinate with spectra and remove it later
     qsos_dr14['ORIG_ID'] = np.arange(len(qsos_dr14))
     # Cut on BOSS (do not include DR7 files)
@@ -42,12 +53,9 @@ def grab_meta(test=False):
 
     # Cut out bad ones
     bad_meta = Table.read(resource_filename('igmspec', 'ingest/files/bad_dr14.fits'))
-    keep = np.array([True]*len(boss_dr14))
-    for row in bad_meta:
-        bad_qso = np.where((boss_dr14['PLATE'] == row['PLATE']) & (
-            boss_dr14['FIBERID'] == row['FIBERID']))[0]
-        keep[bad_qso] = False
-    boss_dr14 = boss_dr14[keep]
+    _, nbad = iiu.match_rows([boss_dr14['PLATE'], boss_dr14['FIBERID']],
+                             [bad_meta['PLATE'], bad_meta['FIBERID']])
+    boss_dr14 = boss_dr14[nbad == 0]
     if test:
         boss_dr14 = boss_dr14[:100]
     '''
@@ -141,6 +149,29 @@ def meta_for_build():
 '''
 
 
+def get_orig_dirs():
+    """ Directories of the spectra by ORIG_ID range
+
+    Returns
+    -------
+    orig_dirs : list of tuple
+      (upper ORIG_ID bound, directory), ascending
+    """
+    orig_dirs = [(50000, 'dr14_quasar_0-50000/'),
+                 (100000, 'dr14_quasar_50000-100000/'),
+                 (150000, 'dr14_quasar_100000-150000/'),
+                 (200000, 'dr14_quasar_150000-200000/'),
+                 (250000, 'dr14_quasar_200000-250000/'),
+                 (300000, 'dr14_quasar_250000-300000/'),
+                 (350000, 'dr14_quasar_300000-350000/'),
+                 (400000, 'dr14_quasar_350000-400000/'),
+                 (450000, 'dr14_quasar_400000-450000/'),
+                 (500000, 'dr14_quasar_450000-500000/'),
+                 (600000, 'dr14_quasar_500000-526356/'),
+                 ]
+    return orig_dirs
+
+
 def get_specfil(idx, meta, KG=False, hiz=False):
     """Grab the BOSS file name + path
     KG : bool, optional
@@ -157,31 +188,14 @@ def get_specfil(idx, meta, KG=False, hiz=False):
 
     if pnm == '6190':
         path += 'dr12_quasar_PlATE_6190/'
-    elif oid < 50000:
-        path += 'dr14_quasar_0-50000/'
-    elif oid < 100000:
-        path += 'dr14_quasar_50000-100000/'
-    elif oid < 150000:
-        path += 'dr14_quasar_100000-150000/'
-    elif oid < 200000:
-        path += 'dr14_quasar_150000-200000/'
-    elif oid < 250000:
-        path += 'dr14_quasar_200000-250000/'
-    elif oid < 300000:
-        path += 'dr14_quasar_250000-300000/'
-    elif oid < 350000:
-        path += 'dr14_quasar_300000-350000/'
-    elif oid < 400000:
-        path += 'dr14_quasar_350000-400000/'
-    elif oid < 450000:
-        path += 'dr14_quasar_400000-450000/'
-    elif oid < 500000:
-        path += 'dr14_quasar_450000-500000/'
-    elif oid < 600000:
-        path += 'dr14_quasar_500000-526356/'
     else:
-        pdb.set_trace()
-        raise ValueError("Uh oh")
+        for ohigh, odir in get_orig_dirs():
+            if oid < ohigh:
+                path += odir
+                break
+        else:
+            pdb.set_trace()
+            raise ValueError("Uh oh")
 
     specfil = path+'spec-{:s}-{:s}-{:s}.fits'.format(pnm, mjd, fnm)
 
@@ -189,7 +203,332 @@ def get_specfil(idx, meta, KG=False, hiz=False):
     return specfil
 
 
-def hdf5_adddata(hdf, sname, meta, debug=False, chk_meta_only=False, boss_hdf=None, **kwargs):
+def get_platefil(idx, meta):
+    """Grab the spPlate file name + path for a row
+    """
+    path = os.getenv('RAW_IGMSPEC')+'/BOSS_DR14/spPlate/'
+    return path+'spPlate-{:04d}-{:d}.fits'.format(meta['PLATE'][idx], meta['MJD'][idx])
+
+
+@speccache.cached
+def read_spec(full_file):
+    """ Read one BOSS DR14 spectrum
+
+    Parameters
+    ----------
+    full_file : str
+
+    Returns
+    -------
+    sdict : dict or None
+      None if the file could not be read
+    """
+    try:
+        sdict = fastspec.readspec(full_file, masking='edges')
+    except:
+        return None
+    return sdict
+
+
+def read_plates(items):
+    """ Read a batch of BOSS DR14 spectra, opening each spPlate file once
+    Falls back to the per-fiber files for missing (or unreadable) plates
+
+    Parameters
+    ----------
+    items : list of tuple
+      (fiber file, plate file, FIBERID)
+
+    Returns
+    -------
+    sdicts : list
+      As read_spec, in the order of items
+    """
+    sdicts = [None]*len(items)
+    plates = OrderedDict()
+    for ii, item in enumerate(items):
+        plates.setdefault(item[1], []).append(ii)
+    for plate_file, idx in plates.items():
+        pdicts = None
+        if inventory.isfile(plate_file):
+            try:
+                pdicts = fastspec.read_plate(plate_file, [items[ii][2] for ii in idx],
+                                             masking='edges')
+            except:
+                print("Failed on plate file: {:s};  using the fiber files".format(plate_file))
+        if pdicts is None:
+            pdicts = [read_spec(items[ii][0]) for ii in idx]
+        for ii, sdict in zip(idx, pdicts):
+            sdicts[ii] = sdict
+    return sdicts
+
+
+def iter_spectra(meta, full_files, row0, row1, nproc=1, plates=False, nbatch=500):
+    """ Read the spectra of rows [row0,row1) of the meta table, in order
+
+    Parameters
+    ----------
+    meta : Table
+    full_files : list
+      Spectrum file of each row of meta
+    row0 : int
+    row1 : int
+    nproc : int, optional
+    plates : bool, optional
+      Read from the spPlate files (see read_plates)
+    nbatch : int, optional
+
+    Returns
+    -------
+    generator of sdict (or None)
+    """
+    if plates:
+        items = [(full_files[jj], get_platefil(jj, meta), meta['FIBERID'][jj])
+                 for jj in range(row0, row1)]
+        batches = [items[ii:ii+nbatch] for ii in range(0, len(items), nbatch)]
+        return itertools.chain.from_iterable(
+            iiu.map_spectra(read_plates, batches, nproc=nproc, max_pending=2*nproc))
+    else:
+        return iiu.map_spectra(read_spec, full_files[row0:row1], nproc=nproc)
+
+
+def ingest_rows(writer, meta, full_files, row0, row1, nproc=1, plates=False, nbatch=500,
+                chk_meta_only=False):
+    """ Read and write the spectra of rows [row0,row1) of the meta table
+
+    Parameters
+    ----------
+    writer : SpecWriter
+      Row jj of meta is written to row jj-row0+writer.nstart
+    meta : Table
+    full_files : list
+    row0 : int
+    row1 : int
+    nproc : int, optional
+    plates : bool, optional
+    nbatch : int, optional
+    chk_meta_only : bool, optional
+
+    Returns
+    -------
+    generator of (jj, rowmeta)
+      rowmeta is None for a bad spectrum;  rows without a file are skipped.
+      Bad spectra are written as empty rows with BAD_SPEC in the journal
+    """
+    offset = writer.nstart - row0
+    sdicts = iter_spectra(meta, full_files, row0, row1, nproc=nproc, plates=plates,
+                          nbatch=nbatch)
+    for jj, sdict in enumerate(sdicts, row0):
+        # Generate full file
+        full_file = full_files[jj]
+        if full_file == 'None':
+            continue
+        # Read
+        if sdict is None:
+            print("Failed on full_file: {:s}, {:d}".format(full_file, jj))
+        elif sdict['npix'] < 10:
+            print("Not enough pixels in file: {:s}, {:d}".format(full_file, jj))
+        if (sdict is None) or (sdict['npix'] < 10):
+            if not chk_meta_only:
+                # Journal the bad row so that it is flagged on a resume
+                _ = writer.row(jj+offset, 0)
+                writer.write(jj+offset, meta=dict(BAD_SPEC=True))
+            yield jj, None
+            continue
+        # npix
+        npix = sdict['npix']
+        # Parse name
+        fname = full_file.split('/')[-1]
+        # Fill
+        data = writer.row(jj+offset, npix)
+        data['flux'][0][:npix] = sdict['flux']
+        data['sig'][0][:npix] = sdict['sig']
+        data['wave'][0][:npix] = sdict['wave']
+        # Meta
+        rowmeta = dict(SPEC_FILE=str(fname), WV_MIN=np.min(data['wave'][0][:npix]),
+                       WV_MAX=np.max(data['wave'][0][:npix]), NPIX=npix)
+        if not chk_meta_only:
+            # Only way to set the dataset correctly
+            writer.write(jj+offset, meta=rowmeta)
+        yield jj, rowmeta
+
+
+def get_blocks(meta):
+    """ Blocks of rows of the meta table by ORIG_ID range,
+    i.e. the directories of the spectra (see get_specfil)
+
+    Parameters
+    ----------
+    meta : Table
+      Ordered by ORIG_ID
+
+    Returns
+    -------
+    blocks : OrderedDict
+      (row0, row1) keyed by the directory name
+    """
+    blocks = OrderedDict()
+    oid = np.asarray(meta['ORIG_ID'])
+    if np.any(np.diff(oid) < 0):
+        raise ValueError("meta is not ordered by ORIG_ID")
+    olow = 0
+    for ohigh, odir in get_orig_dirs():
+        rows = np.where((oid >= olow) & (oid < ohigh))[0]
+        olow = ohigh
+        if len(rows) > 0:
+            blocks[odir[:-1]] = (int(rows[0]), int(rows[-1])+1)
+    if olow <= np.max(oid):
+        raise ValueError("ORIG_ID beyond the last directory")
+    return blocks
+
+
+def block_file(block_path, block):
+    return os.path.join(block_path, 'BOSS_DR14_{:s}.hdf5'.format(block))
+
+
+def ingest_block(meta, block, row0, row1, block_path, nproc=1, plates=False, nbatch=500):
+    """ Ingest rows [row0,row1) of the meta table into a block file,
+    with the per-row meta in a 'rowmeta' dataset (STATUS: 0=good, 1=bad, 2=no file)
+
+    Parameters
+    ----------
+    meta : Table
+    block : str
+    row0 : int
+    row1 : int
+    block_path : str
+    nproc : int, optional
+    plates : bool, optional
+    nbatch : int, optional
+    """
+    import h5py
+    bfile = block_file(block_path, block)
+    print("Ingesting rows {:d}-{:d} into {:s}".format(row0, row1, bfile))
+    full_files = [get_specfil(jj, meta) for jj in range(len(meta))]
+    hdf = h5py.File(bfile+'.tmp', 'w')
+    max_npix = 4660  # Just needs to be large enough
+    data = init_data(max_npix, include_co=False)
+    spec_set = hdf.create_dataset('spec', data=data, chunks=True,
+                                  maxshape=(None,), compression='gzip')
+    spec_set.resize((row1-row0,))
+    writer = SpecWriter(spec_set, data)
+    rowmeta = Table()
+    rowmeta['STATUS'] = np.full(row1-row0, 2, dtype=int)
+    rowmeta['SPEC_FILE'] = np.zeros(row1-row0, dtype='S64')
+    rowmeta['NPIX'] = np.zeros(row1-row0, dtype=int)
+    rowmeta['WV_MIN'] = np.zeros(row1-row0)
+    rowmeta['WV_MAX'] = np.zeros(row1-row0)
+    for jj, rmeta in ingest_rows(writer, meta, full_files, row0, row1, nproc=nproc,
+                                 plates=plates, nbatch=nbatch):
+        kk = jj - row0
+        if rmeta is None:
+            rowmeta['STATUS'][kk] = 1
+            continue
+        rowmeta['STATUS'][kk] = 0
+        for key in ['SPEC_FILE', 'NPIX', 'WV_MIN', 'WV_MAX']:
+            rowmeta[key][kk] = rmeta[key]
+    writer.close()
+    hdf['rowmeta'] = rowmeta.as_array()
+    hdf.close()
+    os.rename(bfile+'.tmp', bfile)
+
+
+def _block_worker(meta, blocks, block_path, nproc, plates, nbatch, max_age):
+    from igmspec.workqueue import LockQueue
+    queue = LockQueue(block_path, list(blocks.keys()), max_age=max_age)
+    while True:
+        block = queue.claim()
+        if block is None:
+            return
+        try:
+            ingest_block(meta, block, blocks[block][0], blocks[block][1], block_path,
+                         nproc=nproc, plates=plates, nbatch=nbatch)
+        except:
+            queue.release(block)
+            raise
+        queue.complete(block)
+
+
+def run_blocks(meta, block_path, nworker=1, nproc=1, plates=False, nbatch=500,
+               max_age=None, wait=True, poll=30.):
+    """ Work on the blocks of rows (see get_blocks) from the lock-file queue
+    in block_path.  Run this on each machine sharing the path, with the
+    same meta (grab_meta), e.g. with scripts/ingest_boss_dr14.py
+
+    Parameters
+    ----------
+    meta : Table
+    block_path : str
+    nworker : int, optional
+      Local worker processes, each on one block at a time
+    nproc : int, optional
+      Processes for reading the spectra of each block
+    plates : bool, optional
+    nbatch : int, optional
+    max_age : float, optional
+      Age (s) of a lock beyond which its block is taken to be abandoned
+    wait : bool, optional
+      Wait for the blocks claimed by other machines
+    poll : float, optional
+    """
+    import multiprocessing
+    from igmspec.workqueue import LockQueue
+    blocks = get_blocks(meta)
+    args = (meta, blocks, block_path, nproc, plates, nbatch, max_age)
+    if nworker <= 1:
+        _block_worker(*args)
+    else:
+        procs = [multiprocessing.Process(target=_block_worker, args=args) for ii in range(nworker)]
+        for proc in procs:
+            proc.start()
+        for proc in procs:
+            proc.join()
+        if any([proc.exitcode != 0 for proc in procs]):
+            raise ValueError("Failed to ingest the BOSS_DR14 blocks")
+    if wait:
+        LockQueue(block_path, list(blocks.keys())).wait(poll=poll)
+
+
+def stitch_blocks(spec_set, meta, block_path, chk_meta_only=False, nrow=1000):
+    """ Copy the block files into the spec dataset
+
+    Parameters
+    ----------
+    spec_set : h5py Dataset
+    meta : Table
+    block_path : str
+    chk_meta_only : bool, optional
+    nrow : int, optional
+      Rows per slab
+
+    Returns
+    -------
+    rowmetas : list of (jj, rowmeta)
+      As ingest_rows
+    """
+    import h5py
+    rowmetas = []
+    for block, (row0, row1) in get_blocks(meta).items():
+        bhdf = h5py.File(block_file(block_path, block), 'r')
+        rowmeta = bhdf['rowmeta'][()]
+        for kk in range(row1-row0):
+            if rowmeta['STATUS'][kk] == 1:
+                rowmetas.append((row0+kk, None))
+            elif rowmeta['STATUS'][kk] == 0:
+                rowmetas.append((row0+kk, dict(SPEC_FILE=rowmeta['SPEC_FILE'][kk].decode('utf-8'),
+                                               NPIX=rowmeta['NPIX'][kk], WV_MIN=rowmeta['WV_MIN'][kk],
+                                               WV_MAX=rowmeta['WV_MAX'][kk])))
+        if not chk_meta_only:
+            for ss in range(0, row1-row0, nrow):
+                se = min(ss+nrow, row1-row0)
+                spec_set[row0+ss:row0+se] = bhdf['spec'][ss:se]
+        bhdf.close()
+    return rowmetas
+
+
+def hdf5_adddata(hdf, sname, meta, debug=False, chk_meta_only=False, boss_hdf=None,
+                 nproc=1, journal=None, nvalid=0, plates=False, nbatch=500,
+                 block_path=None, nworker=1, **kwargs):
     """ Add BOSS data to the DB
 
     Parameters
@@ -202,6 +541,26 @@ def hdf5_adddata(hdf, sname, meta, debug=False, chk_meta_only=False, boss_hdf=No
     chk_meta_only : bool, optional
       Only check meta file;  will not write
     boss_hdf : str, optional
+    nproc : int, optional
+      Number of processes for reading the raw spectra
+    journal : BuildJournal, optional
+      Record the rows as they are written and resume after those
+      committed by a previous (crashed) build
+    nvalid : int, optional
+      Check the fast reader (fastspec) against linetools on a sample
+      of this many files before ingesting
+    plates : bool, optional
+      Read the spectra from the spPlate files, one per (PLATE, MJD),
+      in batches of consecutive rows
+    nbatch : int, optional
+      Rows per batch for plates
+    block_path : str, optional
+      Ingest the rows in blocks by ORIG_ID range, each into a block file
+      in this path, and then stitch them.  The blocks are claimed from a
+      lock-file queue, so other machines sharing the path may work on
+      them too (see run_blocks).  The journal is not used
+    nworker : int, optional
+      Number of local workers on the blocks
 
 
     Returns
@@ -214,114 +573,80 @@ def hdf5_adddata(hdf, sname, meta, debug=False, chk_meta_only=False, boss_hdf=No
         print("Using previously generated {:s} dataset...".format(sname))
         boss_hdf.copy(sname, hdf)
         return
-    boss_grp = hdf.create_group(sname)
+    if chk_meta_only or (block_path is not None):
+        journal = None
+    resume = (journal is not None) and (journal.rows_done(sname) > 0)
 
     # Build spectra (and parse for meta)
     nspec = len(meta)
     max_npix = 4660  # Just needs to be large enough
     data = init_data(max_npix, include_co=False)
     # Init
-    spec_set = hdf[sname].create_dataset('spec', data=data, chunks=True,
-                                         maxshape=(None,), compression='gzip')
-    spec_set.resize((nspec,))
-    wvminlist = []
-    wvmaxlist = []
-    speclist = []
-    npixlist = []
-    # Loop
-    maxpix = 0
+    if resume:
+        spec_set = hdf[sname]['spec']
+        if 'meta' in hdf[sname].keys():
+            del hdf[sname]['meta']
+    else:
+        boss_grp = hdf.create_group(sname)
+        spec_set = hdf[sname].create_dataset('spec', data=data, chunks=True,
+                                             maxshape=(None,), compression='gzip')
+        spec_set.resize((nspec,))
+    writer = SpecWriter(spec_set, data, journal=journal, gname=sname)
+    mbuild = MetaBuilder(nspec)
     bad_spec = np.array([False]*len(meta))
-    for jj in range(len(meta)):
-        # Generate full file
-        full_file = get_specfil(jj, meta)
-        if full_file == 'None':
-            continue
-        # Read
-        try:
-            spec = lsio.readspec(full_file, masking='edges')
-        except:
-            print("Failed on full_file: {:s}, {:d}".format(full_file, jj))
-            bad_spec[jj] = True
-            continue
-        # npix
-        npix = spec.npix
-        if npix < 10:
-            print("Not enough pixels in file: {:s}, {:d}".format(full_file, jj))
+    # Rows committed by a previous build
+    if resume:
+        print("Resuming {:s} at row {:d}".format(sname, writer.nstart))
+        for jj, rowmeta in enumerate(journal.rowmeta(sname)):
+            if rowmeta.get('BAD_SPEC', False):
+                bad_spec[jj] = True
+                continue
+            mbuild.set_row(jj, SPEC_FILE=rowmeta['SPEC_FILE'], NPIX=rowmeta['NPIX'],
+                           WV_MIN=rowmeta['WV_MIN'], WV_MAX=rowmeta['WV_MAX'])
+    # Loop
+    maxpix = int(np.max(mbuild.columns['NPIX'], initial=0))
+    full_files = [get_specfil(jj, meta) for jj in range(len(meta))]
+    if nvalid > 0:
+        if len(fastspec.validate(full_files, nsample=nvalid, masking='edges')) > 0:
+            raise ValueError("Fast reader disagrees with linetools")
+        if plates:
+            items = [(full_files[jj], get_platefil(jj, meta), meta['FIBERID'][jj])
+                     for jj in range(nspec)]
+            if len(fastspec.validate_plates(items, nsample=nvalid, masking='edges')) > 0:
+                raise ValueError("spPlate files disagree with the fiber files")
+    if block_path is not None:
+        # Blocks of rows by ORIG_ID range, possibly shared with other machines
+        run_blocks(meta, block_path, nworker=nworker, nproc=nproc, plates=plates, nbatch=nbatch)
+        rowmetas = stitch_blocks(spec_set, meta, block_path, chk_meta_only=chk_meta_only)
+    else:
+        rowmetas = ingest_rows(writer, meta, full_files, writer.nstart, nspec, nproc=nproc,
+                               plates=plates, nbatch=nbatch, chk_meta_only=chk_meta_only)
+    for jj, rowmeta in rowmetas:
+        if rowmeta is None:
             bad_spec[jj] = True
             continue
-        '''
-        # Kludge for higest redshift systems
-        if npix < 10:
-            full_file = get_specfil(jj, meta, hiz=True)
-            try:
-                spec = lsio.readspec(full_file)
-            except:
-                print("Missing: {:s}".format(full_file))
-            npix = spec.npix
-        elif npix > max_npix:
-            raise ValueError("Not enough pixels in the data... ({:d})".format(npix))
-        else:
-            maxpix = max(npix,maxpix)
-        '''
-        maxpix = max(npix,maxpix)
-        # Parse name
-        fname = full_file.split('/')[-1]
-        # Fill
-        for key in ['wave','flux','sig']:
-            data[key] = 0.  # Important to init (for compression too)
-        data['flux'][0][:npix] = spec.flux.value
-        data['sig'][0][:npix] = spec.sig.value
-        data['wave'][0][:npix] = spec.wavelength.value
-        '''
-        # GZ Continuum -- packed in with spectrum, generated by my IDL script
-        try:
-            co = spec.co.value
-        except AttributeError:
-            co = np.zeros_like(spec.flux.value)
-        # KG Continuum
-        KG_file = get_specfil(row, KG=True)
-        if os.path.isfile(KG_file) and (npix>1):  # Latter is for junk in GZ file.  Needs fixing
-            hduKG = fits.open(KG_file)
-            KGtbl = hduKG[1].data
-            wvKG = 10.**KGtbl['LOGLAM']
-            try:
-                assert (wvKG[0]-spec.wavelength[0].value) < 1e-5
-            except:
-                pdb.set_trace()
-            gdpix = np.where(wvKG < (1+row['zem_GROUP'])*1200.)[0]
-            co[gdpix] = KGtbl['CONT'][gdpix]
-        data['co'][0][:npix] = co
-        '''
-        # Meta
-        speclist.append(str(fname))
-        wvminlist.append(np.min(data['wave'][0][:npix]))
-        wvmaxlist.append(np.max(data['wave'][0][:npix]))
-        npixlist.append(npix)
-        if chk_meta_only:
-            continue
-        # Only way to set the dataset correctly
-        spec_set[jj] = data
+        maxpix = max(rowmeta['NPIX'],maxpix)
+        mbuild.set_row(jj, SPEC_FILE=rowmeta['SPEC_FILE'], NPIX=rowmeta['NPIX'],
+                       WV_MIN=rowmeta['WV_MIN'], WV_MAX=rowmeta['WV_MAX'])
+    writer.close()
 
     # Deal with null spec -- Should only be done once, saved and then ready to go
     if np.any(bad_spec):
         bad_meta = meta[bad_spec]
-        pdb.set_trace()
+        raise ValueError("{:d} bad spectra in {:s};  add them to ingest/files/bad_dr14.fits: "
+                         "ORIG_ID={}".format(len(bad_meta), sname, list(bad_meta['ORIG_ID'])))
     print("Max pix = {:d}".format(maxpix))
     # Add columns
-    meta.add_column(Column(speclist, name='SPEC_FILE'))
-    meta.add_column(Column(npixlist, name='NPIX'))
-    meta.add_column(Column(wvminlist, name='WV_MIN'))
-    meta.add_column(Column(wvmaxlist, name='WV_MAX'))
-    meta.add_column(Column(np.arange(nspec,dtype=int),name='GROUP_ID'))
-    meta.add_column(Column([2000.]*len(meta), name='EPOCH'))
+    mbuild.group_id()
+    mbuild.constant('EPOCH', 2000.)
+    mbuild.add_to(meta)
 
     # Add HDLLS meta to hdf5
     if chk_meta(meta):
         if chk_meta_only:
-            pdb.set_trace()
+            return
         hdf[sname]['meta'] = meta
     else:
-        pdb.set_trace()
         raise ValueError("meta file failed")
     # References
     refs = [dict(url='http://adsabs.harvard.edu/abs/2015ApJS..219...12A',
@@ -0,0 +1,394 @@
+""" Module for a binary cache of the large input catalogs
+
+Catalogs such as DR14Q, DR12Q, specObj and the Myers files are read
+with Table.read once, on the first build that uses them, and saved as
+one .npy file per column plus a JSON index of the units, descriptions,
+masks and header keywords.  Later builds memory-map only the columns
+they read, with no decompression or FITS parsing.  Entries are keyed by
+the path, size and mtime of the catalog and its extension;  an entry
+replaces those of older versions of the same file.
+
+The cache is off unless $IGMSPEC_CATCACHE names its directory (see
+enable);  open_catalog and read_table then read the FITS file directly.
+"""
+from __future__ import print_function, absolute_import, division, unicode_literals
+
+import os
+import json
+import shutil
+import hashlib
+from collections import OrderedDict
+import pdb
+
+import numpy as np
+
+from astropy.io import fits
+from astropy.table import Table, Column, MaskedColumn
+
+from igmspec.ingest import utils as iiu
+
+# Open caches, by directory
+_caches = {}
+
+
+def enable(cache_path):
+    """ Turn on the cache for this process and those it starts
+
+    Parameters
+    ----------
+    cache_path : str
+    """
+    os.environ['IGMSPEC_CATCACHE'] = cache_path
+
+
+def get_cache():
+    """ Cache set by $IGMSPEC_CATCACHE
+
+    Returns
+    -------
+    cache : CatalogCache or None
+    """
+    cache_path = os.getenv('IGMSPEC_CATCACHE')
+    if cache_path is None:
+        return None
+    if cache_path not in _caches:
+        _caches[cache_path] = CatalogCache(cache_path)
+    return _caches[cache_path]
+
+
+def catalog_keys(cat_file, ext=1):
+    """ Keys of a catalog:  one for the file and extension, one for its version
+
+    Parameters
+    ----------
+    cat_file : str
+    ext : int, optional
+
+    Returns
+    -------
+    fkey : str
+    vkey : str
+    """
+    stat = os.stat(cat_file)
+    fkey = hashlib.md5('{:s} {:d}'.format(os.path.abspath(cat_file), ext).encode('utf-8')).hexdigest()
+    vkey = hashlib.md5('{:d} {:d}'.format(stat.st_size, iiu.mtime_ns(stat)).encode('utf-8')).hexdigest()
+    return fkey, vkey
+
+
+class CatalogCache(object):
+    """ Directory of catalogs converted to one array file per column
+
+    Parameters
+    ----------
+    cache_path : str
+    """
+    def __init__(self, cache_path):
+        self.cache_path = cache_path
+        self.nhit = 0
+        self.nmiss = 0
+        if not os.path.isdir(cache_path):
+            try:
+                os.makedirs(cache_path)
+            except OSError:  # Made by another process
+                pass
+
+    def convert(self, cat_file, ext=1):
+        """ Add a catalog to the cache
+
+        Parameters
+        ----------
+        cat_file : str
+        ext : int, optional
+
+        Returns
+        -------
+        entry_path : str
+        """
+        fkey, vkey = catalog_keys(cat_file, ext)
+        print("Catalog cache: converting {:s}".format(cat_file))
+        tbl = Table.read(cat_file, hdu=ext)
+        index = dict(source=os.path.abspath(cat_file), ext=ext, nrow=len(tbl), columns=[])
+        try:
+            index['meta'] = json.loads(json.dumps(tbl.meta))
+        except (TypeError, ValueError):
+            index['meta'] = {}
+        # Write under a temporary name;  the rename marks a complete entry
+        entry_path = os.path.join(self.cache_path, fkey, vkey)
+        tmp_path = entry_path+'.{:d}.tmp'.format(os.getpid())
+        os.makedirs(tmp_path)
+        for ii, key in enumerate(tbl.keys()):
+            col = tbl[key]
+            np.save(os.path.join(tmp_path, '{:d}.npy'.format(ii)), np.asarray(col))
+            masked = isinstance(col, MaskedColumn)
+            if masked:
+                np.save(os.path.join(tmp_path, '{:d}.mask.npy'.format(ii)), np.asarray(col.mask))
+            index['columns'].append(dict(name=key, masked=masked, description=col.description,
+                                         unit=None if col.unit is None else col.unit.to_string(),
+                                         format=col.format))
+        with open(os.path.join(tmp_path, 'index.json'), 'w') as f:
+            json.dump(index, f)
+        try:
+            os.rename(tmp_path, entry_path)
+        except OSError:  # Converted by another process
+            shutil.rmtree(tmp_path)
+        # Older versions of the file
+        for old in os.listdir(os.path.join(self.cache_path, fkey)):
+            if (old != vkey) and ('.tmp' not in old):
+                shutil.rmtree(os.path.join(self.cache_path, fkey, old), ignore_errors=True)
+        return entry_path
+
+    def open(self, cat_file, ext=1):
+        """ Cached catalog, converted on a miss
+
+        Parameters
+        ----------
+        cat_file : str
+        ext : int, optional
+
+        Returns
+        -------
+        catalog : CachedCatalog
+        """
+        fkey, vkey = catalog_keys(cat_file, ext)
+        entry_path = os.path.join(self.cache_path, fkey, vkey)
+        if os.path.isdir(entry_path):
+            self.nhit += 1
+        else:
+            self.nmiss += 1
+            entry_path = self.convert(cat_file, ext=ext)
+        return CachedCatalog(entry_path)
+
+
+class CachedCatalog(object):
+    """ Catalog in the cache;  the columns are memory-mapped (copy on write)
+
+    Parameters
+    ----------
+    entry_path : str
+    """
+    def __init__(self, entry_path):
+        self.entry_path = entry_path
+        with open(os.path.join(entry_path, 'index.json'), 'r') as f:
+            self.index = json.load(f)
+        self.names = [cdict['name'] for cdict in self.index['columns']]
+        self._ids = dict([(name, ii) for ii, name in enumerate(self.names)])
+
+    def __len__(self):
+        return self.index['nrow']
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def column(self, key):
+        """ One column
+
+        Parameters
+        ----------
+        key : str
+
+        Returns
+        -------
+        ndarray
+          Memory-mapped
+        """
+        return np.load(os.path.join(self.entry_path, '{:d}.npy'.format(self._ids[key])), mmap_mode='c')
+
+    def read(self, columns):
+        """ Some columns, read into memory
+
+        Parameters
+        ----------
+        columns : list
+
+        Returns
+        -------
+        cols : dict of ndarray
+        """
+        return dict([(key, np.array(self.column(key))) for key in columns])
+
+    def take(self, rows, columns=None, chunk=None):
+        """ Gather rows into one array per column
+
+        Parameters
+        ----------
+        rows : ndarray
+          Indices of the rows
+        columns : list, optional
+          Defaults to all
+        chunk : int, optional
+          Not used;  only the pages of the rows are read
+
+        Returns
+        -------
+        cols : OrderedDict of ndarray
+        """
+        rows = np.asarray(rows, dtype=int)
+        if columns is None:
+            columns = self.names
+        return OrderedDict([(key, self.column(key)[rows]) for key in columns])
+
+    def table(self, columns=None):
+        """ Table of the catalog, as read by Table.read
+
+        Parameters
+        ----------
+        columns : list, optional
+          Defaults to all
+
+        Returns
+        -------
+        tbl : Table
+        """
+        if columns is None:
+            columns = self.names
+        cols = []
+        for key in columns:
+            ii = self._ids[key]
+            cdict = self.index['columns'][ii]
+            kwargs = dict(name=key, description=cdict['description'], unit=cdict['unit'],
+                          format=cdict['format'], copy=False)
+            if cdict['masked']:
+                mask = np.load(os.path.join(self.entry_path, '{:d}.mask.npy'.format(ii)))
+                cols.append(MaskedColumn(self.column(key), mask=mask, **kwargs))
+            else:
+                cols.append(Column(self.column(key), **kwargs))
+        return Table(cols, meta=self.index['meta'], copy=False)
+
+    def close(self):
+        pass
+
+
+class FitsCatalog(object):
+    """ Catalog read from its FITS file (memory-mapped when not compressed)
+
+    Parameters
+    ----------
+    cat_file : str
+    ext : int, optional
+    """
+    def __init__(self, cat_file, ext=1):
+        self.cat_file = cat_file
+        self.ext = ext
+        self.hdulist = fits.open(cat_file, memmap=True)
+        self.data = self.hdulist[ext].data
+        self.names = list(self.data.names)
+
+    def __len__(self):
+        return len(self.data)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def column(self, key):
+        return np.asarray(self.data[key])
+
+    def read(self, columns):
+        """ Some columns, read into memory
+
+        Parameters
+        ----------
+        columns : list
+
+        Returns
+        -------
+        cols : dict of ndarray
+        """
+        return dict([(key, np.array(self.data[key])) for key in columns])
+
+    def take(self, rows, columns=None, chunk=1000000):
+        """ Gather rows into one array per column, a chunk of rows at a time
+
+        Parameters
+        ----------
+        rows : ndarray
+          Indices of the rows
+        columns : list, optional
+          Defaults to all
+        chunk : int, optional
+
+        Returns
+        -------
+        cols : OrderedDict of ndarray
+        """
+        rows = np.asarray(rows, dtype=int)
+        if columns is None:
+            columns = self.names
+        if chunk is None:
+            chunk = max(len(rows), 1)
+        cols = OrderedDict()
+        empty = self.data[0:0]
+        for key in columns:
+            vals = np.asarray(empty[key])
+            cols[key] = np.zeros((len(rows),)+vals.shape[1:], dtype=vals.dtype)
+        for i0 in range(0, len(rows), chunk):
+            sub = self.data[rows[i0:i0+chunk]]
+            for key in columns:
+                cols[key][i0:i0+len(sub)] = sub[key]
+        return cols
+
+    def table(self, columns=None):
+        """ Table of the catalog, by Table.read
+
+        Parameters
+        ----------
+        columns : list, optional
+          Defaults to all
+
+        Returns
+        -------
+        tbl : Table
+        """
+        tbl = Table.read(self.cat_file, hdu=self.ext)
+        if columns is not None:
+            tbl = tbl[columns]
+        return tbl
+
+    def close(self):
+        self.hdulist.close()
+
+
+def open_catalog(cat_file, ext=1):
+    """ Open a catalog, through the cache when enabled
+
+    Parameters
+    ----------
+    cat_file : str
+    ext : int, optional
+
+    Returns
+    -------
+    catalog : CachedCatalog or FitsCatalog
+    """
+    cache = get_cache()
+    if cache is None:
+        return FitsCatalog(cat_file, ext=ext)
+    return cache.open(cat_file, ext=ext)
+
+
+def read_table(cat_file, columns=None, ext=1):
+    """ Table.read through the cache when enabled
+
+    Parameters
+    ----------
+    cat_file : str
+    columns : list, optional
+      Only these columns;  defaults to all
+    ext : int, optional
+
+    Returns
+    -------
+    tbl : Table
+    """
+    cache = get_cache()
+    if cache is None:
+        tbl = Table.read(cat_file, hdu=ext)
+        if columns is not None:
+            tbl = tbl[columns]
+        return tbl
+    return cache.open(cat_file, ext=ext).table(columns=columns)
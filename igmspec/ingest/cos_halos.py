@@ -8,7 +8,7 @@ from __future__ import print_function, absolute_import, division, unicode_litera
 import numpy as np
 import pdb
 import warnings
-import os, json, glob, imp
+import os, json, imp
 
 from astropy.table import Table, Column, vstack
 from astropy.coordinates import SkyCoord, match_coordinates_sky
@@ -20,6 +20,13 @@ from linetools import utils as ltu
 
 from specdb.build.utils import chk_meta
 from specdb.build.utils import init_data
+
+from igmspec import inventory
+from igmspec.ingest import utils as iiu
+from igmspec.ingest import quasars
+from igmspec.ingest.metabuilder import MetaBuilder
+from igmspec.ingest import speccache
+from igmspec.ingest.writer import SpecWriter
 #igms_path = imp.find_module('igmspec')[1]
 
 
@@ -30,11 +37,8 @@ def grab_meta():
 
     """
     from time import strptime
-    from specdb.zem.utils import zem_from_radec
-    from specdb.specdb import IgmSpec
     from specdb.defs import get_res_dicts
     Rdicts = get_res_dicts()
-    igmsp = IgmSpec(db_file=os.getenv('SPECDB')+'/IGMspec_DB_v01.hdf5', skip_test=True)
 
     summ_file = os.getenv('RAW_IGMSPEC')+'/COS-Halos/cos_halos_obs.ascii'
     chalos_meta = Table.read(summ_file, format='ascii')
@@ -72,7 +76,8 @@ def grab_meta():
     chalos_meta['INSTR'] = 'COS' # Deals with padding
     chalos_meta['TELESCOPE'] = 'HST'
     # Myers for zem
-    zem, zsource = zem_from_radec(chalos_meta['RA'], chalos_meta['DEC'], Table(igmsp.hdf['quasars'].value))
+    qcat = quasars.get_catalog(os.getenv('SPECDB')+'/IGMspec_DB_v01.hdf5')
+    zem, zsource = qcat.zem(chalos_meta['RA'], chalos_meta['DEC'])
     badz = zem <= 0.
     if np.sum(badz) > 0:
         raise ValueError("Bad zem in COS-Halos")
@@ -80,22 +85,23 @@ def grab_meta():
     chalos_meta['sig_zem'] = 0.  # Need to add
     chalos_meta['flag_zem'] = zsource
     # HIRES
-    hires_files = glob.glob(os.getenv('RAW_IGMSPEC')+'/COS-Halos/HIRES/J*f.fits.gz')
-    hires_tab = chalos_meta[0:0]
+    hires_files = inventory.glob(os.getenv('RAW_IGMSPEC')+'/COS-Halos/HIRES/J*f.fits.gz')
     subnm = np.array([row['QSO'][4:9] for row in chalos_meta])
     signs = np.array([row['QSO'][14] for row in chalos_meta])
+    hires_rows = []
     for ifile in hires_files:
         print(ifile)
         fname = ifile.split('/')[-1]
         mt = np.where((subnm == fname[0:5]) & (signs == fname[5]))[0]
         if len(mt) != 1:
             pdb.set_trace()
-        # Add row
-        hires_tab.add_row(chalos_meta[mt[0]])
-        hires_tab[-1]['INSTR'] = 'HIRES'
-        hires_tab[-1]['TELESCOPE'] = 'Keck I'
-        hires_tab[-1]['DISPERSER'] = 'Red'
-        hires_tab[-1]['R'] = Rdicts['HIRES']['C1']
+        hires_rows.append(mt[0])
+    # Add rows
+    hires_tab = chalos_meta[np.array(hires_rows, dtype=int)]
+    hires_tab['INSTR'] = 'HIRES'
+    hires_tab['TELESCOPE'] = 'Keck I'
+    hires_tab['DISPERSER'] = 'Red'
+    hires_tab['R'] = Rdicts['HIRES']['C1']
     # Combine
     chalos_meta = vstack([chalos_meta, hires_tab])
     chalos_meta['STYPE'] = str('QSO')
@@ -109,8 +115,24 @@ def grab_meta():
     return chalos_meta
 
 
+@speccache.cached
+def read_spec(full_file):
+    """ Read one COS-Halos spectrum
+
+    Parameters
+    ----------
+    full_file : str
+
+    Returns
+    -------
+    sdict : dict
+    """
+    spec = lsio.readspec(full_file)
+    return iiu.spec_to_dict(spec)
+
+
 def hdf5_adddata(hdf, sname, meta, debug=False, chk_meta_only=False,
-                 mk_test_file=False):
+                 mk_test_file=False, nproc=1):
     """ Append COS-Halos data to the h5 file
 
     Parameters
@@ -124,6 +146,8 @@ def hdf5_adddata(hdf, sname, meta, debug=False, chk_meta_only=False,
       Only check meta file;  will not write
     mk_test_file : bool, optional
       Generate the debug test file for Travis??
+    nproc : int, optional
+      Number of processes for reading the raw spectra
 
     Returns
     -------
@@ -145,14 +169,13 @@ def hdf5_adddata(hdf, sname, meta, debug=False, chk_meta_only=False,
     spec_set = hdf[sname].create_dataset('spec', data=data, chunks=True,
                                          maxshape=(None,), compression='gzip')
     spec_set.resize((nspec,))
-    wvminlist = []
-    wvmaxlist = []
-    npixlist = []
-    speclist = []
+    writer = SpecWriter(spec_set, data)
+    mbuild = MetaBuilder(nspec)
     # Loop
     path = os.getenv('RAW_IGMSPEC')+'/COS-Halos/'
     maxpix = 0
-    for jj,row in enumerate(meta):
+    full_files = []
+    for row in meta:
         # Generate full file
         coord = ltu.radec_to_coord((row['RA_GROUP'],row['DEC_GROUP']))
         if row['INSTR'].strip() == 'COS':
@@ -160,41 +183,39 @@ def hdf5_adddata(hdf, sname, meta, debug=False, chk_meta_only=False,
                                                coord.dec.to_string(sep='',pad=True,alwayssign=True)[0:5])
         else: # HIRES
             full_file = path+'/HIRES/J{:s}{:s}_f.fits.gz'.format(coord.ra.to_string(unit=u.hour,sep='',pad=True)[0:4], coord.dec.to_string(sep='',pad=True,alwayssign=True)[0:5])
+        full_files.append(full_file)
+    stats = iiu.PrefetchStats()
+    for jj, sdict in enumerate(iiu.map_spectra(read_spec, full_files, nproc=nproc, stats=stats)):
+        full_file = full_files[jj]
         # Extract
         print("COS-Halos: Reading {:s}".format(full_file))
-        spec = lsio.readspec(full_file)
         # Parse name
         fname = full_file.split('/')[-1]
         # npix
-        npix = spec.npix
+        npix = sdict['npix']
         if npix > max_npix:
             raise ValueError("Not enough pixels in the data... ({:d})".format(npix))
         else:
             maxpix = max(npix,maxpix)
         # Some fiddling about
-        for key in ['wave','flux','sig']:
-            data[key] = 0.  # Important to init (for compression too)
-        data['flux'][0][:npix] = spec.flux.value
-        data['sig'][0][:npix] = spec.sig.value
-        data['wave'][0][:npix] = spec.wavelength.value
+        data = writer.row(jj, npix)
+        data['flux'][0][:npix] = sdict['flux']
+        data['sig'][0][:npix] = sdict['sig']
+        data['wave'][0][:npix] = sdict['wave']
         # Meta
-        speclist.append(str(fname))
-        wvminlist.append(np.min(data['wave'][0][:npix]))
-        wvmaxlist.append(np.max(data['wave'][0][:npix]))
-        npixlist.append(npix)
+        mbuild.set_spec(jj, fname, data['wave'][0], npix)
         if chk_meta_only:
             continue
         # Only way to set the dataset correctly
-        spec_set[jj] = data
+        writer.write(jj)
+    writer.close()
 
     #
     print("Max pix = {:d}".format(maxpix))
+    print("Read-ahead: {}".format(stats))
     # Add columns
-    meta.add_column(Column(speclist, name='SPEC_FILE'))
-    meta.add_column(Column(npixlist, name='NPIX'))
-    meta.add_column(Column(wvminlist, name='WV_MIN'))
-    meta.add_column(Column(wvmaxlist, name='WV_MAX'))
-    meta.add_column(Column(np.arange(nspec,dtype=int), name='GROUP_ID'))
+    mbuild.group_id()
+    mbuild.add_to(meta)
 
     # Add HDLLS meta to hdf5
     if chk_meta(meta):
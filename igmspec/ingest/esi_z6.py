@@ -5,7 +5,6 @@ Worseck et al. 2014
 from __future__ import print_function, absolute_import, division, unicode_literals
 
 
-import numpy as np
 import pdb
 import os
 import json
@@ -18,18 +17,27 @@ from astropy import units as u
 from linetools.spectra import io as lsio
 from linetools import utils as ltu
 
-from specdb.build.utils import chk_meta
-from specdb.build.utils import init_data
+from igmspec.ingest import utils as iiu
+from igmspec.ingest import speccache
+from igmspec.ingest import metacache
+from igmspec.ingest.writer import SpecWriter
+from igmspec.ingest.metabuilder import MetaBuilder
 
 
-path = os.getenv('RAW_IGMSPEC')+'/ESI_z6/'
+def raw_path():
+    """ Path to the raw ESI_z6 spectra;  read at call time
+    """
+    return os.getenv('RAW_IGMSPEC')+'/ESI_z6/'
+
 
+@metacache.cached('ESI_z6', files=['ESI_z6/overview_data_igmspec.txt'])
 def grab_meta():
     """ Grab GGG meta Table
     Returns
     -------
 
     """
+    from specdb.build.utils import chk_meta
     # This table has units in it!
     meta = Table.read(os.getenv('RAW_IGMSPEC')+'/ESI_z6/overview_data_igmspec.txt', format='ascii', delimiter='\t')
     nqso = len(meta)
@@ -54,104 +62,134 @@ def grab_meta():
     return meta
 
 
-def read_spec(row):
+def get_specfil(row):
+    """ Generate the spectrum file name from the coordinates
+    """
     # Filename
     coord = SkyCoord(ra=row['RA_GROUP'], dec=row['DEC_GROUP'], unit='deg')
     filename = 'J{:s}{:s}.txt'.format(coord.ra.to_string(unit=u.hour,sep='',pad=True)[0:4],
                               coord.dec.to_string(sep='',pad=True,alwayssign=True)[0:5])
+    return filename
+
+
+@speccache.cached
+def read_spec(full_file):
+    """ Read one ESI_z6 spectrum
+
+    Parameters
+    ----------
+    full_file : str
+
+    Returns
+    -------
+    sdict : dict
+    """
     # Read
-    spec = lsio.readspec(path+filename)
+    spec = lsio.readspec(full_file)
     # Return
-    return filename, spec
+    return iiu.spec_to_dict(spec, include_co=True)
 
 
-def hdf5_adddata(hdf, sname, meta, debug=False, chk_meta_only=False):
-    """ Append GGG data to the h5 file
+def write_spectra(hdf, sname, meta, data, chk_meta_only=False, nproc=1):
+    """ Write the ESI_z6 spectra and fill their meta columns
+
+    Does not need specdb;  the caller provides the template row and
+    checks the meta
 
     Parameters
     ----------
     hdf : hdf5 pointer
     sname : str
-      Survey name
+      Survey name;  its group must exist
     meta : Table
+      Modified in place with the spectral columns and GROUP_ID
+    data : ndarray
+      Template row, i.e. the output of init_data()
     chk_meta_only : bool, optional
-      Only check meta file;  will not write
+      Only fill the meta;  will not write the spectra
+    nproc : int, optional
+      Number of processes for reading the raw spectra
 
     Returns
     -------
-
+    maxpix : int
     """
-    # Add Survey
-    print("Adding {:s} survey to DB".format(sname))
-    _ = hdf.create_group(sname)
-    # Load up
-    if sname != 'ESI_z6':
-        raise IOError("Not expecting this survey..")
-
-    # Build spectra (and parse for meta)
     nspec = len(meta)
-    max_npix = 30000  # Just needs to be large enough
-    # Init
-    data = init_data(max_npix, include_co=True)
+    max_npix = data['wave'].shape[-1]
     spec_set = hdf[sname].create_dataset('spec', data=data, chunks=True,
                                          maxshape=(None,), compression='gzip')
     spec_set.resize((nspec,))
-    Rlist = []
-    wvminlist = []
-    wvmaxlist = []
-    npixlist = []
-    speclist = []
-    gratinglist = []
-    telelist = []
-    dateobslist = []
-    instrlist = []
+    writer = SpecWriter(spec_set, data)
+    mbuild = MetaBuilder(nspec)
     # Loop
     maxpix = 0
-    for jj,row in enumerate(meta):
+    path = raw_path()
+    filenames = [get_specfil(row) for row in meta]
+    for jj, sdict in enumerate(iiu.map_spectra(read_spec, [path+filename for filename in filenames], nproc=nproc)):
         # Generate full file
-        full_file, spec = read_spec(row)
+        full_file = filenames[jj]
         # Parse name
         fname = full_file.split('/')[-1]
         # npix
-        npix = spec.npix
+        npix = sdict['npix']
         if npix > max_npix:
             raise ValueError("Not enough pixels in the data... ({:d})".format(npix))
         else:
             maxpix = max(npix,maxpix)
         # Some fiddling about
-        for key in ['wave','flux','sig']:
-            data[key] = 0.  # Important to init (for compression too)
-        data['flux'][0][:npix] = spec.flux.value
-        data['sig'][0][:npix] = spec.sig.value
-        data['wave'][0][:npix] = spec.wavelength.value
-        data['co'][0][:npix] = spec.co.value
+        data = writer.row(jj, npix)
+        data['flux'][0][:npix] = sdict['flux']
+        data['sig'][0][:npix] = sdict['sig']
+        data['wave'][0][:npix] = sdict['wave']
+        data['co'][0][:npix] = sdict['co']
         # Meta
         #head = spec.header
-        speclist.append(str(fname))
-        wvminlist.append(np.min(data['wave'][0][:npix]))
-        wvmaxlist.append(np.max(data['wave'][0][:npix]))
-        #telelist.append(head['OBSERVAT'])
-        #instrlist.append(head['INSTRUME'])
-        #tval = Time(head['DATE'], format='isot', out_subfmt='date')
-        #dateobslist.append(tval.iso)
-        npixlist.append(npix)
+        mbuild.set_spec(jj, fname, data['wave'][0], npix)
         # Only way to set the dataset correctly
         if chk_meta_only:
             continue
-        spec_set[jj] = data
+        writer.write(jj)
+    writer.close()
+    # Add columns
+    mbuild.group_id()
+    mbuild.add_to(meta)
+    return maxpix
 
+
+def hdf5_adddata(hdf, sname, meta, debug=False, chk_meta_only=False, nproc=1):
+    """ Append GGG data to the h5 file
+
+    Parameters
+    ----------
+    hdf : hdf5 pointer
+    sname : str
+      Survey name
+    meta : Table
+    chk_meta_only : bool, optional
+      Only check meta file;  will not write
+    nproc : int, optional
+      Number of processes for reading the raw spectra
+
+    Returns
+    -------
+
+    """
+    from specdb.build.utils import chk_meta
+    from specdb.build.utils import init_data
+    # Add Survey
+    print("Adding {:s} survey to DB".format(sname))
+    _ = hdf.create_group(sname)
+    # Load up
+    if sname != 'ESI_z6':
+        raise IOError("Not expecting this survey..")
+
+    # Build spectra (and parse for meta)
+    max_npix = 30000  # Just needs to be large enough
+    # Init
+    data = init_data(max_npix, include_co=True)
+    maxpix = write_spectra(hdf, sname, meta, data, chk_meta_only=chk_meta_only, nproc=nproc)
     #
     print("Max pix = {:d}".format(maxpix))
-    # Add columns
-    meta.add_column(Column(speclist, name='SPEC_FILE'))
-    #meta.add_column(Column(telelist, name='TELESCOPE'))
-    #meta.add_column(Column(instrlist, name='INSTR'))
-    #meta.add_column(Column(dateobslist, name='DATE-OBS'))
-    meta.add_column(Column(npixlist, name='NPIX'))
-    meta.add_column(Column(wvminlist, name='WV_MIN'))
-    meta.add_column(Column(wvmaxlist, name='WV_MAX'))
-    #meta.add_column(Column(Rlist, name='R'))
-    meta.add_column(Column(np.arange(nspec,dtype=int),name='GROUP_ID'))
 
     # Add HDLLS meta to hdf5
     if chk_meta(meta):
@@ -5,7 +5,6 @@ Rafelski et al. 2012, 2014
 from __future__ import print_function, absolute_import, division, unicode_literals
 
 
-import numpy as np
 import pdb
 import os, glob
 import imp
@@ -23,9 +22,16 @@ from linetools import utils as ltu
 from specdb.build.utils import chk_meta
 from specdb.build.utils import init_data
 
+from igmspec.ingest import utils as iiu
+from igmspec.ingest import speccache
+from igmspec.ingest import metacache
+from igmspec.ingest.writer import SpecWriter
+from igmspec.ingest.metabuilder import MetaBuilder
+
 igms_path = imp.find_module('igmspec')[1]
 
 
+@metacache.cached('ESI_DLA', files=['HighzESIDLA/ascii_highz_rafelski.list'])
 def grab_meta():
     """ Grab High-z ESI meta Table
 
@@ -81,7 +87,23 @@ def meta_for_build(esidla_meta=None):
 '''
 
 
-def hdf5_adddata(hdf, sname, meta, debug=False, chk_meta_only=False):
+@speccache.cached
+def read_spec(full_file):
+    """ Read one ESI_DLA spectrum
+
+    Parameters
+    ----------
+    full_file : str
+
+    Returns
+    -------
+    sdict : dict
+    """
+    spec = lsio.readspec(full_file)
+    return iiu.spec_to_dict(spec, wave_unit='AA')
+
+
+def hdf5_adddata(hdf, sname, meta, debug=False, chk_meta_only=False, nproc=1):
     """ Append ESI data to the h5 file
 
     Parameters
@@ -93,6 +115,8 @@ def hdf5_adddata(hdf, sname, meta, debug=False, chk_meta_only=False):
       Survey name
     chk_meta_only : bool, optional
       Only check meta file;  will not write
+    nproc : int, optional
+      Number of processes for reading the raw spectra
 
     Returns
     -------
@@ -117,64 +141,56 @@ def hdf5_adddata(hdf, sname, meta, debug=False, chk_meta_only=False):
     spec_set = hdf[sname].create_dataset('spec', data=data, chunks=True,
                                          maxshape=(None,), compression='gzip')
     spec_set.resize((nspec,))
-    Rlist = []
-    wvminlist = []
-    wvmaxlist = []
-    npixlist = []
-    speclist = []
+    writer = SpecWriter(spec_set, data)
+    mbuild = MetaBuilder(nspec)
+    mbuild.add_column('R', float)
     # Loop
     maxpix = 0
-    for jj,row in enumerate(meta):
-        #
-        specfile = os.getenv('RAW_IGMSPEC')+'/HighzESIDLA/{:s}a_xF.fits'.format(
-            row['Name'])
+    full_files = [os.getenv('RAW_IGMSPEC')+'/HighzESIDLA/{:s}a_xF.fits'.format(row['Name'])
+                  for row in meta]
+    for jj, sdict in enumerate(iiu.map_spectra(read_spec, full_files, nproc=nproc)):
+        row = meta[jj]
+        # Read
+        specfile = full_files[jj]
         print("ESI_DLA: Reading {:s}".format(specfile))
-        spec = lsio.readspec(specfile)
         # Parse name
         fname = specfile.split('/')[-1]
         # npix
-        npix = spec.npix
+        npix = sdict['npix']
         if npix > max_npix:
             raise ValueError("Not enough pixels in the data... ({:d})".format(npix))
         else:
             maxpix = max(npix,maxpix)
         # Continuum
         # Some fiddling about
-        for key in ['wave','flux','sig']:
-            data[key] = 0.  # Important to init (for compression too)
-        data['flux'][0][:npix] = spec.flux.value
-        data['sig'][0][:npix] = spec.sig.value
-        data['wave'][0][:npix] = spec.wavelength.to('AA').value
+        data = writer.row(jj, npix)
+        data['flux'][0][:npix] = sdict['flux']
+        data['sig'][0][:npix] = sdict['sig']
+        data['wave'][0][:npix] = sdict['wave']
         #data['co'][0][:npix] = spec.co.value
         # Meta
-        head = spec.header
-        speclist.append(str(fname))
-        wvminlist.append(np.min(data['wave'][0][:npix]))
-        wvmaxlist.append(np.max(data['wave'][0][:npix]))
-        npixlist.append(npix)
+        head = sdict['head']
+        mbuild.set_spec(jj, fname, data['wave'][0], npix)
         try:
-            Rlist.append(Rdicts['ESI'][head['SLMSKNAM']])
+            mbuild.set_row(jj, R=Rdicts['ESI'][head['SLMSKNAM']])
         except KeyError:
             if row['Slit'] == 0.75:
-                Rlist.append(Rdicts['ESI']['0.75_arcsec'])
+                mbuild.set_row(jj, R=Rdicts['ESI']['0.75_arcsec'])
             elif row['Slit'] == 0.5:
-                Rlist.append(Rdicts['ESI']['0.50_arcsec'])
+                mbuild.set_row(jj, R=Rdicts['ESI']['0.50_arcsec'])
             else:
                 pdb.set_trace()
         # Only way to set the dataset correctly
         if chk_meta_only:
             continue
-        spec_set[jj] = data
+        writer.write(jj)
+    writer.close()
 
     #
     print("Max pix = {:d}".format(maxpix))
     # Add columns
-    meta.add_column(Column(speclist, name='SPEC_FILE'))
-    meta.add_column(Column(npixlist, name='NPIX'))
-    meta.add_column(Column(wvminlist, name='WV_MIN'))
-    meta.add_column(Column(wvmaxlist, name='WV_MAX'))
-    meta.add_column(Column(Rlist, name='R'))
-    meta.add_column(Column(np.arange(nspec,dtype=int),name='GROUP_ID'))
+    mbuild.group_id()
+    mbuild.add_to(meta)
 
     # Add HDLLS meta to hdf5
     if chk_meta(meta):
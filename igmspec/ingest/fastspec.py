@@ -0,0 +1,328 @@
+""" Module for reading SDSS/BOSS spectra straight into numpy arrays
+
+These bypass linetools.spectra.io.readspec and its XSpectrum1D
+(units, masked arrays, header copies), which dominate the ingestion of
+the hundreds of thousands of BOSS and SDSS files.  The outputs match
+those of iiu.spec_to_dict(lsio.readspec(filename)), which may be
+verified on a sample of files with validate().
+"""
+from __future__ import print_function, absolute_import, division, unicode_literals
+
+import os
+import numpy as np
+import pdb
+
+from astropy.io import fits
+
+from linetools.spectra import io as lsio
+
+from igmspec.ingest import utils as iiu
+
+# Binary table columns that readspec would pick up instead of (or in
+# addition to) flux, ivar and loglam
+_OTHER_TAGS = ['SPEC', 'FLUX', 'FLAM', 'FX', 'FNORM', 'fl', 'counts', 'COUNTS',
+               'ERROR', 'ERR', 'SIGMA_FLUX', 'ERR_FLUX', 'SIGMA', 'sigma', 'er', 'err',
+               'error', 'sig', 'IVAR', 'IVAR_OPT', 'FLUX_IVAR', 'VAR', 'var',
+               'WAVE', 'WAVELENGTH', 'LAMBDA', 'LOGLAM', 'wa', 'wave', 'wl', 'wavelength',
+               'CONT', 'CO', 'CONTINUUM', 'co', 'cont', 'continuum']
+
+
+def ivar_to_sig(ivar):
+    """ Convert inverse variance to error, with 0 for ivar <= 0
+
+    Parameters
+    ----------
+    ivar : ndarray
+
+    Returns
+    -------
+    sig : ndarray
+      Same dtype as ivar
+    """
+    sig = np.zeros_like(ivar)
+    gdp = ivar > 0.
+    sig[gdp] = np.sqrt(1./ivar[gdp])
+    return sig
+
+
+def mask_edges(sdict):
+    """ Trim the pixels with sig <= 0 at either end of a spectrum
+    (readspec with masking='edges')
+
+    Parameters
+    ----------
+    sdict : dict
+      Modified in place
+
+    Returns
+    -------
+    sdict : dict
+    """
+    gdsig = np.where(sdict['sig'] > 0.)[0]
+    if len(gdsig) == 0:
+        i0, i1 = 0, 0
+    else:
+        i0, i1 = gdsig[0], gdsig[-1]+1
+    for key in ['wave', 'flux', 'sig', 'co']:
+        if sdict[key] is not None:
+            sdict[key] = sdict[key][i0:i1]
+    sdict['npix'] = i1 - i0
+    return sdict
+
+
+def _mk_dict(head, wave, flux, sig, co=None):
+    sdict = dict(npix=wave.size, wave=wave.astype(np.float64),
+                 flux=flux.astype(np.float32), sig=sig.astype(np.float32),
+                 co=co, head=head)
+    if co is not None:
+        sdict['co'] = co.astype(np.float32)
+    return sdict
+
+
+def read_coadd(hdulist):
+    """ Spectrum from an SDSS spec-PPPP-MMMMM-FFFF.fits file,
+    i.e. the flux, ivar and loglam columns of the coadd HDU
+
+    Parameters
+    ----------
+    hdulist : HDUList
+
+    Returns
+    -------
+    sdict : dict
+    """
+    coadd = hdulist[1].data
+    wave = 10.**np.asarray(coadd['loglam'])
+    sig = ivar_to_sig(np.asarray(coadd['ivar']))
+    return _mk_dict(hdulist[0].header, wave, np.asarray(coadd['flux']), sig)
+
+
+def read_multi(hdulist):
+    """ Spectrum from a BOSS file with flux, ivar and loglam
+    (and optionally the continuum) in HDUs 0-3
+
+    Parameters
+    ----------
+    hdulist : HDUList
+
+    Returns
+    -------
+    sdict : dict
+    """
+    wave = 10.**hdulist[2].data.flatten()
+    sig = ivar_to_sig(hdulist[1].data.flatten())
+    co = None
+    if len(hdulist) == 4:
+        if 'float' in hdulist[3].data.dtype.name:  # Can be an int mask
+            co = hdulist[3].data
+    return _mk_dict(hdulist[0].header, wave, hdulist[0].data.flatten(), sig, co=co)
+
+
+def read_spspec(hdulist):
+    """ Spectrum from an SDSS DR7 spSpec file
+    Flux and error are rows 0 and 2 of the image
+
+    Parameters
+    ----------
+    hdulist : HDUList
+
+    Returns
+    -------
+    sdict : dict
+    """
+    head0 = hdulist[0].header
+    wave = lsio.setwave(head0)
+    return _mk_dict(head0, wave, hdulist[0].data[0, :].flatten(),
+                    hdulist[0].data[2, :].flatten())
+
+
+def read_plate(platefile, fibers, masking='none'):
+    """ Spectra of several fibers from an spPlate file
+    (flux and ivar images, log-linear wavelength solution in the header),
+    read once and sliced in one step
+
+    The wavelengths are computed in float32, as stored in the loglam
+    column of the spec-PPPP-MMMMM-FFFF.fits files
+
+    Parameters
+    ----------
+    platefile : str
+    fibers : list of int
+      FIBERID values (1-indexed)
+    masking : str, optional
+      'none' or 'edges'
+
+    Returns
+    -------
+    sdicts : list of dict
+      As readspec, in the order of fibers
+    """
+    with fits.open(platefile, memmap=False) as hdulist:
+        head0 = hdulist[0].header
+        rows = np.asarray(fibers, dtype=int) - 1
+        flux = hdulist[0].data[rows]
+        sig = ivar_to_sig(hdulist[1].data[rows])
+    npix = flux.shape[1]
+    loglam = (head0['COEFF0'] + head0['COEFF1']*np.arange(npix)).astype(np.float32)
+    wave = 10.**loglam
+    sdicts = []
+    for ii in range(len(rows)):
+        sdict = _mk_dict(head0, wave, flux[ii], sig[ii])
+        if masking == 'edges':
+            sdict = mask_edges(sdict)
+        elif masking != 'none':
+            raise IOError("Not ready for masking={:s}".format(masking))
+        sdicts.append(sdict)
+    return sdicts
+
+
+def get_reader(hdulist):
+    """ Fast reader for the format of a file
+
+    Parameters
+    ----------
+    hdulist : HDUList
+
+    Returns
+    -------
+    reader : function or None
+      None if the format is not one handled here
+    """
+    head0 = hdulist[0].header
+    if head0['NAXIS'] == 0:
+        if len(hdulist) < 2 or (not isinstance(hdulist[1], fits.BinTableHDU)):
+            return None
+        names = hdulist[1].columns.names
+        if not all([key in names for key in ['flux', 'ivar', 'loglam']]):
+            return None
+        if any([key in names for key in _OTHER_TAGS]):
+            return None
+        return read_coadd
+    elif head0['NAXIS'] == 1:
+        if len(hdulist) < 3 or (hdulist[0].name == 'FLUX'):
+            return None
+        if str(head0.get('TELESCOP', ''))[0:4] != 'SDSS':
+            return None
+        return read_multi
+    elif head0['NAXIS'] == 2:
+        if hdulist[0].name == 'FLUX':  # DESI
+            return None
+        if 'CRVAL1' not in head0:
+            return None
+        return read_spspec
+    return None
+
+
+def readspec(filename, masking='none'):
+    """ Read an SDSS/BOSS spectrum, falling back to linetools for
+    formats (or continuum files) not handled here
+
+    Parameters
+    ----------
+    filename : str
+    masking : str, optional
+      'none' or 'edges';  as in XSpectrum1D
+
+    Returns
+    -------
+    sdict : dict
+      As iiu.spec_to_dict
+    """
+    sdict = None
+    with fits.open(filename, memmap=False) as hdulist:
+        reader = get_reader(hdulist)
+        if reader is not None:
+            sdict = reader(hdulist)
+    # Continuum in a separate file?
+    if (sdict is not None) and (sdict['co'] is None):
+        if filename.endswith('.fits') or filename.endswith('.fits.gz'):
+            if os.path.exists(filename.replace('.fits', '_c.fits')):
+                sdict = None
+    if sdict is None:
+        spec = lsio.readspec(filename, masking=masking)
+        return iiu.spec_to_dict(spec, include_co=spec.co_is_set)
+    if masking == 'edges':
+        sdict = mask_edges(sdict)
+    elif masking != 'none':
+        raise IOError("Not ready for masking={:s}".format(masking))
+    return sdict
+
+
+def validate(filenames, nsample=100, masking='none', seed=12345):
+    """ Check readspec against linetools on a random sample of files
+
+    Parameters
+    ----------
+    filenames : list
+    nsample : int, optional
+    masking : str, optional
+    seed : int, optional
+
+    Returns
+    -------
+    bad : list
+      Files where the two disagree
+    """
+    rstate = np.random.RandomState(seed)
+    nsample = min(nsample, len(filenames))
+    idx = rstate.choice(len(filenames), nsample, replace=False)
+    bad = []
+    for ii in np.sort(idx):
+        filename = filenames[ii]
+        if not os.path.isfile(filename):
+            continue
+        fast = readspec(filename, masking=masking)
+        spec = lsio.readspec(filename, masking=masking)
+        slow = iiu.spec_to_dict(spec)
+        ok = fast['npix'] == slow['npix']
+        if ok:
+            for key in ['wave', 'flux', 'sig']:
+                if not np.array_equal(np.asarray(fast[key], dtype=slow[key].dtype), slow[key]):
+                    ok = False
+            if spec.co_is_set:
+                ok = ok and (fast['co'] is not None) and np.array_equal(
+                    fast['co'], spec.co.value)
+        if not ok:
+            print("Fast reader disagrees with readspec for {:s}".format(filename))
+            bad.append(filename)
+    print("Validated the fast reader on {:d} files;  {:d} bad".format(nsample, len(bad)))
+    return bad
+
+
+def validate_plates(items, nsample=100, masking='none', seed=12345):
+    """ Check read_plate against readspec of the per-fiber files
+    on a random sample
+
+    Parameters
+    ----------
+    items : list of tuple
+      (fiber file, plate file, FIBERID)
+    nsample : int, optional
+    masking : str, optional
+    seed : int, optional
+
+    Returns
+    -------
+    bad : list
+      Fiber files where the two disagree
+    """
+    rstate = np.random.RandomState(seed)
+    nsample = min(nsample, len(items))
+    idx = rstate.choice(len(items), nsample, replace=False)
+    bad = []
+    for ii in np.sort(idx):
+        full_file, plate_file, fiber = items[ii]
+        if not (os.path.isfile(full_file) and os.path.isfile(plate_file)):
+            continue
+        fast = read_plate(plate_file, [fiber], masking=masking)[0]
+        slow = readspec(full_file, masking=masking)
+        ok = fast['npix'] == slow['npix']
+        if ok:
+            for key in ['wave', 'flux', 'sig']:
+                if not np.array_equal(fast[key], slow[key]):
+                    ok = False
+        if not ok:
+            print("Plate {:s} disagrees with {:s}".format(plate_file, full_file))
+            bad.append(full_file)
+    print("Validated the plate reader on {:d} fibers;  {:d} bad".format(nsample, len(bad)))
+    return bad
@@ -5,7 +5,6 @@ Worseck et al. 2014
 from __future__ import print_function, absolute_import, division, unicode_literals
 
 
-import numpy as np
 import pdb
 import os
 import imp
@@ -20,9 +19,16 @@ from linetools import utils as ltu
 from specdb.build.utils import chk_meta
 from specdb.build.utils import init_data
 
+from igmspec.ingest import utils as iiu
+from igmspec.ingest import speccache
+from igmspec.ingest import metacache
+from igmspec.ingest.writer import SpecWriter
+from igmspec.ingest.metabuilder import MetaBuilder
+
 igms_path = imp.find_module('igmspec')[1]
 
 
+@metacache.cached('GGG', files=['GGG/GGG_catalog.fits.gz'])
 def grab_meta():
     """ Grab GGG meta Table
     Returns
@@ -75,7 +81,23 @@ def meta_for_build():
 '''
 
 
-def hdf5_adddata(hdf, sname, meta, debug=False, chk_meta_only=False):
+@speccache.cached
+def read_spec(full_file):
+    """ Read one GGG spectrum
+
+    Parameters
+    ----------
+    full_file : str
+
+    Returns
+    -------
+    sdict : dict
+    """
+    spec = lsio.readspec(full_file)
+    return iiu.spec_to_dict(spec)
+
+
+def hdf5_adddata(hdf, sname, meta, debug=False, chk_meta_only=False, nproc=1):
     """ Append GGG data to the h5 file
 
     Parameters
@@ -86,6 +108,8 @@ def hdf5_adddata(hdf, sname, meta, debug=False, chk_meta_only=False):
     meta : Table
     chk_meta_only : bool, optional
       Only check meta file;  will not write
+    nproc : int, optional
+      Number of processes for reading the raw spectra
 
     Returns
     -------
@@ -106,75 +130,60 @@ def hdf5_adddata(hdf, sname, meta, debug=False, chk_meta_only=False):
     spec_set = hdf[sname].create_dataset('spec', data=data, chunks=True,
                                          maxshape=(None,), compression='gzip')
     spec_set.resize((nspec,))
-    Rlist = []
-    wvminlist = []
-    wvmaxlist = []
-    npixlist = []
-    speclist = []
-    gratinglist = []
-    telelist = []
-    dateobslist = []
-    instrlist = []
+    writer = SpecWriter(spec_set, data)
+    mbuild = MetaBuilder(nspec, columns=[('SPEC_FILE', str), ('GRATING', str), ('TELESCOPE', str),
+                                         ('INSTR', str), ('DATE-OBS', str), ('NPIX', int),
+                                         ('WV_MIN', float), ('WV_MAX', float), ('R', float),
+                                         ('GROUP_ID', int)])
     # Loop
     path = os.getenv('RAW_IGMSPEC')+'/GGG/'
     maxpix = 0
+    full_files = []
     for jj,row in enumerate(meta):
-        # Generate full file
         if jj >= nspec//2:
-            full_file = path+row['name']+'_R400.fits.gz'
-            gratinglist.append('R400')
+            full_files.append(path+row['name']+'_R400.fits.gz')
+            mbuild.set_row(jj, GRATING='R400')
         else:
-            full_file = path+row['name']+'_B600.fits.gz'
-            gratinglist.append('B600')
+            full_files.append(path+row['name']+'_B600.fits.gz')
+            mbuild.set_row(jj, GRATING='B600')
+    for jj, sdict in enumerate(iiu.map_spectra(read_spec, full_files, nproc=nproc)):
+        full_file = full_files[jj]
         # Extract
         print("GGG: Reading {:s}".format(full_file))
-        spec = lsio.readspec(full_file)
         # Parse name
         fname = full_file.split('/')[-1]
         # npix
-        npix = spec.npix
+        npix = sdict['npix']
         if npix > max_npix:
             raise ValueError("Not enough pixels in the data... ({:d})".format(npix))
         else:
             maxpix = max(npix,maxpix)
         # Some fiddling about
-        for key in ['wave','flux','sig']:
-            data[key] = 0.  # Important to init (for compression too)
-        data['flux'][0][:npix] = spec.flux.value
-        data['sig'][0][:npix] = spec.sig.value
-        data['wave'][0][:npix] = spec.wavelength.value
+        data = writer.row(jj, npix)
+        data['flux'][0][:npix] = sdict['flux']
+        data['sig'][0][:npix] = sdict['sig']
+        data['wave'][0][:npix] = sdict['wave']
         # Meta
-        head = spec.header
-        speclist.append(str(fname))
-        wvminlist.append(np.min(data['wave'][0][:npix]))
-        wvmaxlist.append(np.max(data['wave'][0][:npix]))
-        telelist.append(head['OBSERVAT'])
-        instrlist.append(head['INSTRUME'])
+        head = sdict['head']
+        mbuild.set_spec(jj, fname, data['wave'][0], npix)
         tval = Time(head['DATE'], format='isot', out_subfmt='date')
-        dateobslist.append(tval.iso)
-        npixlist.append(npix)
+        mbuild.set_row(jj, TELESCOPE=head['OBSERVAT'], INSTR=head['INSTRUME'],
+                       **{'DATE-OBS': tval.iso})
         if 'R400' in fname:
-            Rlist.append(833.)
+            mbuild.set_row(jj, R=833.)
         else:
-            Rlist.append(940.)
+            mbuild.set_row(jj, R=940.)
         # Only way to set the dataset correctly
         if chk_meta_only:
             continue
-        spec_set[jj] = data
+        writer.write(jj)
+    writer.close()
 
     #
     print("Max pix = {:d}".format(maxpix))
     # Add columns
-    meta.add_column(Column(speclist, name='SPEC_FILE'))
-    meta.add_column(Column(gratinglist, name='GRATING'))
-    meta.add_column(Column(telelist, name='TELESCOPE'))
-    meta.add_column(Column(instrlist, name='INSTR'))
-    meta.add_column(Column(dateobslist, name='DATE-OBS'))
-    meta.add_column(Column(npixlist, name='NPIX'))
-    meta.add_column(Column(wvminlist, name='WV_MIN'))
-    meta.add_column(Column(wvmaxlist, name='WV_MAX'))
-    meta.add_column(Column(Rlist, name='R'))
-    meta.add_column(Column(np.arange(nspec,dtype=int),name='GROUP_ID'))
+    mbuild.group_id()
+    mbuild.add_to(meta)
 
     # Add HDLLS meta to hdf5
     if chk_meta(meta):
@@ -10,7 +10,7 @@ import pdb
 import os, json, glob, imp
 import datetime
 
-from astropy.table import Table, Column
+from astropy.table import Table
 from astropy import units as u
 from astropy.time import Time
 
@@ -19,11 +19,18 @@ from linetools.spectra import io as lsio
 
 from specdb.build.utils import chk_meta
 from specdb.build.utils import init_data
+
+from igmspec.ingest import utils as iiu
+from igmspec.ingest import speccache
+from igmspec.ingest import metacache
+from igmspec.ingest.writer import SpecWriter
+from igmspec.ingest.metabuilder import MetaBuilder
 from specdb.build.utils import set_resolution
 
 igms_path = imp.find_module('igmspec')[1]
 
 
+@metacache.cached('HDLA100', files=[], extra=metacache.pyigm_data)
 def grab_meta():
     """ Generates the meta data needed for the IGMSpec build
     Returns
@@ -69,8 +76,24 @@ def grab_meta():
     return meta
 
 
+@speccache.cached
+def read_spec(full_file):
+    """ Read one HDLA100 spectrum
+
+    Parameters
+    ----------
+    full_file : str
+
+    Returns
+    -------
+    sdict : dict
+    """
+    spec = lsio.readspec(full_file)
+    return iiu.spec_to_dict(spec)
+
+
 def hdf5_adddata(hdf, sname, hdla100_meta, debug=False, chk_meta_only=False,
-                 mk_test_file=False):
+                 mk_test_file=False, nproc=1):
     """ Append HDLA100 data to the h5 file
 
     Parameters
@@ -84,6 +107,8 @@ def hdf5_adddata(hdf, sname, hdla100_meta, debug=False, chk_meta_only=False,
       Only check meta file;  will not write
     mk_test_file : bool, optional
       Generate the debug test file for Travis??
+    nproc : int, optional
+      Number of processes for reading the raw spectra
 
     Returns
     -------
@@ -109,37 +134,33 @@ def hdf5_adddata(hdf, sname, hdla100_meta, debug=False, chk_meta_only=False,
                                          maxshape=(None,), compression='gzip')
     nspec = len(hdla100_meta)
     spec_set.resize((nspec,))
-    Rlist = []
-    wvminlist = []
-    wvmaxlist = []
-    dateobslist = []
-    npixlist = []
-    gratinglist = []
+    writer = SpecWriter(spec_set, data)
+    mbuild = MetaBuilder(nspec, columns=[('EPOCH', float), ('NPIX', int), ('DATE-OBS', str),
+                                         ('WV_MIN', float), ('WV_MAX', float), ('R', float),
+                                         ('GROUP_ID', int), ('DISPERSER', str), ('INSTR', str),
+                                         ('TELESCOPE', str)])
     # Loop
-    for jj,row in enumerate(hdla100_meta):
+    full_files = [os.getenv('RAW_IGMSPEC')+'/HDLA100/'+row['SPEC_FILE'] for row in hdla100_meta]
+    for jj, sdict in enumerate(iiu.map_spectra(read_spec, full_files, nproc=nproc)):
         kk = jj
         # Extract
-        f = os.getenv('RAW_IGMSPEC')+'/HDLA100/'+row['SPEC_FILE']
-        spec = lsio.readspec(f)
+        f = full_files[jj]
         # Parse name
         fname = f.split('/')[-1]
         # npix
-        head = spec.header
-        npix = spec.npix
+        head = sdict['head']
+        npix = sdict['npix']
         if npix > max_npix:
             raise ValueError("Not enough pixels in the data... ({:d})".format(npix))
         # Some fiddling about
-        for key in ['wave','flux','sig']:
-            data[key] = 0.  # Important to init (for compression too)
-        data['flux'][0][:npix] = spec.flux.value
-        data['sig'][0][:npix] = spec.sig.value
-        data['wave'][0][:npix] = spec.wavelength.value
+        data = writer.row(kk, npix)
+        data['flux'][0][:npix] = sdict['flux']
+        data['sig'][0][:npix] = sdict['sig']
+        data['wave'][0][:npix] = sdict['wave']
         # Meta
-        wvminlist.append(np.min(data['wave'][0][:npix]))
-        wvmaxlist.append(np.max(data['wave'][0][:npix]))
-        npixlist.append(npix)
+        mbuild.set_pix(kk, data['wave'][0], npix)
         try:
-            Rlist.append(set_resolution(head))
+            mbuild.set_row(kk, R=set_resolution(head))
         except ValueError:
             raise ValueError("Header is required for {:s}".format(fname))
         else:
@@ -148,36 +169,31 @@ def hdf5_adddata(hdf, sname, hdla100_meta, debug=False, chk_meta_only=False,
                 t = Time(datetime.datetime(int(spl[2])+1900, int(spl[1]), int(spl[0])), format='datetime')
             else:
                 t = Time(head['DATE-OBS'], format='isot', out_subfmt='date')
-        dateobslist.append(t.iso)
+        mbuild.set_row(kk, **{'DATE-OBS': str(t.iso)})
         # Grating
         try:
-            gratinglist.append(head['XDISPERS'])
+            mbuild.set_row(kk, DISPERSER=head['XDISPERS'])
         except KeyError:
             try:
                 yr = t.value.year
             except AttributeError:
                 yr = int(t.value[0:4])
             if yr <= 1997:
-                gratinglist.append('RED')
+                mbuild.set_row(kk, DISPERSER='RED')
             else:
                 pdb.set_trace()
         # Only way to set the dataset correctly
         if chk_meta_only:
             continue
-        spec_set[kk] = data
+        writer.write(kk)
+    writer.close()
 
     # Add columns
-    nmeta = len(hdla100_meta)
-    hdla100_meta.add_column(Column([2000.]*nmeta, name='EPOCH'))
-    hdla100_meta.add_column(Column(npixlist, name='NPIX'))
-    hdla100_meta.add_column(Column([str(date) for date in dateobslist], name='DATE-OBS'))
-    hdla100_meta.add_column(Column(wvminlist, name='WV_MIN'))
-    hdla100_meta.add_column(Column(wvmaxlist, name='WV_MAX'))
-    hdla100_meta.add_column(Column(Rlist, name='R'))
-    hdla100_meta.add_column(Column(np.arange(nmeta,dtype=int),name='GROUP_ID'))
-    hdla100_meta.add_column(Column(gratinglist, name='DISPERSER'))
-    hdla100_meta['INSTR'] = ['HIRES']*nspec
-    hdla100_meta['TELESCOPE'] = ['Keck-I']*nspec
+    mbuild.constant('EPOCH', 2000.)
+    mbuild.group_id()
+    mbuild.constant('INSTR', 'HIRES')
+    mbuild.constant('TELESCOPE', 'Keck-I')
+    mbuild.add_to(hdla100_meta)
     #hdla100_meta.rename_column('Z_QSO', 'zem')
 
     # Add HDLLS meta to hdf5
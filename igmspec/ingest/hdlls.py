@@ -7,11 +7,10 @@ from __future__ import print_function, absolute_import, division, unicode_litera
 
 import numpy as np
 import pdb
-import os, json, glob, imp
+import os, json, imp
 import datetime
 
 from astropy.table import Table, Column
-from astropy.coordinates import SkyCoord, match_coordinates_sky
 from astropy import units as u
 from astropy.io import fits
 
@@ -20,6 +19,15 @@ from linetools.spectra import io as lsio
 
 from specdb.build.utils import chk_meta, set_resolution, init_data
 
+from igmspec import inventory
+from igmspec import xmatch
+from igmspec.ingest import utils as iiu
+from igmspec.ingest import speccache
+from igmspec.ingest import metacache
+from igmspec.ingest import headers as iih
+from igmspec.ingest.writer import SpecWriter
+from igmspec.ingest.metabuilder import MetaBuilder
+
 igms_path = imp.find_module('igmspec')[1]
 
 
@@ -54,6 +62,7 @@ def grab_meta_mike():
     return mike_meta
 
 
+@metacache.cached('HD-LLS_DR1', files=['HD-LLS_DR1/HD-LLS_DR1.fits'])
 def grab_meta():
     """ Generates the meta data needed for the IGMSpec build
     Returns
@@ -100,8 +109,28 @@ def grab_meta():
     return hdlls_full
 
 
+@speccache.cached
+def read_spec(full_file):
+    """ Read one HD-LLS spectrum
+
+    Parameters
+    ----------
+    full_file : str
+
+    Returns
+    -------
+    sdict : dict
+      Includes the primary header and the names of extensions 1,2
+    """
+    spec = lsio.readspec(full_file)  # Handles dummy pixels in ESI
+    sdict = iiu.spec_to_dict(spec)
+    sdict['head'] = iih.getheader(full_file)
+    sdict['extnames'] = [iih.getheader(full_file, ext).get('EXTNAME', '').upper() for ext in [1,2]]
+    return sdict
+
+
 def hdf5_adddata(hdf, sname, meta, debug=False, chk_meta_only=False,
-                 mk_test_file=False):
+                 mk_test_file=False, nproc=1):
     """ Append HD-LLS data to the h5 file
 
     Parameters
@@ -115,6 +144,8 @@ def hdf5_adddata(hdf, sname, meta, debug=False, chk_meta_only=False,
       Only check meta file;  will not write
     mk_test_file : bool, optional
       Generate the debug test file for Travis??
+    nproc : int, optional
+      Number of processes for reading the raw spectra
 
     Returns
     -------
@@ -127,11 +158,10 @@ def hdf5_adddata(hdf, sname, meta, debug=False, chk_meta_only=False,
     # Load up
     Rdicts = defs.get_res_dicts()
     mike_meta = grab_meta_mike()
-    mike_coord = SkyCoord(ra=mike_meta['RA_GROUP'], dec=mike_meta['DEC_GROUP'], unit='deg')
+    mike_tree = xmatch.SkyTree(mike_meta['RA_GROUP'], mike_meta['DEC_GROUP'])
     # Checks
     if sname != 'HD-LLS_DR1':
         raise IOError("Not expecting this survey..")
-    full_coord = SkyCoord(ra=meta['RA_GROUP'], dec=meta['DEC_GROUP'], unit='deg')
 
 
     # Build spectra (and parse for meta)
@@ -145,102 +175,91 @@ def hdf5_adddata(hdf, sname, meta, debug=False, chk_meta_only=False,
     spec_set = hdf[sname].create_dataset('spec', data=data, chunks=True,
                                          maxshape=(None,), compression='gzip')
     spec_set.resize((nspec,))
-    Rlist = []
-    wvminlist = []
-    wvmaxlist = []
-    dateobslist = []
-    npixlist = []
-    instrlist = []
-    gratinglist = []
-    telelist = []
+    writer = SpecWriter(spec_set, data)
+    mbuild = MetaBuilder(nspec, columns=[('EPOCH', float), ('NPIX', int), ('DATE-OBS', str),
+                                         ('WV_MIN', float), ('WV_MAX', float), ('R', float),
+                                         ('GROUP_ID', int), ('GRATING', str), ('INSTR', str),
+                                         ('TELESCOPE', str)])
     # Loop
-    members = glob.glob(os.getenv('RAW_IGMSPEC')+'/{:s}/*fits'.format(sname))
+    members = inventory.glob(os.getenv('RAW_IGMSPEC')+'/{:s}/*fits'.format(sname))
+    members = [member for member in members if 'HD-LLS_DR1.fits' not in member]
+    iih.prescan(members, exts=(0,1,2), nproc=nproc)
+    # Meta row of each file
+    meta_idx, nmeta = iiu.match_rows(np.array([member.split('/')[-1] for member in members]),
+                                     meta['SPEC_FILE'], label='HD-LLS SPEC_FILE')
     kk = -1
-    for jj,member in enumerate(members):
-        if 'HD-LLS_DR1.fits' in member:
-            continue
+    for jj, sdict in enumerate(iiu.map_spectra(read_spec, members, nproc=nproc)):
         kk += 1
         # Extract
-        f = member
-        hdu = fits.open(f)
+        f = members[jj]
         # Parse name
         fname = f.split('/')[-1]
-        mt = np.where(meta['SPEC_FILE'] == fname)[0]
         if mk_test_file and (jj>=3):
             continue
-        if len(mt) != 1:
+        if nmeta[jj] != 1:
             pdb.set_trace()
             raise ValueError("HD-LLS: No match to spectral file?!")
         else:
             print('loading {:s}'.format(fname))
-            full_idx[kk] = mt[0]
+            full_idx[kk] = meta_idx[jj]
         # npix
-        head = hdu[0].header
-        # Some fiddling about
-        for key in ['wave','flux','sig']:
-            data[key] = 0.  # Important to init (for compression too)
+        head = sdict['head']
         # Double check
         if kk == 0:
-            assert hdu[1].name == 'ERROR'
-            assert hdu[2].name == 'WAVELENGTH'
+            assert sdict['extnames'][0] == 'ERROR'
+            assert sdict['extnames'][1] == 'WAVELENGTH'
         # Write
-        spec = lsio.readspec(f)  # Handles dummy pixels in ESI
-        npix = spec.npix
+        npix = sdict['npix']
         if npix > max_npix:
             raise ValueError("Not enough pixels in the data... ({:d})".format(npix))
-        data['flux'][0][:npix] = spec.flux.value
-        data['sig'][0][:npix] = spec.sig.value
-        data['wave'][0][:npix] = spec.wavelength.value
+        data = writer.row(kk, npix)
+        data['flux'][0][:npix] = sdict['flux']
+        data['sig'][0][:npix] = sdict['sig']
+        data['wave'][0][:npix] = sdict['wave']
         #data['flux'][0][:npix] = hdu[0].data
         #data['sig'][0][:npix] = hdu[1].data
         #data['wave'][0][:npix] = hdu[2].data
         # Meta
-        wvminlist.append(np.min(data['wave'][0][:npix]))
-        wvmaxlist.append(np.max(data['wave'][0][:npix]))
-        npixlist.append(npix)
+        mbuild.set_pix(kk, data['wave'][0], npix)
         if 'HIRES' in fname:
-            instrlist.append('HIRES')
-            telelist.append('Keck-I')
-            gratinglist.append('BOTH')
+            mbuild.set_row(kk, INSTR='HIRES', TELESCOPE='Keck-I', GRATING='BOTH')
             try:
-                Rlist.append(set_resolution(head))
+                mbuild.set_row(kk, R=set_resolution(head))
             except ValueError:
                 # A few by hand (pulled from Table 1)
                 if 'J073149' in fname:
-                    Rlist.append(Rdicts['HIRES']['C5'])
+                    mbuild.set_row(kk, R=Rdicts['HIRES']['C5'])
                     tval = datetime.datetime.strptime('2006-01-04', '%Y-%m-%d')
                 elif 'J081435' in fname:
-                    Rlist.append(Rdicts['HIRES']['C1'])
+                    mbuild.set_row(kk, R=Rdicts['HIRES']['C1'])
                     tval = datetime.datetime.strptime('2006-12-26', '%Y-%m-%d') # 2008 too
                 elif 'J095309' in fname:
-                    Rlist.append(Rdicts['HIRES']['C1'])
+                    mbuild.set_row(kk, R=Rdicts['HIRES']['C1'])
                     tval = datetime.datetime.strptime('2005-03-18', '%Y-%m-%d')
                 elif 'J113418' in fname:
-                    Rlist.append(Rdicts['HIRES']['C5'])
+                    mbuild.set_row(kk, R=Rdicts['HIRES']['C5'])
                     tval = datetime.datetime.strptime('2006-01-05', '%Y-%m-%d')
                 elif 'J135706' in fname:
-                    Rlist.append(Rdicts['HIRES']['C5'])
+                    mbuild.set_row(kk, R=Rdicts['HIRES']['C5'])
                     tval = datetime.datetime.strptime('2007-04-28', '%Y-%m-%d')
                 elif 'J155556.9' in fname:
-                    Rlist.append(Rdicts['HIRES']['C5'])
+                    mbuild.set_row(kk, R=Rdicts['HIRES']['C5'])
                     tval = datetime.datetime.strptime('2005-04-15', '%Y-%m-%d')
                 elif 'J212329' in fname:
-                    Rlist.append(Rdicts['HIRES']['E3'])
+                    mbuild.set_row(kk, R=Rdicts['HIRES']['E3'])
                     tval = datetime.datetime.strptime('2006-08-20', '%Y-%m-%d')
                 else:
                     pdb.set_trace()
             else:
                 tval = datetime.datetime.strptime(head['DATE-OBS'], '%Y-%m-%d')
-            dateobslist.append(datetime.datetime.strftime(tval,'%Y-%m-%d'))
+            mbuild.set_row(kk, **{'DATE-OBS': datetime.datetime.strftime(tval,'%Y-%m-%d')})
         elif 'ESI' in fname:
-            instrlist.append('ESI')
-            telelist.append('Keck-II')
-            gratinglist.append('ECH')
+            mbuild.set_row(kk, INSTR='ESI', TELESCOPE='Keck-II', GRATING='ECH')
             try:
-                Rlist.append(set_resolution(head))
+                mbuild.set_row(kk, R=set_resolution(head))
             except ValueError:
                 print("Using R=6,000 for ESI")
-                Rlist.append(6000.)
+                mbuild.set_row(kk, R=6000.)
             try:
                 tval = datetime.datetime.strptime(head['DATE'], '%Y-%m-%d')
             except KeyError:
@@ -248,56 +267,44 @@ def hdf5_adddata(hdf, sname, meta, debug=False, chk_meta_only=False,
                     tval = datetime.datetime.strptime('2004-09-11', '%Y-%m-%d')
                 else:
                     pdb.set_trace()
-            dateobslist.append(datetime.datetime.strftime(tval,'%Y-%m-%d'))
+            mbuild.set_row(kk, **{'DATE-OBS': datetime.datetime.strftime(tval,'%Y-%m-%d')})
         elif 'MIKE' in fname:  # APPROXIMATE
             if 'MIKEr' in fname:
-                instrlist.append('MIKEr')
-                gratinglist.append('RED')
+                mbuild.set_row(kk, INSTR='MIKEr', GRATING='RED')
             elif 'MIKEb' in fname:
-                instrlist.append('MIKEb')
-                gratinglist.append('BLUE')
+                mbuild.set_row(kk, INSTR='MIKEb', GRATING='BLUE')
             else:
-                instrlist.append('MIKE')
-                gratinglist.append('BOTH')
-            telelist.append('Magellan')
-            sep = full_coord[mt[0]].separation(mike_coord)
-            imin = np.argmin(sep)
-            if sep[imin] > 1.*u.arcsec:
+                mbuild.set_row(kk, INSTR='MIKE', GRATING='BOTH')
+            mbuild.set_row(kk, TELESCOPE='Magellan')
+            imin, sep = mike_tree.nearest(meta['RA_GROUP'][meta_idx[jj]], meta['DEC_GROUP'][meta_idx[jj]])
+            imin = imin[0]
+            if sep[0] > 1./3600:
                 pdb.set_trace()
                 raise ValueError("Bad separation in MIKE")
             # R and Date
-            Rlist.append(25000. / mike_meta['Slit'][imin])
+            mbuild.set_row(kk, R=25000. / mike_meta['Slit'][imin])
             tval = datetime.datetime.strptime(mike_meta['DATE-OBS'][imin], '%Y-%b-%d')
-            dateobslist.append(datetime.datetime.strftime(tval,'%Y-%m-%d'))
+            mbuild.set_row(kk, **{'DATE-OBS': datetime.datetime.strftime(tval,'%Y-%m-%d')})
         elif 'MAGE' in fname:  # APPROXIMATE
-            instrlist.append('MagE')
             if 'Clay' in head['TELESCOP']:
-                telelist.append('Magellan/Clay')
+                mbuild.set_row(kk, TELESCOPE='Magellan/Clay')
             else:
-                telelist.append('Magellan/Baade')
-            gratinglist.append('N/A')
-            Rlist.append(set_resolution(head))
-            dateobslist.append(head['DATE-OBS'])
+                mbuild.set_row(kk, TELESCOPE='Magellan/Baade')
+            mbuild.set_row(kk, INSTR='MagE', GRATING='N/A', R=set_resolution(head),
+                           **{'DATE-OBS': str(head['DATE-OBS'])})
         else:  # MagE
             raise ValueError("UH OH")
         # Only way to set the dataset correctly
         if chk_meta_only:
             continue
-        spec_set[kk] = data
+        writer.write(kk)
+    writer.close()
 
     # Add columns
     meta = meta[full_idx]
-    nmeta = len(meta)
-    meta.add_column(Column([2000.]*nmeta, name='EPOCH'))
-    meta.add_column(Column(npixlist, name='NPIX'))
-    meta.add_column(Column([str(date) for date in dateobslist], name='DATE-OBS'))
-    meta.add_column(Column(wvminlist, name='WV_MIN'))
-    meta.add_column(Column(wvmaxlist, name='WV_MAX'))
-    meta.add_column(Column(Rlist, name='R'))
-    meta.add_column(Column(np.arange(nmeta,dtype=int),name='GROUP_ID'))
-    meta.add_column(Column(gratinglist, name='GRATING'))
-    meta.add_column(Column(instrlist, name='INSTR'))
-    meta.add_column(Column(telelist, name='TELESCOPE'))
+    mbuild.constant('EPOCH', 2000.)
+    mbuild.group_id()
+    mbuild.add_to(meta)
     # v02
     meta.rename_column('GRATING', 'DISPERSER')
 
@@ -0,0 +1,250 @@
+""" Module for a persistent cache of the FITS headers of the raw files
+
+Several ingests open the raw files only for a few header cards.
+The headers are cached in an SQLite file keyed by path and extension.
+Each entry is valid for the size and mtime of the file it was read from,
+so repeated builds (and meta-only runs) skip the header I/O entirely.
+The cache may be filled in parallel with prescan().
+
+The cache is off unless $IGMSPEC_HEADERS names its file (see enable);
+the headers are then read directly and prescan() does nothing.
+"""
+from __future__ import print_function, absolute_import, division, unicode_literals
+
+import os
+import sqlite3
+import threading
+import pdb
+
+from astropy.io import fits
+
+from igmspec.ingest import utils as iiu
+
+# Open caches, by file, process and thread (sqlite connections are not shared)
+_caches = {}
+
+
+def enable(db_file):
+    """ Turn on the cache for this process and those it starts
+
+    Parameters
+    ----------
+    db_file : str
+    """
+    os.environ['IGMSPEC_HEADERS'] = db_file
+
+
+def cache_file():
+    """ Header cache file set by $IGMSPEC_HEADERS
+
+    Returns
+    -------
+    db_file : str or None
+      None if the cache is off
+    """
+    return os.getenv('IGMSPEC_HEADERS')
+
+
+def file_stamp(path):
+    """ Size and mtime (ns) of a file, which validate its cached headers
+
+    Parameters
+    ----------
+    path : str
+
+    Returns
+    -------
+    size : int
+    mtime : int
+    """
+    stat = os.stat(path)
+    return stat.st_size, iiu.mtime_ns(stat)
+
+
+class HeaderCache(object):
+    """ SQLite cache of FITS headers
+
+    Parameters
+    ----------
+    db_file : str
+    """
+    def __init__(self, db_file):
+        self.db_file = db_file
+        self.conn = sqlite3.connect(db_file, timeout=60.)
+        self.conn.execute('CREATE TABLE IF NOT EXISTS headers (path TEXT, ext INTEGER, '
+                          'size INTEGER, mtime INTEGER, header TEXT, PRIMARY KEY (path, ext))')
+        self.conn.commit()
+        self.nhit = 0
+        self.nmiss = 0
+
+    def lookup(self, path, ext=0, stamp=None):
+        """ Cached header, if still valid
+
+        Parameters
+        ----------
+        path : str
+        ext : int, optional
+        stamp : tuple, optional
+          file_stamp() of path
+
+        Returns
+        -------
+        header : Header or None
+        """
+        if stamp is None:
+            stamp = file_stamp(path)
+        row = self.conn.execute('SELECT size, mtime, header FROM headers WHERE path=? AND ext=?',
+                                (os.path.abspath(path), ext)).fetchone()
+        if (row is None) or ((row[0], row[1]) != stamp):
+            return None
+        return fits.Header.fromstring(row[2])
+
+    def store(self, entries):
+        """ Add headers to the cache
+
+        Parameters
+        ----------
+        entries : list of tuple
+          (path, ext, stamp, header string)
+        """
+        self.conn.executemany('INSERT OR REPLACE INTO headers VALUES (?,?,?,?,?)',
+                              [(os.path.abspath(path), ext, stamp[0], stamp[1], shead)
+                               for path, ext, stamp, shead in entries])
+        self.conn.commit()
+
+    def getheader(self, path, ext=0):
+        """ Header of one extension of a FITS file, read on a miss
+
+        Parameters
+        ----------
+        path : str
+        ext : int, optional
+
+        Returns
+        -------
+        header : Header
+        """
+        stamp = file_stamp(path)
+        header = self.lookup(path, ext, stamp=stamp)
+        if header is not None:
+            self.nhit += 1
+            return header
+        self.nmiss += 1
+        header = fits.getheader(path, ext)
+        self.store([(path, ext, stamp, header.tostring())])
+        return header
+
+    def prescan(self, paths, exts=(0,), nproc=1):
+        """ Read the headers missing from the cache, in parallel
+
+        Parameters
+        ----------
+        paths : list
+        exts : tuple, optional
+          Extensions to cache for every path
+        nproc : int, optional
+          Number of worker processes (see iiu.map_spectra)
+
+        Returns
+        -------
+        nread : int
+          Number of files read
+        """
+        todo = []
+        for path in paths:
+            stamp = file_stamp(path)
+            if any([self.lookup(path, ext, stamp=stamp) is None for ext in exts]):
+                todo.append((path, tuple(exts)))
+        print("Header cache: reading {:d} of {:d} files".format(len(todo), len(paths)))
+        entries = []
+        for shead in iiu.map_spectra(read_headers, todo, nproc=nproc):
+            entries += shead
+            if len(entries) >= 1000:
+                self.store(entries)
+                entries = []
+        self.store(entries)
+        return len(todo)
+
+    def close(self):
+        self.conn.close()
+
+
+def read_headers(path, exts):
+    """ Headers of several extensions of a file, for the cache
+
+    Parameters
+    ----------
+    path : str
+    exts : tuple
+
+    Returns
+    -------
+    entries : list of tuple
+      (path, ext, stamp, header string)
+    """
+    stamp = file_stamp(path)
+    entries = []
+    with fits.open(path) as hdulist:  # Lazy;  the data units are not read
+        for ext in exts:
+            entries.append((path, ext, stamp, hdulist[ext].header.tostring()))
+    return entries
+
+
+def get_cache(db_file=None):
+    """ Open header cache of this process and thread
+
+    Parameters
+    ----------
+    db_file : str, optional
+
+    Returns
+    -------
+    cache : HeaderCache or None
+      None if the cache is off
+    """
+    if db_file is None:
+        db_file = cache_file()
+        if db_file is None:
+            return None
+    key = (db_file, os.getpid(), threading.current_thread().ident)
+    if key not in _caches:
+        _caches[key] = HeaderCache(db_file)
+    return _caches[key]
+
+
+def getheader(path, ext=0):
+    """ Header of one extension of a FITS file, through the cache
+
+    Parameters
+    ----------
+    path : str
+    ext : int, optional
+
+    Returns
+    -------
+    header : Header
+    """
+    cache = get_cache()
+    if cache is None:
+        return fits.getheader(path, ext)
+    return cache.getheader(path, ext)
+
+
+def prescan(paths, exts=(0,), nproc=1):
+    """ Fill the cache with the headers of a set of files
+
+    Parameters
+    ----------
+    paths : list
+    exts : tuple, optional
+    nproc : int, optional
+
+    Returns
+    -------
+    nread : int
+      0 if the cache is off
+    """
+    cache = get_cache()
+    if cache is None:
+        return 0
+    return cache.prescan(paths, exts=exts, nproc=nproc)
@@ -19,7 +19,13 @@ from astropy.time import Time
 from linetools.spectra import io as lsio
 from linetools import utils as ltu
 
-#from igmspec.ingest import utils as iiu
+from igmspec import inventory
+from igmspec.ingest import utils as iiu
+from igmspec.ingest import speccache
+from igmspec.ingest import metacache
+from igmspec.ingest import headers as iih
+from igmspec.ingest.writer import SpecWriter
+from igmspec.ingest.metabuilder import MetaBuilder
 from specdb.build.utils import chk_meta
 from specdb.build.utils import init_data
 from specdb import defs
@@ -27,6 +33,7 @@ from specdb import defs
 #igms_path = imp.find_module('igmspec')[1]
 
 
+@metacache.cached('UVpSM4', files=['HST_Cooksey/HSTQSO_pre-SM4.lst'])
 def grab_meta():
     """ Grab HST/FUSE Cooksey meta Table
     Returns
@@ -96,8 +103,46 @@ def meta_for_build():
 '''
 
 
+@speccache.cached
+def read_spec(full_file, instr):
+    """ Read one HST/FUSE spectrum
+
+    Parameters
+    ----------
+    full_file : str
+    instr : str
+      Instrument, e.g. FUSE
+
+    Returns
+    -------
+    sdict : dict
+      co is only filled if the continuum is set
+    """
+    # Extract
+    if instr == 'FUSE':
+        hext = 1
+    else:
+        hext = 0
+    try:
+        spec = lsio.readspec(full_file, head_exten=hext, masking='edges')
+    except: # BAD HEADER
+        hdu = fits.open(full_file)
+        head1 = hdu[1].header
+        hdu[1].verify('fix')
+        tbl = Table(hdu[1].data)
+        spec = lsio.readspec(tbl, masking='edges')
+        spec.meta['headers'][spec.select] = head1
+        # Continuum
+        cfile = full_file.replace('.fits', '_c.fits')
+        if inventory.isfile(cfile):
+            # Watch that mask!
+            gdp = ~spec.data['flux'][spec.select].mask
+            spec.data['co'][spec.select][gdp] = (fits.open(cfile)[0].data)[gdp]
+    return iiu.spec_to_dict(spec, include_co=spec.co_is_set)
+
+
 def hdf5_adddata(hdf, sname, meta, debug=False, chk_meta_only=False,
-                 mk_test_file=False):
+                 mk_test_file=False, nproc=1):
     """ Append HST/FUSE data to the h5 file
 
     Parameters
@@ -111,6 +156,8 @@ def hdf5_adddata(hdf, sname, meta, debug=False, chk_meta_only=False,
       Only check meta file;  will not write
     mk_test_file : bool, optional
       Generate the debug test file for Travis??
+    nproc : int, optional
+      Number of processes for reading the raw spectra
 
     Returns
     -------
@@ -132,70 +179,52 @@ def hdf5_adddata(hdf, sname, meta, debug=False, chk_meta_only=False,
     spec_set = hdf[sname].create_dataset('spec', data=data, chunks=True,
                                          maxshape=(None,), compression='gzip')
     spec_set.resize((nspec,))
-    Rlist = []
-    wvminlist = []
-    wvmaxlist = []
-    npixlist = []
-    gratinglist = []
-    datelist = []
+    writer = SpecWriter(spec_set, data)
+    mbuild = MetaBuilder(nspec, columns=[('NPIX', int), ('WV_MIN', float), ('R', float),
+                                         ('DISPERSER', str), ('WV_MAX', float),
+                                         ('DATE-OBS', str), ('GROUP_ID', int)])
     badf = []
     badstis = []
     badghrs = []
     # Loop
     path = os.getenv('RAW_IGMSPEC')+'/HST_Cooksey/'
     maxpix = 0
-    for jj,row in enumerate(meta):
-        # Generate full file
+    items = []
+    for row in meta:
         full_file = path+'{:s}/{:s}/{:s}'.format(
                          row['QSO'],row['INSTR'],row['SPEC_FILE'])
-        # Extract
-        if row['INSTR'] == 'FUSE':
-            hext = 1
-        else:
-            hext = 0
+        items.append((full_file, row['INSTR']))
+    for jj, sdict in enumerate(iiu.map_spectra(read_spec, items, nproc=nproc)):
+        row = meta[jj]
+        # Generate full file
+        full_file = items[jj][0]
         print("HST_Cooksey: Reading {:s}".format(full_file))
-        try:
-            spec = lsio.readspec(full_file, head_exten=hext, masking='edges')
-        except: # BAD HEADER
-            hdu = fits.open(full_file)
-            head1 = hdu[1].header
-            hdu[1].verify('fix')
-            tbl = Table(hdu[1].data)
-            spec = lsio.readspec(tbl, masking='edges')
-            spec.meta['headers'][spec.select] = head1
-            # Continuum
-            cfile = full_file.replace('.fits', '_c.fits')
-            if os.path.isfile(cfile):
-                # Watch that mask!
-                gdp = ~spec.data['flux'][spec.select].mask
-                spec.data['co'][spec.select][gdp] = (fits.open(cfile)[0].data)[gdp]
+        head = sdict['head']
         # npix
-        npix = spec.npix
+        npix = sdict['npix']
         if npix > max_npix:
             raise ValueError("Not enough pixels in the data... ({:d})".format(npix))
         else:
             maxpix = max(npix,maxpix)
         # Some fiddling about
-        for key in ['wave','flux','sig', 'co']:
-            data[key] = 0.  # Important to init (for compression too)
-        data['flux'][0][:npix] = spec.flux.value
-        data['sig'][0][:npix] = spec.sig.value
-        data['wave'][0][:npix] = spec.wavelength.value
-        if spec.co_is_set:
+        data = writer.row(jj, npix)
+        data['flux'][0][:npix] = sdict['flux']
+        data['sig'][0][:npix] = sdict['sig']
+        data['wave'][0][:npix] = sdict['wave']
+        if sdict['co'] is not None:
             try:
-                data['co'][0][:npix] = spec.co.value
+                data['co'][0][:npix] = sdict['co']
             except ValueError:
                 pdb.set_trace()
         # Meta
         datet = None
         if row['INSTR'] == 'FUSE':
-            if 'HISTORY' in spec.header.keys():
-                ncards = len(spec.header['HISTORY'])
+            if 'HISTORY' in head.keys():
+                ncards = len(head['HISTORY'])
                 flg_H = True
             else:
                 flg_H = False
-                hdu = fits.open(full_file)
-                head0 = hdu[0].header
+                head0 = iih.getheader(full_file)
                 ncards = len(head0)
                 # Is this a good one?
                 if 'APER_ACT' in head0:
@@ -203,23 +232,22 @@ def hdf5_adddata(hdf, sname, meta, debug=False, chk_meta_only=False,
                 else:  # Need to fight harder for the header
                     # Look for untrim
                     untrim = full_file+'.untrim'
-                    if not os.path.isfile(untrim):
+                    if not inventory.isfile(untrim):
                         pdb.set_trace()
                     # Read
-                    hduu = fits.open(untrim)
                     if 'PKS2005' in untrim:  # One extra kludge..
-                        head0 = hduu[1].header
+                        head0 = iih.getheader(untrim, 1)
                         flg_H = True
                         ncards = len(head0['HISTORY'])
                     else:
-                        head0 = hduu[0].header
+                        head0 = iih.getheader(untrim)
                         ncards = len(head0)
-                spec.meta['headers'][spec.select] = head0
+                head = head0
             # Read from history
             for ss in range(ncards):
                 if flg_H:
                     try:
-                        card = Header.fromstring(spec.header['HISTORY'][ss])
+                        card = Header.fromstring(head['HISTORY'][ss])
                     except:
                         pdb.set_trace()
                     try:
@@ -229,7 +257,7 @@ def hdf5_adddata(hdf, sname, meta, debug=False, chk_meta_only=False,
                     else:
                         card0 = card[0]
                 else:
-                    ckey, card0 = list(spec.header.keys())[ss], spec.header[ss]
+                    ckey, card0 = list(head.keys())[ss], head[ss]
                 # Parse
                 if ckey == 'APERTURE':
                     aper = card0
@@ -239,39 +267,37 @@ def hdf5_adddata(hdf, sname, meta, debug=False, chk_meta_only=False,
                     ext_ap = card0
                 elif ckey == 'DATE': # Extracted aperture
                     datet = card0
-            gratinglist.append(ext_ap+det)
+            grating = ext_ap+det
         elif row['INSTR'] == 'STIS':
             try:
-                datet = spec.header['DATE']
+                datet = head['DATE']
             except KeyError:  # handful of kludged coadds
-                if 'HISTORY' not in spec.header.keys():
+                if 'HISTORY' not in head.keys():
                     # Grab from the other extension, e.g. PKS0405
-                    hdu = fits.open(full_file)
-                    head1 = hdu[1].header
-                    spec.meta['headers'][0] = head1
-                for ihist in spec.header['HISTORY']:
+                    head = iih.getheader(full_file, 1)
+                for ihist in head['HISTORY']:
                     if 'TDATEOBS' in ihist:
                         idash = ihist.find('-')
                         datet = ihist[idash-4:idash+6]
                 # Grating from name
                 i0 = full_file.rfind('_')
                 i1 = full_file.rfind('.fits')
-                gratinglist.append(full_file[i0+1:i1])
+                grating = full_file[i0+1:i1]
                 if datet is None:
                     pdb.set_trace()
             else:
-                gratinglist.append(spec.header['OPT_ELEM'])
+                grating = head['OPT_ELEM']
         elif row['INSTR'] == 'GHRS':
             # Date
             try:
-                tmp = spec.header['DATE-OBS']
+                tmp = head['DATE-OBS']
             except KeyError:
                 # Pull header from parallel file
                 iM = full_file.find('M_1')
                 if iM <= 0:
                     iM = full_file.find('L_1')
                 ofile = full_file[:iM+1]+'_F.fits'
-                if not os.path.isfile(ofile):
+                if not inventory.isfile(ofile):
                     if 'NGC4151' in ofile:  # Kludge
                         ofile = ofile.replace('G160M', 'G160Mmd')
                     elif 'PKS2155-304_GHRS_G140L' in ofile:  # Kludge
@@ -280,9 +306,7 @@ def hdf5_adddata(hdf, sname, meta, debug=False, chk_meta_only=False,
                         ofile = ofile.replace('G160M', 'G160Mmd')
                     else:
                         pdb.set_trace()
-                hdu = fits.open(ofile)
-                head0 = hdu[0].header
-                spec.meta['headers'][spec.select] = head0
+                head = iih.getheader(ofile)
             # Reformat
             prs = tmp.split('/')
             if prs[2][0] == '9':
@@ -291,30 +315,29 @@ def hdf5_adddata(hdf, sname, meta, debug=False, chk_meta_only=False,
                 yr = '20'+prs[2]
             datet = yr+'-'+prs[1]+'-{:02d}'.format(int(prs[0]))
             # Grating
-            gratinglist.append(spec.header['GRATING'])
+            grating = head['GRATING']
         else:
             pdb.set_trace()
         if datet is None:
             try:
-                datet = spec.header['DATE-OBS']
+                datet = head['DATE-OBS']
             except KeyError:
                 print("Missing Header for file: {:s}".format(full_file))
                 badf.append(full_file)
                 datet = '9999-9-9'
         t = Time(datet, format='isot', out_subfmt='date')  # Fixes to YYYY-MM-DD
-        datelist.append(t.iso)
+        mbuild.set_row(jj, DISPERSER=grating, **{'DATE-OBS': t.iso})
         try:
-            Rlist.append(Rdicts[row['INSTR']][gratinglist[-1]])
+            mbuild.set_row(jj, R=Rdicts[row['INSTR']][grating])
         except KeyError:
-            print(gratinglist[-1])
+            print(grating)
             pdb.set_trace()
-        wvminlist.append(np.min(data['wave'][0][:npix]))
-        wvmaxlist.append(np.max(data['wave'][0][:npix]))
-        npixlist.append(npix)
+        mbuild.set_pix(jj, data['wave'][0], npix)
         if chk_meta_only:
             continue
         # Only way to set the dataset correctly
-        spec_set[jj] = data
+        writer.write(jj)
+    writer.close()
 
     #
     if (len(badstis)) > 0:
@@ -327,13 +350,8 @@ def hdf5_adddata(hdf, sname, meta, debug=False, chk_meta_only=False,
         pdb.set_trace()
     print("Max pix = {:d}".format(maxpix))
     # Add columns
-    meta.add_column(Column(npixlist, name='NPIX'))
-    meta.add_column(Column(wvminlist, name='WV_MIN'))
-    meta.add_column(Column(Rlist, name='R'))
-    meta.add_column(Column(gratinglist, name='DISPERSER'))
-    meta.add_column(Column(wvmaxlist, name='WV_MAX'))
-    meta.add_column(Column(datelist, name='DATE-OBS'))
-    meta.add_column(Column(np.arange(nspec,dtype=int),name='GROUP_ID'))
+    mbuild.group_id()
+    mbuild.add_to(meta)
 
     # Add HDLLS meta to hdf5
     if chk_meta(meta):
@@ -8,11 +8,10 @@ from __future__ import print_function, absolute_import, division, unicode_litera
 import numpy as np
 import pdb
 import warnings
-import os, json, glob, imp
+import os, json, imp
 import datetime
 
 from astropy.table import Table, Column, vstack
-from astropy.coordinates import SkyCoord, match_coordinates_sky
 from astropy import units as u
 from astropy.io import fits
 
@@ -22,9 +21,19 @@ from linetools import utils as ltu
 from specdb.build.utils import chk_meta
 from specdb.build.utils import init_data
 
+from igmspec import inventory
+from igmspec import xmatch
+from igmspec.ingest import utils as iiu
+from igmspec.ingest import speccache
+from igmspec.ingest import metacache
+from igmspec.ingest.writer import SpecWriter
+from igmspec.ingest.metabuilder import MetaBuilder
+
 #igms_path = imp.find_module('igmspec')[1]
 
 
+@metacache.cached('HSTQSO', files=['HSTQSO/hstqso.lst', 'HSTQSO/all_qso_table.txt',
+                                    'HSTQSO/date_obs*'])
 def grab_meta():
     """ Grab HSTQSO meta Table
     Returns
@@ -39,7 +48,7 @@ def grab_meta():
     radec_file = os.getenv('RAW_IGMSPEC')+'/HSTQSO/all_qso_table.txt'
     radec = Table.read(radec_file, format='ascii')
     # DATE-OBS
-    date_files = glob.glob(os.getenv('RAW_IGMSPEC')+'/HSTQSO/date_obs*')
+    date_files = inventory.glob(os.getenv('RAW_IGMSPEC')+'/HSTQSO/date_obs*')
     for ss,date_file in enumerate(date_files):
         if ss == 0:
             tab_date = Table.read(date_file, format='ascii')
@@ -47,18 +56,20 @@ def grab_meta():
             tab_date = vstack([tab_date, Table.read(date_file, format='ascii')])
     # RA/DEC, DATE
     hstqso_meta.add_column(Column(['2000-01-01']*nspec, name='DATE-OBS'))
+    specs = np.array([str(spec_file).split('.')[0] for spec_file in hstqso_meta['SPEC_FILE']])
+    date_idx, ndate = iiu.match_rows(specs, tab_date['SPEC'], label='HSTQSO SPEC')
+    alt_idx, nalt = iiu.match_rows(hstqso_meta['QSO_ALT_NAME'], radec['File_ID'])
+    name_idx, nname = iiu.match_rows(hstqso_meta['QSO_NAME'], radec['File_ID'])
     for jj,row in enumerate(hstqso_meta):
         if row['INST'] == 'COS':
             spec_files[jj] = str(row['QSO_ALT_NAME']+'_hsla.fits')
             continue
         # DATE
-        spec = row['SPEC_FILE'].split('.')[0]
-        mt1 = np.where(tab_date['SPEC'] == spec)[0]
-        if len(mt1) == 0:
-            print("NO DATE MATCH for {:s}!".format(spec))
+        if ndate[jj] == 0:
+            print("NO DATE MATCH for {:s}!".format(specs[jj]))
             pdb.set_trace()
         else:
-            mt1 = mt1[0] # TAKING THE FIRST ONE
+            mt1 = date_idx[jj] # TAKING THE FIRST ONE
         joe_date = tab_date['DATE-OBS'][mt1].split('-')
         hstqso_meta[jj]['DATE-OBS'] = '{:s}-{:02d}-{:02d}'.format(joe_date[0], int(joe_date[1]), int(joe_date[2]))
         if int(joe_date[1]) > 12:
@@ -66,29 +77,26 @@ def grab_meta():
         # RA/DEC
         if row['INST'] != 'FOS':
             continue
-        mt = np.where(radec['File_ID'] == row['QSO_ALT_NAME'])[0]
-        if len(mt) == 0:
-            mt = np.where(radec['File_ID'] == row['QSO_NAME'])[0]
-            if len(mt) == 0:
+        if nalt[jj] == 0:
+            if nname[jj] == 0:
                 print("NO RA/DEC MATCH!")
                 pdb.set_trace()
             else:
-                mt = mt[0]
+                mt = name_idx[jj]
         else:
-            mt = mt[0]
+            mt = alt_idx[jj]
         hstqso_meta[jj]['RA'] = radec['RA'][mt]
         hstqso_meta[jj]['DEC'] = radec['DEC'][mt]
     # Deal with Dups (mainly bad FOS coords)
-    coord = SkyCoord(ra=hstqso_meta['RA'], dec=hstqso_meta['DEC'], unit='deg')
-    idx, d2d, d3d = match_coordinates_sky(coord, coord, nthneighbor=2)
-    dups = np.where(d2d < 2.0*u.arcsec)[0]  # Closest lens is ~2"
+    tree = xmatch.SkyTree(hstqso_meta['RA'], hstqso_meta['DEC'])
+    idx, d2d = tree.nearest(tree.ra, tree.dec, nth=2)
+    dups = np.where(d2d < 2.0/3600)[0]  # Closest lens is ~2"
     flag_dup = np.array([False]*len(hstqso_meta))
     for idup in dups:
         if flag_dup[idup]:
             continue
-        dcoord = SkyCoord(ra=hstqso_meta['RA'][idup], dec=hstqso_meta['DEC'][idup], unit='deg')
-        sep = dcoord.separation(coord)
-        isep = np.where(sep < 2.0*u.arcsec)[0]
+        _, isep, sep = tree.within(tree.ra[idup], tree.dec[idup], 2.0*u.arcsec)
+        isep = isep[sep < 2.0/3600]
         # Search for COS first
         icos = np.where(hstqso_meta['INST'][isep] == 'COS')[0]
         if len(icos) > 0:
@@ -133,14 +141,13 @@ def meta_for_build():
     # Meta
     hstqso_meta = grab_meta()
     # Cut down to unique sources
-    coord = SkyCoord(ra=hstqso_meta['RA'], dec=hstqso_meta['DEC'], unit='deg')
-    idx, d2d, d3d = match_coordinates_sky(coord, coord, nthneighbor=2)
-    dups = np.where(d2d < 1.5*u.arcsec)[0]  # Closest lens is ~2"
+    tree = xmatch.SkyTree(hstqso_meta['RA'], hstqso_meta['DEC'])
+    idx, d2d = tree.nearest(tree.ra, tree.dec, nth=2)
+    dups = np.where(d2d < 1.5/3600)[0]  # Closest lens is ~2"
     keep = np.array([True]*len(hstqso_meta))
     for idup in dups:
-        dcoord = SkyCoord(ra=hstqso_meta['RA'][idup], dec=hstqso_meta['DEC'][idup], unit='deg')
-        sep = dcoord.separation(coord)
-        isep = np.where(sep < 1.5*u.arcsec)[0]
+        _, isep, sep = tree.within(tree.ra[idup], tree.dec[idup], 1.5*u.arcsec)
+        isep = isep[sep < 1.5/3600]
         keep[isep] = False
         keep[np.min(isep)] = True  # Only keep 1
     hstqso_meta = hstqso_meta[keep]
@@ -158,8 +165,29 @@ def meta_for_build():
 '''
 
 
+@speccache.cached
+def read_spec(full_file):
+    """ Read one HSTQSO spectrum
+
+    Parameters
+    ----------
+    full_file : str
+
+    Returns
+    -------
+    sdict : dict
+      Includes DATE-OBS for the COS (hsla) files
+    """
+    hduf = fits.open(full_file)
+    spec = lsio.readspec(full_file, masking='edges')
+    sdict = iiu.spec_to_dict(spec)
+    if 'hsla' in full_file.split('/')[-1]:  # COS
+        sdict['DATE-OBS'] = hduf[1].data['DATEOBS'][0][0]
+    return sdict
+
+
 def hdf5_adddata(hdf, sname, meta, debug=False, chk_meta_only=False,
-                 mk_test_file=False):
+                 mk_test_file=False, nproc=1):
     """ Append HSTQSO data to the h5 file
 
     Parameters
@@ -173,6 +201,8 @@ def hdf5_adddata(hdf, sname, meta, debug=False, chk_meta_only=False,
       Only check meta file;  will not write
     mk_test_file : bool, optional
       Generate the debug test file for Travis??
+    nproc : int, optional
+      Number of processes for reading the raw spectra
 
     Returns
     -------
@@ -193,71 +223,64 @@ def hdf5_adddata(hdf, sname, meta, debug=False, chk_meta_only=False,
     spec_set = hdf[sname].create_dataset('spec', data=data, chunks=True,
                                          maxshape=(None,), compression='gzip')
     spec_set.resize((nspec,))
-    wvminlist = []
-    wvmaxlist = []
-    npixlist = []
-    Rlist = []
+    writer = SpecWriter(spec_set, data)
+    mbuild = MetaBuilder(nspec, columns=[('EPOCH', float), ('NPIX', int), ('WV_MIN', float),
+                                         ('WV_MAX', float), ('R', float), ('GROUP_ID', int)])
     # Loop
     #path = os.getenv('RAW_IGMSPEC')+'/KODIAQ_data_20150421/'
     path = os.getenv('RAW_IGMSPEC')+'/HSTQSO/'
     maxpix = 0
-    for jj,row in enumerate(meta):
+    full_files = [path+row['SPEC_FILE']+'.gz' for row in meta]
+    for jj, sdict in enumerate(iiu.map_spectra(read_spec, full_files, nproc=nproc)):
+        row = meta[jj]
         # Generate full file
-        full_file = path+row['SPEC_FILE']+'.gz'
+        full_file = full_files[jj]
         # Extract
         print("HSTQSO: Reading {:s}".format(full_file))
-        hduf = fits.open(full_file)
-        head0 = hduf[0].header
-        spec = lsio.readspec(full_file, masking='edges')
         # Parse name
         fname = full_file.split('/')[-1]
         # npix
-        npix = spec.npix
+        npix = sdict['npix']
         if npix > max_npix:
             raise ValueError("Not enough pixels in the data... ({:d})".format(npix))
         else:
             maxpix = max(npix,maxpix)
         # Some fiddling about
-        for key in ['wave','flux','sig']:
-            data[key] = 0.  # Important to init (for compression too)
-        data['flux'][0][:npix] = spec.flux.value
-        data['sig'][0][:npix] = spec.sig.value
-        data['wave'][0][:npix] = spec.wavelength.value
+        data = writer.row(jj, npix)
+        data['flux'][0][:npix] = sdict['flux']
+        data['sig'][0][:npix] = sdict['sig']
+        data['wave'][0][:npix] = sdict['wave']
         # Meta
         if 'FOS-L' in fname:
-            Rlist.append(300.)
+            mbuild.set_row(jj, R=300.)
         elif 'FOS-H' in fname:
-            Rlist.append(14000.)
+            mbuild.set_row(jj, R=14000.)
         elif 'STIS' in fname:
             if row['DISPERSER'] == 'G230L':
-                Rlist.append(700.)
+                mbuild.set_row(jj, R=700.)
             elif row['DISPERSER'] == 'G140L':
-                Rlist.append(1200.)
+                mbuild.set_row(jj, R=1200.)
             else:
                 raise ValueError("Bad STIS grating")
         elif 'hsla' in fname:  # COS
-            Rlist.append(18000.)
-            row['DATE-OBS'] = hduf[1].data['DATEOBS'][0][0]
+            mbuild.set_row(jj, R=18000.)
+            row['DATE-OBS'] = sdict['DATE-OBS']
         else:
             pdb.set_trace()
             raise ValueError("Missing instrument!")
-        wvminlist.append(np.min(data['wave'][0][:npix]))
-        wvmaxlist.append(np.max(data['wave'][0][:npix]))
-        npixlist.append(npix)
+        mbuild.set_pix(jj, data['wave'][0], npix)
         if chk_meta_only:
             continue
         # Only way to set the dataset correctly
-        spec_set[jj] = data
+        writer.write(jj)
+    writer.close()
 
     #
     print("Max pix = {:d}".format(maxpix))
     # Add columns
-    meta.add_column(Column([2000.]*nspec, name='EPOCH'))
-    meta.add_column(Column(npixlist, name='NPIX'))
-    meta.add_column(Column(wvminlist, name='WV_MIN'))
-    meta.add_column(Column(wvmaxlist, name='WV_MAX'))
-    meta.add_column(Column(Rlist, name='R'))
-    meta.add_column(Column(np.arange(nspec,dtype=int),name='GROUP_ID'))
+    mbuild.constant('EPOCH', 2000.)
+    mbuild.group_id()
+    mbuild.add_to(meta)
 
     # Add HDLLS meta to hdf5
     if chk_meta(meta):
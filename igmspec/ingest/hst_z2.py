@@ -5,7 +5,6 @@ Prochaska et al. 2015
 from __future__ import print_function, absolute_import, division, unicode_literals
 
 
-import numpy as np
 import pdb
 import warnings
 import os, json
@@ -21,9 +20,16 @@ from linetools import utils as ltu
 from specdb.build.utils import chk_meta
 from specdb.build.utils import init_data
 
+from igmspec.ingest import utils as iiu
+from igmspec.ingest import speccache
+from igmspec.ingest import metacache
+from igmspec.ingest.writer import SpecWriter
+from igmspec.ingest.metabuilder import MetaBuilder, SPEC_COLUMNS
+
 #igms_path = imp.find_module('igmspec')[1]
 
 
+@metacache.cached('HST_z2', files=['HST_z2/hst_z2.ascii'])
 def grab_meta():
     """ Grab KODIAQ meta Table
     Returns
@@ -85,8 +91,24 @@ def meta_for_build():
 '''
 
 
+@speccache.cached
+def read_spec(full_file):
+    """ Read one HST_z2 spectrum
+
+    Parameters
+    ----------
+    full_file : str
+
+    Returns
+    -------
+    sdict : dict
+    """
+    spec = lsio.readspec(full_file)
+    return iiu.spec_to_dict(spec)
+
+
 def hdf5_adddata(hdf, sname, meta, debug=False, chk_meta_only=False,
-                 mk_test_file=False):
+                 mk_test_file=False, nproc=1):
     """ Append HST_z2 data to the h5 file
 
     Parameters
@@ -100,6 +122,8 @@ def hdf5_adddata(hdf, sname, meta, debug=False, chk_meta_only=False,
       Only check meta file;  will not write
     mk_test_file : bool, optional
       Generate the debug test file for Travis??
+    nproc : int, optional
+      Number of processes for reading the raw spectra
 
     Returns
     -------
@@ -120,60 +144,52 @@ def hdf5_adddata(hdf, sname, meta, debug=False, chk_meta_only=False,
     spec_set = hdf[sname].create_dataset('spec', data=data, chunks=True,
                                          maxshape=(None,), compression='gzip')
     spec_set.resize((nspec,))
-    wvminlist = []
-    wvmaxlist = []
-    npixlist = []
-    speclist = []
+    writer = SpecWriter(spec_set, data)
+    mbuild = MetaBuilder(nspec, columns=[('EPOCH', float)]+SPEC_COLUMNS)
     # Loop
     #path = os.getenv('RAW_IGMSPEC')+'/KODIAQ_data_20150421/'
     path = os.getenv('RAW_IGMSPEC')+'/HST_z2/'
     maxpix = 0
-    for jj,row in enumerate(meta):
-        # Generate full file
+    full_files = []
+    for row in meta:
         if row['INSTR'] == 'ACS':
             full_file = path+row['qso']+'.fits.gz'
         elif row['INSTR'] == 'WFC3':
             coord = ltu.radec_to_coord((row['RA_GROUP'],row['DEC_GROUP']))
             full_file = path+'/J{:s}{:s}_wfc3.fits.gz'.format(coord.ra.to_string(unit=u.hour,sep='',precision=2,pad=True),
                                                coord.dec.to_string(sep='',pad=True,alwayssign=True,precision=1))
+        full_files.append(full_file)
+    for jj, sdict in enumerate(iiu.map_spectra(read_spec, full_files, nproc=nproc)):
+        full_file = full_files[jj]
         # Extract
         print("HST_z2: Reading {:s}".format(full_file))
-        hduf = fits.open(full_file)
-        #head = hduf[0].header
-        spec = lsio.readspec(full_file)
         # Parse name
         fname = full_file.split('/')[-1]
         # npix
-        npix = spec.npix
+        npix = sdict['npix']
         if npix > max_npix:
             raise ValueError("Not enough pixels in the data... ({:d})".format(npix))
         else:
             maxpix = max(npix,maxpix)
         # Some fiddling about
-        for key in ['wave','flux','sig']:
-            data[key] = 0.  # Important to init (for compression too)
-        data['flux'][0][:npix] = spec.flux.value
-        data['sig'][0][:npix] = spec.sig.value
-        data['wave'][0][:npix] = spec.wavelength.value
+        data = writer.row(jj, npix)
+        data['flux'][0][:npix] = sdict['flux']
+        data['sig'][0][:npix] = sdict['sig']
+        data['wave'][0][:npix] = sdict['wave']
         # Meta
-        speclist.append(str(fname))
-        wvminlist.append(np.min(data['wave'][0][:npix]))
-        wvmaxlist.append(np.max(data['wave'][0][:npix]))
-        npixlist.append(npix)
+        mbuild.set_spec(jj, fname, data['wave'][0], npix)
         if chk_meta_only:
             continue
         # Only way to set the dataset correctly
-        spec_set[jj] = data
+        writer.write(jj)
+    writer.close()
 
     #
     print("Max pix = {:d}".format(maxpix))
     # Add columns
-    meta.add_column(Column([2000.]*nspec, name='EPOCH'))
-    meta.add_column(Column(speclist, name='SPEC_FILE'))
-    meta.add_column(Column(npixlist, name='NPIX'))
-    meta.add_column(Column(wvminlist, name='WV_MIN'))
-    meta.add_column(Column(wvmaxlist, name='WV_MAX'))
-    meta.add_column(Column(np.arange(nspec,dtype=int),name='GROUP_ID'))
+    mbuild.constant('EPOCH', 2000.)
+    mbuild.group_id()
+    mbuild.add_to(meta)
 
     # Add HDLLS meta to hdf5
     if chk_meta(meta):
@@ -5,7 +5,6 @@ O'Meara et al. 2016
 from __future__ import print_function, absolute_import, division, unicode_literals
 
 
-import numpy as np
 import pdb
 import os, json
 import imp
@@ -24,9 +23,16 @@ from specdb.build.utils import chk_meta
 from specdb.build.utils import set_resolution
 from specdb.build.utils import init_data
 
+from igmspec.ingest import utils as iiu
+from igmspec.ingest import speccache
+from igmspec.ingest import metacache
+from igmspec.ingest.writer import SpecWriter
+from igmspec.ingest.metabuilder import MetaBuilder
+
 igms_path = imp.find_module('igmspec')[1]
 
 
+@metacache.cached('KODIAQ_DR1', files=[])  # The summary is a package file
 def grab_meta():
     """ Grab KODIAQ meta Table
     Returns
@@ -94,7 +100,26 @@ def meta_for_build():
     return meta
 '''
 
-def hdf5_adddata(hdf, sname, meta, debug=False, chk_meta_only=False):
+@speccache.cached
+def read_spec(full_file):
+    """ Read one KODIAQ DR1 spectrum
+
+    Parameters
+    ----------
+    full_file : str
+
+    Returns
+    -------
+    sdict : dict
+    """
+    hduf = fits.open(full_file)
+    spec = lsio.readspec(full_file)
+    sdict = iiu.spec_to_dict(spec)
+    sdict['head'] = hduf[0].header
+    return sdict
+
+
+def hdf5_adddata(hdf, sname, meta, debug=False, chk_meta_only=False, nproc=1):
     """ Append KODIAQ data to the h5 file
 
     Parameters
@@ -106,6 +131,8 @@ def hdf5_adddata(hdf, sname, meta, debug=False, chk_meta_only=False):
       Survey name
     chk_meta_only : bool, optional
       Only check meta file;  will not write
+    nproc : int, optional
+      Number of processes for reading the raw spectra
 
     Returns
     -------
@@ -127,68 +154,58 @@ def hdf5_adddata(hdf, sname, meta, debug=False, chk_meta_only=False):
     spec_set = hdf[sname].create_dataset('spec', data=data, chunks=True,
                                          maxshape=(None,), compression='gzip')
     spec_set.resize((nspec,))
-    # Lists
-    Rlist = []
-    wvminlist = []
-    wvmaxlist = []
-    gratinglist = []
-    npixlist = []
-    speclist = []
+    writer = SpecWriter(spec_set, data)
+    # Columns
+    mbuild = MetaBuilder(nspec, columns=[('EPOCH', float), ('SPEC_FILE', str), ('NPIX', int),
+                                         ('WV_MIN', float), ('WV_MAX', float), ('R', float),
+                                         ('GRATING', str), ('GROUP_ID', int)])
     # Loop
     #path = os.getenv('RAW_IGMSPEC')+'/KODIAQ_data_20150421/'
     path = os.getenv('RAW_IGMSPEC')+'/KODIAQ_data_20160618/'  # BZERO FIXED
     maxpix = 0
-    for jj,row in enumerate(meta):
+    full_files = [path+row['qso']+'/'+row['pi_date']+'/'+row['spec_prefix']+'_f.fits'
+                  for row in meta]
+    for jj, sdict in enumerate(iiu.map_spectra(read_spec, full_files, nproc=nproc)):
         # Generate full file
-        full_file = path+row['qso']+'/'+row['pi_date']+'/'+row['spec_prefix']+'_f.fits'
+        full_file = full_files[jj]
         # Extract
         print("KODIAQ: Reading {:s}".format(full_file))
-        hduf = fits.open(full_file)
-        head = hduf[0].header
-        spec = lsio.readspec(full_file)
+        head = sdict['head']
         # Parse name
         fname = full_file.split('/')[-1]
         # npix
-        npix = spec.npix
+        npix = sdict['npix']
         if npix > max_npix:
             raise ValueError("Not enough pixels in the data... ({:d})".format(npix))
         else:
             maxpix = max(npix,maxpix)
         # Some fiddling about
-        for key in ['wave','flux','sig']:
-            data[key] = 0.  # Important to init (for compression too)
-        data['flux'][0][:npix] = spec.flux.value
-        data['sig'][0][:npix] = spec.sig.value
-        data['wave'][0][:npix] = spec.wavelength.value
+        data = writer.row(jj, npix)
+        data['flux'][0][:npix] = sdict['flux']
+        data['sig'][0][:npix] = sdict['sig']
+        data['wave'][0][:npix] = sdict['wave']
         # Meta
-        speclist.append(str(fname))
-        wvminlist.append(np.min(data['wave'][0][:npix]))
-        wvmaxlist.append(np.max(data['wave'][0][:npix]))
+        mbuild.set_spec(jj, fname, data['wave'][0], npix)
         if head['XDISPERS'].strip() == 'UV':
-            gratinglist.append('BLUE')
+            mbuild.set_row(jj, GRATING='BLUE')
         else:
-            gratinglist.append('RED')
-        npixlist.append(npix)
+            mbuild.set_row(jj, GRATING='RED')
         try:
-            Rlist.append(set_resolution(head))
+            mbuild.set_row(jj, R=set_resolution(head))
         except ValueError:
             pdb.set_trace()
         # Only way to set the dataset correctly
         if chk_meta_only:
             continue
-        spec_set[jj] = data
+        writer.write(jj)
+    writer.close()
 
     #
     print("Max pix = {:d}".format(maxpix))
     # Add columns
-    meta.add_column(Column([2000.]*nspec, name='EPOCH'))
-    meta.add_column(Column(speclist, name='SPEC_FILE'))
-    meta.add_column(Column(npixlist, name='NPIX'))
-    meta.add_column(Column(wvminlist, name='WV_MIN'))
-    meta.add_column(Column(wvmaxlist, name='WV_MAX'))
-    meta.add_column(Column(Rlist, name='R'))
-    meta.add_column(Column(gratinglist, name='GRATING'))
-    meta.add_column(Column(np.arange(nspec,dtype=int),name='GROUP_ID'))
+    mbuild.constant('EPOCH', 2000.)
+    mbuild.group_id()
+    mbuild.add_to(meta)
 
     # Add HDLLS meta to hdf5
     if chk_meta(meta):
@@ -0,0 +1,170 @@
+""" Module for building the columns of a meta table by row index
+
+The ingest loops fill preallocated numpy arrays, one per column, by
+the row of the spectrum instead of growing Python lists;  the columns
+are added to the meta Table in one step once the loop is done.
+"""
+from __future__ import print_function, absolute_import, division, unicode_literals
+
+from collections import OrderedDict
+import pdb
+
+import numpy as np
+
+from astropy.table import Column
+
+# Columns filled from the spectra of (nearly) every group
+SPEC_COLUMNS = [('SPEC_FILE', str), ('NPIX', int), ('WV_MIN', float), ('WV_MAX', float)]
+
+
+class MetaBuilder(object):
+    """ Columns of a meta table, filled by row
+
+    Parameters
+    ----------
+    nspec : int
+    columns : list of tuple, optional
+      (name, dtype);  defaults to SPEC_COLUMNS
+      str columns are held as objects until to_columns()
+    """
+    def __init__(self, nspec, columns=None):
+        self.nspec = nspec
+        self.columns = OrderedDict()
+        if columns is None:
+            columns = SPEC_COLUMNS
+        for name, dtype in columns:
+            self.add_column(name, dtype)
+
+    def add_column(self, name, dtype, fill=None):
+        """ Preallocate a column
+
+        Parameters
+        ----------
+        name : str
+        dtype : type or str
+        fill : optional
+          Initial value;  zeros (or '') by default
+        """
+        if dtype is str:
+            arr = np.full(self.nspec, '' if fill is None else fill, dtype=object)
+        else:
+            arr = np.zeros(self.nspec, dtype=dtype)
+            if fill is not None:
+                arr[:] = fill
+        self.columns[name] = arr
+
+    def set_row(self, jj, **values):
+        """ Fill the values of one row
+
+        Parameters
+        ----------
+        jj : int
+        values : dict
+          Keyed by column name
+        """
+        for name, value in values.items():
+            self.columns[name][jj] = value
+
+    def set_spec(self, jj, fname, wave, npix):
+        """ Fill the SPEC_FILE, NPIX, WV_MIN and WV_MAX of one row
+
+        Parameters
+        ----------
+        jj : int
+        fname : str
+        wave : ndarray
+          Wavelengths of the row;  only the first npix are used
+        npix : int
+        """
+        self.columns['SPEC_FILE'][jj] = str(fname)
+        self.set_pix(jj, wave, npix)
+
+    def set_pix(self, jj, wave, npix):
+        """ Fill the NPIX, WV_MIN and WV_MAX of one row, e.g. when
+        SPEC_FILE is already in the meta table
+
+        Parameters
+        ----------
+        jj : int
+        wave : ndarray
+          Wavelengths of the row;  only the first npix are used
+        npix : int
+        """
+        self.columns['NPIX'][jj] = npix
+        self.columns['WV_MIN'][jj] = np.min(wave[:npix])
+        self.columns['WV_MAX'][jj] = np.max(wave[:npix])
+
+    def constant(self, name, value):
+        """ Column of a single value, e.g. EPOCH, INSTR or TELESCOPE
+
+        Parameters
+        ----------
+        name : str
+        value : str, float or int
+        """
+        if isinstance(value, str):
+            self.columns[name] = np.full(self.nspec, value, dtype=object)
+        else:
+            self.columns[name] = np.full(self.nspec, value)
+
+    def map_values(self, name, keys, mapping, dtype=float):
+        """ Column looked up from a dict by the values of another column,
+        once per distinct value, e.g. R from the DISPERSER
+
+        Parameters
+        ----------
+        name : str
+        keys : ndarray or Column
+        mapping : dict
+        dtype : type, optional
+
+        Returns
+        -------
+        missing : list
+          Keys not in the mapping;  their rows are left at zero
+        """
+        ukeys, inv = np.unique(np.asarray(keys), return_inverse=True)
+        uvals = np.zeros(len(ukeys), dtype=dtype)
+        missing = []
+        for ii, key in enumerate(ukeys):
+            try:
+                uvals[ii] = mapping[key]
+            except KeyError:
+                missing.append(key)
+        self.columns[name] = uvals[inv]
+        return missing
+
+    def group_id(self):
+        """ GROUP_ID column, i.e. the row index
+        """
+        self.columns['GROUP_ID'] = np.arange(self.nspec, dtype=int)
+
+    def to_columns(self):
+        """ The columns, with str ones converted to fixed width
+
+        Returns
+        -------
+        columns : list of Column
+        """
+        cols = []
+        for name, arr in self.columns.items():
+            if arr.dtype == object:
+                arr = arr.astype(str)
+            cols.append(Column(arr, name=name))
+        return cols
+
+    def add_to(self, meta):
+        """ Add the columns to the meta table in one step
+
+        Parameters
+        ----------
+        meta : Table
+
+        Returns
+        -------
+        meta : Table
+        """
+        if len(meta) != self.nspec:
+            raise ValueError("meta has {:d} rows, not {:d}".format(len(meta), self.nspec))
+        meta.add_columns(self.to_columns())
+        return meta
@@ -0,0 +1,177 @@
+""" Module for an on-disk cache of the grab_meta output of each group
+
+grab_meta of most groups parses catalogs, tarballs and per-object
+files whose contents rarely change.  Its output Table is pickled (so
+that it is restored exactly) and keyed by the source of the ingest
+module (and the igmspec modules it uses), the arguments and a
+fingerprint of the inputs:  the raw files read by grab_meta (the
+summary tables, as listed by each module) plus the package files of
+the group, and any other files given by the module.  The raw data of
+the whole group (see fingerprint.group_fingerprint) are used only if
+a module lists no files.  Meta-only runs and ID dry runs then skip
+the parsing.
+
+The cache is off unless $IGMSPEC_METACACHE names its directory
+(see enable).  Groups whose meta reads a quasars catalog of a DB
+(SDSS_DR7, XQ-100, COS-Halos, UVES_Dall) are not cached.
+"""
+from __future__ import print_function, absolute_import, division, unicode_literals
+
+import os
+import sys
+import glob
+import pickle
+import hashlib
+import functools
+import pdb
+
+from igmspec import fingerprint as ifp
+from igmspec.ingest import utils as iiu
+
+
+def enable(cache_path):
+    """ Turn on the cache for this process and those it starts
+
+    Parameters
+    ----------
+    cache_path : str
+    """
+    os.environ['IGMSPEC_METACACHE'] = cache_path
+
+
+def listing(path):
+    """ Names of the files under a directory, without a stat of each
+
+    Parameters
+    ----------
+    path : str
+
+    Returns
+    -------
+    names : list
+      Relative to path, sorted
+    """
+    names = []
+    todo = [path]
+    while len(todo) > 0:
+        for entry in iiu.scandir(todo.pop()):
+            if entry.is_dir():
+                todo.append(entry.path)
+            else:
+                names.append(os.path.relpath(entry.path, path))
+    names.sort()
+    return names
+
+
+def input_hash(gname, module, files=None, extra=None, dirs=None):
+    """ Fingerprint of the inputs of grab_meta
+
+    Parameters
+    ----------
+    gname : str
+    module : module
+    files : list, optional
+      Raw files read (relative to $RAW_IGMSPEC);  wildcards are allowed.
+      Defaults to all of the raw data of the group
+    extra : function, optional
+      Returns a list of other files or directories read
+    dirs : list, optional
+      Raw directories (relative to $RAW_IGMSPEC) whose file names only
+      are read, e.g. to require that a spectrum exist
+
+    Returns
+    -------
+    str
+    """
+    md5 = hashlib.md5()
+    raw_path = os.getenv('RAW_IGMSPEC')
+    if files is None:
+        md5.update(ifp.group_fingerprint(gname, module)['hash'].encode('utf-8'))
+    else:
+        md5.update(ifp.code_hash(module).encode('utf-8'))
+        for pfile in ifp.pkg_files(gname):
+            md5.update(ifp.hash_file(pfile).encode('utf-8'))
+        for rfile in files:
+            if glob.has_magic(rfile):
+                paths = sorted(glob.glob(os.path.join(raw_path, rfile)))
+            else:
+                paths = [os.path.join(raw_path, rfile)]
+            for path in paths:
+                for relpath, size, mtime in ifp.scan_files(path):
+                    md5.update('{:s} {:s} {:d} {:d}\n'.format(os.path.relpath(path, raw_path),
+                                                               relpath, size, mtime).encode('utf-8'))
+    if dirs is not None:
+        for rdir in dirs:
+            for name in listing(os.path.join(raw_path, rdir)):
+                md5.update('{:s}/{:s}\n'.format(rdir, name).encode('utf-8'))
+    if extra is not None:
+        for path in extra():
+            for relpath, size, mtime in ifp.scan_files(path):
+                md5.update('{:s}/{:s} {:d} {:d}\n'.format(path, relpath, size, mtime).encode('utf-8'))
+    return md5.hexdigest()
+
+
+def pyigm_data():
+    """ Data directory of pyigm, read by some grab_meta (e.g. HDLA100, COS-Dwarfs)
+
+    Returns
+    -------
+    paths : list
+    """
+    import pyigm
+    return [os.path.join(os.path.dirname(pyigm.__file__), 'data')]
+
+
+def cached(gname, files=None, extra=None, dirs=None):
+    """ Decorator to look up the output of a grab_meta function in the
+    cache (when enabled) before generating it
+
+    Parameters
+    ----------
+    gname : str
+    files : list, optional
+    extra : function, optional
+    dirs : list, optional
+      See input_hash
+
+    Returns
+    -------
+    function
+    """
+    def decorator(grab_meta):
+        @functools.wraps(grab_meta)
+        def wrapper(*args, **kwargs):
+            cache_path = os.getenv('IGMSPEC_METACACHE')
+            if cache_path is None:
+                return grab_meta(*args, **kwargs)
+            module = sys.modules[grab_meta.__module__]
+            md5 = hashlib.md5()
+            md5.update(input_hash(gname, module, files=files, extra=extra,
+                                  dirs=dirs).encode('utf-8'))
+            md5.update('{!r} {!r}'.format(args, sorted(kwargs.items())).encode('utf-8'))
+            root = os.path.join(cache_path, '{:s}_{:s}'.format(gname, grab_meta.__name__))
+            mfile = '{:s}_{:s}.pkl'.format(root, md5.hexdigest())
+            if os.path.isfile(mfile):
+                with open(mfile, 'rb') as f:
+                    meta = pickle.load(f)
+                print("Meta cache: {:s} meta loaded from {:s}".format(gname, mfile))
+                return meta
+            meta = grab_meta(*args, **kwargs)
+            if not os.path.isdir(cache_path):
+                try:
+                    os.makedirs(cache_path)
+                except OSError:  # Made by another process
+                    pass
+            # Drop the outputs of older inputs (or other arguments)
+            for old in glob.glob(root+'_*.pkl'):
+                try:
+                    os.remove(old)
+                except OSError:  # Removed by another process
+                    pass
+            tmp_file = mfile+'.{:d}.tmp'.format(os.getpid())
+            with open(tmp_file, 'wb') as f:
+                pickle.dump(meta, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.rename(tmp_file, mfile)
+            return meta
+        return wrapper
+    return decorator
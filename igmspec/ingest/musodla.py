@@ -7,7 +7,7 @@ from __future__ import print_function, absolute_import, division, unicode_litera
 
 import numpy as np
 import pdb
-import os, json, glob, imp
+import os, json, imp
 
 from astropy.coordinates import SkyCoord, match_coordinates_sky
 from astropy.table import Table, Column
@@ -20,9 +20,17 @@ from linetools.spectra import io as lsio
 from specdb.build.utils import chk_meta
 from specdb.build.utils import init_data
 
+from igmspec import inventory
+from igmspec.ingest import utils as iiu
+from igmspec.ingest import speccache
+from igmspec.ingest import metacache
+from igmspec.ingest.writer import SpecWriter
+from igmspec.ingest.metabuilder import MetaBuilder
+
 igms_path = imp.find_module('igmspec')[1]
 
 
+@metacache.cached('MUSoDLA', files=['MUSoDLA/datatab_v2.dat'])
 def grab_meta():
     """ Ingest supplied meta table
     Returns
@@ -104,8 +112,33 @@ def grab_meta():
     return meta
 
 
+@speccache.cached
+def read_spec(full_file):
+    """ Read one MUSoDLA spectrum
+
+    Parameters
+    ----------
+    full_file : str
+
+    Returns
+    -------
+    sdict : dict
+      sig has been converted from IVAR for most of the MagE files
+    """
+    spec = lsio.readspec(full_file, masking='edges')
+    sdict = iiu.spec_to_dict(spec)
+    # Parse name
+    fname = full_file.split('/')[-1]
+    if 'MagE' in full_file:
+        if fname in ['J2122-0014_MagE.ascii','J0011+1446_MagE.ascii']:
+            pass  # Special cases..
+        else:
+            sdict['sig'] = 1./np.sqrt(sdict['sig'])  # IVAR
+    return sdict
+
+
 def hdf5_adddata(hdf, sname, musodla_meta, debug=False, chk_meta_only=False,
-                 mk_test_file=False):
+                 mk_test_file=False, nproc=1):
     """ Append MUSoDLA data to the h5 file
 
     Parameters
@@ -119,6 +152,8 @@ def hdf5_adddata(hdf, sname, musodla_meta, debug=False, chk_meta_only=False,
       Only check meta file;  will not write
     mk_test_file : bool, optional
       Generate the debug test file for Travis??
+    nproc : int, optional
+      Number of processes for reading the raw spectra
 
     Returns
     -------
@@ -140,53 +175,34 @@ def hdf5_adddata(hdf, sname, musodla_meta, debug=False, chk_meta_only=False,
                                          maxshape=(None,), compression='gzip')
     nspec = len(musodla_meta)
     spec_set.resize((nspec,))
-    wvminlist = []
-    wvmaxlist = []
-    npixlist = []
+    writer = SpecWriter(spec_set, data)
+    mbuild = MetaBuilder(nspec, columns=[('EPOCH', float), ('NPIX', int), ('WV_MIN', float),
+                                         ('WV_MAX', float), ('GROUP_ID', int)])
     # Loop
-    for jj,row in enumerate(musodla_meta):
+    full_files = [os.getenv('RAW_IGMSPEC')+'/MUSoDLA/data/'+row['SPEC_FILE'] for row in musodla_meta]
+    for jj, sdict in enumerate(iiu.map_spectra(read_spec, full_files, nproc=nproc)):
         kk = jj
-        # Extract
-        f = os.getenv('RAW_IGMSPEC')+'/MUSoDLA/data/'+row['SPEC_FILE']
-        try:
-            spec = lsio.readspec(f, masking='edges')
-        except:
-            pdb.set_trace()
-        # Parse name
-        fname = f.split('/')[-1]
         # npix
-        head = spec.header
-        npix = spec.npix
+        npix = sdict['npix']
         if npix > max_npix:
             raise ValueError("Not enough pixels in the data... ({:d})".format(npix))
         # Some fiddling about
-        for key in ['wave','flux','sig']:
-            data[key] = 0.  # Important to init (for compression too)
-        data['flux'][0][:npix] = spec.flux.value
-        if 'MagE' in f:
-            if fname in ['J2122-0014_MagE.ascii','J0011+1446_MagE.ascii']:
-                data['sig'][0][:npix] = spec.sig.value  # Special cases..
-            else:
-                data['sig'][0][:npix] = 1./np.sqrt(spec.sig.value)  # IVAR
-        else:
-            data['sig'][0][:npix] = spec.sig.value
-        data['wave'][0][:npix] = spec.wavelength.value
+        data = writer.row(kk, npix)
+        data['flux'][0][:npix] = sdict['flux']
+        data['sig'][0][:npix] = sdict['sig']
+        data['wave'][0][:npix] = sdict['wave']
         # Meta
-        wvminlist.append(np.min(data['wave'][0][:npix]))
-        wvmaxlist.append(np.max(data['wave'][0][:npix]))
-        npixlist.append(npix)
+        mbuild.set_pix(kk, data['wave'][0], npix)
         # Only way to set the dataset correctly
         if chk_meta_only:
             continue
-        spec_set[kk] = data
+        writer.write(kk)
+    writer.close()
 
     # Add columns
-    nmeta = len(musodla_meta)
-    musodla_meta.add_column(Column([2000.]*nmeta, name='EPOCH'))
-    musodla_meta.add_column(Column(npixlist, name='NPIX'))
-    musodla_meta.add_column(Column(wvminlist, name='WV_MIN'))
-    musodla_meta.add_column(Column(wvmaxlist, name='WV_MAX'))
-    musodla_meta.add_column(Column(np.arange(nmeta,dtype=int),name='GROUP_ID'))
+    mbuild.constant('EPOCH', 2000.)
+    mbuild.group_id()
+    mbuild.add_to(musodla_meta)
 
     # Add HDLLS meta to hdf5
     if chk_meta(musodla_meta):
@@ -222,7 +238,7 @@ def chk_mage_flux():
     """ At least one MagE file has a mix of fluxed and normalized spectra
     And a 'normal' error array
     """
-    mage_files = glob.glob(os.getenv('RAW_IGMSPEC')+'/MUSoDLA/data/*MagE.ascii')
+    mage_files = inventory.glob(os.getenv('RAW_IGMSPEC')+'/MUSoDLA/data/*MagE.ascii')
     for mfile in mage_files:
         spec = lsio.readspec(mfile)
         nhigh = np.sum(spec.flux.value > 1e10)
@@ -14,7 +14,10 @@ from linetools import utils as ltu
 
 from specdb.build import utils as sbu
 
-def add_to_hdf(hdf, Z_MIN = 0.1, Z_MAX = 7.1, MATCH_TOL = 2.0*u.arcsec):
+from igmspec import xmatch
+from igmspec.ingest import catcache
+
+def add_to_hdf(hdf, Z_MIN = 0.1, Z_MAX = 7.1, MATCH_TOL = 2.0*u.arcsec, chunk=1000000):
     """Generate Myers + SDSS_BOSS QSO catalog from Myers and DR12 files
 
        This routine reads in the SDSS/BOSS specObj and PhotPosPlate files
@@ -40,6 +43,9 @@ def add_to_hdf(hdf, Z_MIN = 0.1, Z_MAX = 7.1, MATCH_TOL = 2.0*u.arcsec):
     MATCH_TOL : quantity, optional [default 2.0*u.arcsec]
            matching radius between Myers and SDSS/BOSS catalogs
 
+    chunk : int, optional [default 1000000]
+           rows gathered at a time from the FITS catalogs (without the catalog cache)
+
     Returns
     -------
     None :
@@ -66,23 +72,22 @@ def add_to_hdf(hdf, Z_MIN = 0.1, Z_MAX = 7.1, MATCH_TOL = 2.0*u.arcsec):
     import json
 
     from astropy.table import Column, hstack, vstack
-    from astropy.coordinates import SkyCoord, search_around_sky
 
     ## SDSS/BOSS data stuff
     specfile = os.getenv('RAW_IGMSPEC') + '/SDSS_BOSS/specObj-dr12_trim.fits'
-    spec = Table.read(specfile)
     # Read in select columns from DR12 photometry. This and the file above are aligned
     posfile = os.getenv('RAW_IGMSPEC') + '/SDSS_BOSS/photoPosPlate-dr12_trim.fits'
-    phot = Table.read(posfile)
-
-    # Trim to QSO, Specprimary, spec2d called it a QSO, redshift flag cuts, sanity check on coords
-    itrim = (spec['SPECPRIMARY'] == 1) & \
-            [('QSO' in q) for q in spec['CLASS']] & \
-            (spec['ZWARNING'] < 5) & \
-            (spec['PLUG_RA'] >= 0.0) & (spec['PLUG_RA'] <= 360.0) & \
-            (np.abs(spec['PLUG_DEC']) <= 90.0)
-    spec = spec[itrim]
-    phot = phot[itrim]
+    with catcache.open_catalog(specfile) as spec_cat, catcache.open_catalog(posfile) as phot_cat:
+        # Trim to QSO, Specprimary, spec2d called it a QSO, redshift flag cuts, sanity check on coords
+        spec_cut = spec_cat.read(['SPECPRIMARY', 'CLASS', 'ZWARNING', 'PLUG_RA', 'PLUG_DEC'])
+        itrim = (spec_cut['SPECPRIMARY'] == 1) & \
+                (np.char.find(spec_cut['CLASS'].astype(str), 'QSO') >= 0) & \
+                (spec_cut['ZWARNING'] < 5) & \
+                (spec_cut['PLUG_RA'] >= 0.0) & (spec_cut['PLUG_RA'] <= 360.0) & \
+                (np.abs(spec_cut['PLUG_DEC']) <= 90.0)
+        rows = np.where(itrim)[0]
+        spec = Table(spec_cat.take(rows, chunk=chunk), copy=False)
+        phot = Table(phot_cat.take(rows, chunk=chunk), copy=False)
     sdss_boss1 = hstack([spec, phot], join_type='exact')
     # Add SDSS prefix to all SDSS tags
     for key in sdss_boss1.keys():
@@ -91,38 +96,37 @@ def add_to_hdf(hdf, Z_MIN = 0.1, Z_MAX = 7.1, MATCH_TOL = 2.0*u.arcsec):
     # Read in the Myers file, match it to Myers sweeps photometry
     # Myers master QSO catalog
     ADM_file = os.getenv('RAW_IGMSPEC') + '/Myers/GTR-ADM-QSO-master-wvcv.fits.gz'
-    ADM_qso = Table.read(ADM_file)
-    head1 = fits.open(ADM_file)[1].header
-    DATE = head1['DATE']
+    DATE = fits.getheader(ADM_file, 1)['DATE']
+    with catcache.open_catalog(ADM_file) as ADM_cat:
+        # Trim to only spectroscopic objects before reading the rest
+        ispec = spectro_myers(ADM_cat.read(['SOURCEBIT']))
+        ADM_qso = Table(ADM_cat.take(np.where(ispec)[0], chunk=chunk), copy=False)
 
     # Photometry for Myers QSO catalog. This file is not aligned with the catalog file, i.e. it is a
     # superset that includes the catalog file. For that reason we need to match and tack on photometry
     ADM_sweep_file = os.getenv('RAW_IGMSPEC') + '/Myers/GTR-ADM-QSO-master-sweeps-Feb5-2016.fits'
-    ADM_sweep = Table.read(ADM_sweep_file)
-
-    c_qso = SkyCoord(ra=ADM_qso['RA'], dec=ADM_qso['DEC'],unit ='deg')
-    c_swp = SkyCoord(ra=ADM_sweep['RA'], dec=ADM_sweep['DEC'], unit='deg')
-
-    ## Create an aligned Table for matching photometry from sweeps
-    nqso = len(ADM_qso)
-    qso_phot = Table(np.repeat(np.zeros_like(ADM_sweep[0]), nqso))
-    # Rename the RA and DEC
-    qso_phot.rename_column('RA', 'RA_sweep')
-    qso_phot.rename_column('DEC', 'DEC_sweep')
-    # Cull out the keys which already exist in the ADM_qso Table (except
-    # for the RA and DEC, which we renamed)
-    dupe_keys = list(set(ADM_qso.keys()) & set(qso_phot.keys()))
-    qso_phot.remove_columns(dupe_keys)
-    # Match the Myers catalog to the Myers sweeps
-    idx, d2d, d3d = c_qso.match_to_catalog_sky(c_swp)
-    # Currently using 1.0" for matching, as for the SDSS objects, these will mostly be the exact
-    # same coordinates.
-    itrim = (d2d <= 1.0 * u.arcsec)
-    qso_phot[:][itrim] = ADM_sweep[:][idx[itrim]]
+    with catcache.open_catalog(ADM_sweep_file) as sweep_cat:
+        sweep_radec = sweep_cat.read(['RA', 'DEC'])
+        # Match the Myers catalog to the Myers sweeps
+        idx, d2d = xmatch.match_nearest(ADM_qso['RA'], ADM_qso['DEC'],
+                                        sweep_radec['RA'], sweep_radec['DEC'])
+        # Currently using 1.0" for matching, as for the SDSS objects, these will mostly be the exact
+        # same coordinates.
+        imatch = np.where(d2d <= 1.0/3600)[0]
+        # Aligned photometry from the sweeps (zeros without a match);  rename the RA and DEC
+        # and cull out the keys which already exist in the ADM_qso Table
+        sweep_rows = sweep_cat.take(idx[imatch], chunk=chunk)
+    qso_phot = Table()
+    for key, vals in sweep_rows.items():
+        if key in ['RA', 'DEC']:
+            key = key+'_sweep'
+        elif key in ADM_qso.keys():
+            continue
+        col = np.zeros((len(ADM_qso),)+vals.shape[1:], dtype=vals.dtype)
+        col[imatch] = vals
+        qso_phot[key] = col
+    del sweep_rows
     ADM_qso = hstack([ADM_qso, qso_phot], join_type='exact')
-    # Trim to only spectroscopic objects
-    ispec = spectro_myers(ADM_qso)
-    ADM_qso = ADM_qso[ispec]
     # assign best redshifts to ZEM tag
     zbest_myers(ADM_qso)
     # Add MYERS prefix to all MYERS tags
@@ -135,9 +139,8 @@ def add_to_hdf(hdf, Z_MIN = 0.1, Z_MAX = 7.1, MATCH_TOL = 2.0*u.arcsec):
     # Deal with each in turn.
 
     # 1) SDSS-MYERS match. Add Myers tags to the SDSS structure
-    c_sdss = SkyCoord(ra=sdss_boss1['SDSS_BOSS_PLUG_RA'], dec=sdss_boss1['SDSS_BOSS_PLUG_DEC'], unit='deg')
-    c_myers = SkyCoord(ra=ADM_qso['MYERS_RA'], dec=ADM_qso['MYERS_DEC'], unit='deg')
-    isdss, imyers, d2d, _ = search_around_sky(c_sdss, c_myers, MATCH_TOL)
+    isdss, imyers, d2d = xmatch.match_within(sdss_boss1['SDSS_BOSS_PLUG_RA'], sdss_boss1['SDSS_BOSS_PLUG_DEC'],
+                                             ADM_qso['MYERS_RA'], ADM_qso['MYERS_DEC'], MATCH_TOL)
     sdss_myers = hstack([sdss_boss1[isdss], ADM_qso[imyers]], join_type='exact')
     sdss_myers['SDSS_BOSS_MYERS_FLAG'] = 'SDSS_BOSS_MYERS'
     sdss_myers['RA'] = sdss_myers['SDSS_BOSS_PLUG_RA'] # SDSS/BOSS Plug coords most accurate
@@ -148,7 +151,7 @@ def add_to_hdf(hdf, Z_MIN = 0.1, Z_MAX = 7.1, MATCH_TOL = 2.0*u.arcsec):
 
     # 2) SDSS only
     # Find the SDSS objects that have no match in the Myers catalog
-    inomatch = np.ones(len(c_sdss), dtype=bool)
+    inomatch = np.ones(len(sdss_boss1), dtype=bool)
     inomatch[isdss] = False
     sdss_only = sdss_boss1[inomatch]
     sdss_only['SDSS_BOSS_MYERS_FLAG'] = 'SDSS_BOSS_ONLY'
@@ -160,7 +163,7 @@ def add_to_hdf(hdf, Z_MIN = 0.1, Z_MAX = 7.1, MATCH_TOL = 2.0*u.arcsec):
 
     # 3) Myers only
     # Find the Myers objects that have no match in SDSS/BOSS
-    inomatch = np.ones(len(c_myers), dtype=bool)
+    inomatch = np.ones(len(ADM_qso), dtype=bool)
     inomatch[imyers] = False
     myers_only = ADM_qso[inomatch]
     myers_only['SDSS_BOSS_MYERS_FLAG'] = 'MYERS_ONLY'
@@ -267,17 +270,18 @@ def zbest_myers(ADM_qso):
     myers_source = [str(msrc) for msrc in myers_source]  # For hdf5
     #; Above gives top priority to HW, and second priority to BOSS
 
-    # Assign the best redshift to Myers targets
-    zem = []
-    zem_source = []
-    for row in ADM_qso:
-        try:
-            indx = min(np.where(row['SOURCEBIT'] & myers_binary)[0])
-        except ValueError:
-            indx = 0
-        # Fill
-        zem.append(row['ZBEST'][myers_pref[indx]])
-        zem_source.append(myers_source[indx])
+    # Assign the best redshift to Myers targets:  the first bit set in order of
+    # precedence (or the first if none is set) picks the column of ZBEST
+    sourcebit = np.asarray(ADM_qso['SOURCEBIT'])
+    indx = np.zeros(len(sourcebit), dtype=int)
+    unset = np.ones(len(sourcebit), dtype=bool)
+    for ii, mbin in enumerate(myers_binary):
+        first = unset & ((sourcebit & mbin) != 0)
+        indx[first] = ii
+        unset &= ~first
+    zbest = np.asarray(ADM_qso['ZBEST'])
+    zem = zbest[np.arange(len(indx)), np.array(myers_pref)[indx]]
+    zem_source = np.array(myers_source)[indx]
     # Add to Table
     ADM_qso['ZEM'] = zem
     ADM_qso['ZEM_SOURCE'] = zem_source
@@ -384,7 +388,7 @@ def load():
       DATE of creation
     """
     ADM_file = os.getenv('RAW_IGMSPEC')+'/Myers/GTR-ADM-QSO-master-wvcv.fits.gz'
-    ADM_qso = Table.read(ADM_file)
+    ADM_qso = catcache.read_table(ADM_file)
     # Grab header for DATE
     head1 = fits.open(ADM_file)[1].header
     # Return
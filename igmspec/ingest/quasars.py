@@ -0,0 +1,162 @@
+""" Module for redshift lookups in the quasars catalog of a DB
+
+The catalog is read lazily, one column at a time (only RA, DEC, ZEM
+and ZEM_SOURCE for the lookups), and indexed once in a k-d tree
+(igmspec.xmatch) for batched nearest-quasar queries.  Catalogs opened
+from a DB file are kept for the process, so every group of a build
+shares one index;  they are reopened if the file changes.
+"""
+from __future__ import print_function, absolute_import, division, unicode_literals
+
+import os
+import glob
+import pdb
+
+import numpy as np
+import h5py
+
+from astropy import units as u
+
+from igmspec import xmatch
+from igmspec.ingest import utils as iiu
+
+# Open catalogs, by DB file and process
+_catalogs = {}
+
+
+def default_db_file():
+    """ Latest IGMspec DB in $SPECDB, as opened by specdb's IgmSpec()
+
+    Returns
+    -------
+    db_file : str
+    """
+    db_files = sorted(glob.glob(os.getenv('SPECDB')+'/IGMspec_DB_*.hdf5'))
+    if len(db_files) == 0:
+        raise IOError("No IGMspec DB in $SPECDB")
+    return db_files[-1]
+
+
+class QuasarCatalog(object):
+    """ Lazily read quasars catalog
+
+    Parameters
+    ----------
+    hdf : h5py.File or Group
+    name : str, optional
+      Name of the catalog dataset
+    """
+    def __init__(self, hdf, name='quasars'):
+        self.hdf = hdf
+        self.dset = hdf[name]
+        self.nqso = self.dset.shape[0]
+        self._columns = {}
+        self._tree = None
+
+    def __len__(self):
+        return self.nqso
+
+    def column(self, key):
+        """ One column, read on first use
+
+        Parameters
+        ----------
+        key : str
+
+        Returns
+        -------
+        ndarray
+        """
+        if key not in self._columns:
+            values = self.dset[key]
+            if values.dtype.kind == 'S':
+                values = values.astype(str)
+            self._columns[key] = values
+        return self._columns[key]
+
+    @property
+    def tree(self):
+        """ SkyTree of RA, DEC;  built on first use
+        """
+        if self._tree is None:
+            self._tree = xmatch.SkyTree(self.column('RA'), self.column('DEC'))
+        return self._tree
+
+    def nearest(self, ra, dec):
+        """ Nearest quasar to each position
+
+        Parameters
+        ----------
+        ra : ndarray
+        dec : ndarray
+
+        Returns
+        -------
+        idx : ndarray (int)
+        sep : ndarray
+          deg
+        """
+        return self.tree.nearest(ra, dec)
+
+    def zem(self, ra, dec, toler=2*u.arcsec):
+        """ Redshifts of the quasars at a set of positions
+        (as specdb.zem.utils.zem_from_radec)
+
+        Parameters
+        ----------
+        ra : ndarray
+        dec : ndarray
+        toler : Quantity, optional
+
+        Returns
+        -------
+        zem : ndarray
+          0. without a quasar within toler
+        zsource : ndarray
+          ZEM_SOURCE;  'NONENONE' without a quasar within toler
+        """
+        idx, sep = self.nearest(ra, dec)
+        good = sep < toler.to('deg').value
+        zem = np.zeros(len(idx))
+        zem[good] = self.column('ZEM')[idx[good]]
+        zsource = np.array([str('NONENONE')]*len(idx), dtype=object)
+        zsource[good] = self.column('ZEM_SOURCE')[idx[good]]
+        return zem, zsource.astype(str)
+
+    def close(self):
+        """ Close the DB file;  the columns read are kept
+        """
+        self.hdf.close()
+
+
+def get_catalog(db_file=None, name='quasars'):
+    """ Open catalog of a DB file, shared within this process
+
+    Parameters
+    ----------
+    db_file : str, optional
+      Defaults to default_db_file()
+    name : str, optional
+
+    Returns
+    -------
+    catalog : QuasarCatalog
+    """
+    if db_file is None:
+        db_file = default_db_file()
+    stat = os.stat(db_file)
+    key = (os.path.abspath(db_file), name, os.getpid())
+    stamp = (stat.st_size, iiu.mtime_ns(stat))
+    if (key in _catalogs) and (_catalogs[key][0] != stamp):
+        _catalogs.pop(key)[1].close()
+    if key not in _catalogs:
+        _catalogs[key] = (stamp, QuasarCatalog(h5py.File(db_file, 'r'), name=name))
+    return _catalogs[key][1]
+
+
+def clear():
+    """ Close the catalogs opened by get_catalog
+    """
+    for _, catalog in _catalogs.values():
+        catalog.close()
+    _catalogs.clear()
@@ -11,15 +11,23 @@ import datetime
 
 from astropy.table import Table, Column
 from astropy.time import Time
-from astropy.coordinates import SkyCoord, match_coordinates_sky
 from astropy import units as u
 
-from linetools.spectra import io as lsio
 from linetools import utils as ltu
 
 from specdb.build.utils import chk_meta
 from specdb.build.utils import init_data
 
+from igmspec import inventory
+from igmspec import xmatch
+from igmspec.ingest import utils as iiu
+from igmspec.ingest.quasars import QuasarCatalog
+from igmspec.ingest.metabuilder import MetaBuilder
+from igmspec.ingest import speccache
+from igmspec.ingest import catcache
+from igmspec.ingest import fastspec
+from igmspec.ingest.writer import SpecWriter
+
 
 def get_specfil(row, dr7=False):
     """Parse the SDSS spectrum file
@@ -51,9 +59,8 @@ def grab_meta(hdf, old=False):
     -------
     meta
     """
-    from specdb.zem.utils import zem_from_radec
     #sdss_meta = Table.read(os.getenv('RAW_IGMSPEC')+'/SDSS/SDSS_DR7_qso.fits.gz')
-    sdss_meta = Table.read(os.getenv('RAW_IGMSPEC')+'/SDSS/dr7qso.fit.gz')
+    sdss_meta = catcache.read_table(os.getenv('RAW_IGMSPEC')+'/SDSS/dr7qso.fit.gz')
     nspec = len(sdss_meta)
     # DATE
     #t = Time(list(sdss_meta['MJD'].data), format='mjd', out_subfmt='date')  # Fixes to YYYY-MM-DD
@@ -77,7 +84,7 @@ def grab_meta(hdf, old=False):
         sdss_meta['sig_zem'] = 0.
         sdss_meta['flag_zem'] = str('          ')
     # Fix zem
-    zem, zsource = zem_from_radec(sdss_meta['RA'], sdss_meta['DEC'], hdf['quasars'].value, toler=1.0*u.arcsec)
+    zem, zsource = QuasarCatalog(hdf).zem(sdss_meta['RA'], sdss_meta['DEC'], toler=1.0*u.arcsec)
     gdz = zem > 0.
     sdss_meta['zem_GROUP'][gdz] = zem[gdz]
     sdss_meta['flag_zem'] = zsource
@@ -110,24 +117,21 @@ def meta_for_build(old=False):
     """
     sdss_meta = grab_meta()
     # Cut down to unique sources
-    coord = SkyCoord(ra=sdss_meta['RA'], dec=sdss_meta['DEC'], unit='deg')
-    idx, d2d, d3d = match_coordinates_sky(coord, coord, nthneighbor=2)
-    dups = np.where(d2d < 0.5*u.arcsec)[0]
+    tree = xmatch.SkyTree(sdss_meta['RA'], sdss_meta['DEC'])
+    idx, d2d = tree.nearest(tree.ra, tree.dec, nth=2)
+    dups = np.where(d2d < 0.5/3600)[0]
     keep = np.array([True]*len(sdss_meta))
     for idup in dups:
-        dcoord = SkyCoord(ra=sdss_meta['RA'][idup], dec=sdss_meta['DEC'][idup], unit='deg')
-        sep = dcoord.separation(coord)
-        isep = np.where(sep < 0.5*u.arcsec)[0]
+        _, isep, sep = tree.within(tree.ra[idup], tree.dec[idup], 0.5*u.arcsec)
+        isep = isep[sep < 0.5/3600]
         keep[isep] = False
         keep[np.min(isep)] = True  # Only keep 1
     sdss_meta = sdss_meta[keep]
     # Cut one more (pair of QSOs)
     if old:
-        bad_dup_c = SkyCoord(ra=193.96678*u.deg, dec=37.099741*u.deg)
-        coord = SkyCoord(ra=sdss_meta['RA'], dec=sdss_meta['DEC'], unit='deg')
-        sep = bad_dup_c.separation(coord)
-        assert np.sum(sep < 2*u.arcsec) == 2
-        badi = np.argmin(bad_dup_c.separation(coord))
+        sep = xmatch.separation(193.96678, 37.099741, sdss_meta['RA'], sdss_meta['DEC'])
+        assert np.sum(sep < 2./3600) == 2
+        badi = np.argmin(sep)
         keep = np.array([True]*len(sdss_meta))
         keep[badi] = False
         sdss_meta = sdss_meta[keep]
@@ -142,7 +146,23 @@ def meta_for_build(old=False):
 '''
 
 
-def hdf5_adddata(hdf, sname, meta, debug=False, chk_meta_only=False, sdss_hdf=None, **kwargs):
+@speccache.cached
+def read_spec(full_file):
+    """ Read one SDSS DR7 spectrum
+
+    Parameters
+    ----------
+    full_file : str
+
+    Returns
+    -------
+    sdict : dict
+    """
+    return fastspec.readspec(full_file)
+
+
+def hdf5_adddata(hdf, sname, meta, debug=False, chk_meta_only=False, sdss_hdf=None,
+                 nproc=1, nvalid=0, **kwargs):
     """ Add SDSS data to the DB
 
     Parameters
@@ -154,6 +174,11 @@ def hdf5_adddata(hdf, sname, meta, debug=False, chk_meta_only=False, sdss_hdf=No
       Survey name
     chk_meta_only : bool, optional
       Only check meta file;  will not write
+    nproc : int, optional
+      Number of processes for reading the raw spectra
+    nvalid : int, optional
+      Check the fast reader (fastspec) against linetools on a sample
+      of this many files before ingesting
 
     Returns
     -------
@@ -179,74 +204,79 @@ def hdf5_adddata(hdf, sname, meta, debug=False, chk_meta_only=False, sdss_hdf=No
     spec_set = hdf[sname].create_dataset('spec', data=data, chunks=True,
                                          maxshape=(None,), compression='gzip')
     spec_set.resize((nspec,))
+    writer = SpecWriter(spec_set, data)
     # Read Zhu continua, wave file
     cfile = os.getenv('RAW_IGMSPEC')+'/SDSS/ALLQSO_SPEC_106_continuum_nointerp.fits'
     zhu_conti = Table.read(cfile)
     wvfile = cfile.replace('continuum','wave')
     zhu_wave = Table.read(wvfile)
+    # Continuum and wavelength columns of each spectrum, by PLATE/FIBER
+    conti_idx, nconti = iiu.match_rows([meta['PLATE'], meta['FIBER']],
+                                       [zhu_conti['PLATE'][0], zhu_conti['FIBER'][0]])
+    wave_idx, nwave = iiu.match_rows([meta['PLATE'], meta['FIBER']],
+                                     [zhu_wave['PLATE'][0], zhu_wave['FIBER'][0]])
     #
-    wvminlist = []
-    wvmaxlist = []
-    npixlist = []
-    speclist = []
-    # Loop
-    maxpix = 0
-    for jj,row in enumerate(meta):
+    mbuild = MetaBuilder(nspec)
+    # Files
+    full_files = []
+    for row in meta:
         full_file = get_specfil(row)
-        if not os.path.isfile(full_file):
+        if not inventory.isfile(full_file):
             full_file = get_specfil(row, dr7=True)
+        full_files.append(full_file)
+    if nvalid > 0:
+        if len(fastspec.validate(full_files, nsample=nvalid)) > 0:
+            raise ValueError("Fast reader disagrees with linetools")
+    # Loop
+    maxpix = 0
+    stats = iiu.PrefetchStats()
+    for jj, sdict in enumerate(iiu.map_spectra(read_spec, full_files, nproc=nproc, stats=stats)):
+        row = meta[jj]
+        full_file = full_files[jj]
         # Extract
         #print("SDSS: Reading {:s}".format(full_file))
         # Parse name
         fname = full_file.split('/')[-1]
-        # Generate full file
-        spec = lsio.readspec(full_file)
         # npix
-        npix = spec.npix
+        npix = sdict['npix']
         if npix > max_npix:
             raise ValueError("Not enough pixels in the data... ({:d})".format(npix))
         else:
             maxpix = max(npix,maxpix)
         # Some fiddling about
-        for key in ['wave','flux','sig','co']:
-            data[key] = 0.  # Important to init (for compression too)
-        data['flux'][0][:npix] = spec.flux.value
-        data['sig'][0][:npix] = spec.sig.value
-        data['wave'][0][:npix] = spec.wavelength.value
+        data = writer.row(jj, npix)
+        data['flux'][0][:npix] = sdict['flux']
+        data['sig'][0][:npix] = sdict['sig']
+        data['wave'][0][:npix] = sdict['wave']
         # Continuum
-        mtc = (zhu_conti['PLATE'] == row['PLATE']) & (zhu_conti['FIBER']==row['FIBER'])
-        mtw = (zhu_wave['PLATE'] == row['PLATE']) & (zhu_wave['FIBER']==row['FIBER'])
-        if np.sum(mtc) == 1:
-            imin = np.argmin(np.abs(zhu_wave['WAVE'][0][:,np.where(mtw)[1]]-spec.wavelength[0].value))
-            data['co'][0][:npix] = zhu_conti['CONTINUUM'][0][imin:npix+imin,np.where(mtc)[1]].flatten()
-        elif np.sum(mtc) > 1:
-            print("Multiple continua for plate={:d}, row={:d}.  Taking the first".format(row['PLATE'], row['FIBER']))
-            imin = np.argmin(np.abs(zhu_wave['WAVE'][0][:,np.where(mtw)[1][0]]-spec.wavelength[0].value))
-            data['co'][0][:npix] = zhu_conti['CONTINUUM'][0][imin:npix+imin,np.where(mtc)[1][0]].flatten()
-        elif np.sum(mtc) == 0:
+        if nconti[jj] > 0:
+            if nconti[jj] > 1:
+                print("Multiple continua for plate={:d}, row={:d}.  Taking the first".format(row['PLATE'], row['FIBER']))
+            if nwave[jj] == 0:
+                raise ValueError("No Zhu wavelengths for the continuum of plate={:d}, row={:d}".format(
+                    row['PLATE'], row['FIBER']))
+            imin = np.argmin(np.abs(zhu_wave['WAVE'][0][:,wave_idx[jj]]-sdict['wave'][0]))
+            data['co'][0][:npix] = zhu_conti['CONTINUUM'][0][imin:npix+imin,conti_idx[jj]]
+        else:
             print("No SDSS continuum for plate={:d}, row={:d}".format(row['PLATE'], row['FIBER']))
         #from xastropy.xutils import xdebug as xdb
         #xdb.set_trace()
         #xdb.xplot(data['wave'][0], data['flux'][0], data['co'][0])
 
         # Meta
-        speclist.append(str(fname))
-        wvminlist.append(np.min(data['wave'][0][:npix]))
-        wvmaxlist.append(np.max(data['wave'][0][:npix]))
-        npixlist.append(npix)
+        mbuild.set_spec(jj, fname, data['wave'][0], npix)
         # Only way to set the dataset correctly
         if chk_meta_only:
             continue
-        spec_set[jj] = data
+        writer.write(jj)
+    writer.close()
 
     #
     print("Max pix = {:d}".format(maxpix))
+    print("Read-ahead: {}".format(stats))
     # Add columns
-    meta.add_column(Column(speclist, name='SPEC_FILE'))
-    meta.add_column(Column(npixlist, name='NPIX'))
-    meta.add_column(Column(wvminlist, name='WV_MIN'))
-    meta.add_column(Column(wvmaxlist, name='WV_MAX'))
-    meta.add_column(Column(np.arange(nspec,dtype=int),name='GROUP_ID'))
+    mbuild.group_id()
+    mbuild.add_to(meta)
 
     # Add HDLLS meta to hdf5
     if chk_meta(meta):
@@ -0,0 +1,297 @@
+""" Module for an on-disk cache of the decoded raw spectra
+
+Each output of a read_spec function is saved as one binary file of
+its arrays (wave, flux, sig, co, ...), memory-mapped on a hit, plus a
+JSON sidecar with npix, the header and any other values.  Entries are
+keyed by the reader, the source of its ingest module (and of the
+igmspec modules that uses, e.g. fastspec) and the name, size and
+mtime of each raw file it reads, as recorded by the inventory when
+there is one (see igmspec.inventory).  Later builds and debugging runs
+therefore skip the parsing of FITS, gzip and ASCII files entirely.
+The cache is bounded in size;  the least recently used entries are
+evicted first.
+
+The cache is off unless $IGMSPEC_SPECCACHE names its directory (see
+enable);  $IGMSPEC_SPECCACHE_GB sets its size (default 20 GB).  The
+whole cache is walked, and trimmed to size, only by enable() in the
+parent process and by a process whose own saves exceed the size.
+"""
+from __future__ import print_function, absolute_import, division, unicode_literals
+
+import os
+import sys
+import json
+import hashlib
+import functools
+import pdb
+
+import numpy as np
+
+from astropy.io import fits
+
+from igmspec import fingerprint as ifp
+from igmspec import inventory
+
+# Open caches, by directory;  and module source hashes
+_caches = {}
+_mhashes = {}
+
+
+def enable(cache_path, max_gb=20.):
+    """ Turn on the cache for this process and those it starts,
+    and evict the least recently used entries above its size
+
+    Parameters
+    ----------
+    cache_path : str
+    max_gb : float, optional
+
+    Returns
+    -------
+    cache : SpecCache
+    """
+    os.environ['IGMSPEC_SPECCACHE'] = cache_path
+    os.environ['IGMSPEC_SPECCACHE_GB'] = str(max_gb)
+    cache = get_cache()
+    cache.nbytes = cache.evict()
+    return cache
+
+
+def get_cache():
+    """ Cache set by $IGMSPEC_SPECCACHE
+
+    Returns
+    -------
+    cache : SpecCache or None
+    """
+    cache_path = os.getenv('IGMSPEC_SPECCACHE')
+    if cache_path is None:
+        return None
+    if cache_path not in _caches:
+        max_gb = float(os.getenv('IGMSPEC_SPECCACHE_GB', 20.))
+        _caches[cache_path] = SpecCache(cache_path, max_bytes=int(max_gb*1024**3))
+    return _caches[cache_path]
+
+
+def reader_key(reader, args):
+    """ Key of the output of reader(*args)
+
+    Parameters
+    ----------
+    reader : function
+    args : tuple
+
+    Returns
+    -------
+    key : str or None
+      None if none of the arguments is a raw file, i.e. nothing to
+      validate the entry against
+    """
+    module = sys.modules[reader.__module__]
+    if module.__name__ not in _mhashes:
+        # Source of the reader and of the igmspec decoders it uses, e.g. fastspec
+        _mhashes[module.__name__] = ifp.code_hash(module)
+    md5 = hashlib.md5()
+    md5.update('{:s}.{:s} {:s}\n'.format(module.__name__, reader.__name__,
+                                          _mhashes[module.__name__]).encode('utf-8'))
+    nfile = 0
+    for arg in args:
+        # Size and mtime from the inventory, if any
+        stat = inventory.stat(arg) if isinstance(arg, str) else None
+        if stat is not None:
+            md5.update('{:s} {:d} {:d}\n'.format(os.path.abspath(arg), stat[0],
+                                                  stat[1]).encode('utf-8'))
+            nfile += 1
+        else:
+            md5.update('{!r}\n'.format(arg).encode('utf-8'))
+    if nfile == 0:
+        return None
+    return md5.hexdigest()
+
+
+class SpecCache(object):
+    """ Directory of decoded spectra
+
+    Parameters
+    ----------
+    cache_path : str
+    max_bytes : int, optional
+
+    Attributes
+    ----------
+    nbytes : int
+      Size of the cache as of the last evict(), plus the entries saved
+      since by this process;  0 until evict() is first run
+    """
+    def __init__(self, cache_path, max_bytes=20*1024**3):
+        self.cache_path = cache_path
+        self.max_bytes = max_bytes
+        self.nhit = 0
+        self.nmiss = 0
+        self.nbytes = 0
+        if not os.path.isdir(cache_path):
+            try:
+                os.makedirs(cache_path)
+            except OSError:  # Made by another process
+                pass
+
+    def files(self, key):
+        root = os.path.join(self.cache_path, key[0:2], key)
+        return root+'.bin', root+'.json'
+
+    def load(self, key):
+        """ Cached spectrum;  the arrays are memory-mapped (copy on write)
+
+        Parameters
+        ----------
+        key : str
+
+        Returns
+        -------
+        sdict : dict or None
+        """
+        bfile, jfile = self.files(key)
+        try:
+            with open(jfile, 'r') as f:
+                entry = json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+        sdict = entry['values']
+        if entry['header'] is not None:
+            sdict['head'] = fits.Header.fromstring(entry['header'])
+        for name, (dtype, shape, offset) in entry['arrays'].items():
+            if int(np.prod(shape)) == 0:
+                sdict[name] = np.zeros(shape, dtype=dtype)
+            else:
+                sdict[name] = np.memmap(bfile, dtype=dtype, mode='c', offset=offset,
+                                        shape=tuple(shape))
+        # Most recently used
+        os.utime(jfile, None)
+        return sdict
+
+    def save(self, key, sdict):
+        """ Add a spectrum to the cache
+
+        Parameters
+        ----------
+        key : str
+        sdict : dict
+
+        Returns
+        -------
+        saved : bool
+          False if sdict holds values that cannot be cached
+        """
+        entry = dict(values={}, arrays={}, header=None)
+        arrays = []
+        offset = 0
+        for name, value in sdict.items():
+            if isinstance(value, np.ndarray):
+                value = np.ascontiguousarray(value)
+                if value.dtype.hasobject:
+                    return False
+                entry['arrays'][name] = (value.dtype.str, list(value.shape), offset)
+                arrays.append(value)
+                offset += -(-value.nbytes // 8) * 8  # Aligned
+            elif (name == 'head') and isinstance(value, fits.Header):
+                entry['header'] = value.tostring()
+            elif isinstance(value, np.generic):
+                entry['values'][name] = value.item()
+            elif (value is None) or isinstance(value, (str, bool, int, float, list)):
+                entry['values'][name] = value
+            else:
+                return False
+        try:
+            jstr = json.dumps(entry)
+        except (TypeError, ValueError):
+            return False
+        bfile, jfile = self.files(key)
+        if not os.path.isdir(os.path.dirname(bfile)):
+            try:
+                os.makedirs(os.path.dirname(bfile))
+            except OSError:
+                pass
+        # Write under temporary names;  the JSON file marks a complete entry
+        suffix = '.{:d}.tmp'.format(os.getpid())
+        with open(bfile+suffix, 'wb') as f:
+            for value in arrays:
+                f.write(value.tobytes())
+                f.write(b'\0' * (-value.nbytes % 8))
+        with open(jfile+suffix, 'w') as f:
+            f.write(jstr)
+        os.rename(bfile+suffix, bfile)
+        os.rename(jfile+suffix, jfile)
+        self.nbytes += offset + len(jstr)
+        if self.nbytes > self.max_bytes:
+            self.nbytes = self.evict()
+        return True
+
+    def evict(self):
+        """ Remove the least recently used entries until the cache is
+        below 90% of max_bytes
+
+        Returns
+        -------
+        nbytes : int
+          Size of the cache
+        """
+        entries = []
+        nbytes = 0
+        for root, dirs, files in os.walk(self.cache_path):
+            for fname in files:
+                if not fname.endswith('.json'):
+                    continue
+                jfile = os.path.join(root, fname)
+                bfile = jfile[:-5]+'.bin'
+                try:
+                    size = os.path.getsize(jfile) + os.path.getsize(bfile)
+                    atime = os.path.getmtime(jfile)
+                except OSError:  # Evicted by another process
+                    continue
+                entries.append((atime, size, jfile, bfile))
+                nbytes += size
+        if nbytes <= self.max_bytes:
+            return nbytes
+        entries.sort()
+        for atime, size, jfile, bfile in entries:
+            if nbytes <= 0.9*self.max_bytes:
+                break
+            for cfile in [jfile, bfile]:
+                try:
+                    os.remove(cfile)
+                except OSError:
+                    pass
+            nbytes -= size
+        return nbytes
+
+
+def cached(reader):
+    """ Decorator to look up the outputs of a read_spec function in the
+    cache (when enabled) before reading the raw file
+
+    Parameters
+    ----------
+    reader : function
+
+    Returns
+    -------
+    function
+    """
+    @functools.wraps(reader)
+    def wrapper(*args):
+        cache = get_cache()
+        if cache is None:
+            return reader(*args)
+        key = reader_key(reader, args)
+        if key is None:
+            return reader(*args)
+        sdict = cache.load(key)
+        if sdict is not None:
+            cache.nhit += 1
+            return sdict
+        cache.nmiss += 1
+        sdict = reader(*args)
+        if isinstance(sdict, dict):
+            cache.save(key, sdict)
+        return sdict
+    return wrapper
@@ -0,0 +1,59 @@
+# Module to run tests on the input catalog cache
+
+import os
+import numpy as np
+
+from astropy.table import Table
+
+from igmspec.ingest import catcache
+
+
+def mk_catalog(cat_file, nrow=50):
+    tbl = Table()
+    tbl['RA'] = np.linspace(0., 300., nrow)
+    tbl['RA'].unit = 'deg'
+    tbl['PLATE'] = np.arange(nrow, dtype=np.int32)
+    tbl['SPECTRO'] = np.array(['BOSS', 'SDSS']*(nrow//2))
+    tbl['PSFFLUX'] = np.ones((nrow, 5))
+    tbl.meta['DATE'] = '2017-06-01'
+    tbl.write(cat_file, overwrite=True)
+
+
+def test_catcache(tmpdir, monkeypatch):
+    monkeypatch.delenv('IGMSPEC_CATCACHE', raising=False)
+    cat_file = str(tmpdir.join('DR14Q.fits.gz'))
+    mk_catalog(cat_file)
+    orig = Table.read(cat_file)
+    # Without the cache
+    tbl = catcache.read_table(cat_file, columns=['RA', 'SPECTRO'])
+    assert tbl.keys() == ['RA', 'SPECTRO']
+    # Through the cache
+    cache = catcache.CatalogCache(str(tmpdir.join('cache')))
+    tbl = cache.open(cat_file).table()
+    assert cache.nmiss == 1
+    assert tbl.keys() == orig.keys()
+    assert tbl['RA'].unit == orig['RA'].unit
+    assert tbl.meta['DATE'] == '2017-06-01'
+    for key in orig.keys():
+        assert np.all(tbl[key] == orig[key])
+    assert np.sum(tbl['SPECTRO'] == 'BOSS') == 25
+    # Copy on write
+    tbl['RA'][0] = -1.
+    with cache.open(cat_file) as cat:
+        assert cache.nhit == 1
+        assert cat.column('RA')[0] == 0.
+        rows = cat.take([3, 1], columns=['PLATE', 'PSFFLUX'])
+        assert list(rows['PLATE']) == [3, 1]
+        assert rows['PSFFLUX'].shape == (2, 5)
+    # Same rows from the FITS file
+    with catcache.FitsCatalog(cat_file) as cat:
+        frows = cat.take([3, 1], chunk=1)
+        assert list(frows['PLATE']) == [3, 1]
+        assert cat.read(['RA'])['RA'][1] == orig['RA'][1]
+    # A new version replaces the old one
+    mk_catalog(cat_file, nrow=10)
+    os.utime(cat_file, (0, 0))
+    assert len(cache.open(cat_file)) == 10
+    assert cache.nmiss == 2
+    fkey, _ = catcache.catalog_keys(cat_file)
+    assert len(os.listdir(str(tmpdir.join('cache', fkey)))) == 1
@@ -0,0 +1,70 @@
+# Module to run tests on the ESI_z6 ingest, serial and parallel
+
+import os
+import numpy as np
+import h5py
+import pytest
+
+from astropy.table import Table
+
+from linetools.spectra import io as lsio
+
+from igmspec.ingest import esi_z6
+
+
+def mk_raw(raw_path):
+    """ Write three small ESI_z6 spectra and their meta Table
+    """
+    os.makedirs(os.path.join(raw_path, 'ESI_z6'))
+    meta = Table()
+    meta['RA_GROUP'] = [10., 150.5, 300.25]
+    meta['DEC_GROUP'] = [-5.5, 2.25, 30.]
+    rstate = np.random.RandomState(1234)
+    for row, npix in zip(meta, [40, 75, 12]):
+        wave = 8000. + np.arange(npix)
+        flux = rstate.uniform(0., 2., npix)
+        sig = rstate.uniform(0.05, 0.2, npix)
+        co = np.ones(npix)
+        np.savetxt(os.path.join(raw_path, 'ESI_z6', esi_z6.get_specfil(row)),
+                   np.array([wave, flux, sig, co]).T)
+    return meta
+
+
+@pytest.mark.filterwarnings('ignore:No header found')
+def test_write_spectra(tmpdir, monkeypatch, template):
+    raw_path = str(tmpdir.join('RAW'))
+    meta = mk_raw(raw_path)
+    monkeypatch.setenv('RAW_IGMSPEC', raw_path)
+    monkeypatch.delenv('IGMSPEC_SPECCACHE', raising=False)
+    max_npix = 100
+    hdf = h5py.File(str(tmpdir.join('tst.hdf5')), 'w')
+    metas = {}
+    for nproc in [1, 2]:
+        sname = 'ESI_z6_{:d}'.format(nproc)
+        _ = hdf.create_group(sname)
+        metas[nproc] = meta.copy()
+        maxpix = esi_z6.write_spectra(hdf, sname, metas[nproc], template(max_npix),
+                                      nproc=nproc)
+        assert maxpix == 75
+    # Serial, straight from linetools
+    for jj, row in enumerate(meta):
+        fname = esi_z6.get_specfil(row)
+        spec = lsio.readspec(os.path.join(raw_path, 'ESI_z6', fname))
+        npix = spec.npix
+        for nproc in [1, 2]:
+            srow = hdf['ESI_z6_{:d}'.format(nproc)]['spec'][jj]
+            assert np.allclose(srow['wave'][:npix], spec.wavelength.value)
+            assert np.allclose(srow['flux'][:npix], spec.flux.value)
+            assert np.allclose(srow['sig'][:npix], spec.sig.value)
+            assert np.allclose(srow['co'][:npix], spec.co.value)
+            assert np.all(srow['flux'][npix:] == 0.)
+            mrow = metas[nproc][jj]
+            assert mrow['SPEC_FILE'] == fname
+            assert mrow['NPIX'] == npix
+            assert np.isclose(mrow['WV_MIN'], spec.wavelength.value[0])
+            assert np.isclose(mrow['WV_MAX'], spec.wavelength.value[-1])
+    # Same meta either way
+    assert metas[1].colnames == metas[2].colnames
+    for key in metas[1].colnames:
+        assert np.all(metas[1][key] == metas[2][key])
+    assert list(metas[1]['GROUP_ID']) == [0, 1, 2]
@@ -0,0 +1,88 @@
+# Module to run tests on the fast SDSS/BOSS reader
+
+import numpy as np
+
+from astropy.io import fits
+from astropy.table import Table
+
+from igmspec.ingest import fastspec
+
+
+def mk_files(tmpdir):
+    rstate = np.random.RandomState(1)
+    npix = 300
+    loglam = (3.55 + 1e-4*np.arange(npix)).astype('float32')
+    ivar = rstate.uniform(0., 2., npix).astype('float32')
+    ivar[:5] = 0.
+    ivar[-7:] = 0.
+    ivar[100] = 0.
+    flux = rstate.normal(size=npix).astype('float32')
+    files = []
+    # spec-PPPP-MMMMM-FFFF.fits
+    coadd = Table(dict(flux=flux, loglam=loglam, ivar=ivar, and_mask=np.zeros(npix, dtype='int32')))
+    files.append(str(tmpdir.join('spec-1234-56789-0001.fits')))
+    fits.HDUList([fits.PrimaryHDU(), fits.BinTableHDU(coadd)]).writeto(files[-1])
+    # BOSS flux, ivar, loglam, co
+    prihdu = fits.PrimaryHDU(flux)
+    prihdu.header['TELESCOP'] = 'SDSS 2.5-M'
+    files.append(str(tmpdir.join('spec-1234-56789-0002.fits')))
+    fits.HDUList([prihdu, fits.ImageHDU(ivar), fits.ImageHDU(loglam),
+                  fits.ImageHDU(2*flux)]).writeto(files[-1])
+    # spSpec
+    prihdu = fits.PrimaryHDU(np.vstack([flux, flux, np.abs(flux), flux]))
+    prihdu.header['CRVAL1'] = 3.58
+    prihdu.header['CD1_1'] = 1e-4
+    prihdu.header['CRPIX1'] = 1
+    prihdu.header['DC-FLAG'] = 1
+    files.append(str(tmpdir.join('spSpec-51234-1234-001.fit.gz')))
+    prihdu.writeto(files[-1])
+    return files, ivar, flux
+
+
+def test_readspec(tmpdir):
+    files, ivar, flux = mk_files(tmpdir)
+    # Coadd
+    sdict = fastspec.readspec(files[0])
+    assert sdict['npix'] == 300
+    assert sdict['sig'].dtype == np.float32
+    assert sdict['sig'][0] == 0.
+    np.testing.assert_allclose(sdict['sig'][10], 1./np.sqrt(ivar[10]), rtol=1e-6)
+    sdict = fastspec.readspec(files[0], masking='edges')
+    assert sdict['npix'] == 288
+    assert sdict['sig'][95] == 0.  # Interior pixel is kept
+    # Continuum
+    sdict = fastspec.readspec(files[1])
+    np.testing.assert_allclose(sdict['co'], 2*flux)
+    # spSpec
+    sdict = fastspec.readspec(files[2])
+    np.testing.assert_allclose(sdict['wave'][0], 10.**3.58)
+
+
+def test_validate(tmpdir):
+    files, _, _ = mk_files(tmpdir)
+    for masking in ['none', 'edges']:
+        assert len(fastspec.validate(files, masking=masking)) == 0
+
+
+def test_read_plate(tmpdir):
+    rstate = np.random.RandomState(2)
+    nfiber, npix = 4, 200
+    flux = rstate.normal(size=(nfiber, npix)).astype('float32')
+    ivar = rstate.uniform(0., 2., (nfiber, npix)).astype('float32')
+    ivar[:, :3] = 0.
+    prihdu = fits.PrimaryHDU(flux)
+    prihdu.header['COEFF0'] = 3.5682
+    prihdu.header['COEFF1'] = 1e-4
+    platefile = str(tmpdir.join('spPlate-1234-56789.fits'))
+    fits.HDUList([prihdu, fits.ImageHDU(ivar)]).writeto(platefile)
+    # Fiber files
+    loglam = (3.5682 + 1e-4*np.arange(npix)).astype('float32')
+    items = []
+    for fiber in [3, 1]:
+        coadd = Table(dict(flux=flux[fiber-1], loglam=loglam, ivar=ivar[fiber-1]))
+        items.append((str(tmpdir.join('spec-1234-56789-{:04d}.fits'.format(fiber))), platefile, fiber))
+        fits.HDUList([fits.PrimaryHDU(), fits.BinTableHDU(coadd)]).writeto(items[-1][0])
+    sdicts = fastspec.read_plate(platefile, [3, 1], masking='edges')
+    assert sdicts[0]['npix'] == npix-3
+    np.testing.assert_array_equal(sdicts[1]['flux'], flux[0][3:])
+    assert len(fastspec.validate_plates(items, masking='edges')) == 0
@@ -0,0 +1,58 @@
+# Module to run tests on the FITS header cache
+
+import os
+import numpy as np
+
+from astropy.io import fits
+
+from igmspec.ingest import headers as iih
+
+
+def test_header_cache(tmpdir):
+    files = []
+    for ii in range(3):
+        prihdu = fits.PrimaryHDU(np.zeros(10))
+        prihdu.header['DISPELEM'] = 'VIS'
+        prihdu.header['HISTORY'] = 'APER_ACT= {:d}'.format(ii)
+        files.append(str(tmpdir.join('spec{:d}.fits.gz'.format(ii))))
+        fits.HDUList([prihdu, fits.ImageHDU(np.zeros(10), name='ERROR')]).writeto(files[-1])
+    cache = iih.HeaderCache(str(tmpdir.join('headers.sqlite')))
+    assert cache.prescan(files, exts=(0,1)) == 3
+    assert cache.prescan(files, exts=(0,1)) == 0
+    head = cache.getheader(files[1])
+    assert head['DISPELEM'] == 'VIS'
+    assert 'APER_ACT= 1' in str(head['HISTORY'])
+    assert cache.getheader(files[2], 1)['EXTNAME'] == 'ERROR'
+    assert (cache.nhit, cache.nmiss) == (2, 0)
+    # Modified file is read again
+    with fits.open(files[0], mode='update') as hdulist:
+        hdulist[0].header['DISPELEM'] = 'NIR'
+    os.utime(files[0], (0, 0))
+    assert cache.getheader(files[0])['DISPELEM'] == 'NIR'
+    assert cache.nmiss == 1
+    cache.close()
+    # Persistent
+    cache = iih.HeaderCache(str(tmpdir.join('headers.sqlite')))
+    assert cache.getheader(files[0])['DISPELEM'] == 'NIR'
+    assert cache.nmiss == 0
+    cache.close()
+
+
+def test_header_cache_off(tmpdir, monkeypatch):
+    spec_file = str(tmpdir.join('spec.fits'))
+    prihdu = fits.PrimaryHDU(np.zeros(10))
+    prihdu.header['DISPELEM'] = 'VIS'
+    prihdu.writeto(spec_file)
+    # Off unless enabled;  nothing is written next to the raw data
+    monkeypatch.delenv('IGMSPEC_HEADERS', raising=False)
+    assert iih.get_cache() is None
+    assert iih.prescan([spec_file]) == 0
+    assert iih.getheader(spec_file)['DISPELEM'] == 'VIS'
+    assert os.listdir(str(tmpdir)) == ['spec.fits']
+    # On
+    monkeypatch.setenv('IGMSPEC_HEADERS', str(tmpdir.join('headers.sqlite')))
+    assert iih.prescan([spec_file]) == 1
+    assert iih.getheader(spec_file)['DISPELEM'] == 'VIS'
+    assert iih.get_cache().nhit == 1
+    iih.get_cache().close()
+    iih._caches.clear()
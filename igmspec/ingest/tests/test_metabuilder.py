@@ -0,0 +1,48 @@
+# Module to run tests on the columnar meta builder
+
+import numpy as np
+
+from astropy.table import Table
+
+from igmspec.ingest.metabuilder import MetaBuilder
+
+
+def test_metabuilder():
+    meta = Table()
+    meta['DISPERSER'] = ['G130M', 'G160M', 'G130M', 'E140M']
+    mbuild = MetaBuilder(len(meta))
+    for jj in [2, 0, 1, 3]:
+        wave = np.zeros(10)
+        wave[:jj+5] = 1000. + np.arange(jj+5)
+        mbuild.set_spec(jj, 'spec{:d}.fits'.format(jj), wave, jj+5)
+    mbuild.group_id()
+    mbuild.constant('EPOCH', 2000.)
+    mbuild.constant('INSTR', 'COS')
+    missing = mbuild.map_values('R', meta['DISPERSER'], {'G130M': 18000., 'G160M': 20000.})
+    mbuild.add_to(meta)
+    assert missing == ['E140M']
+    assert meta.colnames == ['DISPERSER', 'SPEC_FILE', 'NPIX', 'WV_MIN', 'WV_MAX', 'GROUP_ID',
+                             'EPOCH', 'INSTR', 'R']
+    assert list(meta['SPEC_FILE']) == ['spec0.fits', 'spec1.fits', 'spec2.fits', 'spec3.fits']
+    assert np.array_equal(meta['NPIX'], [5, 6, 7, 8])
+    assert np.array_equal(meta['WV_MAX'], [1004., 1005., 1006., 1007.])
+    assert np.all(meta['WV_MIN'] == 1000.)
+    assert np.array_equal(meta['R'], [18000., 20000., 18000., 0.])
+    assert meta['INSTR'].dtype.kind == 'U'
+
+
+def test_metabuilder_columns():
+    meta = Table()
+    meta['SPEC_FILE'] = ['a.fits', 'b.fits']
+    mbuild = MetaBuilder(len(meta), columns=[('EPOCH', float), ('NPIX', int), ('WV_MIN', float),
+                                             ('WV_MAX', float), ('GROUP_ID', int), ('INSTR', str)])
+    for jj in [1, 0]:
+        mbuild.set_pix(jj, 1000. + np.arange(10), 5+jj)
+        mbuild.set_row(jj, INSTR='HIRES' if jj == 0 else 'ESI')
+    mbuild.constant('EPOCH', 2000.)
+    mbuild.group_id()
+    mbuild.add_to(meta)
+    # Preallocated columns keep their order
+    assert meta.colnames == ['SPEC_FILE', 'EPOCH', 'NPIX', 'WV_MIN', 'WV_MAX', 'GROUP_ID', 'INSTR']
+    assert np.array_equal(meta['WV_MAX'], [1004., 1005.])
+    assert list(meta['INSTR']) == ['HIRES', 'ESI']
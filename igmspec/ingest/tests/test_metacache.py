@@ -0,0 +1,76 @@
+# Module to run tests on the grab_meta cache
+
+import os
+import numpy as np
+
+from astropy.table import Table
+
+from igmspec.ingest import metacache
+
+ncall = [0]
+
+
+@metacache.cached('TEST', files=['TEST/summary.ascii'])
+def grab_meta(scale=1.):
+    ncall[0] += 1
+    meta = Table.read(os.getenv('RAW_IGMSPEC')+'/TEST/summary.ascii', format='ascii')
+    meta['zem'] = meta['zem'] * scale
+    return meta
+
+
+def test_metacache(tmpdir, monkeypatch):
+    raw_path = str(tmpdir.join('raw'))
+    os.makedirs(os.path.join(raw_path, 'TEST'))
+    sfile = os.path.join(raw_path, 'TEST', 'summary.ascii')
+    with open(sfile, 'w') as f:
+        f.write('name zem\nA 2.0\nB 3.0\n')
+    monkeypatch.setenv('RAW_IGMSPEC', raw_path)
+    # Off
+    monkeypatch.delenv('IGMSPEC_METACACHE', raising=False)
+    grab_meta()
+    grab_meta()
+    assert ncall[0] == 2
+    # On
+    monkeypatch.setenv('IGMSPEC_METACACHE', str(tmpdir.join('cache')))
+    meta = grab_meta()
+    meta2 = grab_meta()
+    assert ncall[0] == 3
+    assert list(meta2['name']) == ['A', 'B']
+    np.testing.assert_allclose(meta2['zem'], [2., 3.])
+    # Arguments are part of the key
+    meta = grab_meta(scale=2.)
+    assert ncall[0] == 4
+    np.testing.assert_allclose(meta['zem'], [4., 6.])
+    # Changed input
+    with open(sfile, 'w') as f:
+        f.write('name zem\nA 2.5\nB 3.0\n')
+    os.utime(sfile, (0, 0))
+    meta = grab_meta(scale=2.)
+    assert ncall[0] == 5
+    assert meta['zem'][0] == 5.
+    assert len(os.listdir(str(tmpdir.join('cache')))) == 1
+
+
+def test_input_hash(tmpdir, monkeypatch):
+    import types
+    raw_path = str(tmpdir.join('raw'))
+    os.makedirs(os.path.join(raw_path, 'TEST', 'fits', 'ra00_01'))
+    for fname in ['summary.ascii', 'date_obs1.txt', 'fits/ra00_01/J0001a.fits.gz']:
+        with open(os.path.join(raw_path, 'TEST', fname), 'w') as f:
+            f.write('1 2 3\n')
+    monkeypatch.setenv('RAW_IGMSPEC', raw_path)
+    module = types.ModuleType(str('igmspec.ingest.test_fake'))
+    module.__file__ = metacache.__file__
+    kwargs = dict(files=['TEST/summary.ascii', 'TEST/date_obs*'], dirs=['TEST/fits'])
+    ihash = metacache.input_hash('TEST', module, **kwargs)
+    assert ihash == metacache.input_hash('TEST', module, **kwargs)
+    # Contents of the spectra do not matter, only their names
+    with open(os.path.join(raw_path, 'TEST', 'fits/ra00_01/J0001a.fits.gz'), 'a') as f:
+        f.write('4\n')
+    assert metacache.input_hash('TEST', module, **kwargs) == ihash
+    open(os.path.join(raw_path, 'TEST', 'fits/ra00_01/J0002a.fits.gz'), 'w').close()
+    ihash2 = metacache.input_hash('TEST', module, **kwargs)
+    assert ihash2 != ihash
+    # Files matched by a wildcard
+    open(os.path.join(raw_path, 'TEST', 'date_obs2.txt'), 'w').close()
+    assert metacache.input_hash('TEST', module, **kwargs) != ihash2
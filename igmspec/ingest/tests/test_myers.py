@@ -0,0 +1,67 @@
+# Module to run tests on the Myers + SDSS/BOSS quasars catalog
+
+import os
+import numpy as np
+import h5py
+import pytest
+
+from astropy.table import Table
+
+pytest.importorskip('specdb')
+
+from igmspec.ingest import myers
+
+
+def mk_raw(raw_path):
+    os.makedirs(os.path.join(raw_path, 'SDSS_BOSS'))
+    os.makedirs(os.path.join(raw_path, 'Myers'))
+    # SDSS/BOSS:  two QSOs, one also in Myers, and a star
+    spec = Table()
+    spec['SPECPRIMARY'] = np.array([1, 1, 1], dtype=np.int16)
+    spec['CLASS'] = np.array(['QSO', 'QSO', 'STAR'])
+    spec['ZWARNING'] = np.zeros(3, dtype=np.int32)
+    spec['PLUG_RA'] = [10., 20., 30.]
+    spec['PLUG_DEC'] = [-5., 0., 5.]
+    spec['Z'] = [2., 2.5, 0.]
+    spec.write(os.path.join(raw_path, 'SDSS_BOSS', 'specObj-dr12_trim.fits'))
+    phot = Table()
+    phot['PSFMAG'] = np.ones((3, 5))
+    phot.write(os.path.join(raw_path, 'SDSS_BOSS', 'photoPosPlate-dr12_trim.fits'))
+    # Myers:  the first SDSS QSO, a QSO of 2QZ and a photometric (KDE) one
+    adm = Table()
+    adm['RA'] = [10.+0.5/3600, 40., 50.]
+    adm['DEC'] = [-5., 10., 15.]
+    adm['SOURCEBIT'] = np.array([2**0, 2**1, 2**9], dtype=np.int64)
+    zbest = np.zeros((3, 19))
+    zbest[0, 0] = 2.01
+    zbest[1, 1] = 1.5
+    zbest[2, 9] = 1.
+    adm['ZBEST'] = zbest
+    adm.meta['DATE'] = '2016-02-05'
+    adm.write(os.path.join(raw_path, 'Myers', 'GTR-ADM-QSO-master-wvcv.fits.gz'))
+    # Sweeps, a superset
+    sweeps = Table()
+    sweeps['RA'] = [50., 40., 10.+0.5/3600, 60.]
+    sweeps['DEC'] = [15., 10., -5., 20.]
+    sweeps['PSFFLUX'] = np.arange(20.).reshape(4, 5)
+    sweeps.write(os.path.join(raw_path, 'Myers', 'GTR-ADM-QSO-master-sweeps-Feb5-2016.fits'))
+
+
+def test_add_to_hdf(tmpdir, monkeypatch):
+    raw_path = str(tmpdir.join('RAW'))
+    mk_raw(raw_path)
+    monkeypatch.setenv('RAW_IGMSPEC', raw_path)
+    monkeypatch.delenv('IGMSPEC_CATCACHE', raising=False)
+    hdf = h5py.File(str(tmpdir.join('tst.hdf5')), 'w')
+    myers.add_to_hdf(hdf)
+    qso = hdf['quasars'][()]
+    flags = [flag.decode('utf-8') if isinstance(flag, bytes) else flag
+             for flag in qso['SDSS_BOSS_MYERS_FLAG']]
+    assert flags == ['SDSS_BOSS_MYERS', 'SDSS_BOSS_ONLY', 'MYERS_ONLY']
+    np.testing.assert_allclose(qso['ZEM'], [2.01, 2.5, 1.5])
+    np.testing.assert_allclose(qso['RA'], [10., 20., 40.])
+    assert qso['SOURCEBIT'][1] == 2**19
+    # Sweeps photometry of the Myers entries
+    np.testing.assert_allclose(qso['MYERS_PSFFLUX'][2], np.arange(5., 10.))
+    assert hdf['quasars'].attrs['MYERS_DATE'] == '2016-02-05'
+    hdf.close()
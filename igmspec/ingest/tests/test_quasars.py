@@ -0,0 +1,42 @@
+# Module to run tests on the quasars catalog lookups
+
+import os
+import numpy as np
+import h5py
+
+from astropy import units as u
+
+from igmspec.ingest import quasars
+
+
+def mk_db(db_file, zem):
+    qso = np.zeros(3, dtype=[(str('RA'), float), (str('DEC'), float), (str('ZEM'), float),
+                             (str('ZEM_SOURCE'), 'S8'), (str('FLUX'), float, (5,))])
+    qso['RA'] = [10., 20., 30.]
+    qso['DEC'] = [-5., 0., 5.]
+    qso['ZEM'] = zem
+    qso['ZEM_SOURCE'] = [b'BOSS_PCA', b'SDSS', b'2QZ']
+    with h5py.File(db_file, 'w') as hdf:
+        hdf['quasars'] = qso
+
+
+def test_zem(tmpdir):
+    db_file = str(tmpdir.join('IGMspec_DB_v01.hdf5'))
+    mk_db(db_file, [1., 2., 3.])
+    qcat = quasars.get_catalog(db_file)
+    zem, zsource = qcat.zem([20.+0.5/3600, 30., 40.], [0., 5., 0.])
+    np.testing.assert_allclose(zem, [2., 3., 0.])
+    assert list(zsource) == ['SDSS', '2QZ', 'NONENONE']
+    # Only the columns used are read
+    assert sorted(qcat._columns.keys()) == ['DEC', 'RA', 'ZEM', 'ZEM_SOURCE']
+    zem, _ = qcat.zem([20.+1.5/3600], [0.], toler=1*u.arcsec)
+    assert zem[0] == 0.
+    # Shared, until the file changes
+    assert quasars.get_catalog(db_file) is qcat
+    os.utime(db_file, (0, 0))
+    assert quasars.get_catalog(db_file) is not qcat
+    quasars.clear()
+    mk_db(db_file, [1.5, 2.5, 3.5])
+    zem, _ = quasars.get_catalog(db_file).zem([10.], [-5.])
+    assert zem[0] == 1.5
+    quasars.clear()
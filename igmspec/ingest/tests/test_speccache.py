@@ -0,0 +1,77 @@
+# Module to run tests on the decoded spectrum cache
+
+import os
+import numpy as np
+
+from astropy.io import fits
+
+from igmspec.ingest import speccache
+
+
+@speccache.cached
+def fake_read(full_file, scale):
+    data = np.loadtxt(full_file)
+    head = fits.Header()
+    head['DATE-OBS'] = '2016-01-01'
+    return dict(npix=data.shape[0], wave=data[:,0], flux=(data[:,1]*scale).astype('float32'),
+                sig=data[:,1].astype('float32'), co=None, head=head, hiz=False)
+
+
+def test_speccache(tmpdir, monkeypatch):
+    spec_file = str(tmpdir.join('spec.dat'))
+    np.savetxt(spec_file, np.array([[4000., 1.], [4001., 2.], [4002., 3.]]))
+    monkeypatch.setenv('RAW_IGMSPEC', str(tmpdir))
+    # Off
+    monkeypatch.delenv('IGMSPEC_SPECCACHE', raising=False)
+    monkeypatch.delenv('IGMSPEC_SPECCACHE_GB', raising=False)
+    sdict = fake_read(spec_file, 2.)
+    assert speccache.get_cache() is None
+    # On
+    monkeypatch.setenv('IGMSPEC_SPECCACHE', str(tmpdir.join('cache')))
+    cache = speccache.get_cache()
+    sdict1 = fake_read(spec_file, 2.)
+    sdict2 = fake_read(spec_file, 2.)
+    assert (cache.nhit, cache.nmiss) == (1, 1)
+    assert isinstance(sdict2['flux'], np.memmap)
+    for key in ['wave', 'flux', 'sig']:
+        assert sdict2[key].dtype == sdict[key].dtype
+        assert np.array_equal(sdict2[key], sdict[key])
+        # The cached re-read matches the read that filled the cache
+        assert np.array_equal(sdict2[key], sdict1[key])
+    assert sdict2['co'] is None
+    assert sdict2['head']['DATE-OBS'] == '2016-01-01'
+    assert sdict2['npix'] == 3
+    # Other arguments and modified files are new entries
+    _ = fake_read(spec_file, 3.)
+    os.utime(spec_file, (0, 0))
+    _ = fake_read(spec_file, 2.)
+    assert cache.nmiss == 3
+    # LRU eviction
+    cache.max_bytes = 1
+    assert cache.evict() == 0
+    assert fake_read(spec_file, 2.)['npix'] == 3
+    assert cache.nmiss == 4
+    # Opening the cache does not walk it;  enable() trims it to size
+    monkeypatch.setattr(speccache, '_caches', {})
+    assert speccache.get_cache().nbytes == 0
+    monkeypatch.setattr(speccache, '_caches', {})
+    assert speccache.enable(str(tmpdir.join('cache')), max_gb=1e-9).nbytes == 0
+    _ = fake_read(spec_file, 2.)
+    assert (speccache.get_cache().nhit, speccache.get_cache().nmiss) == (0, 1)
+
+
+def test_reader_key(tmpdir, monkeypatch):
+    from igmspec import fingerprint as ifp
+    spec_file = str(tmpdir.join('spec.dat'))
+    np.savetxt(spec_file, np.array([[4000., 1.], [4001., 2.]]))
+    monkeypatch.setenv('RAW_IGMSPEC', str(tmpdir))
+    monkeypatch.setattr(speccache, '_mhashes', {})
+    key = speccache.reader_key(fake_read.__wrapped__, (spec_file, 2.))
+    assert key == speccache.reader_key(fake_read.__wrapped__, (spec_file, 2.))
+    assert speccache.reader_key(fake_read.__wrapped__, (2.,)) is None
+    # Edits to the igmspec modules used by the reader (here, indirectly) are new entries
+    hash_file = ifp.hash_file
+    monkeypatch.setattr(ifp, 'hash_file', lambda filename: (
+        'edited' if filename.endswith('xmatch.py') else hash_file(filename)))
+    monkeypatch.setattr(speccache, '_mhashes', {})
+    assert speccache.reader_key(fake_read.__wrapped__, (spec_file, 2.)) != key
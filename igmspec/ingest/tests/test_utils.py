@@ -0,0 +1,60 @@
+# Module to run tests on ingest utilities
+
+import numpy as np
+import pytest
+
+from igmspec.ingest import utils as iiu
+
+
+def fake_read(npix, scale):
+    return dict(npix=npix, flux=np.arange(npix)*scale)
+
+
+def test_map_spectra():
+    items = [(npix, 2.) for npix in [5, 50, 1, 20, 3]]
+    serial = list(iiu.map_spectra(fake_read, items))
+    parallel = list(iiu.map_spectra(fake_read, items, nproc=2, max_pending=2))
+    # Same order, same values
+    assert [sdict['npix'] for sdict in parallel] == [5, 50, 1, 20, 3]
+    for sdict1, sdict2 in zip(serial, parallel):
+        assert np.array_equal(sdict1['flux'], sdict2['flux'])
+
+
+def test_prefetch():
+    items = [(npix, 2.) for npix in [5, 50, 1, 20, 3]]
+    stats = iiu.PrefetchStats()
+    threaded = list(iiu.map_spectra(fake_read, items, nthread=2, max_pending=3, stats=stats))
+    serial = list(iiu.map_spectra(fake_read, items, nthread=0))
+    for sdict1, sdict2 in zip(serial, threaded):
+        assert np.array_equal(sdict1['flux'], sdict2['flux'])
+    assert stats.nread == 5
+    assert stats.max_depth <= 3
+    assert stats.stall_time >= 0.
+
+
+def test_match_rows():
+    right = np.array(['b', 'a', 'c', 'a'])
+    idx, nmatch = iiu.match_rows(np.array(['a', 'c', 'd']), right)
+    assert list(idx) == [1, 2, -1]
+    assert list(nmatch) == [2, 1, 0]
+    # Multi-column keys;  bytes and str compare equal
+    plate = np.array([1, 1, 2, 2])
+    fiber = np.array([5, 6, 5, 6])
+    idx, nmatch = iiu.match_rows([np.array([2, 1, 3]), np.array([5, 6, 5])], [plate, fiber])
+    assert list(idx) == [2, 1, -1]
+    idx, _ = iiu.match_rows(np.array([b'c']), right)
+    assert idx[0] == 2
+    # Assertions
+    with pytest.raises(ValueError):
+        iiu.match_rows(np.array(['a']), right, unique=True)
+    with pytest.raises(ValueError):
+        iiu.match_rows(np.array(['d']), right, require=True)
+    # Brute force
+    rstate = np.random.RandomState(1)
+    left = rstate.randint(0, 50, size=(2, 300))
+    right = rstate.randint(0, 50, size=(2, 1000))
+    idx, nmatch = iiu.match_rows(list(left), list(right))
+    for ii in range(300):
+        mt = np.where((right[0] == left[0, ii]) & (right[1] == left[1, ii]))[0]
+        assert nmatch[ii] == len(mt)
+        assert idx[ii] == (mt[0] if len(mt) > 0 else -1)
@@ -0,0 +1,53 @@
+# Module to run tests on the spectrum writer
+
+import numpy as np
+import h5py
+import pytest
+
+from igmspec.ingest.writer import SpecWriter
+
+
+def test_specwriter(tmpdir, template):
+    rstate = np.random.RandomState(1234)
+    nspec, max_npix = 23, 100
+    npixs = rstate.randint(1, max_npix, nspec)
+    skip = [4, 10, 11]
+    hdf = h5py.File(str(tmpdir.join('tst.hdf5')), 'w')
+    # One row at a time
+    data = template(max_npix)
+    spec_set = hdf.create_dataset('row', data=data, chunks=True,
+                                  maxshape=(None,), compression='gzip')
+    spec_set.resize((nspec,))
+    for jj, npix in enumerate(npixs):
+        if jj in skip:
+            continue
+        for key in ['wave','flux','sig','co']:
+            data[key] = 0.
+        data['flux'][0][:npix] = jj + 1.
+        data['wave'][0][:npix] = np.arange(npix)
+        if jj % 2 == 0:
+            data['co'][0][:npix] = 1.
+        spec_set[jj] = data
+    # Buffered
+    data = template(max_npix)
+    spec_set2 = hdf.create_dataset('slab', data=data, chunks=True,
+                                   maxshape=(None,), compression='gzip')
+    spec_set2.resize((nspec,))
+    writer = SpecWriter(spec_set2, data, nrow=5)
+    for jj, npix in enumerate(npixs):
+        data = writer.row(jj, npix)
+        data['flux'][0][:npix] = jj + 1.
+        data['wave'][0][:npix] = np.arange(npix)
+        if jj % 2 == 0:
+            data['co'][0][:npix] = 1.
+        if jj in skip:
+            continue
+        writer.write(jj)
+    writer.close()
+    # Test
+    assert writer.nwrite == nspec - len(skip)
+    assert spec_set[:].tobytes() == spec_set2[:].tobytes()
+    # Order
+    with pytest.raises(ValueError):
+        writer.row(0, 10)
+    hdf.close()
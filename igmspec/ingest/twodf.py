@@ -18,6 +18,13 @@ from linetools import utils as ltu
 from specdb.build.utils import chk_meta
 from specdb.build.utils import init_data
 
+from igmspec import inventory
+from igmspec.ingest import utils as iiu
+from igmspec.ingest import speccache
+from igmspec.ingest import metacache
+from igmspec.ingest.writer import SpecWriter
+from igmspec.ingest.metabuilder import MetaBuilder
+
 def get_specfil(row):
     """Parse the 2QZ spectrum file
     Requires a link to the database Class
@@ -38,6 +45,7 @@ def get_specfil(row):
     return specfil
 
 
+@metacache.cached('2QZ', files=['2QZ/2QZ393524355693.out'], dirs=['2QZ/2df/fits'])
 def grab_meta():
     """ Grab GGG meta Table
     Catalog -- http://www.2dfquasar.org/Spec_Cat/catalogue.html
@@ -117,7 +125,7 @@ def grab_meta():
     gdm = np.array([True]*len(tdf_meta))
     for jj,row in enumerate(tdf_meta):
         full_file = get_specfil(row)
-        if not os.path.isfile(full_file):
+        if not inventory.isfile(full_file):
             print("{:s} has no spectrum.  Not including".format(full_file))
             gdm[jj] = False
             continue
@@ -154,7 +162,36 @@ def meta_for_build():
 '''
 
 
-def hdf5_adddata(hdf, sname, meta, debug=False, chk_meta_only=False):
+@speccache.cached
+def read_spec(full_file):
+    """ Read one 2QZ spectrum
+
+    Parameters
+    ----------
+    full_file : str
+
+    Returns
+    -------
+    sdict : dict or None
+      None if the variance array is bad
+    """
+    hdu = fits.open(full_file)
+    head0 = hdu[0].header
+    wave = lsio.setwave(head0)
+    flux = hdu[0].data
+    var = hdu[2].data
+    sig = np.zeros_like(flux)
+    gd = var > 0.
+    if np.sum(gd) == 0:
+        return None
+    sig[gd] = np.sqrt(var[gd])
+    # npix
+    spec = XSpectrum1D.from_tuple((wave,flux,sig))
+    spec.meta['headers'][0] = head0
+    return iiu.spec_to_dict(spec)
+
+
+def hdf5_adddata(hdf, sname, meta, debug=False, chk_meta_only=False, nproc=1):
     """ Add 2QZ data to the DB
 
     Parameters
@@ -166,6 +203,8 @@ def hdf5_adddata(hdf, sname, meta, debug=False, chk_meta_only=False):
       Survey name
     chk_meta_only : bool, optional
       Only check meta file;  will not write
+    nproc : int, optional
+      Number of processes for reading the raw spectra
 
     Returns
     -------
@@ -189,61 +228,46 @@ def hdf5_adddata(hdf, sname, meta, debug=False, chk_meta_only=False):
     spec_set = hdf[sname].create_dataset('spec', data=data, chunks=True,
                                          maxshape=(None,), compression='gzip')
     spec_set.resize((nspec,))
-    wvminlist = []
-    wvmaxlist = []
-    npixlist = []
-    speclist = []
+    writer = SpecWriter(spec_set, data)
+    mbuild = MetaBuilder(nspec)
     # Loop
     maxpix = 0
-    for jj,row in enumerate(meta):
-        full_file = get_specfil(row)
+    full_files = [get_specfil(row) for row in meta]
+    stats = iiu.PrefetchStats()
+    for jj, sdict in enumerate(iiu.map_spectra(read_spec, full_files, nproc=nproc, stats=stats)):
+        full_file = full_files[jj]
         # Parse name
         fname = full_file.split('/')[-1]
         # Read
-        hdu = fits.open(full_file)
-        head0 = hdu[0].header
-        wave = lsio.setwave(head0)
-        flux = hdu[0].data
-        var = hdu[2].data
-        sig = np.zeros_like(flux)
-        gd = var > 0.
-        if np.sum(gd) == 0:
+        if sdict is None:
             print("{:s} has a bad var array.  Not including".format(fname))
             pdb.set_trace()
             continue
-        sig[gd] = np.sqrt(var[gd])
         # npix
-        spec = XSpectrum1D.from_tuple((wave,flux,sig))
-        npix = spec.npix
-        spec.meta['headers'][0] = head0
+        npix = sdict['npix']
         if npix > max_npix:
             raise ValueError("Not enough pixels in the data... ({:d})".format(npix))
         else:
             maxpix = max(npix,maxpix)
         # Some fiddling about
-        for key in ['wave','flux','sig']:
-            data[key] = 0.  # Important to init (for compression too)
-        data['flux'][0][:npix] = spec.flux.value
-        data['sig'][0][:npix] = spec.sig.value
-        data['wave'][0][:npix] = spec.wavelength.value
+        data = writer.row(jj, npix)
+        data['flux'][0][:npix] = sdict['flux']
+        data['sig'][0][:npix] = sdict['sig']
+        data['wave'][0][:npix] = sdict['wave']
         # Meta
-        speclist.append(str(fname))
-        wvminlist.append(np.min(data['wave'][0][:npix]))
-        wvmaxlist.append(np.max(data['wave'][0][:npix]))
-        npixlist.append(npix)
+        mbuild.set_spec(jj, fname, data['wave'][0], npix)
         # Only way to set the dataset correctly
         if chk_meta_only:
             continue
-        spec_set[jj] = data
+        writer.write(jj)
+    writer.close()
 
     #
     print("Max pix = {:d}".format(maxpix))
+    print("Read-ahead: {}".format(stats))
     # Add columns
-    meta.add_column(Column(speclist, name='SPEC_FILE'))
-    meta.add_column(Column(npixlist, name='NPIX'))
-    meta.add_column(Column(wvminlist, name='WV_MIN'))
-    meta.add_column(Column(wvmaxlist, name='WV_MAX'))
-    meta.add_column(Column(np.arange(nspec,dtype=int),name='GROUP_ID'))
+    mbuild.group_id()
+    mbuild.add_to(meta)
 
     # Add HDLLS meta to hdf5
     if chk_meta(meta):
@@ -2,4 +2,305 @@
 """
 from __future__ import print_function, absolute_import, division, unicode_literals
 
+import os
+import time
+import multiprocessing
+from collections import deque
+try:  # Python 3 (or the futures backport)
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:
+    ThreadPoolExecutor = None
+    from multiprocessing.pool import ThreadPool
+try:  # Python 3.5+
+    from os import scandir as _scandir
+except ImportError:
+    _scandir = None
 
+import numpy as np
+import pdb
+
+from igmspec import buildstats as ibs
+
+
+class _DirEntry(object):
+    """ Minimal os.DirEntry, for scandir on Python 2
+    """
+    def __init__(self, dpath, name):
+        self.name = name
+        self.path = os.path.join(dpath, name)
+
+    def is_dir(self):
+        return os.path.isdir(self.path)
+
+    def is_file(self):
+        return os.path.isfile(self.path)
+
+    def stat(self):
+        return os.stat(self.path)
+
+
+def scandir(path):
+    """ Entries of a directory, i.e. os.scandir (Python 3.5+)
+    or an equivalent built on os.listdir
+
+    Parameters
+    ----------
+    path : str
+
+    Returns
+    -------
+    iterable of os.DirEntry (or equivalent)
+    """
+    if _scandir is not None:
+        return _scandir(path)
+    return [_DirEntry(path, name) for name in os.listdir(path)]
+
+
+def mtime_ns(stat):
+    """ Modification time of an os.stat result in ns
+    (st_mtime_ns is Python 3.3+)
+
+    Parameters
+    ----------
+    stat : os.stat_result
+
+    Returns
+    -------
+    int
+    """
+    try:
+        return stat.st_mtime_ns
+    except AttributeError:
+        return int(stat.st_mtime * 1e9)
+
+
+def spec_to_dict(spec, include_co=False, wave_unit=None):
+    """ Unpack an XSpectrum1D into plain numpy arrays
+
+    These are cheap to pickle, so a worker process can hand them
+    back to the process that owns the HDF5 file.
+
+    Parameters
+    ----------
+    spec : XSpectrum1D
+    include_co : bool, optional
+      Grab the continuum too
+    wave_unit : str, optional
+      Convert the wavelengths to this unit, e.g. 'AA'
+
+    Returns
+    -------
+    sdict : dict
+      npix, wave, flux, sig, co (None unless include_co), head
+    """
+    if wave_unit is None:
+        wave = spec.wavelength.value
+    else:
+        wave = spec.wavelength.to(wave_unit).value
+    sdict = dict(npix=spec.npix, wave=wave, flux=spec.flux.value,
+                 sig=spec.sig.value, co=None, head=spec.header)
+    if include_co:
+        sdict['co'] = spec.co.value
+    return sdict
+
+
+def _key_codes(keys):
+    # Integer code of each row of a set of key columns;  equal keys, equal codes
+    codes = np.zeros(len(keys[0]), dtype=np.int64)
+    for key in keys:
+        uniq, inv = np.unique(np.asarray(key), return_inverse=True)
+        _, codes = np.unique(codes*len(uniq) + inv.ravel(), return_inverse=True)
+    return codes.ravel()
+
+
+def match_rows(left, right, unique=False, require=False, label='match_rows'):
+    """ Row of a table matching each row of another on one or more
+    key columns, by sorting;  replaces np.where in a loop
+
+    Parameters
+    ----------
+    left : ndarray or list of ndarray
+      Key column(s) of the rows to look up
+    right : ndarray or list of ndarray
+      Key column(s) of the rows looked up, in the same order
+    unique : bool, optional
+      Raise a ValueError if a left row matches more than one right row
+    require : bool, optional
+      Raise a ValueError if a left row matches no right row
+    label : str, optional
+      For the error messages
+
+    Returns
+    -------
+    idx : ndarray (int)
+      First matching right row of each left row;  -1 without a match
+    nmatch : ndarray (int)
+      Number of matching right rows
+    """
+    if not isinstance(left, (list, tuple)):
+        left, right = [left], [right]
+    if len(left) != len(right):
+        raise ValueError("{:s}: {:d} key columns on the left, {:d} on the right".format(
+            label, len(left), len(right)))
+    nleft = len(left[0])
+    codes = _key_codes([np.concatenate([np.asarray(lkey), np.asarray(rkey)])
+                        for lkey, rkey in zip(left, right)])
+    lcodes, rcodes = codes[:nleft], codes[nleft:]
+    # Stable, so that the first match is the first right row
+    order = np.argsort(rcodes, kind='mergesort')
+    srcodes = rcodes[order]
+    first = np.searchsorted(srcodes, lcodes, side='left')
+    nmatch = np.searchsorted(srcodes, lcodes, side='right') - first
+    idx = np.full(nleft, -1, dtype=int)
+    matched = nmatch > 0
+    idx[matched] = order[first[matched]]
+    if unique and np.any(nmatch > 1):
+        bad = np.where(nmatch > 1)[0]
+        raise ValueError("{:s}: {:d} rows with more than one match, e.g. row {:d}".format(
+            label, len(bad), bad[0]))
+    if require and not np.all(matched):
+        bad = np.where(~matched)[0]
+        raise ValueError("{:s}: {:d} rows without a match, e.g. row {:d}".format(
+            label, len(bad), bad[0]))
+    return idx, nmatch
+
+
+class PrefetchStats(object):
+    """ Counters of the read-ahead of map_spectra
+
+    Attributes
+    ----------
+    nread : int
+      Spectra handed to the writer
+    nstall : int
+      Times the writer had to wait for the next spectrum
+    stall_time : float
+      Seconds the writer spent waiting on the readers
+    depth_sum : int
+      Sum over the spectra of the number read ahead and ready when the
+      writer asked for the next one;  see mean_depth
+    max_depth : int
+    """
+    def __init__(self):
+        self.nread = 0
+        self.nstall = 0
+        self.stall_time = 0.
+        self.depth_sum = 0
+        self.max_depth = 0
+
+    @property
+    def mean_depth(self):
+        return self.depth_sum / max(self.nread, 1)
+
+    def __repr__(self):
+        return ('<PrefetchStats: nread={:d} nstall={:d} stall_time={:.2f}s '
+                'mean_depth={:.1f} max_depth={:d}>'.format(
+                    self.nread, self.nstall, self.stall_time, self.mean_depth, self.max_depth))
+
+
+def _next_result(pending, stats, ready, get):
+    # Pop the oldest read, tallying the depth of the queue and any stall
+    if stats is not None:
+        depth = sum([1 for result in pending if ready(result)])
+        stats.depth_sum += depth
+        stats.max_depth = max(stats.max_depth, depth)
+        stats.nread += 1
+        result = pending.popleft()
+        if ready(result):
+            return get(result)
+        t0 = time.time()
+        out = get(result)
+        stats.nstall += 1
+        stats.stall_time += time.time() - t0
+        return out
+    return get(pending.popleft())
+
+
+def map_spectra(reader, items, nproc=1, max_pending=None, nthread=2, stats=None):
+    """ Read a series of raw spectra, optionally with a pool of
+    worker processes
+
+    Results are always yielded in the order of items, so that the
+    calling process (the only one holding the HDF5 file) writes the rows
+    exactly as a serial build would.
+
+    With nproc=1, the next max_pending files are read (and decompressed,
+    for .fits.gz) by a pool of nthread threads while the caller packs and
+    writes the current one.  zlib and the file reads release the GIL,
+    so these overlap even without worker processes.
+
+    Parameters
+    ----------
+    reader : function
+      Module-level (i.e. picklable) function that decodes one raw file
+    items : list
+      Arguments for each call to reader;  tuples are unpacked
+    nproc : int, optional
+      Number of worker processes.  1 reads in this process
+    max_pending : int, optional
+      Maximum number of spectra read ahead of the writer
+      Defaults to 4*nproc (4*nthread for threads)
+    nthread : int, optional
+      Number of read-ahead threads when nproc=1;  0 reads serially
+    stats : PrefetchStats, optional
+      Filled with the queue depth and stall counters
+
+    Returns
+    -------
+    generator of reader outputs
+    """
+    bstats = ibs.get_stats()
+    if (bstats is None) or (bstats.group is None):
+        return _map_spectra(reader, items, nproc=nproc, max_pending=max_pending,
+                            nthread=nthread, stats=stats)
+    # Time the reads and the packing for the build report
+    return bstats.timed_reads(_map_spectra(ibs.TimedReader(reader), items, nproc=nproc,
+                                           max_pending=max_pending, nthread=nthread,
+                                           stats=stats))
+
+
+def _map_spectra(reader, items, nproc=1, max_pending=None, nthread=2, stats=None):
+    # Generator of map_spectra
+    items = [item if isinstance(item, tuple) else (item,) for item in items]
+    if nproc <= 1:
+        if (nthread <= 0) or (len(items) <= 1):
+            for item in items:
+                if stats is not None:
+                    stats.nread += 1
+                yield reader(*item)
+            return
+        if max_pending is None:
+            max_pending = 4*nthread
+    elif max_pending is None:
+        max_pending = 4*nproc
+    futures = (nproc <= 1) and (ThreadPoolExecutor is not None)
+    if futures:
+        pool = ThreadPoolExecutor(max_workers=nthread)
+        ready = lambda result: result.done()
+        get = lambda result: result.result()
+        submit = lambda item: pool.submit(reader, *item)
+    else:
+        if nproc <= 1:  # Threads, without concurrent.futures
+            pool = ThreadPool(processes=nthread)
+        else:
+            pool = multiprocessing.Pool(processes=nproc)
+        ready = lambda result: result.ready()
+        get = lambda result: result.get()
+        submit = lambda item: pool.apply_async(reader, item)
+    try:
+        pending = deque()
+        nsub = 0
+        while (nsub < len(items)) or (len(pending) > 0):
+            # Keep the workers busy but bound the memory
+            while (nsub < len(items)) and (len(pending) < max_pending):
+                pending.append(submit(items[nsub]))
+                nsub += 1
+            yield _next_result(pending, stats, ready, get)
+    finally:
+        if futures:
+            for result in pending:
+                result.cancel()
+            pool.shutdown(wait=True)
+        else:
+            pool.terminate()
+            pool.join()
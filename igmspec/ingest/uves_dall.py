@@ -19,10 +19,14 @@ from astropy import units as u
 from linetools.spectra import io as lsio
 from linetools import utils as ltu
 
-from specdb.specdb import IgmSpec
 from specdb.build.utils import chk_meta
 from specdb.build.utils import init_data
-from specdb.zem.utils import zem_from_radec
+
+from igmspec.ingest import utils as iiu
+from igmspec.ingest import quasars
+from igmspec.ingest import speccache
+from igmspec.ingest.writer import SpecWriter
+from igmspec.ingest.metabuilder import MetaBuilder
 
 igms_path = imp.find_module('igmspec')[1]
 
@@ -51,9 +55,7 @@ def grab_meta():
     uvesdall_meta['RA_GROUP'] = rad
     uvesdall_meta['DEC_GROUP'] = decd
     # Add zem
-    igmsp = IgmSpec()
-    ztbl = Table(igmsp.hdf['quasars'].value)
-    zem, zsource = zem_from_radec(rad, decd, ztbl)
+    zem, zsource = quasars.get_catalog().zem(rad, decd)
     badz = np.where(zem < 0.1)[0]
     for ibadz in badz:
         if uvesdall_meta['NAME'][ibadz] == 'HE2243-6031':
@@ -107,7 +109,25 @@ def meta_for_build(uvesdall_meta=None):
 '''
 
 
-def hdf5_adddata(hdf, sname, meta, debug=False, chk_meta_only=False):
+@speccache.cached
+def read_spec(specfile):
+    """ Read one UVES_Dall ASCII spectrum
+
+    Parameters
+    ----------
+    specfile : str
+
+    Returns
+    -------
+    sdict : dict
+    """
+    spec = Table.read(specfile,format='ascii.fast_no_header',guess=False)#, data_start=1)
+    sdict = dict(npix=len(spec['col1']), wave=spec['col1'].data, flux=spec['col2'].data,
+                 sig=spec['col3'].data, co=spec['col4'].data, head=None)
+    return sdict
+
+
+def hdf5_adddata(hdf, sname, meta, debug=False, chk_meta_only=False, nproc=1):
     """ Append UVES_Dall data to the h5 file
 
     Parameters
@@ -119,6 +139,8 @@ def hdf5_adddata(hdf, sname, meta, debug=False, chk_meta_only=False):
       Survey name
     chk_meta_only : bool, optional
       Only check meta file;  will not write
+    nproc : int, optional
+      Number of processes for reading the raw spectra
 
     Returns
     -------
@@ -142,48 +164,44 @@ def hdf5_adddata(hdf, sname, meta, debug=False, chk_meta_only=False):
     spec_set = hdf[sname].create_dataset('spec', data=data, chunks=True,
                                          maxshape=(None,), compression='gzip')
     spec_set.resize((nspec,))
-    wvminlist, wvmaxlist, npixlist, speclist = [], [], [], []
+    writer = SpecWriter(spec_set, data)
+    mbuild = MetaBuilder(nspec)
     # Loop
     maxpix = 0
-    for jj,row in enumerate(meta):
+    specfiles = [os.getenv('RAW_IGMSPEC')+'/UVES_Dall/{:s}_flux.dat'.format(row['NAME'])
+                 for row in meta]
+    for jj, sdict in enumerate(iiu.map_spectra(read_spec, specfiles, nproc=nproc)):
         # Read
-        specfile = os.getenv('RAW_IGMSPEC')+'/UVES_Dall/{:s}_flux.dat'.format(row['NAME'])
+        specfile = specfiles[jj]
         print("UVES_Dall: Reading {:s}".format(specfile))
-        spec = Table.read(specfile,format='ascii.fast_no_header',guess=False)#, data_start=1)
         # Parse name
         fname = specfile.split('/')[-1]
         # npix
-        npix = len(spec['col1'])
+        npix = sdict['npix']
         if npix > max_npix:
             raise ValueError("Not enough pixels in the data... ({:d})".format(npix))
         else:
             maxpix = max(npix,maxpix)
         # Continuum
         # Some fiddling about
-        for key in ['wave','flux','sig','co']:
-            data[key] = 0.  # Important to init (for compression too)
-        data['flux'][0][:npix] = spec['col2']
-        data['sig'][0][:npix] = spec['col3']
-        data['wave'][0][:npix] = spec['col1']
-        data['co'][0][:npix] = spec['col4']
+        data = writer.row(jj, npix)
+        data['flux'][0][:npix] = sdict['flux']
+        data['sig'][0][:npix] = sdict['sig']
+        data['wave'][0][:npix] = sdict['wave']
+        data['co'][0][:npix] = sdict['co']
         # Meta
-        speclist.append(str(fname))
-        wvminlist.append(np.min(data['wave'][0][:npix]))
-        wvmaxlist.append(np.max(data['wave'][0][:npix]))
-        npixlist.append(npix)
+        mbuild.set_spec(jj, fname, data['wave'][0], npix)
         # Only way to set the dataset correctly
         if chk_meta_only:
             continue
-        spec_set[jj] = data
+        writer.write(jj)
+    writer.close()
 
     #
     print("Max pix = {:d}".format(maxpix))
     # Add columns
-    meta.add_column(Column(speclist, name='SPEC_FILE'))
-    meta.add_column(Column(npixlist, name='NPIX'))
-    meta.add_column(Column(wvminlist, name='WV_MIN'))
-    meta.add_column(Column(wvmaxlist, name='WV_MAX'))
-    meta.add_column(Column(np.arange(nspec,dtype=int),name='GROUP_ID'))
+    mbuild.group_id()
+    mbuild.add_to(meta)
 
     # Add HDLLS meta to hdf5
     if chk_meta(meta):
@@ -0,0 +1,157 @@
+""" Module for writing the spectra of a group to the hdf5 file
+"""
+from __future__ import print_function, absolute_import, division, unicode_literals
+
+import time
+
+import numpy as np
+import pdb
+
+from igmspec import buildstats as ibs
+
+
+class SpecWriter(object):
+    """ Buffered writer for the padded 'spec' dataset of a group
+
+    Rows are filled in a preallocated block and flushed to the
+    dataset as slabs of whole chunks, rather than one HDF5 write
+    (and chunk recompression) per spectrum.
+
+    Only the pixels a slot held previously are zeroed when it is
+    reused, not the full max_npix width.
+
+    Parameters
+    ----------
+    spec_set : h5py Dataset
+      Already resized to the number of spectra
+    data : ndarray
+      Template row, i.e. the output of init_data()
+    nrow : int, optional
+      Number of rows to buffer;  rounded down to a whole number of chunks
+      Default is set by buff_bytes
+    buff_bytes : int, optional
+      Target size of the buffer in bytes
+    journal : BuildJournal, optional
+      If provided, each flushed slab is recorded in the journal (with
+      the per-row meta) and writing resumes after the committed rows
+    gname : str, optional
+      Group name for the journal
+    """
+    def __init__(self, spec_set, data, nrow=None, buff_bytes=32*1024**2,
+                 journal=None, gname=None):
+        self.spec_set = spec_set
+        self.fields = data.dtype.names
+        # Buffer size
+        if spec_set.chunks is None:
+            chunk = 1
+        else:
+            chunk = spec_set.chunks[0]
+        if nrow is None:
+            nrow = buff_bytes // data.dtype.itemsize
+        self.nrow = max(nrow // chunk, 1) * chunk
+        # Init
+        self.block = np.zeros(self.nrow, dtype=data.dtype)
+        self.dirty = np.zeros(self.nrow, dtype=int)  # Pixels that may be non-zero
+        self.written = np.zeros(self.nrow, dtype=bool)
+        self.meta = [None]*self.nrow
+        self.nwrite = 0
+        # Journal
+        self.journal = journal
+        self.gname = gname
+        if journal is None:
+            self.start = 0
+        else:
+            self.start = journal.rows_done(gname)
+        self.nstart = self.start
+
+    def row(self, jj, npix):
+        """ Grab a zeroed row of the buffer for spectrum jj
+
+        Parameters
+        ----------
+        jj : int
+          Row of the spec dataset;  must not decrease between calls
+        npix : int
+          Number of pixels to be filled
+
+        Returns
+        -------
+        data : ndarray
+          View of the buffer with the same shape as init_data(),
+          i.e. fill with data['flux'][0][:npix] = flux
+        """
+        if jj < self.start:
+            raise ValueError("Rows must be written in order")
+        if npix > self.block['wave'].shape[1]:
+            raise ValueError("Not enough pixels in the data... ({:d})".format(npix))
+        if jj >= self.start + self.nrow:
+            # Slabs stay chunk aligned
+            new_start = self.start + ((jj-self.start) // self.nrow) * self.nrow
+            self.flush(nend=new_start)
+            self.start = new_start
+        kk = jj - self.start
+        self._zero(kk)
+        self.dirty[kk] = npix
+        return self.block[kk:kk+1]
+
+    def write(self, jj, meta=None):
+        """ Mark row jj as ready for the dataset
+
+        Parameters
+        ----------
+        jj : int
+          Row previously grabbed with row()
+        meta : dict, optional
+          Per-row meta to record in the journal
+        """
+        kk = jj - self.start
+        if (kk < 0) or (kk >= self.nrow):
+            raise ValueError("Row {:d} is not in the buffer".format(jj))
+        self.written[kk] = True
+        self.meta[kk] = meta
+        self.nwrite += 1
+
+    def flush(self, nend=None):
+        """ Write the buffered rows to the dataset as one slab
+
+        Parameters
+        ----------
+        nend : int, optional
+          Rows before this one are complete (for the journal)
+          Defaults to the last row written
+        """
+        bstats = ibs.get_stats()
+        if bstats is not None:
+            wall0, cpu0 = time.time(), ibs.thread_time()
+        if np.any(self.written):
+            nflush = np.max(np.where(self.written)[0]) + 1
+            # Rows skipped within the slab are written as zeros
+            for kk in np.where(~self.written[:nflush])[0]:
+                self._zero(kk)
+            self.spec_set[self.start:self.start+nflush] = self.block[:nflush]
+        else:
+            nflush = 0
+        if self.journal is not None:
+            if nend is None:
+                nend = self.start + nflush
+            if nend > self.start:
+                rowmeta = [self.meta[kk] for kk in np.where(self.written)[0]]
+                self.spec_set.file.flush()
+                self.journal.commit_rows(self.gname, self.start, nend, rowmeta)
+        self.written[:] = False
+        self.meta = [None]*self.nrow
+        if (bstats is not None) and (nflush > 0):
+            bstats.add_write(time.time()-wall0, ibs.thread_time()-cpu0, nflush,
+                             nflush*self.block.dtype.itemsize)
+
+    def close(self):
+        """ Flush whatever remains in the buffer
+        """
+        self.flush()
+
+    def _zero(self, kk):
+        ndirty = self.dirty[kk]
+        if ndirty > 0:
+            for key in self.fields:
+                self.block[key][kk][:ndirty] = 0.
+            self.dirty[kk] = 0
@@ -7,11 +7,10 @@ from __future__ import print_function, absolute_import, division, unicode_litera
 
 import numpy as np
 import pdb
-import os, glob
+import os
 import imp
 import json
 
-from astropy.coordinates import SkyCoord, match_coordinates_sky
 from astropy.table import Table, Column, vstack
 from astropy.time import Time
 from astropy.io import fits
@@ -23,6 +22,15 @@ from linetools import utils as ltu
 from specdb.build.utils import chk_meta
 from specdb.build.utils import init_data
 
+from igmspec import inventory
+from igmspec import xmatch
+from igmspec.ingest import utils as iiu
+from igmspec.ingest import quasars
+from igmspec.ingest import speccache
+from igmspec.ingest import headers as iih
+from igmspec.ingest.writer import SpecWriter
+from igmspec.ingest.metabuilder import MetaBuilder
+
 igms_path = imp.find_module('igmspec')[1]
 
 
@@ -33,8 +41,6 @@ def grab_meta():
     -------
 
     """
-    from specdb.specdb import IgmSpec
-    igmsp = IgmSpec()
     #
     xq100_table = Table.read(os.getenv('RAW_IGMSPEC')+'/XQ-100/XQ100_v1_2.fits.gz')
     nqso = len(xq100_table)
@@ -42,31 +48,31 @@ def grab_meta():
     eso_tbl = Table.read(os.getenv('RAW_IGMSPEC')+'/XQ-100/metadata_eso_XQ100.csv', format='ascii.csv')
     ar_files = eso_tbl['ARCFILE'].data
     # Spectral files
-    spec_files = glob.glob(os.getenv('RAW_IGMSPEC')+'/XQ-100/ADP.*')
+    spec_files = inventory.glob(os.getenv('RAW_IGMSPEC')+'/XQ-100/ADP.*')
+    iih.prescan(spec_files)
     # Dummy column
-    xq100_coords = SkyCoord(ra=xq100_table['RA'], dec=xq100_table['DEC'], unit='deg')
+    xq100_tree = xmatch.SkyTree(xq100_table['RA'], xq100_table['DEC'])
     matches = []
     sv_spec_files = []
     sv_orig_files = []
     sv_rescale_files = []
-    for spec_file in spec_files:
+    # ESO files
+    ssfiles = np.array([spec_file[spec_file.rfind('/')+1:-5] for spec_file in spec_files])
+    eso_idx, neso = iiu.match_rows(ssfiles, ar_files, label='XQ-100 ARCFILE')
+    for ss, spec_file in enumerate(spec_files):
         if 'ADP.2016-07-15T08:22:40.682.fits' in spec_file:
             print("XQ-100: Skipping summary file")
             continue
         # ESO file
-        ssfile = spec_file[spec_file.rfind('/')+1:-5]
-        eso_mt = np.where(ar_files == ssfile)[0]
-        try:
-            ofile = eso_tbl['ORIGFILE'][eso_mt][0]
-        except IndexError:
+        if neso[ss] == 0:
             print("XQ-100: File {:s} not really in XQ100!".format(spec_file))
             continue
+        ofile = eso_tbl['ORIGFILE'][eso_idx[ss]]
         if ('_1' in ofile) or ('_2' in ofile) or ('_3' in ofile) or ('_4' in ofile):
             print("XQ-100: Skipping additional file: {:s}".format(ofile))
             continue
         # Match
-        hdu = fits.open(spec_file)
-        head0 = hdu[0].header
+        head0 = iih.getheader(spec_file)
         if head0['DISPELEM'] == 'UVB,VIS,NIR':
             print("XQ-100: Skipping merged spectrum file")
             if 'rescale' not in ofile:
@@ -74,12 +80,11 @@ def grab_meta():
                 pdb.set_trace()
             continue
         try:
-            coord = SkyCoord(ra=head0['RA'], dec=head0['DEC'], unit='deg')
+            imt, sep = xq100_tree.nearest(head0['RA'], head0['DEC'])
         except KeyError:
             pdb.set_trace()
-        sep = coord.separation(xq100_coords)
-        imt = np.argmin(sep)
-        if sep[imt] > 0.1*u.arcsec:
+        imt = imt[0]
+        if sep[0] > 0.1/3600:
             pdb.set_trace()
             raise ValueError("Bad offset")
         # Save
@@ -100,14 +105,12 @@ def grab_meta():
     xq100_meta.rename_column('RA','RA_GROUP')
     xq100_meta.rename_column('DEC','DEC_GROUP')
     # Match to Myers
-    myers = Table(igmsp.hdf['quasars'].value)
-    myers_coord = SkyCoord(ra=myers['RA'], dec=myers['DEC'], unit='deg')
-    xq100_coord = SkyCoord(ra=xq100_meta['RA_GROUP'], dec=xq100_meta['DEC_GROUP'], unit='deg')
-    idx, d2d, _ = match_coordinates_sky(xq100_coord, myers_coord, nthneighbor=1)
-    xq100_meta['RA_GROUP'] = myers_coord.ra.value[idx]
-    xq100_meta['DEC_GROUP'] = myers_coord.dec.value[idx]
+    myers = quasars.get_catalog()
+    idx, d2d = myers.nearest(xq100_meta['RA_GROUP'], xq100_meta['DEC_GROUP'])
+    xq100_meta['RA_GROUP'] = myers.column('RA')[idx]
+    xq100_meta['DEC_GROUP'] = myers.column('DEC')[idx]
     # One bad one (Taking RA/DEC from Simbad)
-    bad_c = d2d.to('arcsec') > 20*u.arcsec
+    bad_c = d2d > 20./3600
     xq100_meta['RA_GROUP'][bad_c] = 215.2823
     xq100_meta['DEC_GROUP'][bad_c] = -6.73232
     # DATE-OBS
@@ -152,7 +155,23 @@ def meta_for_build(xq100_meta=None):
 '''
 
 
-def hdf5_adddata(hdf, sname, meta, debug=False, chk_meta_only=False):
+@speccache.cached
+def read_spec(full_file):
+    """ Read one XQ-100 spectrum
+
+    Parameters
+    ----------
+    full_file : str
+
+    Returns
+    -------
+    sdict : dict
+    """
+    spec = lsio.readspec(full_file)
+    return iiu.spec_to_dict(spec, include_co=True, wave_unit='AA')
+
+
+def hdf5_adddata(hdf, sname, meta, debug=False, chk_meta_only=False, nproc=1):
     """ Append XQ-100 data to the h5 file
 
     Parameters
@@ -164,6 +183,8 @@ def hdf5_adddata(hdf, sname, meta, debug=False, chk_meta_only=False):
       Survey name
     chk_meta_only : bool, optional
       Only check meta file;  will not write
+    nproc : int, optional
+      Number of processes for reading the raw spectra
 
     Returns
     -------
@@ -186,70 +207,49 @@ def hdf5_adddata(hdf, sname, meta, debug=False, chk_meta_only=False):
     spec_set = hdf[sname].create_dataset('spec', data=data, chunks=True,
                                          maxshape=(None,), compression='gzip')
     spec_set.resize((nspec,))
-    Rlist = []
-    wvminlist = []
-    wvmaxlist = []
-    npixlist = []
-    speclist = []
-    gratinglist = []
-    telelist = []
-    instrlist = []
+    writer = SpecWriter(spec_set, data)
+    mbuild = MetaBuilder(nspec, columns=[('DISPERSER', str), ('TELESCOPE', str), ('INSTR', str),
+                                         ('NPIX', int), ('WV_MIN', float), ('WV_MAX', float)])
     # Loop
     maxpix = 0
-    for jj,row in enumerate(meta):
+    full_files = [row['SPEC_FILE'] for row in meta]
+    for jj, sdict in enumerate(iiu.map_spectra(read_spec, full_files, nproc=nproc)):
+        row = meta[jj]
         #
         print("XQ-100: Reading {:s}".format(row['SPEC_FILE']))
-        spec = lsio.readspec(row['SPEC_FILE'])
-        # Parse name
-        fname = row['SPEC_FILE'].split('/')[-1]
         # npix
-        npix = spec.npix
+        npix = sdict['npix']
         if npix > max_npix:
             raise ValueError("Not enough pixels in the data... ({:d})".format(npix))
         else:
             maxpix = max(npix,maxpix)
         # Continuum
         # Some fiddling about
-        for key in ['wave','flux','sig']:
-            data[key] = 0.  # Important to init (for compression too)
-        data['flux'][0][:npix] = spec.flux.value
-        data['sig'][0][:npix] = spec.sig.value
-        data['wave'][0][:npix] = spec.wavelength.to('AA').value
-        data['co'][0][:npix] = spec.co.value
+        data = writer.row(jj, npix)
+        data['flux'][0][:npix] = sdict['flux']
+        data['sig'][0][:npix] = sdict['sig']
+        data['wave'][0][:npix] = sdict['wave']
+        data['co'][0][:npix] = sdict['co']
         # Meta
-        head = spec.header
-        speclist.append(str(fname))
-        wvminlist.append(np.min(data['wave'][0][:npix]))
-        wvmaxlist.append(np.max(data['wave'][0][:npix]))
-        telelist.append(head['TELESCOP'])
-        instrlist.append(head['INSTRUME'])
-        gratinglist.append(head['DISPELEM'])
-        npixlist.append(npix)
-        if gratinglist[-1] == 'NIR':  # From Lopez+16
-            Rlist.append(4350.)
-        elif gratinglist[-1] == 'VIS':
-            Rlist.append(7450.)
-        elif gratinglist[-1] == 'UVB':
-            Rlist.append(5300.)
-        else:
-            pdb.set_trace()
-            raise ValueError("UH OH")
+        head = sdict['head']
+        mbuild.set_row(jj, DISPERSER=head['DISPELEM'], TELESCOPE=head['TELESCOP'],
+                       INSTR=head['INSTRUME'], NPIX=npix,
+                       WV_MIN=np.min(data['wave'][0][:npix]), WV_MAX=np.max(data['wave'][0][:npix]))
         # Only way to set the dataset correctly
         if chk_meta_only:
             continue
-        spec_set[jj] = data
+        writer.write(jj)
+    writer.close()
 
     #
     print("Max pix = {:d}".format(maxpix))
     # Add columns
-    meta.add_column(Column(gratinglist, name='DISPERSER'))
-    meta.add_column(Column(telelist, name='TELESCOPE'))
-    meta.add_column(Column(instrlist, name='INSTR'))
-    meta.add_column(Column(npixlist, name='NPIX'))
-    meta.add_column(Column(wvminlist, name='WV_MIN'))
-    meta.add_column(Column(wvmaxlist, name='WV_MAX'))
-    meta.add_column(Column(Rlist, name='R'))
-    meta.add_column(Column(np.arange(nspec,dtype=int),name='GROUP_ID'))
+    Rdict = {'NIR': 4350., 'VIS': 7450., 'UVB': 5300.}  # From Lopez+16
+    missing = mbuild.map_values('R', mbuild.columns['DISPERSER'], Rdict)
+    if len(missing) > 0:
+        raise ValueError("No resolution for the XQ-100 arm(s) {}".format(missing))
+    mbuild.group_id()
+    mbuild.add_to(meta)
 
     # Add HDLLS meta to hdf5
     if chk_meta(meta):
@@ -0,0 +1,403 @@
+""" Module for an inventory of the raw data files
+
+One parallel pass over $RAW_IGMSPEC records every file (path, size,
+mtime and, for SDSS/BOSS spectra, PLATE/MJD/FIBER) in an indexed
+SQLite table.  The existence checks and globs of the ingest code then
+query the table instead of the (network) filesystem.  Without an
+inventory, isfile() and glob() fall back to os.path.isfile and glob.glob.
+
+The inventory is not updated as the raw data change;  run
+build_inventory() (or build_igmspec.py --inventory) after adding files.
+The mtime of each directory scanned is recorded:  a directory that has
+changed since (files added or removed), or that was never scanned,
+is checked with os.path and glob instead, with a warning if stale.
+Its file is $IGMSPEC_INVENTORY, if set, and otherwise
+igmspec_inventory.sqlite in $RAW_IGMSPEC.
+"""
+from __future__ import print_function, absolute_import, division, unicode_literals
+
+import os
+import re
+import glob as _glob
+import fnmatch
+import sqlite3
+import threading
+import warnings
+import pdb
+
+from igmspec import defs
+from igmspec.ingest import utils as iiu
+
+# Open inventories, by file, process and thread
+_inventories = {}
+
+# spec-PPPP-MMMMM-FFFF, speclya-PPPP-MMMMM-FFFF, spPlate-PPPP-MMMMM (BOSS)
+# and spSpec-MMMMM-PPPP-FFF (SDSS DR7)
+_boss_re = re.compile(r'^(?:spec|speclya|spPlate)-(\d+)-(\d+)(?:-(\d+))?\.fits')
+_sdss_re = re.compile(r'^spSpec-(\d+)-(\d+)-(\d+)\.fit')
+
+
+def inventory_file():
+    """ Default inventory file
+
+    Returns
+    -------
+    db_file : str
+    """
+    db_file = os.getenv('IGMSPEC_INVENTORY')
+    if db_file is None:
+        db_file = os.path.join(os.getenv('RAW_IGMSPEC'), 'igmspec_inventory.sqlite')
+    return db_file
+
+
+def parse_ids(fname):
+    """ PLATE, MJD and FIBER from the name of an SDSS/BOSS file
+
+    Parameters
+    ----------
+    fname : str
+
+    Returns
+    -------
+    ids : tuple
+      (plate, mjd, fiber);  None for those not in the name
+    """
+    mt = _boss_re.match(fname)
+    if mt is not None:
+        fiber = None if mt.group(3) is None else int(mt.group(3))
+        return int(mt.group(1)), int(mt.group(2)), fiber
+    mt = _sdss_re.match(fname)
+    if mt is not None:
+        return int(mt.group(2)), int(mt.group(1)), int(mt.group(3))
+    return None, None, None
+
+
+def scan_dir(path, raw_path, recurse=True):
+    """ Files in a directory, in the order of os.scandir
+
+    Parameters
+    ----------
+    path : str
+    raw_path : str
+    recurse : bool, optional
+
+    Returns
+    -------
+    entries : list of tuple
+      (path, dir, name, size, mtime, plate, mjd, fiber);
+      paths are relative to raw_path
+    subdirs : list
+      Subdirectories not scanned (recurse=False)
+    dirs : list of tuple
+      (dir, mtime) of the directories scanned
+    """
+    entries, subdirs, dirs = [], [], []
+    todo = [path]
+    while len(todo) > 0:
+        dpath = todo.pop(0)
+        rdir = os.path.relpath(dpath, raw_path)
+        # Before the scan, so that a change during it shows
+        dirs.append((rdir, iiu.mtime_ns(os.stat(dpath))))
+        for entry in iiu.scandir(dpath):
+            if entry.is_dir():
+                if recurse:
+                    todo.append(entry.path)
+                else:
+                    subdirs.append(entry.path)
+            elif entry.is_file():
+                stat = entry.stat()
+                entries.append((os.path.join(rdir, entry.name), rdir, entry.name, stat.st_size,
+                                iiu.mtime_ns(stat)) + parse_ids(entry.name))
+    return entries, subdirs, dirs
+
+
+def build_inventory(raw_path=None, db_file=None, nproc=8, raw_dirs=None):
+    """ Scan the raw data into a new inventory
+
+    Parameters
+    ----------
+    raw_path : str, optional
+      Defaults to $RAW_IGMSPEC
+    db_file : str, optional
+      Defaults to inventory_file()
+    nproc : int, optional
+      Number of processes scanning the subdirectories
+    raw_dirs : list, optional
+      Directories (relative to raw_path) to scan;  defaults to all those
+      of defs.get_raw_dirs()
+
+    Returns
+    -------
+    nfiles : int
+    """
+    if raw_path is None:
+        raw_path = os.getenv('RAW_IGMSPEC')
+    if db_file is None:
+        db_file = inventory_file()
+    if raw_dirs is None:
+        raw_dirs = []
+        for rdirs in defs.get_raw_dirs().values():
+            raw_dirs += [rdir for rdir in rdirs if rdir not in raw_dirs]
+    # Top levels here;  their subdirectories (e.g. BOSS plates) in parallel
+    entries, subdirs, dirs = [], [], []
+    for rdir in raw_dirs:
+        full_path = os.path.join(raw_path, rdir)
+        if os.path.isfile(full_path):
+            stat = os.stat(full_path)
+            entries.append((rdir, os.path.dirname(rdir) or '.', os.path.basename(rdir),
+                            stat.st_size, iiu.mtime_ns(stat)) + parse_ids(os.path.basename(rdir)))
+        elif os.path.isdir(full_path):
+            sentries, ssubdirs, sdirs = scan_dir(full_path, raw_path, recurse=False)
+            entries += sentries
+            subdirs += ssubdirs
+            dirs += sdirs
+        else:
+            print("Inventory: missing raw data {:s}".format(full_path))
+    for sentries, _, sdirs in iiu.map_spectra(scan_dir, [(subdir, raw_path) for subdir in subdirs],
+                                              nproc=nproc, nthread=0):
+        entries += sentries
+        dirs += sdirs
+    # Write
+    if os.path.isfile(db_file+'.tmp'):
+        os.remove(db_file+'.tmp')
+    conn = sqlite3.connect(db_file+'.tmp')
+    conn.execute('CREATE TABLE files (path TEXT PRIMARY KEY, dir TEXT, name TEXT, size INTEGER, '
+                 'mtime INTEGER, plate INTEGER, mjd INTEGER, fiber INTEGER)')
+    conn.executemany('INSERT INTO files VALUES (?,?,?,?,?,?,?,?)', entries)
+    conn.execute('CREATE INDEX files_dir ON files (dir)')
+    conn.execute('CREATE INDEX files_ids ON files (plate, mjd, fiber)')
+    conn.execute('CREATE TABLE dirs (dir TEXT PRIMARY KEY, mtime INTEGER)')
+    conn.executemany('INSERT INTO dirs VALUES (?,?)', dirs)
+    conn.execute('CREATE TABLE info (raw_path TEXT)')
+    conn.execute('INSERT INTO info VALUES (?)', (os.path.abspath(raw_path),))
+    conn.commit()
+    conn.close()
+    os.rename(db_file+'.tmp', db_file)
+    _inventories.clear()
+    print("Inventory of {:d} raw files written to {:s}".format(len(entries), db_file))
+    return len(entries)
+
+
+class Inventory(object):
+    """ Queries of an inventory file
+
+    Parameters
+    ----------
+    db_file : str
+    """
+    def __init__(self, db_file):
+        self.db_file = db_file
+        self.conn = sqlite3.connect(db_file)
+        self.raw_path = self.conn.execute('SELECT raw_path FROM info').fetchone()[0]
+        # Directories checked against the filesystem, by relative path
+        self._current = {}
+        tables = [row[0] for row in self.conn.execute("SELECT name FROM sqlite_master WHERE type='table'")]
+        if 'dirs' not in tables:
+            warnings.warn("Inventory {:s} predates the directory mtimes;  rebuild it "
+                          "(it is not used until then)".format(db_file))
+            self._has_dirs = False
+        else:
+            self._has_dirs = True
+
+    def relpath(self, path):
+        """ Path relative to the raw data, or None if outside of it
+        """
+        rpath = os.path.relpath(os.path.abspath(path), self.raw_path)
+        if rpath.startswith('..'):
+            return None
+        return rpath
+
+    def is_current(self, rdir):
+        """ Does the inventory hold the current files of a directory?
+        i.e. was it scanned and is its mtime unchanged since.
+        Each directory is checked once
+
+        Parameters
+        ----------
+        rdir : str
+          Relative to the raw data
+
+        Returns
+        -------
+        bool
+        """
+        if rdir not in self._current:
+            row = None
+            if self._has_dirs:
+                row = self.conn.execute('SELECT mtime FROM dirs WHERE dir=?', (rdir,)).fetchone()
+            if row is None:  # Not scanned
+                self._current[rdir] = False
+            else:
+                try:
+                    mtime = iiu.mtime_ns(os.stat(os.path.join(self.raw_path, rdir)))
+                except OSError:
+                    mtime = None
+                self._current[rdir] = (mtime == row[0])
+                if not self._current[rdir]:
+                    warnings.warn("Raw directory {:s} has changed since the inventory was built;  "
+                                  "using the filesystem.  Rebuild the inventory".format(rdir))
+        return self._current[rdir]
+
+    def isfile(self, path):
+        """ Is the file in the inventory?
+        Checked with os.path if its directory is not current
+
+        Parameters
+        ----------
+        path : str
+
+        Returns
+        -------
+        bool
+        """
+        rpath = self.relpath(path)
+        if (rpath is None) or (not self.is_current(os.path.dirname(rpath) or '.')):
+            return os.path.isfile(path)
+        return self.conn.execute('SELECT 1 FROM files WHERE path=?', (rpath,)).fetchone() is not None
+
+    def stat(self, path):
+        """ Size and mtime of a file, as of the scan
+        Taken from os.stat if its directory is not current
+
+        Parameters
+        ----------
+        path : str
+
+        Returns
+        -------
+        stat : tuple or None
+          (size, mtime in ns);  None if there is no such file
+        """
+        rpath = self.relpath(path)
+        if (rpath is None) or (not self.is_current(os.path.dirname(rpath) or '.')):
+            return _stat(path)
+        row = self.conn.execute('SELECT size, mtime FROM files WHERE path=?', (rpath,)).fetchone()
+        if row is None:
+            return None
+        return row[0], row[1]
+
+    def glob(self, pattern):
+        """ Files matching a pattern with wildcards in the file name only
+        Uses glob.glob if the directory is not current
+
+        Parameters
+        ----------
+        pattern : str
+
+        Returns
+        -------
+        files : list
+          In the order of the scan
+        """
+        dpath, fpattern = os.path.split(pattern)
+        rdir = self.relpath(dpath)
+        if (rdir is None) or _glob.has_magic(dpath) or (not self.is_current(rdir)):
+            return _glob.glob(pattern)
+        rows = self.conn.execute('SELECT name FROM files WHERE dir=? ORDER BY rowid', (rdir,))
+        return [os.path.join(dpath, row[0]) for row in rows if fnmatch.fnmatch(row[0], fpattern)]
+
+    def find_ids(self, plate, mjd, fiber=None):
+        """ Files of a PLATE/MJD(/FIBER), as of the scan
+
+        Parameters
+        ----------
+        plate : int
+        mjd : int
+        fiber : int, optional
+
+        Returns
+        -------
+        files : list
+          Full paths
+        """
+        if fiber is None:
+            rows = self.conn.execute('SELECT path FROM files WHERE plate=? AND mjd=?',
+                                     (int(plate), int(mjd)))
+        else:
+            rows = self.conn.execute('SELECT path FROM files WHERE plate=? AND mjd=? AND fiber=?',
+                                     (int(plate), int(mjd), int(fiber)))
+        return [os.path.join(self.raw_path, row[0]) for row in rows]
+
+
+def get_inventory(db_file=None):
+    """ Open inventory of this process and thread
+
+    Parameters
+    ----------
+    db_file : str, optional
+
+    Returns
+    -------
+    inventory : Inventory or None
+      None if there is no inventory file
+    """
+    if db_file is None:
+        db_file = inventory_file()
+    key = (db_file, os.getpid(), threading.current_thread().ident)
+    if key not in _inventories:
+        if os.path.isfile(db_file):
+            _inventories[key] = Inventory(db_file)
+        else:
+            _inventories[key] = None
+    return _inventories[key]
+
+
+def isfile(path):
+    """ os.path.isfile through the inventory
+
+    Parameters
+    ----------
+    path : str
+
+    Returns
+    -------
+    bool
+    """
+    inventory = get_inventory()
+    if inventory is None:
+        return os.path.isfile(path)
+    return inventory.isfile(path)
+
+
+def _stat(path):
+    """ Size and mtime (ns) of a file from os.stat;  None if not a file
+    """
+    if not os.path.isfile(path):
+        return None
+    stat = os.stat(path)
+    return stat.st_size, iiu.mtime_ns(stat)
+
+
+def stat(path):
+    """ Size and mtime (ns) of a file through the inventory
+
+    Parameters
+    ----------
+    path : str
+
+    Returns
+    -------
+    stat : tuple or None
+      (size, mtime);  None if there is no such file
+    """
+    inventory = get_inventory()
+    if inventory is None:
+        return _stat(path)
+    return inventory.stat(path)
+
+
+def glob(pattern):
+    """ glob.glob through the inventory
+
+    Parameters
+    ----------
+    pattern : str
+
+    Returns
+    -------
+    files : list
+    """
+    inventory = get_inventory()
+    if inventory is None:
+        return _glob.glob(pattern)
+    return inventory.glob(pattern)
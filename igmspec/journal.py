@@ -0,0 +1,172 @@
+""" Module for the build journal, which allows a crashed DB build to resume
+
+The journal is an append-only JSON-lines sidecar to the DB file.
+Each line records one of:
+  * the start of a build (version)
+  * a range of rows committed to the spec dataset of a group,
+    with the per-row meta needed to rebuild the meta table
+  * a group that is complete (spec and meta)
+"""
+from __future__ import print_function, absolute_import, division, unicode_literals
+
+import os
+import json
+import pdb
+
+import numpy as np
+
+
+def journal_file(outfil):
+    """ Name of the journal for a DB file
+
+    Parameters
+    ----------
+    outfil : str
+
+    Returns
+    -------
+    jfile : str
+    """
+    return outfil+'.journal'
+
+
+class BuildJournal(object):
+    """ Sidecar manifest of the progress of a DB build
+
+    Parameters
+    ----------
+    outfil : str
+      DB file being built
+    version : str
+      DB version
+    resume : bool, optional
+      Read the existing journal instead of starting a new one
+    """
+    def __init__(self, outfil, version, resume=False):
+        self.jfile = journal_file(outfil)
+        self.version = version
+        self.done = []
+        self.rows = {}
+        self.meta = {}
+        if resume:
+            self.load()
+        else:
+            if os.path.isfile(self.jfile):
+                os.remove(self.jfile)
+            self._append(dict(event='start', version=version))
+
+    def load(self):
+        """ Parse the journal of a previous (partial) build
+        """
+        if not os.path.isfile(self.jfile):
+            raise IOError("No journal {:s} to resume from".format(self.jfile))
+        with open(self.jfile, 'r') as f:
+            lines = f.readlines()
+        for ii, line in enumerate(lines):
+            try:
+                entry = json.loads(line)
+            except ValueError:  # Partial line from a crash;  drop it
+                with open(self.jfile, 'w') as f:
+                    f.writelines(lines[:ii])
+                break
+            else:
+                if entry['event'] == 'start':
+                    if entry['version'] != self.version:
+                        raise IOError("Journal is for version {:s}, not {:s}".format(
+                            entry['version'], self.version))
+                elif entry['event'] == 'rows':
+                    gname = entry['group']
+                    if entry['row0'] != self.rows.get(gname, 0):
+                        raise ValueError("Journal rows for {:s} are not contiguous".format(gname))
+                    self.rows[gname] = entry['row1']
+                    self.meta.setdefault(gname, []).extend(entry['rowmeta'])
+                elif entry['event'] == 'group':
+                    self.done.append(entry['group'])
+        print("Resuming build with {:d} completed groups".format(len(self.done)))
+
+    def is_done(self, gname):
+        """ Has the group been completed?
+
+        Parameters
+        ----------
+        gname : str
+
+        Returns
+        -------
+        bool
+        """
+        return gname in self.done
+
+    def rows_done(self, gname):
+        """ Number of rows of the spec dataset committed for a group
+
+        Parameters
+        ----------
+        gname : str
+
+        Returns
+        -------
+        int
+        """
+        return self.rows.get(gname, 0)
+
+    def rowmeta(self, gname):
+        """ Per-row meta of the committed rows of a group
+
+        Parameters
+        ----------
+        gname : str
+
+        Returns
+        -------
+        list of dict
+        """
+        return self.meta.get(gname, [])
+
+    def commit_rows(self, gname, row0, row1, rowmeta):
+        """ Record rows written to the spec dataset
+        The hdf5 file must have been flushed before this call
+
+        Parameters
+        ----------
+        gname : str
+        row0 : int
+        row1 : int
+          Rows [row0,row1) are complete
+        rowmeta : list of dict
+          Meta for each row written in the range
+        """
+        self._append(dict(event='rows', group=gname, row0=int(row0), row1=int(row1),
+                          rowmeta=rowmeta))
+        self.rows[gname] = int(row1)
+        self.meta.setdefault(gname, []).extend(rowmeta)
+
+    def complete_group(self, gname):
+        """ Record a group as complete
+
+        Parameters
+        ----------
+        gname : str
+        """
+        self._append(dict(event='group', group=gname))
+        self.done.append(gname)
+
+    def remove(self):
+        """ Remove the journal, i.e. once the build has finished
+        """
+        if os.path.isfile(self.jfile):
+            os.remove(self.jfile)
+
+    def _append(self, entry):
+        with open(self.jfile, 'a') as f:
+            f.write(json.dumps(entry, default=_to_python)+'\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def _to_python(obj):
+    """ numpy scalars to python for json
+    """
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError("Cannot write {:s} to the journal".format(str(type(obj))))
@@ -0,0 +1,118 @@
+""" Module to reference the spectra of a previous DB file
+instead of copying them, and to materialize such a file
+"""
+from __future__ import print_function, absolute_import, division, unicode_literals
+
+import os
+import pdb
+
+import h5py
+
+SPEC_MODES = ['copy', 'external', 'virtual']
+
+
+def add_spec(src_hdf, hdf, gname, mode='copy'):
+    """ Add the spec dataset of a group from a previous DB file
+
+    Parameters
+    ----------
+    src_hdf : h5py File
+      Previous DB file;  must stay in place for 'external' and 'virtual'
+    hdf : h5py File
+      DB file being built;  the group must exist
+    gname : str
+    mode : str, optional
+      copy -- Copy the (compressed) dataset
+      external -- HDF5 external link to the dataset
+      virtual -- Virtual dataset mapping the full dataset
+    """
+    path = '/'+gname+'/spec'
+    src_file = os.path.abspath(src_hdf.filename)
+    if mode == 'copy':
+        src_hdf.copy(path, hdf[gname])
+    elif mode == 'external':
+        hdf[gname]['spec'] = h5py.ExternalLink(src_file, path)
+    elif mode == 'virtual':
+        src = src_hdf[path]
+        layout = h5py.VirtualLayout(shape=src.shape, dtype=src.dtype)
+        layout[:] = h5py.VirtualSource(src_file, path, shape=src.shape, dtype=src.dtype)
+        hdf[gname].create_virtual_dataset('spec', layout)
+    else:
+        raise IOError("Bad mode {:s};  allowed are {}".format(mode, SPEC_MODES))
+
+
+def is_linked(grp, key):
+    """ Is the dataset an external link or virtual dataset?
+
+    Parameters
+    ----------
+    grp : h5py Group
+    key : str
+
+    Returns
+    -------
+    bool
+    """
+    if isinstance(grp.get(key, getlink=True), h5py.ExternalLink):
+        return True
+    obj = grp[key]
+    return isinstance(obj, h5py.Dataset) and obj.is_virtual
+
+
+def materialize(infile, outfile, nrow=1000):
+    """ Write a standalone copy of a DB file, i.e. for distribution
+    External links and virtual datasets are replaced by the data
+
+    Parameters
+    ----------
+    infile : str
+    outfile : str
+    nrow : int, optional
+      Rows per slab when a virtual dataset has to be copied row by row
+    """
+    hin = h5py.File(infile, 'r')
+    hout = h5py.File(outfile, 'w')
+    _copy_attrs(hin, hout)
+    _materialize_group(hin, hout, nrow)
+    hin.close()
+    hout.close()
+    print("Wrote standalone DB file {:s}".format(outfile))
+
+
+def _materialize_group(gin, gout, nrow):
+    for key in gin.keys():
+        obj = gin[key]
+        if isinstance(obj, h5py.Group):
+            grp = gout.create_group(key)
+            _copy_attrs(obj, grp)
+            _materialize_group(obj, grp, nrow)
+        elif not obj.is_virtual:
+            # Regular dataset or external link;  copied compressed
+            gout.copy(obj, gout, name=key)
+            if is_linked(gin, key):
+                print("Materialized {:s}".format(obj.name))
+        else:
+            sources = obj.virtual_sources()
+            if len(sources) == 1:  # Copy the full source dataset
+                sfile = sources[0].file_name
+                if not os.path.isabs(sfile):
+                    sfile = os.path.join(os.path.dirname(gin.file.filename), sfile)
+                with h5py.File(sfile, 'r') as hsrc:
+                    src = hsrc[sources[0].dset_name]
+                    if src.shape == obj.shape:
+                        gout.copy(src, gout, name=key)
+                        _copy_attrs(obj, gout[key])
+                        print("Materialized {:s}".format(obj.name))
+                        continue
+            # Slab by slab
+            dset = gout.create_dataset(key, shape=obj.shape, dtype=obj.dtype, chunks=True,
+                                       maxshape=(None,)+obj.shape[1:], compression='gzip')
+            for ss in range(0, obj.shape[0], nrow):
+                dset[ss:ss+nrow] = obj[ss:ss+nrow]
+            _copy_attrs(obj, dset)
+            print("Materialized {:s}".format(obj.name))
+
+
+def _copy_attrs(obj_in, obj_out):
+    for akey in obj_in.attrs.keys():
+        obj_out.attrs[akey] = obj_in.attrs[akey]
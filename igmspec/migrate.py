@@ -0,0 +1,154 @@
+""" Module for migrating the meta tables of groups carried
+from a previous DB version into a new one
+
+Migrations are declared per version as a list of steps for
+all groups ('*') and for individual groups.  Steps only operate
+on meta columns;  the spectra are added separately (see links.add_spec)
+and are never rewritten.
+"""
+from __future__ import print_function, absolute_import, division, unicode_literals
+
+import numpy as np
+import pdb
+
+from collections import OrderedDict
+
+from astropy.table import Table, Column
+
+
+def rename(old, new):
+    """ Step to rename a column
+    """
+    return dict(step='rename', old=old, new=new)
+
+
+def add(name, value):
+    """ Step to add a column with a single value
+    """
+    return dict(step='add', name=name, value=value)
+
+
+def drop(name):
+    """ Step to drop a column
+    """
+    return dict(step='drop', name=name)
+
+
+def derive(name, func):
+    """ Step to add (or replace) a column computed from the group
+
+    Parameters
+    ----------
+    name : str
+    func : function
+      Called as func(meta, grp) with grp the h5py group of the
+      previous DB file;  returns the column values
+    """
+    return dict(step='derive', name=name, func=func)
+
+
+def get_migrations():
+    """ Migrations of the meta tables, by version
+
+    Returns
+    -------
+    mdict : OrderedDict
+      Keyed by version; each a dict keyed by group name ('*' for all)
+      of lists of steps
+    """
+    from igmspec.ingest import boss
+    mdict = OrderedDict()
+    # v01 -> v02
+    mdict['v02'] = {'*': [rename('GRATING', 'DISPERSER')],
+                    # Only scans the continua of files without flag_co
+                    'BOSS_DR12': [derive('flag_co', boss.derive_coflag)],
+                    }
+    # v02 -> v03;  IDs are regenerated by add_ids
+    mdict['v03'] = {'*': [drop('IGM_ID')]}
+    return mdict
+
+
+def get_steps(version, gname):
+    """ Migration steps for a group
+
+    Parameters
+    ----------
+    version : str
+      e.g. v02.1 uses the steps of v02
+    gname : str
+
+    Returns
+    -------
+    steps : list
+    """
+    mdict = get_migrations()
+    vkey = version[0:3]
+    if vkey not in mdict.keys():
+        raise IOError("No migrations for version {:s}".format(version))
+    steps = mdict[vkey].get('*', []) + mdict[vkey].get(gname, [])
+    return steps
+
+
+def apply_steps(meta, steps, grp=None):
+    """ Apply migration steps to a meta table
+
+    Parameters
+    ----------
+    meta : Table
+      Modified in place
+    steps : list
+    grp : h5py Group, optional
+      Group of the previous DB file, for derive steps
+
+    Returns
+    -------
+    meta : Table
+    """
+    for step in steps:
+        if step['step'] == 'rename':
+            meta.rename_column(step['old'], step['new'])
+        elif step['step'] == 'add':
+            meta.add_column(Column([step['value']]*len(meta), name=step['name']))
+        elif step['step'] == 'drop':
+            meta.remove_column(step['name'])
+        elif step['step'] == 'derive':
+            meta[step['name']] = step['func'](meta, grp)
+        else:
+            raise ValueError("Bad migration step {:s}".format(step['step']))
+    return meta
+
+
+def carry_meta(src_hdf, gname, version):
+    """ Read the meta table of a group from a previous DB file
+    and migrate it to version
+
+    Parameters
+    ----------
+    src_hdf : h5py File
+    gname : str
+    version : str
+
+    Returns
+    -------
+    meta : Table
+    """
+    meta = Table(src_hdf[gname+'/meta'][()])
+    return apply_steps(meta, get_steps(version, gname), grp=src_hdf[gname])
+
+
+def write_meta(hdf, gname, meta, src_hdf=None):
+    """ Write the meta table of a group, with the attributes
+    of the previous meta dataset
+
+    Parameters
+    ----------
+    hdf : h5py File
+    gname : str
+    meta : Table
+    src_hdf : h5py File, optional
+    """
+    if 'meta' in hdf[gname].keys():
+        del hdf[gname]['meta']
+    hdf[gname]['meta'] = meta
+    if src_hdf is not None:
+        hdf[gname]['meta'].attrs.update(dict(src_hdf[gname]['meta'].attrs))
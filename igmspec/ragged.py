@@ -0,0 +1,301 @@
+""" Module for the ragged (offset-indexed) spectrum layout
+
+Instead of one fixed-width compound row per spectrum, the pixels of
+all spectra in a group are concatenated into flat 1-D datasets,
+one per field, under group/ragged/.  Row jj of the index
+(aligned with GROUP_ID in the meta table) has its pixels at
+[offsets[jj]:offsets[jj]+NPIX[jj]].
+
+No ingest writes this layout;  the groups of a finished DB file are
+converted from their padded spec datasets with padded_to_ragged, in
+place, or with repack into a new file without the padded datasets
+(see scripts/convert_ragged.py).  RaggedWriter mirrors SpecWriter so
+that an ingest loop could write it directly.
+"""
+from __future__ import print_function, absolute_import, division, unicode_literals
+
+import time
+
+import numpy as np
+import h5py
+import pdb
+
+from igmspec import buildstats as ibs
+
+RAGGED = 'ragged'
+
+
+class RaggedWriter(object):
+    """ Writer for the ragged layout of a group
+
+    Mirrors the row()/write()/close() interface of
+    igmspec.ingest.writer.SpecWriter, so it can stand in for it.
+
+    Parameters
+    ----------
+    grp : h5py Group
+      Group of the survey, e.g. hdf['HD-LLS_DR1']
+    data : ndarray
+      Template row, i.e. the output of init_data()
+    nspec : int
+      Number of spectra in the group
+    buff_pix : int, optional
+      Number of pixels to buffer before appending to the datasets
+    chunk_pix : int, optional
+      Chunk size of the 1-D datasets
+    """
+    def __init__(self, grp, data, nspec, buff_pix=4*1024**2, chunk_pix=65536):
+        self.nspec = nspec
+        self.fields = data.dtype.names
+        self.rgrp = grp.create_group(RAGGED)
+        for key in self.fields:
+            self.rgrp.create_dataset(key, shape=(0,), dtype=data.dtype[key].base,
+                                     chunks=(chunk_pix,), maxshape=(None,),
+                                     compression='gzip')
+        # Index
+        self.npix = np.zeros(nspec, dtype=int)
+        # Buffers
+        self.buff_pix = buff_pix
+        self.scratch = np.zeros_like(data)
+        self.dirty = 0  # Pixels of the scratch row that may be non-zero
+        self.pending = {key: [] for key in self.fields}
+        self.npending = 0
+        self.ntot = 0
+        self.last = -1
+        self.nwrite = 0
+
+    def row(self, jj, npix):
+        """ Grab a zeroed scratch row for spectrum jj
+
+        Parameters
+        ----------
+        jj : int
+          Row of the group;  must not decrease between calls
+        npix : int
+
+        Returns
+        -------
+        data : ndarray
+          Same shape as init_data()
+        """
+        if jj <= self.last:
+            raise ValueError("Rows must be written in order")
+        if npix > self.scratch['wave'].shape[1]:
+            raise ValueError("Not enough pixels in the data... ({:d})".format(npix))
+        for key in self.fields:
+            self.scratch[key][0][:self.dirty] = 0.
+        self.dirty = npix
+        self.npix[jj] = npix
+        return self.scratch
+
+    def write(self, jj, meta=None):
+        """ Append the first NPIX pixels of the scratch row
+
+        Parameters
+        ----------
+        jj : int
+          Row previously grabbed with row()
+        meta : dict, optional
+          Ignored;  for compatibility with SpecWriter
+        """
+        if jj <= self.last:
+            raise ValueError("Rows must be written in order")
+        # Skipped rows have no pixels
+        self.npix[self.last+1:jj] = 0
+        self.last = jj
+        npix = self.npix[jj]
+        for key in self.fields:
+            self.pending[key].append(self.scratch[key][0][:npix].copy())
+        self.npending += npix
+        self.nwrite += 1
+        if self.npending >= self.buff_pix:
+            self.flush()
+
+    def flush(self):
+        """ Append the buffered pixels to the datasets
+        """
+        if self.npending == 0:
+            return
+        bstats = ibs.get_stats()
+        wall0, cpu0 = time.time(), ibs.thread_time()
+        nrows, nbytes = len(self.pending[self.fields[0]]), 0
+        for key in self.fields:
+            dset = self.rgrp[key]
+            dset.resize((self.ntot+self.npending,))
+            dset[self.ntot:] = np.concatenate(self.pending[key])
+            nbytes += self.npending * dset.dtype.itemsize
+            self.pending[key] = []
+        self.ntot += self.npending
+        self.npending = 0
+        if bstats is not None:
+            bstats.add_write(time.time()-wall0, ibs.thread_time()-cpu0, nrows, nbytes)
+
+    def close(self):
+        """ Flush and write the offsets/NPIX index
+        """
+        self.flush()
+        self.npix[self.last+1:] = 0
+        write_index(self.rgrp, self.npix)
+
+
+def write_index(rgrp, npix):
+    """ Write the offsets/NPIX index of a ragged group
+
+    Parameters
+    ----------
+    rgrp : h5py Group
+      group/ragged
+    npix : ndarray
+      Number of pixels per row, aligned with GROUP_ID
+    """
+    offsets = np.zeros(len(npix), dtype=np.int64)
+    offsets[1:] = np.cumsum(npix)[:-1]
+    rgrp['NPIX'] = npix.astype(np.int64)
+    rgrp['offsets'] = offsets
+
+
+def is_ragged(grp):
+    """ Does the group have the ragged layout?
+
+    Parameters
+    ----------
+    grp : h5py Group
+
+    Returns
+    -------
+    bool
+    """
+    return RAGGED in grp.keys()
+
+
+def grab_spec(grp, rows, fields=None):
+    """ Read spectra from the ragged layout
+
+    Runs of consecutive rows are read with a single slice per field.
+
+    Parameters
+    ----------
+    grp : h5py Group
+      Group of the survey, e.g. hdf['HD-LLS_DR1']
+    rows : int or list
+      GROUP_ID values
+    fields : list, optional
+      Defaults to all fields, e.g. wave, flux, sig, co
+
+    Returns
+    -------
+    spectra : list of dict
+      One per row;  each array has exactly NPIX pixels
+    """
+    rgrp = grp[RAGGED]
+    if fields is None:
+        fields = [key for key in rgrp.keys() if key not in ['offsets', 'NPIX']]
+    rows = np.atleast_1d(rows).astype(int)
+    if len(rows) == 0:
+        return []
+    offsets = rgrp['offsets'][:]
+    npix = rgrp['NPIX'][:]
+    # Runs of consecutive rows (in sorted order)
+    srt = np.argsort(rows, kind='mergesort')
+    srows = rows[srt]
+    breaks = np.where(np.diff(srows) != 1)[0] + 1
+    spectra = [None]*len(rows)
+    for run in np.split(np.arange(len(srows)), breaks):
+        r0, r1 = srows[run[0]], srows[run[-1]]
+        i0 = offsets[r0]
+        i1 = offsets[r1] + npix[r1]
+        block = {key: rgrp[key][i0:i1] for key in fields}
+        for ii in run:
+            jj = srows[ii]
+            s0 = offsets[jj] - i0
+            spectra[srt[ii]] = {key: block[key][s0:s0+npix[jj]] for key in fields}
+    return spectra
+
+
+def padded_to_ragged(grp, nrow=1000, npix=None, chunk_pix=65536, out_grp=None):
+    """ Convert the padded spec dataset of a group to the ragged layout
+    The padded dataset is left in place
+
+    Parameters
+    ----------
+    grp : h5py Group
+      Group of the survey with a spec dataset and meta table
+    nrow : int, optional
+      Number of padded rows to read at a time
+    npix : ndarray, optional
+      Number of pixels per row;  defaults to meta['NPIX']
+    chunk_pix : int, optional
+    out_grp : h5py Group, optional
+      Group to write the ragged layout to, e.g. in another file;
+      defaults to grp
+
+    Returns
+    -------
+    rgrp : h5py Group
+    """
+    if out_grp is None:
+        out_grp = grp
+    spec_set = grp['spec']
+    nspec = spec_set.shape[0]
+    if npix is None:
+        npix = grp['meta']['NPIX']
+    npix = np.asarray(npix).astype(int)
+    if len(npix) != nspec:
+        raise ValueError("NPIX does not align with the spec dataset")
+    if is_ragged(out_grp):
+        raise IOError("Group {:s} already has the ragged layout".format(out_grp.name))
+    writer = RaggedWriter(out_grp, spec_set[0:1], nspec, chunk_pix=chunk_pix)
+    for ss in range(0, nspec, nrow):
+        block = spec_set[ss:ss+nrow]
+        for kk in range(len(block)):
+            jj = ss + kk
+            data = writer.row(jj, npix[jj])
+            for key in writer.fields:
+                data[key][0][:npix[jj]] = block[key][kk][:npix[jj]]
+            writer.write(jj)
+    writer.close()
+    print("Converted {:d} spectra in {:s} to the ragged layout".format(nspec, grp.name))
+    return writer.rgrp
+
+
+def repack(src_hdf, out_hdf, groups=None, **kwargs):
+    """ Copy a DB file into a new one with the ragged layout in place of
+    the padded spec datasets
+
+    Deleting a dataset does not shrink an HDF5 file, so the padded
+    datasets are dropped by leaving them out of a new file instead
+
+    Parameters
+    ----------
+    src_hdf : h5py File
+    out_hdf : h5py File
+      New file
+    groups : list, optional
+      Groups to convert;  defaults to all with a spec dataset.
+      The others are copied as is
+    **kwargs
+      Passed to padded_to_ragged
+
+    Returns
+    -------
+    groups : list
+      Groups converted
+    """
+    if groups is None:
+        groups = [key for key in src_hdf.keys() if isinstance(src_hdf[key], h5py.Group)
+                  and ('spec' in src_hdf[key].keys())]
+    out_hdf.attrs.update(dict(src_hdf.attrs))
+    for key in src_hdf.keys():
+        if key not in groups:
+            src_hdf.copy(key, out_hdf)
+            continue
+        out_grp = out_hdf.create_group(key)
+        out_grp.attrs.update(dict(src_hdf[key].attrs))
+        for sub in src_hdf[key].keys():
+            if sub != 'spec':
+                src_hdf[key].copy(sub, out_grp)
+        if is_ragged(src_hdf[key]):
+            print("Group {:s} is already ragged".format(key))
+            continue
+        padded_to_ragged(src_hdf[key], out_grp=out_grp, **kwargs)
+    return groups
@@ -0,0 +1,284 @@
+""" Module for scheduling the stages of a DB build as a DAG
+
+Each stage runs a function once all of the stages it depends on
+are complete.  Independent stages run concurrently in separate
+(non-daemonic) processes, up to a budget of cores;  stages flagged
+inline run in the calling process, e.g. those writing the DB file.
+Ready stages are started in order of their critical path to the end
+of the build, which puts the largest groups first.
+"""
+from __future__ import print_function, absolute_import, division, unicode_literals
+
+import time
+import multiprocessing
+try:  # Python 3.3+
+    from multiprocessing.connection import wait
+except ImportError:
+    wait = None
+import pdb
+
+from collections import OrderedDict
+
+
+def wait_procs(procs, poll=0.1):
+    """ Wait for at least one of the processes to finish
+
+    Parameters
+    ----------
+    procs : list of multiprocessing.Process
+    poll : float, optional
+      Polling interval (s) on Python 2, without multiprocessing.connection.wait
+
+    Returns
+    -------
+    done : list
+      Processes that have finished
+    """
+    if wait is not None:
+        sentinels = dict([(proc.sentinel, proc) for proc in procs])
+        return [sentinels[sentinel] for sentinel in wait(list(sentinels.keys()))]
+    while True:
+        done = [proc for proc in procs if not proc.is_alive()]
+        if len(done) > 0:
+            return done
+        time.sleep(poll)
+
+
+class Stage(object):
+    """ One stage of a build
+
+    Parameters
+    ----------
+    name : str
+    func : function
+    args : tuple, optional
+    kwargs : dict, optional
+    deps : list, optional
+      Names of the stages that must complete first
+    cost : float, optional
+      Estimated cost, in arbitrary but common units
+    ncore : int, optional
+      Cores used by the stage
+    inline : bool, optional
+      Run in the calling process
+    """
+    def __init__(self, name, func, args=(), kwargs=None, deps=None, cost=1.,
+                 ncore=1, inline=False):
+        self.name = name
+        self.func = func
+        self.args = args
+        self.kwargs = {} if kwargs is None else kwargs
+        self.deps = [] if deps is None else list(deps)
+        self.cost = float(cost)
+        self.ncore = int(ncore)
+        self.inline = inline
+        self.time = None
+
+    def __repr__(self):
+        return '<Stage: {:s} deps={} cost={:g} ncore={:d}>'.format(
+            self.name, self.deps, self.cost, self.ncore)
+
+
+class BuildDAG(object):
+    """ Stages of a build and their dependencies
+    """
+    def __init__(self):
+        self.stages = OrderedDict()
+
+    def add(self, name, func, **kwargs):
+        """ Add a stage;  see Stage for the keywords
+
+        Parameters
+        ----------
+        name : str
+        func : function
+
+        Returns
+        -------
+        stage : Stage
+        """
+        if name in self.stages.keys():
+            raise ValueError("Stage {:s} already in the DAG".format(name))
+        stage = Stage(name, func, **kwargs)
+        self.stages[name] = stage
+        return stage
+
+    def tsort(self):
+        """ Stages in a dependency (topological) order
+
+        Returns
+        -------
+        names : list
+        """
+        for stage in self.stages.values():
+            for dep in stage.deps:
+                if dep not in self.stages.keys():
+                    raise ValueError("Stage {:s} depends on missing stage {:s}".format(
+                        stage.name, dep))
+        names = []
+        state = {}
+        for name in self.stages.keys():
+            todo = [(name, False)]
+            while len(todo) > 0:
+                sname, children_done = todo.pop()
+                if children_done:
+                    state[sname] = 'done'
+                    names.append(sname)
+                    continue
+                if state.get(sname) == 'done':
+                    continue
+                if state.get(sname) == 'active':
+                    raise ValueError("Cycle in the DAG at stage {:s}".format(sname))
+                state[sname] = 'active'
+                todo.append((sname, True))
+                for dep in self.stages[sname].deps:
+                    if state.get(dep) != 'done':
+                        todo.append((dep, False))
+        return names
+
+    def path_costs(self, measured=False):
+        """ Cost of the longest path from each stage to the end of the build,
+        including the stage itself
+
+        Parameters
+        ----------
+        measured : bool, optional
+          Use the measured times of a completed run instead of the costs
+
+        Returns
+        -------
+        pcost : dict
+        nxt : dict
+          Next stage on the longest path (or None)
+        """
+        children = {name: [] for name in self.stages.keys()}
+        for stage in self.stages.values():
+            for dep in stage.deps:
+                children[dep].append(stage.name)
+        pcost, nxt = {}, {}
+        for name in reversed(self.tsort()):
+            stage = self.stages[name]
+            cost = stage.time if measured else stage.cost
+            best, nxt[name] = 0., None
+            for child in children[name]:
+                if pcost[child] > best:
+                    best, nxt[name] = pcost[child], child
+            pcost[name] = cost + best
+        return pcost, nxt
+
+    def critical_path(self, measured=False):
+        """ Longest chain of stages, which bounds the build time
+
+        Parameters
+        ----------
+        measured : bool, optional
+          Use the measured times of a completed run
+
+        Returns
+        -------
+        path : list
+          Stage names
+        total : float
+        """
+        pcost, nxt = self.path_costs(measured=measured)
+        roots = [name for name in self.stages.keys() if len(self.stages[name].deps) == 0]
+        name = max(roots, key=lambda key: pcost[key])
+        total = pcost[name]
+        path = []
+        while name is not None:
+            path.append(name)
+            name = nxt[name]
+        return path, total
+
+    def print_critical_path(self, measured=False):
+        """ Print the critical path
+
+        Parameters
+        ----------
+        measured : bool, optional
+          Use the measured times (s) of a completed run
+        """
+        path, total = self.critical_path(measured=measured)
+        if measured:
+            print("Critical path: {:.1f}s".format(total))
+        else:
+            print("Critical path: cost={:g}".format(total))
+        for name in path:
+            stage = self.stages[name]
+            if measured:
+                print("  {:s}: {:.1f}s".format(name, stage.time))
+            else:
+                print("  {:s}: cost={:g}".format(name, stage.cost))
+
+    def run(self, ncore=None):
+        """ Run the stages
+
+        Parameters
+        ----------
+        ncore : int, optional
+          Budget of cores;  defaults to multiprocessing.cpu_count()
+          A stage needing more than the budget runs alone
+        """
+        if ncore is None:
+            ncore = multiprocessing.cpu_count()
+        pcost, _ = self.path_costs()
+        done = set()
+        pending = list(self.stages.keys())
+        running = {}
+        failed = []
+        nbusy = 0
+        while (len(pending) > 0) or (len(running) > 0):
+            # Ready stages, longest path first
+            ready = [name for name in pending
+                     if all([dep in done for dep in self.stages[name].deps])]
+            ready.sort(key=lambda key: pcost[key], reverse=True)
+            if len(failed) > 0:
+                ready = []
+                pending = []
+            # Start processes
+            for name in ready:
+                stage = self.stages[name]
+                if stage.inline:
+                    continue
+                need = min(stage.ncore, ncore)
+                if (nbusy > 0) and (nbusy + need > ncore):
+                    continue
+                proc = multiprocessing.Process(target=stage.func, name=name,
+                                               args=stage.args, kwargs=stage.kwargs)
+                stage.time = time.time()
+                proc.start()
+                print("Started stage {:s}".format(name))
+                running[proc] = need
+                nbusy += need
+                pending.remove(name)
+            # Inline stage?  Only while the processes keep the cores busy
+            inline = [name for name in ready if self.stages[name].inline]
+            if (len(inline) > 0) and (nbusy < ncore):
+                name = inline[0]
+                stage = self.stages[name]
+                print("Running stage {:s}".format(name))
+                t0 = time.time()
+                stage.func(*stage.args, **stage.kwargs)
+                stage.time = time.time() - t0
+                pending.remove(name)
+                done.add(name)
+                continue
+            if len(running) == 0:
+                if len(pending) > 0:
+                    raise ValueError("Stages cannot run: {}".format(pending))
+                break
+            # Wait for a process
+            for proc in wait_procs(list(running.keys())):
+                need = running.pop(proc)
+                proc.join()
+                nbusy -= need
+                stage = self.stages[proc.name]
+                stage.time = time.time() - stage.time
+                if proc.exitcode != 0:
+                    print("Stage {:s} failed with exit code {:d}".format(proc.name, proc.exitcode))
+                    failed.append(proc.name)
+                else:
+                    print("Finished stage {:s} in {:.1f}s".format(proc.name, stage.time))
+                    done.add(proc.name)
+        if len(failed) > 0:
+            raise ValueError("Failed stages: {}".format(failed))
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+"""
+Time the cross-matches of igmspec.xmatch against those of astropy
+on random positions
+"""
+from __future__ import (print_function, absolute_import, division, unicode_literals)
+
+import pdb
+
+def parser(options=None):
+    import argparse
+    # Parse
+    parser = argparse.ArgumentParser(
+        description='Benchmark igmspec.xmatch against astropy.coordinates')
+    parser.add_argument("--sizes", type=str, default='1e4,1e5,1e6', help="Catalog sizes, comma separated [default: 1e4,1e5,1e6]")
+    parser.add_argument("--radius", type=float, default=2., help="Match radius (arcsec) [default: 2]")
+    parser.add_argument("--seed", type=int, default=1234, help="Random seed [default: 1234]")
+
+    if options is None:
+        args = parser.parse_args()
+    else:
+        args = parser.parse_args(options)
+    return args
+
+
+def random_sky(nobj, rstate):
+    """ Uniform positions on the sky (deg)
+    """
+    import numpy as np
+    ra = rstate.uniform(0., 360., nobj)
+    dec = np.degrees(np.arcsin(rstate.uniform(-1., 1., nobj)))
+    return ra, dec
+
+
+def main(args=None):
+    """ Run
+    Parameters
+    ----------
+    args
+
+    Returns
+    -------
+
+    """
+    import time
+    import numpy as np
+    from astropy import units as u
+    from astropy.coordinates import SkyCoord, match_coordinates_sky, search_around_sky
+    from igmspec import xmatch
+
+    # Grab arguments
+    pargs = parser(options=args)
+
+    rstate = np.random.RandomState(pargs.seed)
+    radius = pargs.radius*u.arcsec
+    print("{:>9s} {:>10s} {:>8s} {:>8s} {:>8s}".format('N', 'query', 'astropy', 'xmatch', 'speedup'))
+    for nobj in [int(float(size)) for size in pargs.sizes.split(',')]:
+        ra1, dec1 = random_sky(nobj, rstate)
+        # Catalog 2 is catalog 1 jittered by ~1" with half of the positions replaced
+        ra2 = ra1 + rstate.normal(0., 1./3600, nobj) / np.cos(np.radians(dec1))
+        dec2 = np.clip(dec1 + rstate.normal(0., 1./3600, nobj), -90., 90.)
+        ra2[::2], dec2[::2] = random_sky(len(ra2[::2]), rstate)
+        ra2 = ra2 % 360.
+
+        timings = []
+        # Nearest
+        t0 = time.time()
+        c1 = SkyCoord(ra=ra1, dec=dec1, unit='deg')
+        c2 = SkyCoord(ra=ra2, dec=dec2, unit='deg')
+        aidx, ad2d, _ = match_coordinates_sky(c1, c2)
+        t1 = time.time()
+        xidx, xd2d = xmatch.match_nearest(ra1, dec1, ra2, dec2)
+        t2 = time.time()
+        assert np.all(aidx == xidx)
+        timings.append(('nearest', t1-t0, t2-t1))
+        # Within
+        t0 = time.time()
+        c1 = SkyCoord(ra=ra1, dec=dec1, unit='deg')
+        c2 = SkyCoord(ra=ra2, dec=dec2, unit='deg')
+        ai1, ai2, _, _ = search_around_sky(c1, c2, radius)
+        t1 = time.time()
+        xi1, xi2, _ = xmatch.match_within(ra1, dec1, ra2, dec2, radius)
+        t2 = time.time()
+        assert len(ai1) == len(xi1)
+        timings.append(('within', t1-t0, t2-t1))
+        # Self (nearest other)
+        t0 = time.time()
+        c1 = SkyCoord(ra=ra1, dec=dec1, unit='deg')
+        aidx, _, _ = match_coordinates_sky(c1, c1, nthneighbor=2)
+        t1 = time.time()
+        tree = xmatch.SkyTree(ra1, dec1)
+        xidx, _ = tree.nearest(ra1, dec1, nth=2)
+        t2 = time.time()
+        timings.append(('self', t1-t0, t2-t1))
+        # One position at a time, as in the ingest loops
+        nloop = 100
+        t0 = time.time()
+        c2 = SkyCoord(ra=ra2, dec=dec2, unit='deg')
+        for jj in range(nloop):
+            imin = np.argmin(SkyCoord(ra=ra1[jj], dec=dec1[jj], unit='deg').separation(c2))
+        t1 = time.time()
+        tree = xmatch.SkyTree(ra2, dec2)
+        for jj in range(nloop):
+            imin, _ = tree.nearest(ra1[jj], dec1[jj])
+        t2 = time.time()
+        timings.append(('loop100', t1-t0, t2-t1))
+        for query, tastropy, txmatch in timings:
+            print("{:9d} {:>10s} {:8.3f} {:8.3f} {:8.1f}".format(nobj, query, tastropy, txmatch,
+                                                                   tastropy/max(txmatch, 1e-6)))
+
+if __name__ == '__main__':
+    main()
@@ -22,6 +22,25 @@ def parser(options=None):
     parser.add_argument("--sdss_hdf", help="HDF file with SDSS dataset [avoids repeating spectra ingestion]")
     parser.add_argument("--clobber", default=False, action='store_true', help="Clobber existing file?")
     parser.add_argument("--out_path", type=str, help="Output path for file")
+    parser.add_argument("--nproc", type=int, default=1, help="Number of processes for reading the raw spectra [default: 1]")
+    parser.add_argument("--resume", default=False, action='store_true', help="Resume a crashed build from its journal")
+    parser.add_argument("--prev_db", type=str, help="Previous DB file;  groups with unchanged raw data and ingest code are reused from it (v03 only)")
+    parser.add_argument("--spec_link", type=str, default='copy', help="Add the spectra of groups from previous DB files by: copy, external (link) or virtual (dataset) [default: copy]")
+    parser.add_argument("--shard_path", type=str, help="Merge the new groups from their shard files in this path (v02, v03)")
+    parser.add_argument("--build_shards", default=False, action='store_true', help="Build the missing shard files in shard_path, one process per group, before the merge")
+    parser.add_argument("--nshard", type=int, help="Maximum number of shards built at once [default: all]")
+    parser.add_argument("--dr14_blocks", type=str, help="Ingest BOSS_DR14 in blocks of ORIG_ID in this path, shared with other machines running ingest_boss_dr14.py (v03)")
+    parser.add_argument("--nworker", type=int, default=1, help="Local workers on the BOSS_DR14 blocks [default: 1]")
+    parser.add_argument("--inventory", default=False, action='store_true', help="Rebuild the inventory of the raw data files first (see igmspec.inventory)")
+    parser.add_argument("--spec_cache", type=str, help="Cache the decoded raw spectra in this path for later builds")
+    parser.add_argument("--spec_cache_gb", type=float, default=20., help="Size of the spectrum cache in GB [default: 20]")
+    parser.add_argument("--header_cache", type=str, help="Cache the FITS headers read from the raw files in this SQLite file for later builds")
+    parser.add_argument("--cat_cache", type=str, help="Cache the large input catalogs (DR14Q, DR12Q, Myers, ...) as column files in this path for later builds")
+    parser.add_argument("--meta_cache", type=str, help="Cache the grab_meta output of each group in this path, keyed by its inputs")
+    parser.add_argument("--dag", default=False, action='store_true', help="Run the build as a DAG of stages (catalog, meta and spectra of each group, merge) in shard_path")
+    parser.add_argument("--ncore", type=int, help="Budget of cores for the DAG stages [default: all]")
+    parser.add_argument("--critical_path", default=False, action='store_true', help="Only print the critical path of the DAG")
+    parser.add_argument("--report", type=str, default='igmspec_build_report.json', help="JSON file for the report of the time, rows and bytes of each stage of each group [default: igmspec_build_report.json]")
 
     if options is None:
         args = parser.parse_args()
@@ -41,10 +60,28 @@ def main(args=None):
 
     """
     from igmspec import build_db
+    from igmspec import shards
+    from igmspec import inventory
+    from igmspec.ingest import speccache
+    from igmspec.ingest import catcache
+    from igmspec.ingest import metacache
+    from igmspec.ingest import headers
+    from igmspec import buildstats
     import h5py
 
     # Grab arguments
     pargs = parser(options=args)
+    if pargs.spec_cache is not None:
+        speccache.enable(pargs.spec_cache, max_gb=pargs.spec_cache_gb)
+    if pargs.header_cache is not None:
+        headers.enable(pargs.header_cache)
+    if pargs.cat_cache is not None:
+        catcache.enable(pargs.cat_cache)
+    if pargs.meta_cache is not None:
+        metacache.enable(pargs.meta_cache)
+    if pargs.inventory:
+        inventory.build_inventory(nproc=max(pargs.nproc, 8))
+    stats = buildstats.start()
 
     # BOSS
     if pargs.boss_hdf is not None:
@@ -62,31 +99,96 @@ def main(args=None):
     else:
         sdss_hdf = None
 
+    # DAG
+    if pargs.dag or pargs.critical_path:
+        if pargs.shard_path is None:
+            raise IOError("Need shard_path to run the DAG")
+        if pargs.version is None:
+            version = 'v02'
+        else:
+            version = pargs.version
+        kwargs = dict(test=pargs.test, clobber=pargs.clobber, out_path=pargs.out_path,
+                      resume=pargs.resume, spec_link=pargs.spec_link)
+        skip_groups = None
+        if version[0:3] == 'v03':
+            kwargs['prev_db'] = pargs.prev_db
+            kwargs['redo_dr14'] = (version != 'v03.1')
+            if version == 'v03.1':  # BOSS_DR14 is taken from v03.0
+                skip_groups = ['BOSS_DR14']
+        dag = build_db.get_build_dag(version, pargs.shard_path, nproc=pargs.nproc,
+                                     skip_groups=skip_groups, **kwargs)
+        dag.print_critical_path()
+        if not pargs.critical_path:
+            dag.run(ncore=pargs.ncore)
+            dag.print_critical_path(measured=True)
+            finish_report(stats, pargs.report)
+        return
+
+    # Shards
+    if pargs.build_shards:
+        if pargs.shard_path is None:
+            raise IOError("Need shard_path to build shards")
+        if pargs.version is None:
+            version = 'v02'
+        else:
+            version = pargs.version
+        groups = None
+        if version == 'v03.1':  # BOSS_DR14 is taken from v03.0
+            groups = list(build_db.get_build_groups(version).keys())
+            groups.remove('BOSS_DR14')
+        shards.build_shards(version, pargs.shard_path, groups=groups, nshard=pargs.nshard,
+                            nproc=pargs.nproc, clobber=pargs.clobber)
+
     # Run
     if pargs.version is None:
         print("Building v02 of the igmspec DB")
-        build_db.ver02(test=pargs.test, clobber=pargs.clobber)
+        build_db.ver02(test=pargs.test, clobber=pargs.clobber, nproc=pargs.nproc, resume=pargs.resume,
+                       spec_link=pargs.spec_link, shard_path=pargs.shard_path)
     elif pargs.version == 'v01':
         print("Building v01 of the igmspec DB")
         build_db.ver01(test=pargs.test,
                        boss_hdf=boss_hdf, sdss_hdf=sdss_hdf, clobber=pargs.clobber)
     elif pargs.version == 'v02':
         print("Building v02 of the igmspec DB")
-        build_db.ver02(test=pargs.test, clobber=pargs.clobber)
+        build_db.ver02(test=pargs.test, clobber=pargs.clobber, nproc=pargs.nproc, resume=pargs.resume,
+                       spec_link=pargs.spec_link, shard_path=pargs.shard_path)
     elif pargs.version == 'v02.1':
         print("Building v02.1 of the igmspec DB")
         build_db.ver02(test=pargs.test, version=pargs.version, clobber=pargs.clobber,
-                       out_path=pargs.out_path)
+                       out_path=pargs.out_path, nproc=pargs.nproc, resume=pargs.resume,
+                       spec_link=pargs.spec_link, shard_path=pargs.shard_path)
     elif pargs.version == 'v03':
         print("Building v03 of the igmspec DB")
         build_db.ver03(test=pargs.test, version=pargs.version, clobber=pargs.clobber,
-                       out_path=pargs.out_path, redo_dr14=True)
+                       out_path=pargs.out_path, redo_dr14=True, nproc=pargs.nproc, resume=pargs.resume,
+                       prev_db=pargs.prev_db, spec_link=pargs.spec_link,
+                       shard_path=pargs.shard_path, dr14_blocks=pargs.dr14_blocks,
+                       nworker=pargs.nworker)
     elif pargs.version == 'v03.1':
         print("Building v03.1 of the igmspec DB")
         build_db.ver03(test=pargs.test, version=pargs.version, clobber=pargs.clobber,
-                       out_path=pargs.out_path, redo_dr14=False)
+                       out_path=pargs.out_path, redo_dr14=False, nproc=pargs.nproc, resume=pargs.resume,
+                       prev_db=pargs.prev_db, spec_link=pargs.spec_link,
+                       shard_path=pargs.shard_path, dr14_blocks=pargs.dr14_blocks,
+                       nworker=pargs.nworker)
     else:
         raise IOError("Bad version number")
+    finish_report(stats, pargs.report)
+
+
+def finish_report(stats, outfile):
+    """ Write the build report and print its summary
+
+    Parameters
+    ----------
+    stats : BuildStats
+    outfile : str
+    """
+    from igmspec import buildstats
+    buildstats.stop()
+    stats.write(outfile)
+    stats.print_summary()
+
 
 if __name__ == '__main__':
     main()
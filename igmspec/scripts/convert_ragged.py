@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+"""
+Add the ragged spectrum layout to the groups of a DB file
+"""
+from __future__ import (print_function, absolute_import, division, unicode_literals)
+
+import pdb
+
+def parser(options=None):
+    import argparse
+    # Parse
+    parser = argparse.ArgumentParser(
+        description='Convert the padded spec datasets of an igmspec DB file to the ragged layout')
+    parser.add_argument("db_file", type=str, help="DB file;  modified in place unless --outfile is given")
+    parser.add_argument("-g", "--groups", type=str, help="Comma separated list of groups [default: all]")
+    parser.add_argument("-o", "--outfile", type=str,
+                        help="Write a new DB file without the padded spec datasets of the converted groups"
+                             " (in place, they are kept and the file only grows)")
+
+    if options is None:
+        args = parser.parse_args()
+    else:
+        args = parser.parse_args(options)
+    return args
+
+
+def main(args=None):
+    """ Run
+    Parameters
+    ----------
+    args
+
+    Returns
+    -------
+
+    """
+    from igmspec import ragged
+    import h5py
+
+    # Grab arguments
+    pargs = parser(options=args)
+
+    if pargs.groups is None:
+        groups = None
+    else:
+        groups = pargs.groups.split(',')
+    # New file
+    if pargs.outfile is not None:
+        src_hdf = h5py.File(pargs.db_file, 'r')
+        out_hdf = h5py.File(pargs.outfile, 'w')
+        ragged.repack(src_hdf, out_hdf, groups=groups)
+        out_hdf.close()
+        src_hdf.close()
+        return
+    # In place
+    hdf = h5py.File(pargs.db_file, 'a')
+    if groups is None:
+        groups = [key for key in hdf.keys() if 'spec' in hdf[key].keys()]
+    for group in groups:
+        if ragged.is_ragged(hdf[group]):
+            print("Skipping {:s};  already ragged".format(group))
+            continue
+        ragged.padded_to_ragged(hdf[group])
+    hdf.close()
+
+if __name__ == '__main__':
+    main()
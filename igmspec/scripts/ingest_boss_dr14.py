@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+"""
+Work on the BOSS_DR14 blocks of a build, e.g. from other machines
+sharing the block path with build_igmspec.py --dr14_blocks
+"""
+from __future__ import (print_function, absolute_import, division, unicode_literals)
+
+import pdb
+
+def parser(options=None):
+    import argparse
+    # Parse
+    parser = argparse.ArgumentParser(
+        description='Ingest the BOSS_DR14 spectra in blocks of ORIG_ID from a shared lock-file queue')
+    parser.add_argument("block_path", type=str, help="Shared path for the block, lock and done files")
+    parser.add_argument("--nworker", type=int, default=1, help="Local workers, each on one block at a time [default: 1]")
+    parser.add_argument("--nproc", type=int, default=1, help="Number of processes for reading the raw spectra, per worker [default: 1]")
+    parser.add_argument("--plates", default=False, action='store_true', help="Read the spectra from the spPlate files")
+    parser.add_argument("--max_age", type=float, help="Age (s) beyond which a lock is taken to be from a crashed worker")
+    parser.add_argument("--wait", default=False, action='store_true', help="Wait for the blocks of the other machines")
+    parser.add_argument("-t", "--test", default=False, action='store_true', help="Test?  Must match the build")
+
+    if options is None:
+        args = parser.parse_args()
+    else:
+        args = parser.parse_args(options)
+    return args
+
+
+def main(args=None):
+    """ Run
+    Parameters
+    ----------
+    args
+
+    Returns
+    -------
+
+    """
+    from igmspec.ingest import boss_dr14
+
+    # Grab arguments
+    pargs = parser(options=args)
+
+    meta = boss_dr14.grab_meta(test=pargs.test)
+    boss_dr14.run_blocks(meta, pargs.block_path, nworker=pargs.nworker, nproc=pargs.nproc,
+                         plates=pargs.plates, max_age=pargs.max_age, wait=pargs.wait)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+"""
+Write a standalone copy of a DB file built with linked spectra
+"""
+from __future__ import (print_function, absolute_import, division, unicode_literals)
+
+import pdb
+
+def parser(options=None):
+    import argparse
+    # Parse
+    parser = argparse.ArgumentParser(
+        description='Replace the external links and virtual datasets of an igmspec DB file with the data')
+    parser.add_argument("db_file", type=str, help="DB file with linked spectra")
+    parser.add_argument("outfile", type=str, help="Standalone DB file to write")
+    parser.add_argument("--clobber", default=False, action='store_true', help="Clobber existing file?")
+
+    if options is None:
+        args = parser.parse_args()
+    else:
+        args = parser.parse_args(options)
+    return args
+
+
+def main(args=None):
+    """ Run
+    Parameters
+    ----------
+    args
+
+    Returns
+    -------
+
+    """
+    from igmspec import links
+    from igmspec.build_db import chk_clobber
+
+    # Grab arguments
+    pargs = parser(options=args)
+
+    if not chk_clobber(pargs.outfile, clobber=pargs.clobber):
+        return
+    links.materialize(pargs.db_file, pargs.outfile)
+
+if __name__ == '__main__':
+    main()
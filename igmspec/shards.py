@@ -0,0 +1,264 @@
+""" Module to build the groups of a DB version into separate shard
+files, in independent processes, for a subsequent merge
+
+Each shard holds one group (spec, meta and fingerprint).  Its IGM_ID
+values are placeholders;  the merge (build_db.ver02/ver03 with shard_path)
+regenerates them with add_ids in the canonical group order, so the
+merged DB file is the same as that of a serial build.
+"""
+from __future__ import print_function, absolute_import, division, unicode_literals
+
+import os
+import json
+import pickle
+import multiprocessing
+import pdb
+
+import h5py
+
+from igmspec import defs as idefs
+from igmspec import fingerprint as ifp
+from igmspec import buildstats as ibs
+from igmspec.schedule import wait_procs
+
+
+def shard_file(shard_path, version, gname):
+    """ Name of the shard file of a group
+
+    Parameters
+    ----------
+    shard_path : str
+    version : str
+    gname : str
+
+    Returns
+    -------
+    sfile : str
+    """
+    return os.path.join(shard_path, 'IGMspec_{:s}_{:s}.hdf5'.format(version, gname))
+
+
+def open_shard(shard_path, version, gname):
+    """ Open the shard file of a group
+
+    Parameters
+    ----------
+    shard_path : str
+    version : str
+    gname : str
+
+    Returns
+    -------
+    shard_hdf : h5py File
+    """
+    sfile = shard_file(shard_path, version, gname)
+    if not os.path.isfile(sfile):
+        raise IOError("Missing shard for {:s}: {:s}.  Run build_shards first".format(gname, sfile))
+    return h5py.File(sfile, 'r')
+
+
+def meta_file(shard_path, version, gname):
+    """ Name of the file with the meta table of a group, prior to ingestion
+
+    Parameters
+    ----------
+    shard_path : str
+    version : str
+    gname : str
+
+    Returns
+    -------
+    mfile : str
+    """
+    return os.path.join(shard_path, 'IGMspec_{:s}_{:s}_meta.pkl'.format(version, gname))
+
+
+def grab_meta(module, gname):
+    """ Meta table of a group with placeholder IDs
+
+    Parameters
+    ----------
+    module : module
+      Ingest module
+    gname : str
+
+    Returns
+    -------
+    meta : Table
+    """
+    from specdb.build import utils as sdbbu
+    meta = module.grab_meta()
+    idkey = 'IGM_ID'
+    maindb, tkeys = sdbbu.start_maindb(idkey)
+    flag_g = sdbbu.add_to_group_dict(gname, {}, skip_for_debug=True)
+    _ = sdbbu.add_ids(maindb, meta, flag_g, tkeys, idkey, first=True,
+                      close_pairs=False, debug=False)
+    return meta
+
+
+def build_meta(version, gname, shard_path):
+    """ Generate the meta table of a group and save it for build_shard
+    (pickled, so that the Table is restored exactly)
+
+    Parameters
+    ----------
+    version : str
+    gname : str
+    shard_path : str
+
+    Returns
+    -------
+    mfile : str
+    """
+    from igmspec.build_db import get_build_groups
+    meta = grab_meta(get_build_groups(version)[gname], gname)
+    mfile = meta_file(shard_path, version, gname)
+    with open(mfile+'.tmp', 'wb') as f:
+        pickle.dump(meta, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.rename(mfile+'.tmp', mfile)
+    return mfile
+
+
+def build_catalog(version, shard_path):
+    """ Generate the quasars catalog into its own shard file
+
+    Parameters
+    ----------
+    version : str
+    shard_path : str
+
+    Returns
+    -------
+    sfile : str
+    """
+    sfile = shard_file(shard_path, version, 'quasars')
+    hdf = h5py.File(sfile+'.tmp', 'w')
+    if version[0:3] == 'v02':
+        from igmspec.ingest import myers
+        myers.add_to_hdf(hdf)
+    else:  # Copy from v02
+        v02hdf = h5py.File(os.getenv('SPECDB')+'/IGMspec_DB_v02.1.hdf5', 'r')
+        _ = hdf.create_group('quasars')
+        v02hdf.copy('quasars', hdf['quasars'])
+        v02hdf.close()
+    hdf.close()
+    os.rename(sfile+'.tmp', sfile)
+    print("Wrote catalog shard {:s}".format(sfile))
+    return sfile
+
+
+def build_shard(version, gname, shard_path, nproc=1, clobber=False):
+    """ Ingest one group into its shard file
+    The file is written under a temporary name and renamed once complete
+    The meta table from build_meta is used, if it exists
+
+    Parameters
+    ----------
+    version : str
+    gname : str
+    shard_path : str
+    nproc : int, optional
+      Number of processes for reading the raw spectra
+    clobber : bool, optional
+
+    Returns
+    -------
+    sfile : str
+    """
+    from igmspec.build_db import get_build_groups
+
+    sfile = shard_file(shard_path, version, gname)
+    if os.path.isfile(sfile) and (not clobber):
+        print("Shard {:s} exists;  set clobber=True to rebuild".format(sfile))
+        return sfile
+    module = get_build_groups(version)[gname]
+    # Fingerprint the inputs before reading them
+    fprint = ifp.group_fingerprint(gname, module)
+    with ibs.collect() as stats:
+        # Meta with placeholder IDs
+        mfile = meta_file(shard_path, version, gname)
+        if os.path.isfile(mfile):
+            with open(mfile, 'rb') as f:
+                meta = pickle.load(f)
+        else:
+            with ibs.stage(gname, 'grab_meta') as rec:
+                meta = grab_meta(module, gname)
+                rec.nrows = len(meta)
+        # Spectra
+        tmpfile = sfile+'.tmp'
+        hdf = h5py.File(tmpfile, 'w')
+        with ibs.stage(gname, 'hdf5_adddata', nrows=len(meta)):
+            module.hdf5_adddata(hdf, gname, meta, nproc=nproc)
+        with ibs.stage(gname, 'add_ssa', nrows=len(meta)):
+            module.add_ssa(hdf, gname)
+        ibs.add_storage(hdf, gname)
+    # Timings for the report of the merge
+    hdf.attrs['BUILD_STATS'] = json.dumps(stats.group_dict(gname))
+    ifp.write_fingerprint(hdf, gname, fprint)
+    hdf.attrs['VERSION'] = str(version)
+    hdf.close()
+    os.rename(tmpfile, sfile)
+    print("Wrote shard {:s}".format(sfile))
+    return sfile
+
+
+def build_shards(version, shard_path, groups=None, nshard=None, nproc=1, clobber=False):
+    """ Build the shard files of the groups of a version,
+    each in its own process
+
+    Groups are started largest (by defs.get_build_costs) first, so the
+    wall-clock time is close to that of the largest group when
+    nshard >= ngroups
+
+    Parameters
+    ----------
+    version : str
+    shard_path : str
+    groups : list, optional
+      Defaults to all groups of the version (see build_db.get_build_groups)
+    nshard : int, optional
+      Maximum number of groups built at once;  defaults to all
+    nproc : int, optional
+      Number of processes for reading the raw spectra, per group
+    clobber : bool, optional
+
+    Returns
+    -------
+    sfiles : list
+      Shard files, in the order of groups
+    """
+    from igmspec.build_db import get_build_groups
+
+    build_groups = get_build_groups(version)
+    if groups is None:
+        groups = list(build_groups.keys())
+    if not os.path.isdir(shard_path):
+        os.makedirs(shard_path)
+    todo = [gname for gname in groups if clobber or
+            (not os.path.isfile(shard_file(shard_path, version, gname)))]
+    # Largest first
+    costs = idefs.get_build_costs()
+    todo.sort(key=lambda gname: costs.get(gname, 1.), reverse=True)
+    if nshard is None:
+        nshard = max(len(todo), 1)
+    # Run;  the workers are not daemonic so that they may use nproc
+    running = {}
+    failed = []
+    while (len(todo) > 0) or (len(running) > 0):
+        while (len(todo) > 0) and (len(running) < nshard):
+            gname = todo.pop(0)
+            proc = multiprocessing.Process(target=build_shard, name=gname,
+                                           args=(version, gname, shard_path),
+                                           kwargs=dict(nproc=nproc, clobber=clobber))
+            proc.start()
+            print("Started shard for {:s}".format(gname))
+            running[proc.name] = proc
+        for proc in wait_procs(list(running.values())):
+            running.pop(proc.name)
+            proc.join()
+            if proc.exitcode != 0:
+                print("Shard for {:s} failed with exit code {:d}".format(proc.name, proc.exitcode))
+                failed.append(proc.name)
+    if len(failed) > 0:
+        raise ValueError("Failed shards: {}".format(failed))
+    return [shard_file(shard_path, version, gname) for gname in groups]
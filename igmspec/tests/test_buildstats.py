@@ -0,0 +1,73 @@
+# Module to run tests on the build report
+
+import os
+import json
+import numpy as np
+import h5py
+
+from igmspec import buildstats as ibs
+from igmspec.ingest import utils as iiu
+from igmspec.ingest.writer import SpecWriter
+
+
+def read_spec(spec_file):
+    flux = np.load(spec_file)
+    return dict(flux=flux, npix=flux.size)
+
+
+def test_buildstats(tmpdir):
+    nspec, max_npix = 12, 500
+    spec_files = []
+    for jj in range(nspec):
+        spec_file = str(tmpdir.join('spec{:d}.npy'.format(jj)))
+        np.save(spec_file, np.ones(100+jj, dtype=np.float32))
+        spec_files.append(spec_file)
+    nbytes = np.sum([os.path.getsize(spec_file) for spec_file in spec_files])
+    assert ibs.get_stats() is None
+    with ibs.collect() as stats:
+        hdf = h5py.File(str(tmpdir.join('tst.hdf5')), 'w')
+        with ibs.stage('TST', 'grab_meta') as rec:
+            rec.nrows = nspec
+        with ibs.stage('TST', 'hdf5_adddata', nrows=nspec):
+            grp = hdf.create_group('TST')
+            data = np.zeros((1,), dtype=[(str('wave'), 'float64', (max_npix)),
+                                         (str('flux'), 'float32', (max_npix))])
+            spec_set = grp.create_dataset('spec', data=data, chunks=True,
+                                          maxshape=(None,), compression='gzip')
+            spec_set.resize((nspec,))
+            writer = SpecWriter(spec_set, data, nrow=4)
+            for jj, sdict in enumerate(iiu.map_spectra(read_spec, spec_files)):
+                data = writer.row(jj, sdict['npix'])
+                data['flux'][0][:sdict['npix']] = sdict['flux']
+                writer.write(jj)
+            writer.close()
+        ibs.add_storage(hdf, 'TST')
+        hdf.close()
+    # Only within collect()
+    assert ibs.get_stats() is None
+    # Report
+    outfile = str(tmpdir.join('report.json'))
+    stats.write(outfile)
+    with open(outfile, 'r') as f:
+        report = json.load(f)
+    gdict = report['groups']['TST']
+    assert list(gdict['stages'].keys()) == ['grab_meta', 'hdf5_adddata', 'locate', 'read',
+                                            'pack', 'write']
+    assert gdict['stages']['read']['nrows'] == nspec
+    assert gdict['stages']['read']['bytes_read'] == nbytes
+    assert gdict['stages']['pack']['nrows'] == nspec
+    assert gdict['stages']['write']['nrows'] == nspec
+    assert gdict['stages']['write']['ncall'] == 3
+    assert gdict['stages']['write']['bytes_written'] == gdict['spec_bytes']
+    assert gdict['compression'] > 1.
+    assert gdict['stages']['hdf5_adddata']['wall'] >= gdict['stages']['read']['wall']
+    # Summary
+    tbl = stats.summary_table()
+    assert len(tbl) == 6
+    assert np.all(tbl['GROUP'] == 'TST')
+    # Merged, e.g. from a shard
+    merged = ibs.BuildStats()
+    merged.add_group('TST', stats.group_dict('TST'))
+    merged.add_group('TST', stats.group_dict('TST'))
+    assert merged.group_dict('TST')['stages']['read']['nrows'] == 2*nspec
+    assert merged.group_dict('TST')['compression'] == gdict['compression']
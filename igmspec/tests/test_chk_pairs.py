@@ -0,0 +1,53 @@
+# Module to run tests on the pair checks
+
+import numpy as np
+
+from astropy import units as u
+from astropy.table import Table
+
+from igmspec import chk_pairs
+
+
+def mk_cat():
+    cat = Table()
+    # Chain of three (friends of friends), a BOSS pair, a zem pair,
+    # a good pair from the skip table, an XQ-100 pair and an isolated source
+    cat['RA'] = [100., 100.+6./3600, 100.+12./3600, 50., 50.+5./3600, 60., 60.+5./3600,
+                 10.9697, 10.9697+5./3600, 70., 70.+3./3600, 200.]
+    cat['DEC'] = [10.]*3 + [-5.]*2 + [0.]*2 + [4.4073]*2 + [20.]*2 + [30.]
+    cat['zem'] = [2., 2., 2., 1., 1., 1., 2., 3., 3., 2.5, 2.5, 2.]
+    cat['flag_survey'] = [1., 2., 1., 1., 1., 1., 2., 2., 4., 1., 64., 1.]
+    cat['IGM_ID'] = np.arange(len(cat))
+    return cat
+
+
+def test_find_groups():
+    cat = mk_cat()
+    group = chk_pairs.find_groups(cat['RA'], cat['DEC'], pair_sep=10*u.arcsec)
+    assert list(group) == [0, 0, 0, 1, 1, 2, 2, 3, 3, 4, 4, -1]
+
+
+def test_pair_report():
+    cat = mk_cat()
+    report = chk_pairs.pair_report(cat, pair_sep=10*u.arcsec)
+    assert len(report) == 11
+    status = [report['STATUS'][report['GROUP'] == gg][0] for gg in range(5)]
+    assert status == ['check', 'BOSS', 'zem', 'skip', 'XQ-100']
+    assert list(report['NMEMBER'][:3]) == [3, 3, 3]
+    np.testing.assert_allclose(report['SEP'][:3], [0., 6.*np.cos(np.radians(10.)),
+                                                   12.*np.cos(np.radians(10.))], atol=1e-3)
+    # Nothing close
+    report = chk_pairs.pair_report(cat[-1:], pair_sep=10*u.arcsec)
+    assert len(report) == 0
+
+
+def test_chk_catalog(capsys):
+    cat = mk_cat()
+    report = chk_pairs.chk_catalog(cat, pair_sep=10*u.arcsec)
+    out = capsys.readouterr().out
+    # The XQ-100 groups are shown along with those to check
+    assert 'XQ-100 groups:' in out
+    assert out.count(' XQ-100\n') == 2
+    assert out.count(' check\n') == 3
+    assert 'All clear' not in out
+    assert len(report) == 11
@@ -0,0 +1,78 @@
+# Module to run tests on the group fingerprints
+
+import os
+import h5py
+import pytest
+
+from igmspec import fingerprint as ifp
+from igmspec import defs
+
+
+def test_fingerprint(tmpdir):
+    # Fake raw data
+    raw_path = str(tmpdir.mkdir('raw'))
+    os.makedirs(os.path.join(raw_path, 'ESI_z6', 'sub'))
+    for fname in ['overview.txt', 'sub/J0100+2802.txt']:
+        with open(os.path.join(raw_path, 'ESI_z6', fname), 'w') as f:
+            f.write('1 2 3\n')
+    fprint = ifp.group_fingerprint('ESI_z6', defs, raw_path=raw_path)
+    assert fprint['nfiles'] == 2
+    assert fprint == ifp.group_fingerprint('ESI_z6', defs, raw_path=raw_path)
+    # Record
+    hdf = h5py.File(str(tmpdir.join('prev.hdf5')), 'w')
+    hdf.create_group('ESI_z6')
+    assert not ifp.chk_fingerprint(hdf, 'ESI_z6', fprint)
+    ifp.write_fingerprint(hdf, 'ESI_z6', fprint)
+    assert ifp.chk_fingerprint(hdf, 'ESI_z6', fprint)
+    assert not ifp.chk_fingerprint(None, 'ESI_z6', fprint)
+    # Modify the raw data
+    with open(os.path.join(raw_path, 'ESI_z6', 'sub/J0100+2802.txt'), 'a') as f:
+        f.write('4\n')
+    fprint2 = ifp.group_fingerprint('ESI_z6', defs, raw_path=raw_path)
+    assert fprint2['module'] == fprint['module']
+    assert not ifp.chk_fingerprint(hdf, 'ESI_z6', fprint2)
+    # Different module
+    fprint3 = ifp.group_fingerprint('ESI_z6', ifp, raw_path=raw_path)
+    assert fprint3['raw'] == fprint2['raw']
+    assert fprint3['hash'] != fprint2['hash']
+    hdf.close()
+    # Missing raw data
+    with pytest.raises(IOError):
+        ifp.group_fingerprint('GGG', defs, raw_path=raw_path)
+
+
+def test_fingerprint_deps(tmpdir, monkeypatch):
+    from igmspec.ingest import speccache
+    # igmspec modules used by a module, including within functions
+    sfiles = [os.path.relpath(sfile, os.path.dirname(defs.__file__))
+              for sfile in ifp.module_files(speccache)]
+    for sfile in ['ingest/speccache.py', 'fingerprint.py', 'defs.py', 'ingest/quasars.py',
+                  'xmatch.py']:
+        assert sfile in sfiles
+    assert ifp.module_files(defs) == [defs.__file__]
+    assert ifp.code_hash(speccache) != ifp.code_hash(defs)
+    # Package files
+    pfiles = [os.path.basename(pfile) for pfile in ifp.pkg_files('BOSS_DR14')]
+    assert 'bad_dr14.fits' in pfiles
+    assert ifp.pkg_files('ESI_z6') == []
+    # Quasars catalog
+    raw_path = str(tmpdir.mkdir('raw'))
+    os.makedirs(os.path.join(raw_path, 'UVES_Dall'))
+    specdb_path = str(tmpdir.mkdir('specdb'))
+    monkeypatch.setenv('SPECDB', specdb_path)
+    with pytest.raises(IOError):
+        ifp.group_fingerprint('UVES_Dall', defs, raw_path=raw_path)
+    db_file = os.path.join(specdb_path, 'IGMspec_DB_v02.hdf5')
+    with open(db_file, 'w') as f:
+        f.write('v02\n')
+    fprint = ifp.group_fingerprint('UVES_Dall', defs, raw_path=raw_path)
+    with open(os.path.join(specdb_path, 'IGMspec_DB_v03.hdf5'), 'w') as f:
+        f.write('v03\n')
+    fprint2 = ifp.group_fingerprint('UVES_Dall', defs, raw_path=raw_path)
+    assert fprint2['raw'] == fprint['raw']
+    assert fprint2['pkg'] != fprint['pkg']
+    hdf = h5py.File(str(tmpdir.join('prev.hdf5')), 'w')
+    hdf.create_group('UVES_Dall')
+    ifp.write_fingerprint(hdf, 'UVES_Dall', fprint)
+    assert not ifp.chk_fingerprint(hdf, 'UVES_Dall', fprint2)
+    hdf.close()
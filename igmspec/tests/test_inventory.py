@@ -0,0 +1,50 @@
+# Module to run tests on the raw data inventory
+
+import os
+import pytest
+
+from igmspec import inventory
+
+
+def test_inventory(tmpdir, monkeypatch):
+    raw_path = str(tmpdir.join('raw'))
+    for sub in ['BOSS/7294', 'BOSS/7295', 'XQ-100']:
+        os.makedirs(os.path.join(raw_path, sub))
+    files = ['BOSS/7294/spec-7294-56739-0001.fits.gz', 'BOSS/7294/speclya-7294-56739-0001.fits.gz',
+             'BOSS/7295/spec-7295-56740-0100.fits.gz', 'XQ-100/ADP.2016-07-15T08:22:40.682.fits',
+             'XQ-100/XQ100_v1_2.fits.gz']
+    for ifile in files:
+        open(os.path.join(raw_path, ifile), 'w').close()
+    db_file = str(tmpdir.join('inventory.sqlite'))
+    monkeypatch.setenv('IGMSPEC_INVENTORY', db_file)
+    # No inventory
+    assert inventory.get_inventory() is None
+    assert inventory.isfile(os.path.join(raw_path, files[0]))
+    # Build
+    assert inventory.build_inventory(raw_path=raw_path, raw_dirs=['BOSS', 'XQ-100'], nproc=2) == 5
+    inv = inventory.get_inventory()
+    assert inv is not None
+    assert inventory.isfile(raw_path+'/BOSS/7294//spec-7294-56739-0001.fits.gz')
+    assert not inventory.isfile(raw_path+'/BOSS/7294/spec-7294-56739-0002.fits.gz')
+    assert inventory.glob(raw_path+'/XQ-100/ADP.*') == [raw_path+'/XQ-100/ADP.2016-07-15T08:22:40.682.fits']
+    assert len(inventory.glob(raw_path+'/BOSS/*/spec-*')) == 2  # Falls back to glob
+    assert len(inv.find_ids(7294, 56739)) == 2
+    assert inv.find_ids(7295, 56740, 100) == [os.path.join(raw_path, files[2])]
+    assert inventory.stat(os.path.join(raw_path, files[0]))[0] == 0
+    assert inventory.stat(raw_path+'/BOSS/7294/spec-7294-56739-0002.fits.gz') is None
+    # Directories not scanned go to the filesystem
+    os.makedirs(os.path.join(raw_path, 'HD-LLS_DR1'))
+    open(os.path.join(raw_path, 'HD-LLS_DR1', 'J0001.fits'), 'w').close()
+    assert inventory.isfile(raw_path+'/HD-LLS_DR1/J0001.fits')
+    assert inventory.stat(raw_path+'/HD-LLS_DR1/J0001.fits')[0] == 0
+    assert len(inventory.glob(raw_path+'/HD-LLS_DR1/*.fits')) == 1
+    # As do those changed since the scan
+    open(os.path.join(raw_path, 'XQ-100', 'ADP.new.fits'), 'w').close()
+    os.utime(os.path.join(raw_path, 'XQ-100'), ns=(0, 0))
+    inventory._inventories.clear()
+    with pytest.warns(UserWarning):
+        assert len(inventory.glob(raw_path+'/XQ-100/ADP.*')) == 2
+    assert inventory.isfile(raw_path+'/XQ-100/ADP.new.fits')
+    assert not inventory.get_inventory().is_current('XQ-100')
+    assert inventory.get_inventory().is_current('BOSS/7294')
+    inventory._inventories.clear()
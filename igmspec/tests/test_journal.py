@@ -0,0 +1,62 @@
+# Module to run tests on the build journal
+
+import numpy as np
+import h5py
+import pytest
+
+from igmspec.journal import BuildJournal
+from igmspec.ingest.writer import SpecWriter
+
+
+def ingest(hdf, journal, npixs, template, crash_at=None):
+    """ Mimic hdf5_adddata with a journal """
+    data = template(50, include_co=False)
+    if journal.rows_done('TST') > 0:
+        spec_set = hdf['TST']['spec']
+    else:
+        grp = hdf.create_group('TST')
+        spec_set = grp.create_dataset('spec', data=data, chunks=True,
+                                      maxshape=(None,), compression='gzip')
+        spec_set.resize((len(npixs),))
+    writer = SpecWriter(spec_set, data, nrow=4, journal=journal, gname='TST')
+    npixlist = [rowmeta['NPIX'] for rowmeta in journal.rowmeta('TST')]
+    for jj in range(writer.nstart, len(npixs)):
+        if jj == crash_at:
+            raise ValueError("Crash")
+        npix = npixs[jj]
+        data = writer.row(jj, npix)
+        data['flux'][0][:npix] = jj
+        npixlist.append(npix)
+        writer.write(jj, meta=dict(NPIX=npixlist[-1]))
+    writer.close()
+    journal.complete_group('TST')
+    return npixlist
+
+
+def test_resume(tmpdir, template):
+    npixs = np.random.RandomState(1).randint(1, 50, 15)
+    # Uninterrupted
+    outfil = str(tmpdir.join('full.hdf5'))
+    hdf = h5py.File(outfil, 'w')
+    npix1 = ingest(hdf, BuildJournal(outfil, 'v01'), npixs, template)
+    spec1 = hdf['TST']['spec'][:]
+    hdf.close()
+    # Crash and resume
+    outfil = str(tmpdir.join('crash.hdf5'))
+    hdf = h5py.File(outfil, 'w')
+    journal = BuildJournal(outfil, 'v01')
+    with pytest.raises(ValueError):
+        ingest(hdf, journal, npixs, template, crash_at=10)
+    hdf.close()
+    journal = BuildJournal(outfil, 'v01', resume=True)
+    assert journal.rows_done('TST') == 8
+    assert not journal.is_done('TST')
+    hdf = h5py.File(outfil, 'a')
+    npix2 = ingest(hdf, journal, npixs, template)
+    assert npix1 == npix2
+    assert hdf['TST']['spec'][:].tobytes() == spec1.tobytes()
+    hdf.close()
+    # Completed;  wrong version
+    assert BuildJournal(outfil, 'v01', resume=True).is_done('TST')
+    with pytest.raises(IOError):
+        BuildJournal(outfil, 'v02', resume=True)
@@ -0,0 +1,47 @@
+# Module to run tests on linked spectra
+
+import numpy as np
+import h5py
+import pytest
+
+from igmspec import links
+
+
+def mk_db(filename):
+    dtypes = [(str('wave'), 'float64', (20)),
+              (str('flux'), 'float32', (20)),
+              ]
+    hdf = h5py.File(filename, 'w')
+    for ii, gname in enumerate(['GRP1', 'GRP2']):
+        data = np.zeros(5+ii, dtype=dtypes)
+        data['flux'][:] = np.arange(5+ii)[:,None] + 10*ii
+        grp = hdf.create_group(gname)
+        grp.create_dataset('spec', data=data, chunks=True, maxshape=(None,), compression='gzip')
+        grp['meta'] = np.arange(5+ii)
+        grp['meta'].attrs['SSA'] = gname
+    return hdf
+
+
+def test_link_and_materialize(tmpdir):
+    prev = mk_db(str(tmpdir.join('prev.hdf5')))
+    hdf = h5py.File(str(tmpdir.join('new.hdf5')), 'w')
+    for gname, mode in zip(['GRP1', 'GRP2'], ['external', 'virtual']):
+        hdf.create_group(gname)
+        links.add_spec(prev, hdf, gname, mode=mode)
+        prev.copy(gname+'/meta', hdf[gname])
+        assert links.is_linked(hdf[gname], 'spec')
+        assert not links.is_linked(hdf[gname], 'meta')
+        assert np.array_equal(hdf[gname]['spec'][:], prev[gname]['spec'][:])
+    with pytest.raises(IOError):
+        links.add_spec(prev, hdf, 'GRP1', mode='symlink')
+    hdf.close()
+    # Materialize
+    outfile = str(tmpdir.join('standalone.hdf5'))
+    links.materialize(str(tmpdir.join('new.hdf5')), outfile)
+    hout = h5py.File(outfile, 'r')
+    for gname in ['GRP1', 'GRP2']:
+        assert not links.is_linked(hout[gname], 'spec')
+        assert np.array_equal(hout[gname]['spec'][:], prev[gname]['spec'][:])
+        assert hout[gname]['meta'].attrs['SSA'] == gname
+    hout.close()
+    prev.close()
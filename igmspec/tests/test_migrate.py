@@ -0,0 +1,44 @@
+# Module to run tests on meta migrations
+
+import numpy as np
+import h5py
+import pytest
+
+from astropy.table import Table
+
+from igmspec import migrate
+
+
+def test_migrate_meta(tmpdir):
+    # Previous DB file
+    prev = h5py.File(str(tmpdir.join('prev.hdf5')), 'w')
+    grp = prev.create_group('GRP')
+    data = np.zeros(4, dtype=[(str('flux'), 'float32', (10))])
+    data['flux'][:] = np.arange(4)[:,None]
+    grp.create_dataset('spec', data=data, chunks=True, maxshape=(None,), compression='gzip')
+    meta = Table()
+    meta['IGM_ID'] = np.arange(4)
+    meta['GRATING'] = [b'G140L']*4
+    grp['meta'] = meta
+    grp['meta'].attrs['SSA'] = 'GRP'
+    # Steps
+    def maxflux(meta, grp):
+        return np.max(grp['spec']['flux'], axis=1)
+    steps = [migrate.rename('GRATING', 'DISPERSER'), migrate.drop('IGM_ID'),
+             migrate.add('flag', 1), migrate.derive('FMAX', maxflux)]
+    new_meta = migrate.apply_steps(Table(prev['GRP/meta'][()]), steps, grp=prev['GRP'])
+    assert new_meta.colnames == ['DISPERSER', 'flag', 'FMAX']
+    assert np.all(new_meta['flag'] == 1)
+    np.testing.assert_allclose(new_meta['FMAX'], np.arange(4))
+    # Write with the spectra carried over
+    hdf = h5py.File(str(tmpdir.join('new.hdf5')), 'w')
+    hdf.create_group('GRP')
+    prev.copy('GRP/spec', hdf['GRP'])
+    migrate.write_meta(hdf, 'GRP', new_meta, src_hdf=prev)
+    assert hdf['GRP/meta'].attrs['SSA'] == 'GRP'
+    assert np.array_equal(hdf['GRP/spec'][:], prev['GRP/spec'][:])
+    # Bad step
+    with pytest.raises(ValueError):
+        migrate.apply_steps(new_meta, [dict(step='shuffle')])
+    hdf.close()
+    prev.close()
@@ -0,0 +1,77 @@
+# Module to run tests on the ragged spectrum layout
+
+import numpy as np
+import h5py
+import pytest
+
+from igmspec import ragged
+
+
+def mk_padded(hdf, nspec=12, max_npix=50, seed=1234):
+    rstate = np.random.RandomState(seed)
+    dtypes = [(str('wave'), 'float64', (max_npix)),
+              (str('flux'), 'float32', (max_npix)),
+              (str('sig'),  'float32', (max_npix)),
+              ]
+    data = np.zeros((nspec, ), dtype=dtypes)
+    npix = rstate.randint(1, max_npix, nspec)
+    npix[3] = 0  # e.g. a bad file
+    for jj in range(nspec):
+        data['wave'][jj][:npix[jj]] = 3000. + np.arange(npix[jj])
+        data['flux'][jj][:npix[jj]] = rstate.normal(size=npix[jj])
+        data['sig'][jj][:npix[jj]] = 1.
+    grp = hdf.create_group('TST')
+    grp.create_dataset('spec', data=data, chunks=True, maxshape=(None,), compression='gzip')
+    meta = np.zeros(nspec, dtype=[(str('NPIX'), int), (str('GROUP_ID'), int)])
+    meta['NPIX'] = npix
+    meta['GROUP_ID'] = np.arange(nspec)
+    grp['meta'] = meta
+    return grp, data, npix
+
+
+def test_convert_and_read(tmpdir):
+    hdf = h5py.File(str(tmpdir.join('tst.hdf5')), 'w')
+    grp, data, npix = mk_padded(hdf)
+    rgrp = ragged.padded_to_ragged(grp, nrow=5)
+    assert ragged.is_ragged(grp)
+    assert rgrp['flux'].shape[0] == np.sum(npix)
+    assert np.all(rgrp['NPIX'][:] == npix)
+    # Read back (out of order with duplicates)
+    rows = [7, 2, 3, 4, 11, 2]
+    spectra = ragged.grab_spec(grp, rows)
+    for row, spec in zip(rows, spectra):
+        assert spec['flux'].size == npix[row]
+        for key in ['wave', 'flux', 'sig']:
+            assert np.array_equal(spec[key], data[key][row][:npix[row]])
+    # Single row
+    spec = ragged.grab_spec(grp, 0, fields=['wave'])[0]
+    assert list(spec.keys()) == ['wave']
+    # No second conversion
+    with pytest.raises(IOError):
+        ragged.padded_to_ragged(grp)
+    hdf.close()
+
+
+def test_repack(tmpdir):
+    src = h5py.File(str(tmpdir.join('src.hdf5')), 'w')
+    grp, data, npix = mk_padded(src, nspec=40, max_npix=2000)
+    grp['meta'].attrs['SSA'] = 'TST'
+    src['catalog'] = np.arange(5)
+    src.attrs['VERSION'] = 'v03'
+    src.close()
+    src = h5py.File(str(tmpdir.join('src.hdf5')), 'r')
+    out = h5py.File(str(tmpdir.join('out.hdf5')), 'w')
+    assert ragged.repack(src, out) == ['TST']
+    out.close()
+    out = h5py.File(str(tmpdir.join('out.hdf5')), 'r')
+    assert 'spec' not in out['TST'].keys()
+    assert ragged.is_ragged(out['TST'])
+    assert out['TST/meta'].attrs['SSA'] == 'TST'
+    assert out.attrs['VERSION'] == 'v03'
+    assert np.array_equal(out['catalog'][:], np.arange(5))
+    spec = ragged.grab_spec(out['TST'], 5)[0]
+    assert np.array_equal(spec['flux'], data['flux'][5][:npix[5]])
+    assert 'spec' in src['TST'].keys()
+    out.close()
+    src.close()
+    assert tmpdir.join('out.hdf5').size() < tmpdir.join('src.hdf5').size()
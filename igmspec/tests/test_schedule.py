@@ -0,0 +1,64 @@
+# Module to run tests on the build scheduler
+
+import os
+import time
+import pytest
+
+from igmspec import schedule
+
+
+def touch(path, name, deps=(), wait=0.):
+    for dep in deps:
+        assert os.path.isfile(os.path.join(path, dep))
+    time.sleep(wait)
+    open(os.path.join(path, name), 'w').close()
+
+
+def fail():
+    raise ValueError("Bad stage")
+
+
+def test_dag(tmpdir):
+    path = str(tmpdir)
+    dag = schedule.BuildDAG()
+    dag.add('catalog', touch, args=(path, 'catalog'), cost=2.)
+    dag.add('meta:A', touch, args=(path, 'meta:A'), kwargs=dict(deps=['catalog']),
+            deps=['catalog'])
+    dag.add('spec:A', touch, args=(path, 'spec:A'), kwargs=dict(deps=['meta:A'], wait=0.2),
+            deps=['meta:A'], cost=10., ncore=2)
+    dag.add('meta:B', touch, args=(path, 'meta:B'))
+    dag.add('spec:B', touch, args=(path, 'spec:B'), kwargs=dict(deps=['meta:B']),
+            deps=['meta:B'], cost=3.)
+    dag.add('merge', touch, args=(path, 'merge'),
+            kwargs=dict(deps=['catalog', 'spec:A', 'spec:B']),
+            deps=['catalog', 'spec:A', 'spec:B'], inline=True)
+    with pytest.raises(ValueError):
+        dag.add('merge', touch)
+    # Critical path
+    path_names, total = dag.critical_path()
+    assert path_names == ['catalog', 'meta:A', 'spec:A', 'merge']
+    assert total == 14.
+    # Run
+    dag.run(ncore=2)
+    assert os.path.isfile(os.path.join(path, 'merge'))
+    assert dag.stages['spec:A'].time >= 0.2
+    path_names, total = dag.critical_path(measured=True)
+    assert 'spec:A' in path_names
+
+
+def test_bad_dag():
+    dag = schedule.BuildDAG()
+    dag.add('a', touch, deps=['b'])
+    dag.add('b', touch, deps=['a'])
+    with pytest.raises(ValueError):
+        dag.tsort()
+    dag = schedule.BuildDAG()
+    dag.add('a', touch, deps=['c'])
+    with pytest.raises(ValueError):
+        dag.tsort()
+    # Failed stage
+    dag = schedule.BuildDAG()
+    dag.add('a', fail)
+    dag.add('b', touch, deps=['a'])
+    with pytest.raises(ValueError):
+        dag.run(ncore=1)
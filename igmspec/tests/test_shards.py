@@ -0,0 +1,84 @@
+# Module to run tests on shard files
+
+import os
+import types
+import numpy as np
+import h5py
+import pytest
+
+from astropy.table import Table
+
+from igmspec import shards
+
+
+def test_open_shard(tmpdir):
+    shard_path = str(tmpdir)
+    sfile = shards.shard_file(shard_path, 'v02', 'XQ-100')
+    assert os.path.basename(sfile) == 'IGMspec_v02_XQ-100.hdf5'
+    with pytest.raises(IOError):
+        shards.open_shard(shard_path, 'v02', 'XQ-100')
+    # An incomplete shard is not picked up
+    hdf = h5py.File(sfile+'.tmp', 'w')
+    hdf.close()
+    with pytest.raises(IOError):
+        shards.open_shard(shard_path, 'v02', 'XQ-100')
+    os.rename(sfile+'.tmp', sfile)
+    shard_hdf = shards.open_shard(shard_path, 'v02', 'XQ-100')
+    shard_hdf.close()
+
+
+def mk_meta():
+    meta = Table()
+    meta['RA_GROUP'] = [10., 20., 30.]
+    meta['DEC_GROUP'] = [-5., 0., 5.]
+    meta['zem_GROUP'] = [2., 2.5, 3.]
+    meta['sig_zem'] = 0.
+    meta['flag_zem'] = [b'SDSS']*3
+    meta['STYPE'] = [b'QSO']*3
+    return meta
+
+
+def add_spec_columns(meta):
+    meta['GROUP_ID'] = np.arange(len(meta))
+    meta['NPIX'] = [5, 4, 3]
+    meta['EPOCH'] = 2000.
+
+
+def test_merge_shard(tmpdir):
+    pytest.importorskip('specdb')
+    from specdb.build import utils as sdbbu
+    from igmspec import build_db
+    idkey = 'IGM_ID'
+    # Serial build:  IDs added after grab_meta, then the spectra
+    maindb, tkeys = sdbbu.start_maindb(idkey)
+    meta = mk_meta()
+    maindb = sdbbu.add_ids(maindb, meta, 1, tkeys, idkey, first=True, close_pairs=False,
+                           debug=False)
+    add_spec_columns(meta)
+    # Shard with placeholder IDs
+    shard_path = str(tmpdir.mkdir('shards'))
+    smeta = shards.grab_meta(types.SimpleNamespace(grab_meta=mk_meta), 'TST')
+    add_spec_columns(smeta)
+    shard_hdf = h5py.File(shards.shard_file(shard_path, 'v03', 'TST'), 'w')
+    grp = shard_hdf.create_group('TST')
+    grp['spec'] = np.zeros(3, dtype=[(str('flux'), 'float32', (5))])
+    grp['meta'] = smeta
+    shard_hdf.close()
+    # Merge
+    hdf = h5py.File(str(tmpdir.join('tst.hdf5')), 'w')
+    maindb2, tkeys = sdbbu.start_maindb(idkey)
+    maindb2 = build_db.merge_shard(hdf, 'TST', 'v03', shard_path, maindb2, 1, tkeys, idkey, [])
+    merged = Table(hdf['TST/meta'][()])
+    assert merged.colnames == meta.colnames
+    for key in meta.colnames:
+        assert np.array_equal(merged[key], meta[key])
+    assert len(maindb2) == len(maindb)
+    hdf.close()
+
+
+def test_build_costs():
+    from igmspec import defs
+    # Every group (and the quasars catalog) has a static cost;  no raw file is read
+    costs = defs.get_build_costs()
+    assert sorted(costs.keys()) == sorted(defs.get_raw_dirs().keys())
+    assert max(costs, key=costs.get) == 'BOSS_DR14'
@@ -0,0 +1,36 @@
+# Module to run tests on the lock-file work queue
+
+import os
+import time
+
+from igmspec.workqueue import LockQueue
+
+
+def test_claim_complete(tmpdir):
+    path = str(tmpdir.join('queue'))
+    queue = LockQueue(path, ['a', 'b'])
+    other = LockQueue(path, ['a', 'b'])
+    # Each worker gets its own task
+    assert queue.claim() == 'a'
+    assert other.claim() == 'b'
+    assert queue.claim() is None
+    # Failed task is freed for another worker
+    other.release('b')
+    queue.complete('a')
+    assert other.claim() == 'b'
+    assert not queue.all_done()
+    other.complete('b')
+    assert queue.all_done()
+    assert other.claim() is None
+    queue.wait(poll=0.)
+
+
+def test_stale_lock(tmpdir):
+    path = str(tmpdir)
+    queue = LockQueue(path, ['a'])
+    assert queue.claim() == 'a'
+    # Crashed worker
+    old = time.time() - 100.
+    os.utime(queue.lock_file('a'), (old, old))
+    assert LockQueue(path, ['a'], max_age=1000.).claim() is None
+    assert LockQueue(path, ['a'], max_age=10.).claim() == 'a'
@@ -0,0 +1,74 @@
+# Module to run tests on the sky cross-matches
+
+import numpy as np
+
+from astropy import units as u
+from astropy.coordinates import SkyCoord, match_coordinates_sky, search_around_sky
+
+from igmspec import xmatch
+
+
+def random_sky(nobj, seed=1234):
+    rstate = np.random.RandomState(seed)
+    ra = rstate.uniform(0., 360., nobj)
+    dec = np.degrees(np.arcsin(rstate.uniform(-1., 1., nobj)))
+    return ra, dec
+
+
+def test_separation():
+    ra1, dec1 = random_sky(100, seed=1)
+    ra2, dec2 = random_sky(100, seed=2)
+    sep = xmatch.separation(ra1, dec1, ra2, dec2)
+    asep = SkyCoord(ra=ra1, dec=dec1, unit='deg').separation(SkyCoord(ra=ra2, dec=dec2, unit='deg'))
+    np.testing.assert_allclose(sep, asep.deg, atol=1e-10)
+
+
+def test_nearest():
+    ra1, dec1 = random_sky(500, seed=1)
+    ra2, dec2 = random_sky(2000, seed=2)
+    idx, sep = xmatch.match_nearest(ra1, dec1, ra2, dec2)
+    aidx, ad2d, _ = match_coordinates_sky(SkyCoord(ra=ra1, dec=dec1, unit='deg'),
+                                          SkyCoord(ra=ra2, dec=dec2, unit='deg'))
+    assert np.all(idx == aidx)
+    np.testing.assert_allclose(sep, ad2d.deg, atol=1e-10)
+    # Self-match skips the position itself
+    coord = SkyCoord(ra=ra2, dec=dec2, unit='deg')
+    aidx, ad2d, _ = match_coordinates_sky(coord, coord, nthneighbor=2)
+    tree = xmatch.SkyTree(ra2, dec2)
+    idx, sep = tree.nearest(ra2, dec2, nth=2)
+    assert np.all(idx == aidx)
+    # Scalar
+    idx, sep = tree.nearest(ra2[5], dec2[5])
+    assert idx[0] == 5
+    assert sep[0] < 1e-8
+
+
+def test_within():
+    ra1, dec1 = random_sky(500, seed=1)
+    ra2, dec2 = random_sky(20000, seed=2)
+    radius = 1.*u.deg
+    idx1, idx2, sep = xmatch.match_within(ra1, dec1, ra2, dec2, radius)
+    aidx1, aidx2, ad2d, _ = search_around_sky(SkyCoord(ra=ra1, dec=dec1, unit='deg'),
+                                              SkyCoord(ra=ra2, dec=dec2, unit='deg'), radius)
+    srt = np.lexsort((aidx2, aidx1))
+    assert np.all(idx1 == aidx1[srt])
+    assert np.all(idx2 == aidx2[srt])
+    assert np.all(sep <= 1.)
+    # Degrees are accepted too
+    idx1, idx2, sep = xmatch.match_within(ra1, dec1, ra2, dec2, 1.)
+    assert len(idx1) == len(aidx1)
+
+
+def test_self_match():
+    ra, dec = random_sky(5000)
+    # Add close pairs
+    ra = np.concatenate([ra, ra[:10] + 0.5/3600])
+    dec = np.concatenate([dec, dec[:10]])
+    idx1, idx2, sep = xmatch.self_match(ra, dec, 2.*u.arcsec)
+    assert np.all(idx1 < idx2)
+    pairs = set(zip(idx1.tolist(), idx2.tolist()))
+    for ii in range(10):
+        assert (ii, 5000+ii) in pairs
+    coord = SkyCoord(ra=ra, dec=dec, unit='deg')
+    aidx1, aidx2, _, _ = search_around_sky(coord, coord, 2.*u.arcsec)
+    assert 2*len(idx1) == np.sum(aidx1 != aidx2)
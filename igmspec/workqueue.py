@@ -0,0 +1,132 @@
+""" Module for a work queue coordinated by lock files
+
+Tasks are claimed by creating <task>.lock exclusively (O_CREAT|O_EXCL)
+in a shared directory and completed by creating <task>.done, so
+workers on several machines sharing a filesystem may split the tasks
+without any other communication.
+"""
+from __future__ import print_function, absolute_import, division, unicode_literals
+
+import os
+import time
+import socket
+import pdb
+
+
+class LockQueue(object):
+    """ Work queue of named tasks
+
+    Parameters
+    ----------
+    path : str
+      Shared directory for the lock and done files
+    tasks : list of str
+    max_age : float, optional
+      Locks older than this (s) are taken to be from a crashed worker
+      and may be claimed again.  Default is to never do so
+    """
+    def __init__(self, path, tasks, max_age=None):
+        self.path = path
+        self.tasks = list(tasks)
+        self.max_age = max_age
+        if not os.path.isdir(path):
+            try:
+                os.makedirs(path)
+            except OSError:  # Made by another worker
+                pass
+
+    def lock_file(self, task):
+        return os.path.join(self.path, task+'.lock')
+
+    def done_file(self, task):
+        return os.path.join(self.path, task+'.done')
+
+    def is_done(self, task):
+        """ Has the task been completed?
+
+        Parameters
+        ----------
+        task : str
+
+        Returns
+        -------
+        bool
+        """
+        return os.path.isfile(self.done_file(task))
+
+    def all_done(self):
+        """ Have all of the tasks been completed?
+
+        Returns
+        -------
+        bool
+        """
+        return all([self.is_done(task) for task in self.tasks])
+
+    def claim(self):
+        """ Claim the next task that is neither done nor locked
+
+        Returns
+        -------
+        task : str or None
+          None if there are no tasks left to claim
+        """
+        for task in self.tasks:
+            if self.is_done(task):
+                continue
+            lfile = self.lock_file(task)
+            if (self.max_age is not None) and os.path.isfile(lfile):
+                try:
+                    age = time.time() - os.path.getmtime(lfile)
+                except OSError:  # Released meanwhile
+                    age = 0.
+                if age > self.max_age:
+                    print("Removing stale lock {:s}".format(lfile))
+                    self.release(task)
+            try:
+                fd = os.open(lfile, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except OSError:  # Claimed by another worker
+                continue
+            with os.fdopen(fd, 'w') as f:
+                f.write('{:s} {:d}\n'.format(socket.gethostname(), os.getpid()))
+            # Completed between the check and the lock?
+            if self.is_done(task):
+                self.release(task)
+                continue
+            return task
+        return None
+
+    def complete(self, task):
+        """ Record a claimed task as complete
+
+        Parameters
+        ----------
+        task : str
+        """
+        open(self.done_file(task), 'w').close()
+        self.release(task)
+
+    def release(self, task):
+        """ Give up a claimed task, e.g. after a failure
+
+        Parameters
+        ----------
+        task : str
+        """
+        try:
+            os.remove(self.lock_file(task))
+        except OSError:
+            pass
+
+    def wait(self, poll=30.):
+        """ Wait for all of the tasks to be completed, e.g. by other machines
+
+        Parameters
+        ----------
+        poll : float, optional
+          Seconds between checks
+        """
+        while not self.all_done():
+            left = [task for task in self.tasks if not self.is_done(task)]
+            print("Waiting on tasks: {}".format(left))
+            time.sleep(poll)
@@ -0,0 +1,105 @@
+""" Time writing a BOSS-sized group of spectra to HDF5
+one row at a time vs. with the buffered SpecWriter
+"""
+from __future__ import print_function, absolute_import, division, unicode_literals
+
+import numpy as np
+import os, time
+import tempfile
+
+import h5py
+
+from igmspec.ingest.writer import SpecWriter
+
+
+def fake_spectra(nspec, max_npix, seed=123):
+    """ Generate a set of BOSS-like spectra
+
+    Parameters
+    ----------
+    nspec : int
+    max_npix : int
+    seed : int, optional
+
+    Returns
+    -------
+    spectra : list of (wave, flux, sig) tuples
+    """
+    rstate = np.random.RandomState(seed)
+    spectra = []
+    for npix in rstate.randint(max_npix-1000, max_npix, nspec):
+        wave = 10.**(3.55 + 1e-4*np.arange(npix))
+        flux = rstate.normal(size=npix).astype(np.float32)
+        sig = np.ones(npix, dtype=np.float32)
+        spectra.append((wave, flux, sig))
+    return spectra
+
+
+def init_spec_set(hdf, name, max_npix, nspec):
+    dtypes = [(str('wave'), 'float64', (max_npix)),
+              (str('flux'), 'float32', (max_npix)),
+              (str('sig'),  'float32', (max_npix)),
+              (str('co'),   'float32', (max_npix)),
+              ]
+    data = np.zeros((1, ), dtype=dtypes)
+    spec_set = hdf.create_dataset(name, data=data, chunks=True,
+                                  maxshape=(None,), compression='gzip')
+    spec_set.resize((nspec,))
+    return spec_set, data
+
+
+def time_per_row(hdf, spectra, max_npix):
+    spec_set, data = init_spec_set(hdf, 'per_row', max_npix, len(spectra))
+    t0 = time.time()
+    for jj, (wave, flux, sig) in enumerate(spectra):
+        npix = wave.size
+        for key in ['wave','flux','sig','co']:
+            data[key] = 0.  # Important to init (for compression too)
+        data['flux'][0][:npix] = flux
+        data['sig'][0][:npix] = sig
+        data['wave'][0][:npix] = wave
+        spec_set[jj] = data
+    return time.time() - t0
+
+
+def time_writer(hdf, spectra, max_npix):
+    spec_set, data = init_spec_set(hdf, 'slab', max_npix, len(spectra))
+    t0 = time.time()
+    writer = SpecWriter(spec_set, data)
+    for jj, (wave, flux, sig) in enumerate(spectra):
+        npix = wave.size
+        data = writer.row(jj, npix)
+        data['flux'][0][:npix] = flux
+        data['sig'][0][:npix] = sig
+        data['wave'][0][:npix] = wave
+        writer.write(jj)
+    writer.close()
+    return time.time() - t0
+
+
+def main(nspec=20000, max_npix=4650):
+    """ Print rows/sec for both approaches
+
+    Parameters
+    ----------
+    nspec : int, optional
+    max_npix : int, optional
+      4650 is the BOSS_DR12 value
+    """
+    spectra = fake_spectra(nspec, max_npix)
+    tmpfile = os.path.join(tempfile.mkdtemp(), 'time_spec_writer.hdf5')
+    hdf = h5py.File(tmpfile, 'w')
+    dt_row = time_per_row(hdf, spectra, max_npix)
+    dt_slab = time_writer(hdf, spectra, max_npix)
+    # Same bytes?
+    assert hdf['per_row'][:].tobytes() == hdf['slab'][:].tobytes()
+    hdf.close()
+    os.remove(tmpfile)
+    print("nspec={:d}, max_npix={:d}".format(nspec, max_npix))
+    print("Per row:    {:0.1f} rows/sec".format(nspec/dt_row))
+    print("SpecWriter: {:0.1f} rows/sec".format(nspec/dt_slab))
+
+
+# Command line execution
+if __name__ == '__main__':
+    main()